@@ -36,12 +36,17 @@ for then, *then* we create the PDF canvas and actually print them on it.
 
 All dimension variables here are in big points (bp) because this is the native
 unit of measurement in ReportLab.
+
+Nothing is written to the disk here.  The PDF may be written into a
+``BytesIO``, and many diagrams can be put into one PDF with one page per
+diagram, so that :py:func:`samples.utils.thumbnails.rasterize_pdf` converts
+all of them into thumbnails in one go.
 """
 
 from __future__ import division, unicode_literals
 import django.utils.six as six
 
-import random, math, decimal
+import random, math, decimal, hashlib
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import cm
 from reportlab.lib.styles import ParagraphStyle
@@ -594,10 +599,6 @@ def build_stack(layers, scale):
 class Label(object):
     """Class for labels of layers.
 
-    :cvar needs_left_row: whether the space left to the stack must be used for
-      labels, too; it is ``True`` iff at least one label is placed to the left
-      of the stack
-
     :ivar text: the content of the label
 
     :ivar voffset: the vertical distance between the bottom of the stack
@@ -605,12 +606,15 @@ class Label(object):
 
     :ivar right_row: see constructor
 
-    :type needs_left_row: bool
+    :ivar needs_left_row: whether the space left to the stack must be used for
+      labels, too; it is ``True`` iff at least one label of the diagram is
+      placed to the left of the stack.  It is set by `place_labels`.
+
     :type text: unicode
     :type voffset: float
     :type right_row: bool
+    :type needs_left_row: bool
     """
-    needs_left_row = False
 
     def __init__(self, layer, right_row):
         """
@@ -622,8 +626,7 @@ class Label(object):
         :type right_row: bool
         """
         self.text, self.voffset, self.right_row = layer.name, layer.accumulated_height - layer.height / 2, right_row
-        if not right_row:
-            Label.needs_left_row = True
+        self.needs_left_row = False
 
     def print_label(self, canvas):
         """Draws the label on the canvas.
@@ -649,10 +652,11 @@ class NumberedLabel(Label):
     label(s) are too big to be printed next to the layer(s).  This may have a
     from–to form like “➁–➄” or may be a single number like “➆”.
 
-    :cvar largest_number: the largest number that occurs in the diagram.  It is
+    :ivar largest_number: the largest number that occurs in the diagram.  It is
       needed because if it exceeds 10, the circled numbers from Unicode aren't
       sufficient anymore (Unicode contains only 1–10).  Thus, we have to
-      fallback to parentheses then for *all* numbers: (1), (2), etc.
+      fallback to parentheses then for *all* numbers: (1), (2), etc.  It is set
+      by `place_labels`.
 
     :ivar lower: see constructor
 
@@ -668,7 +672,6 @@ class NumberedLabel(Label):
     :type voffset: float
     :type right_row: bool
     """
-    largest_number = 0
 
     def __init__(self, lower, upper, voffset, right_row):
         """
@@ -686,9 +689,8 @@ class NumberedLabel(Label):
         :type right_row: bool
         """
         self.lower, self.upper, self.voffset, self.right_row = lower, upper, voffset, right_row
-        NumberedLabel.largest_number = max(NumberedLabel.largest_number, upper - 1)
-        if not right_row:
-            Label.needs_left_row = True
+        self.needs_left_row = False
+        self.largest_number = upper - 1
 
     def print_label(self, canvas):
         if self.upper - self.lower == 1:
@@ -704,7 +706,9 @@ class NumberedLabel(Label):
 
 def place_labels(layers):
     """Finds the best places for all labels.  Additionally, move labels for
-    which there is not enough free space to the legend.
+    which there is not enough free space to the legend.  All state which
+    depends on the diagram as a whole is stored in the labels themselves, so
+    that many diagrams can be generated one after the other (or concurrently).
 
     :param layers: the layers to be drawn
 
@@ -739,6 +743,11 @@ def place_labels(layers):
                 displaced_labels.extend(layer.name for layer in layers[i:j])
             i = j - 1
         i += 1
+    needs_left_row = any(not label.right_row for label in labels)
+    for label in labels:
+        label.needs_left_row = needs_left_row
+        if isinstance(label, NumberedLabel):
+            label.largest_number = len(displaced_labels)
     return labels, displaced_labels
 
 
@@ -761,7 +770,7 @@ def build_legend(displaced_labels, width):
     for i, label in enumerate(displaced_labels):
         number = i + 1
         legend.append(
-            Paragraph("""<bullet>{0}</bullet>{1}""".format(get_circled_number(number, NumberedLabel.largest_number), label),
+            Paragraph("""<bullet>{0}</bullet>{1}""".format(get_circled_number(number, len(displaced_labels)), label),
                       legend_label_style))
     total_height = 0
     for item in legend:
@@ -771,26 +780,24 @@ def build_legend(displaced_labels, width):
     return legend, total_height
 
 
-def generate_diagram(filepath, layers, title, subject):
-    """Generates the stack diagram and writes it to a PDF file.
+def draw_diagram(c, layers):
+    """Draws the stack diagram on the current page of the canvas.  The size of
+    the page is set to the size of the diagram, and the page is finished.
 
-    :param filepath: the path to the PDF file that should be written
+    :param c: the PDF canvas
     :param layers: the layers of the stack in chronological order
-    :param title: the title of the PDF file
-    :param subject: the subject of the PDF file
 
-    :type filepath: str
+    :type c: canvas.Canvas
     :type layers: list of `Layer`
-    :type title: unicode
-    :type subject: unicode
     """
     scale = Scale(layers)
     stack_height = build_stack(layers, scale)
     labels, displaced_labels = place_labels(layers)
+    needs_left_row = any(not label.right_row for label in labels)
     total_margin = dimensions["margin"]
     full_label_width = dimensions["label_skip"] + dimensions["label_width"]
     width = dimensions["stack_width"] + 2 * total_margin + full_label_width
-    if Label.needs_left_row:
+    if needs_left_row:
         width += full_label_width
     legend, legend_height = build_legend(displaced_labels, width)
     height = scale.scale_height + stack_height + legend_height + 2 * total_margin + dimensions["scale_skip"]
@@ -803,10 +810,7 @@ def generate_diagram(filepath, layers, title, subject):
         height += 2 * red_line_space
         total_margin += red_line_space
 
-    c = canvas.Canvas(filepath, pagesize=(width, height), pageCompression=True)
-    c.setAuthor("JuliaBase samples database")
-    c.setTitle(title)
-    c.setSubject(subject)
+    c.setPageSize((width, height))
     c.setLineJoin(1)
     c.setLineCap(1)
 
@@ -827,18 +831,83 @@ def generate_diagram(filepath, layers, title, subject):
     for label in labels:
         label.print_label(c)
     c.saveState()
-    if Label.needs_left_row:
+    if needs_left_row:
         c.translate(full_label_width, 0)
     layers = [layer for layer in reversed(layers) if layer.nm >= 0]
     for i, layer in enumerate(layers):
         layer.draw(c)
     c.restoreState()
-    c.translate(full_label_width if Label.needs_left_row else 0, stack_height + dimensions["scale_skip"])
+    c.translate(full_label_width if needs_left_row else 0, stack_height + dimensions["scale_skip"])
     scale.draw(c)
     c.showPage()
+
+
+def generate_diagrams(outfile, stacks, title, subject):
+    """Generates stack diagrams and writes them to a PDF file, one diagram per
+    page.  Every page gets the size of its diagram.
+
+    :param outfile: the path to the PDF file that should be written, or a
+        binary file-like object, e.g. a ``BytesIO``
+    :param stacks: the layers of every stack in chronological order
+    :param title: the title of the PDF file
+    :param subject: the subject of the PDF file
+
+    :type outfile: str or file
+    :type stacks: list of list of `Layer`
+    :type title: unicode
+    :type subject: unicode
+    """
+    c = canvas.Canvas(outfile, pageCompression=True)
+    c.setAuthor("JuliaBase samples database")
+    c.setTitle(title)
+    c.setSubject(subject)
+    for layers in stacks:
+        draw_diagram(c, layers)
     c.save()
 
 
+def generate_diagram(outfile, layers, title, subject):
+    """Generates the stack diagram and writes it to a PDF file.
+
+    :param outfile: the path to the PDF file that should be written, or a
+        binary file-like object, e.g. a ``BytesIO``
+    :param layers: the layers of the stack in chronological order
+    :param title: the title of the PDF file
+    :param subject: the subject of the PDF file
+
+    :type outfile: str or file
+    :type layers: list of `Layer`
+    :type title: unicode
+    :type subject: unicode
+    """
+    generate_diagrams(outfile, [layers], title, subject)
+
+
+def get_stack_hash(layers):
+    """Returns a hash of everything which determines the appearance of a stack
+    diagram.  Two stacks with the same hash look exactly the same (apart from
+    the PDF metadata), even if they belong to different samples.  Note that
+    the labels of the layers are translated, so the hash depends on the
+    current language.
+
+    :param layers: the layers of the stack in chronological order
+
+    :type layers: list of `Layer`
+
+    :return:
+      the hash of the stack
+
+    :rtype: str
+    """
+    hash_ = hashlib.sha1()
+    hash_.update(repr(sorted(dimensions.items())).encode("utf-8"))
+    hash_.update(repr(sorted(parameters.items())).encode("utf-8"))
+    for layer in layers:
+        hash_.update(repr((layer.name, layer.nm, layer.color, layer.structured, layer.textured, layer.verified,
+                           layer.collapsed)).encode("utf-8"))
+    return hash_.hexdigest()
+
+
 if __name__ == "__main__":
     layers = [Layer("Glas", 2e3, "lightblue", textured=True),
               Layer("Eine <i>wirklich</i> <b>wunderschöne</b> <a href='http://www.fz-juelich.de'>αβγ</a>-Schicht", 1e2,
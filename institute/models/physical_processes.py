@@ -121,8 +121,9 @@ class PDSMeasurement(PhysicalProcess):
 
     def get_context_for_user(self, user, old_context):
         context = old_context.copy()
-        plot_locations = self.calculate_plot_locations()
-        context["thumbnail"], context["figure"] = plot_locations["thumbnail_url"], plot_locations["plot_url"]
+        if "thumbnail" not in context or "figure" not in context:
+            plot_locations = self.calculate_plot_locations()
+            context["thumbnail"], context["figure"] = plot_locations["thumbnail_url"], plot_locations["plot_url"]
         return super(PDSMeasurement, self).get_context_for_user(user, context)
 
 
@@ -141,25 +142,27 @@ class SolarsimulatorMeasurement(PhysicalProcess):
 
     def get_context_for_user(self, user, old_context):
         context = old_context.copy()
-        sample = self.samples.get()
-        if "shapes" not in context:
-            layout = institute.layouts.get_layout(sample, self)
-            context["shapes"] = layout.get_map_shapes() if layout else {}
-        context["thumbnail_layout"] = django.core.urlresolvers.reverse(
-            "institute.views.samples.layout.show_layout", kwargs={"sample_id": sample.id, "process_id": self.id})
-        cells = self.cells.all()
-        if "image_urls" not in context:
-            context["image_urls"] = {}
-            for cell in cells:
-                plot_locations = self.calculate_plot_locations(plot_id=cell.position)
-                _thumbnail, _figure = plot_locations["thumbnail_url"], plot_locations["plot_url"]
-                context["image_urls"][cell.position] = (_thumbnail, _figure)
-        if "default_cell" not in context:
-            if self.irradiation == "AM1.5":
-                default_cell = sorted([(cell.eta, cell.position) for cell in cells], reverse=True)[0][1]
-            else:
-                default_cell = sorted([(cell.isc, cell.position) for cell in cells], reverse=True)[0][1]
-            context["default_cell"] = (default_cell,) + context["image_urls"][default_cell]
+        if "shapes" not in context or "thumbnail_layout" not in context:
+            sample = self.samples.get()
+            if "shapes" not in context:
+                layout = institute.layouts.get_layout(sample, self)
+                context["shapes"] = layout.get_map_shapes() if layout else {}
+            context["thumbnail_layout"] = django.core.urlresolvers.reverse(
+                "institute.views.samples.layout.show_layout", kwargs={"sample_id": sample.id, "process_id": self.id})
+        if "image_urls" not in context or "default_cell" not in context:
+            cells = self.cells.all()
+            if "image_urls" not in context:
+                context["image_urls"] = {}
+                for cell in cells:
+                    plot_locations = self.calculate_plot_locations(plot_id=cell.position)
+                    _thumbnail, _figure = plot_locations["thumbnail_url"], plot_locations["plot_url"]
+                    context["image_urls"][cell.position] = (_thumbnail, _figure)
+            if "default_cell" not in context:
+                if self.irradiation == "AM1.5":
+                    default_cell = sorted([(cell.eta, cell.position) for cell in cells], reverse=True)[0][1]
+                else:
+                    default_cell = sorted([(cell.isc, cell.position) for cell in cells], reverse=True)[0][1]
+                context["default_cell"] = (default_cell,) + context["image_urls"][default_cell]
         return super(SolarsimulatorMeasurement, self).get_context_for_user(user, context)
 
     def get_data(self):
@@ -201,6 +204,9 @@ class SolarsimulatorMeasurement(PhysicalProcess):
             return None
         return os.path.join(settings.SOLARSIMULATOR_1_ROOT_DIR, related_cell.data_file)
 
+    def get_plot_ids(self):
+        return list(self.cells.values_list("position", flat=True))
+
     def get_plotfile_basename(self, plot_id):
         try:
             related_cell = self.cells.get(position=plot_id)
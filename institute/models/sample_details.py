@@ -29,7 +29,6 @@ from __future__ import absolute_import, unicode_literals
 import django.utils.six as six
 from django.utils.encoding import python_2_unicode_compatible
 
-import os.path
 from django.utils.translation import ugettext_lazy as _, ugettext, pgettext_lazy
 from django.db import models
 import django.core.urlresolvers
@@ -40,6 +39,7 @@ from jb_common import search, model_fields
 import jb_common.utils.base
 from samples.data_tree import DataNode, DataItem
 import samples.models
+from samples.utils import invalidation
 
 
 @python_2_unicode_compatible
@@ -67,14 +67,10 @@ class SampleDetails(models.Model):
         properly.
         """
         super(SampleDetails, self).save(*args, **kwargs)
-        # I cannot use ``self.sample`` because it may be outdated (changed
-        # through another instance of it in the view).
-        samples.models.Sample.objects.get(id=self.sample.id).save(with_relations=False)
+        invalidation.touch_samples([self.sample_id])
 
     def get_stack_diagram_locations(self):
-        """Returns the locations of the stack diagram files.  This is also needed in
-        :py:mod:`institute.views.samples.stack`, therefore, it is not part of
-        `get_context_for_user`.
+        """Returns the URLs of the stack diagram and its thumbnail.
 
         :return:
           a dictionary containing the following keys:
@@ -82,18 +78,14 @@ class SampleDetails(models.Model):
           =========================  =========================================
                  key                           meaning
           =========================  =========================================
-          ``"diagram_file"``         full path to the PDF diagram file
           ``"diagram_url"``          full relative URL to the diagram (i.e.,
                                      without domain)
-          ``"thumbnail_file"``       full path to the thumbnail file
           ``"thumbnail_url"``        full relative URL to the thumbnail
           =========================  =========================================
 
         :rtype: dict mapping str to str
         """
-        return {"diagram_file": os.path.join("stacks", str(self.pk) + ".pdf"),
-                "diagram_url": django.core.urlresolvers.reverse("stack_diagram", kwargs={"sample_id": str(self.pk)}),
-                "thumbnail_file": os.path.join("stacks", str(self.pk) + ".png"),
+        return {"diagram_url": django.core.urlresolvers.reverse("stack_diagram", kwargs={"sample_id": str(self.pk)}),
                 "thumbnail_url": django.core.urlresolvers.reverse("stack_diagram_thumbnail",
                                                                   kwargs={"sample_id": str(self.pk)})}
 
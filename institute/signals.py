@@ -32,13 +32,16 @@ from __future__ import absolute_import, unicode_literals
 import re
 from django.db.models import signals
 from django.dispatch import receiver
+from django.apps import apps
 from django.contrib.contenttypes.models import ContentType
 import django.contrib.auth.models
 from django.utils.translation import ugettext as _, ugettext
 from jb_common.signals import maintain
 import jb_common.utils.base as utils
-from samples.models import Result, PhysicalProcess, Sample, SampleAlias
+from samples.models import Result, Process, PhysicalProcess, Sample, SampleAlias
+from samples.utils.plot_rendering import prewarm_plots
 from institute import models as institute_app
+from institute.utils import informal_layers, stack_diagrams
 
 
 @receiver(signals.pre_save)
@@ -85,10 +88,20 @@ def add_sample_details(sender, instance, created, **kwargs):
         institute_app.SampleDetails.objects.get_or_create(sample=instance)
 
 
-@receiver(signals.post_save)
-def update_informal_layers(sender, instance, created, **kwargs):
-    """Update the informal layers of all samples connected with the process
-    that was recently changed.  Most of the work is done in the
+@receiver(signals.post_save, sender=institute_app.SolarsimulatorCellMeasurement)
+def prewarm_solarsimulator_cell_thumbnail(sender, instance, raw, **kwargs):
+    """Queues the thumbnail of a solarsimulator cell for rendering.  The cells
+    are saved after their measurement, so
+    `samples.signals.prewarm_plot_thumbnails` cannot find them yet.
+    """
+    if not raw:
+        prewarm_plots(instance.measurement, [instance.position])
+
+
+def update_informal_layers(sender, instance, raw, **kwargs):
+    """Update the informal layers of all samples connected with the physical
+    process that was recently changed, see
+    :py:mod:`institute.utils.informal_layers`.  Most of the work is done in the
     ``update_informal_layers`` method of the processes connected with each
     sample.  Their signature is::
 
@@ -115,71 +128,57 @@ def update_informal_layers(sender, instance, created, **kwargs):
     This method must never modify the ``index`` field of an informal layer.
     Otherwise, newly generated informal layers may not be saved.  Moreover, it
     is not necessary to set ``verified = False`` for modified layers.
+
+    Only the methods of the changed process and of the later processes of the
+    sample are called.  This function is connected only with physical
+    processes, so that saving other models doesn't cost anything.
     """
-    # FixMe: The following line is only necessary as long as
-    # http://code.djangoproject.com/ticket/9318 is not fixed.  When it is
-    # fixed, this function must be connected only with senders of
-    # ``PhysicalProcess``.  If this is not possible because ``PhysicalProcess``
-    # is abstract, this line must stay, and this function must be connected
-    # with senders of ``Process`` only.  The check ``raw==False`` must stay,
-    # though.
-    #
-    # FixMe: The following code doesn't seem to work if the index of an
-    # existing informal layer is 0.  Either one must fix it here or prevent
-    # such indices from happening.
-    if not kwargs.get("raw") and isinstance(instance, PhysicalProcess) and instance.finished:
-        def append_non_process_layers(consumed_layers=None):
-            """Appends old informal layers not connected with a process to the
-            new informal stack.  First, the `consumed_layers` are marked as
-            “already added to the stack”, so that the non-process layers know
-            which of them is next for being added to the stack.
-            """
-            if consumed_layers:
-                for sub_layers in non_process_layers.values():
-                    sub_layers -= consumed_layers
-            while non_process_layers:
-                next_layers = [layer for layer, sublayers in non_process_layers.items() if not sublayers]
-                if not next_layers:
-                    break
-                assert len(next_layers) == 1
-                next_layer = next_layers[0]
-                informal_layers.append(next_layer)
-                del non_process_layers[next_layer]
-                one_removed = False
-                for sub_layers in non_process_layers.values():
-                    if next_layer in sub_layers:
-                        sub_layers.remove(next_layer)
-                        one_removed = True
-                assert not non_process_layers or one_removed
-
-        for sample in instance.samples.all():
-            old_layers = list(sample.sample_details.informal_layers.all())
-            non_process_layers = dict((layer, set(sub_layer for sub_layer in old_layers if sub_layer.index < layer.index))
-                                      for layer in old_layers if not layer.process)
-            informal_layers = []
-            append_non_process_layers()
-            modified_layers = set()
-            for process in sample.processes.all().prefetch_related("content_type"):
-                if hasattr(process.content_type.model_class(), "update_informal_layers"):
-                    process = process.actual_instance
-                    process_layers = [layer for layer in old_layers if layer.process == process]
-                    process.update_informal_layers(
-                        sample, instance, informal_layers, process_layers, modified_layers,
-                        lambda **kwargs: institute_app.InformalLayer(sample_details=sample.sample_details,
-                                                                        process=process, **kwargs))
-                    append_non_process_layers(process_layers)
-            informal_layers.extend(sorted(non_process_layers, key=lambda layer: layer.index))
-            # This also removes layers whose processes have been withdrawn from
-            # the sample.
-            sample.sample_details.informal_layers.exclude(
-                pk__in=set(layer.pk for layer in informal_layers if layer.pk)).delete()
-            for layer in modified_layers:
-                layer.verified = False
-            for i, layer in enumerate(informal_layers):
-                index = i + 1
-                if layer.index != index or layer in modified_layers:
-                    layer.index = index
-                    layer.save(with_relations=False)
+    if not raw and instance.finished:
+        informal_layers.update_stacks(instance)
+
+
+for model in apps.get_models():
+    if issubclass(model, PhysicalProcess):
+        signals.post_save.connect(update_informal_layers, sender=model)
+
+
+@receiver(signals.m2m_changed, sender=Sample.processes.through)
+def update_informal_layers_of_samples(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Update the informal layers of samples which were added to or removed
+    from a physical process, see `update_informal_layers`.  This is necessary
+    because the samples of a process are set after the process was saved, so
+    `update_informal_layers` doesn't see them yet.  On ``clear()``, the
+    affected instances are recorded in the ``pre_clear`` signal, because the
+    ``post_clear`` signal doesn't contain them.
+    """
+    if action == "pre_clear":
+        related_instances = instance.samples if reverse else instance.processes
+        instance._informal_layers_cleared_pks = set(related_instances.values_list("pk", flat=True))
+        return
+    elif action == "post_clear":
+        pk_set = instance.__dict__.pop("_informal_layers_cleared_pks", set())
+    elif action not in ["post_add", "post_remove"]:
+        return
+    if not pk_set:
+        return
+    if reverse:
+        sample_process_pairs = [(sample, instance.actual_instance) for sample in
+                                Sample.objects.filter(pk__in=pk_set).select_related("sample_details")]
+    else:
+        sample_process_pairs = [(instance, process) for process in
+                                utils.resolve_actual_instances(Process.objects.filter(pk__in=pk_set))]
+    for sample, process in sample_process_pairs:
+        if isinstance(process, PhysicalProcess) and (process.finished or action != "post_add"):
+            informal_layers.update_stack(sample, process)
+
+
+@receiver(maintain)
+def prune_stack_thumbnail_cache(sender, **kwargs):
+    """Removes the least recently used stack diagram thumbnails from the file
+    cache if it has grown beyond
+    :py:data:`institute.utils.stack_diagrams.cache_max_size`.
+    """
+    utils.prune_file_cache("stacks", stack_diagrams.cache_max_size)
 
 
 @receiver(maintain)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+import json
+from django.test import TestCase
+from django.test.client import Client
+from jb_common.models import ErrorPage
+
+
+class BulkSubmitTest(TestCase):
+    fixtures = ["test_main"]
+    urls = "institute.tests.urls"
+
+    def setUp(self):
+        self.client = Client()
+        assert self.client.login(username="juliabase", password="12345")
+
+    def bulk_submit(self, items, **kwargs):
+        data = {"items": json.dumps(items)}
+        data.update(kwargs)
+        response = self.client.post("/bulk_submit", data, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode("utf-8"))
+
+    def test_per_item_results(self):
+        result = self.bulk_submit([{"url": "change_my_samples", "data": {}},
+                                   {"url": "no_such_view", "data": {}},
+                                   {"url": "change_my_samples", "data": {"add": {"$result": 1}}},
+                                   {"url": "change_my_samples", "data": {"add": {"$sample": "no-such-sample"}}}])
+        self.assertTrue(result["committed"])
+        self.assertEqual([status for status, __ in result["results"]], [200, 404, 422, 422])
+
+    def test_all_or_nothing(self):
+        result = self.bulk_submit([{"url": "change_my_samples", "data": {}}, {"url": "no_such_view", "data": {}}],
+                                  all_or_nothing="on")
+        self.assertFalse(result["committed"])
+
+    def test_error_page_of_failed_item(self):
+        result = self.bulk_submit([{"url": "5-chamber_depositions/add/", "data": {"number": ""}}], all_or_nothing="on")
+        self.assertFalse(result["committed"])
+        [(status, (error_number, url))] = result["results"]
+        self.assertEqual((status, error_number), (422, 1))
+        self.assertTrue(ErrorPage.objects.filter(hash_value=url.rstrip("/").rpartition("/")[2]).exists())
+
+    def test_invalid_items(self):
+        response = self.client.post("/bulk_submit", {"items": "{"}, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 422)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import, unicode_literals
+
+import threading, time, os, os.path, shutil, tempfile, datetime
+from django.test import SimpleTestCase, override_settings
+from django.core.cache import cache
+from jb_common.utils.base import get_cache_version, get_cache_versions, expire_cache_namespace, \
+    expire_cache_namespaces, CacheLock, LockTimeout, get_cached_file, prune_file_cache
+from jb_common.signals import lock_waited
+
+
+locmem_caches = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                             "LOCATION": "juliabase-test-cache-namespaces"}}
+
+
+@override_settings(CACHES=locmem_caches)
+class CacheNamespaceTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_expire_changes_version(self):
+        version = get_cache_version("sample:1")
+        self.assertEqual(get_cache_version("sample:1"), version)
+        self.assertEqual(expire_cache_namespace("sample:1"), version + 1)
+        self.assertEqual(get_cache_version("sample:1"), version + 1)
+
+    def test_namespaces_are_independent(self):
+        versions = get_cache_versions(["sample:1", "process:1"])
+        expire_cache_namespace("process:1")
+        self.assertEqual(get_cache_version("sample:1"), versions["sample:1"])
+        self.assertNotEqual(get_cache_version("process:1"), versions["process:1"])
+
+    def test_evicted_version_is_not_reused(self):
+        version = get_cache_version("sample:1")
+        cache.set("sample-data:{0}".format(version), "stale")
+        cache.delete("cache-version:sample:1")
+        time.sleep(0.01)
+        self.assertIsNone(cache.get("sample-data:{0}".format(get_cache_version("sample:1"))))
+
+    def test_expire_many(self):
+        versions = get_cache_versions(["sample:1", "sample:2", "process:1"])
+        expire_cache_namespaces(["sample:1", "process:1"])
+        new_versions = get_cache_versions(["sample:1", "sample:2", "process:1"])
+        self.assertNotEqual(new_versions["sample:1"], versions["sample:1"])
+        self.assertNotEqual(new_versions["process:1"], versions["process:1"])
+        self.assertEqual(new_versions["sample:2"], versions["sample:2"])
+        self.assertNotEqual(expire_cache_namespace("sample:1"), new_versions["sample:1"])
+
+    def test_concurrent_writers_and_readers(self):
+        """Simulates the sample data sheet: Writers change the “database” and
+        expire the namespace afterwards.  Readers take the value from the cache
+        if possible, and compute it from the “database” otherwise.  No reader
+        may ever get a value older than the one that was written before the
+        version it used came into existence.
+        """
+        database = {"value": 0}
+        database_lock = threading.Lock()
+        minimal_values = {}
+        observations = []
+        errors = []
+
+        def writer():
+            try:
+                for __ in range(50):
+                    with database_lock:
+                        database["value"] += 1
+                        value = database["value"]
+                    minimal_values[expire_cache_namespace("sample:1")] = value
+            except Exception as error:
+                errors.append(error)
+
+        def reader():
+            try:
+                for __ in range(200):
+                    version = get_cache_version("sample:1")
+                    key = "sample-data:{0}".format(version)
+                    value = cache.get(key)
+                    if value is None:
+                        with database_lock:
+                            value = database["value"]
+                        cache.set(key, value)
+                    observations.append((version, value))
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=writer) for __ in range(4)] + \
+                  [threading.Thread(target=reader) for __ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        for version, value in observations:
+            self.assertGreaterEqual(value, minimal_values.get(version, 0))
+        final_key = "sample-data:{0}".format(get_cache_version("sample:1"))
+        self.assertIn(cache.get(final_key), (None, database["value"]))
+
+
+@override_settings(CACHES=locmem_caches)
+class CacheLockTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_try_lock(self):
+        with CacheLock("sample:1") as lock:
+            self.assertTrue(lock.acquired)
+            with CacheLock("sample:1", blocking=False) as other_lock:
+                self.assertFalse(other_lock.acquired)
+        with CacheLock("sample:1", blocking=False) as lock:
+            self.assertTrue(lock.acquired)
+
+    def test_timeout(self):
+        with CacheLock("sample:1"):
+            start = time.time()
+            with self.assertRaises(LockTimeout):
+                with CacheLock("sample:1", timeout=0.2):
+                    pass
+            self.assertGreaterEqual(time.time() - start, 0.2)
+
+    def test_expiry_and_ownership(self):
+        lock = CacheLock("sample:1", ttl=1)
+        self.assertTrue(lock.acquire(blocking=False))
+        time.sleep(1.1)
+        other_lock = CacheLock("sample:1")
+        self.assertTrue(other_lock.acquire(blocking=False))
+        # The first lock has expired, so it must not release the second one.
+        lock.release()
+        self.assertFalse(CacheLock("sample:1").acquire(blocking=False))
+        other_lock.release()
+        self.assertTrue(CacheLock("sample:1").acquire(blocking=False))
+
+    def test_mutual_exclusion(self):
+        counter = {"value": 0, "maximum": 0}
+
+        def worker():
+            for __ in range(10):
+                with CacheLock("sample:1"):
+                    counter["value"] += 1
+                    counter["maximum"] = max(counter["maximum"], counter["value"])
+                    time.sleep(0.001)
+                    counter["value"] -= 1
+
+        threads = [threading.Thread(target=worker) for __ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter["maximum"], 1)
+
+    def test_metrics(self):
+        reports = []
+
+        def receiver(sender, key, waited, acquired, **kwargs):
+            reports.append((key, acquired))
+
+        lock_waited.connect(receiver)
+        try:
+            with CacheLock("sample:1"):
+                CacheLock("sample:1").acquire(blocking=False)
+        finally:
+            lock_waited.disconnect(receiver)
+        self.assertEqual(reports, [("lock:sample:1", True), ("lock:sample:1", False)])
+
+
+class FileCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(CACHE_ROOT=self.cache_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.cache_root)
+
+    def test_generator_called_once_per_version(self):
+        calls = []
+
+        def generator():
+            calls.append(None)
+            return b"plot"
+
+        timestamps = [datetime.datetime(2015, 1, 1)]
+        filepath = get_cached_file(os.path.join("plots", "a.png"), generator, timestamps=timestamps)
+        self.assertTrue(filepath.startswith(self.cache_root))
+        self.assertTrue(filepath.endswith(".png"))
+        self.assertEqual(open(filepath, "rb").read(), b"plot")
+        self.assertEqual(get_cached_file(os.path.join("plots", "a.png"), generator, timestamps=timestamps), filepath)
+        self.assertEqual(len(calls), 1)
+        new_filepath = get_cached_file(os.path.join("plots", "a.png"), generator,
+                                       timestamps=[datetime.datetime(2015, 1, 2)])
+        self.assertNotEqual(new_filepath, filepath)
+        self.assertEqual(len(calls), 2)
+
+    def test_prune_removes_least_recently_used(self):
+        filepaths = []
+        for i in range(4):
+            filepath = get_cached_file(os.path.join("plots", "{}.png".format(i)), lambda: 100 * b"x")
+            os.utime(filepath, (1000 + i, 1000 + i))
+            filepaths.append(filepath)
+        os.utime(filepaths[0], None)
+        prune_file_cache("plots", 250)
+        self.assertEqual([os.path.exists(filepath) for filepath in filepaths], [True, False, False, True])
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+import io, unittest
+from django.test import TestCase
+from django.test.client import Client
+from samples.utils.columnar_export import get_tables, pyarrow
+from institute.models import ClusterToolDeposition, FiveChamberDeposition
+
+
+class ColumnarExportTest(TestCase):
+    fixtures = ["test_main"]
+    urls = "institute.tests.urls"
+
+    def setUp(self):
+        self.client = Client()
+        assert self.client.login(username="juliabase", password="12345")
+
+    def test_tables(self):
+        self.assertEqual([table.name for table in get_tables(ClusterToolDeposition)],
+                         ["cluster_tool_deposition", "cluster_tool_deposition__layers",
+                          "cluster_tool_deposition__layers__cluster_tool_hot_wire_layer",
+                          "cluster_tool_deposition__layers__cluster_tool_pecvd_layer"])
+        main_table = get_tables(FiveChamberDeposition)[0]
+        columns = dict((name, type_) for name, __, type_ in main_table.columns)
+        self.assertEqual(columns["id"], "int64")
+        self.assertEqual(columns["timestamp"], "timestamp")
+        self.assertEqual(columns["operator_id"], "int64")
+        self.assertEqual(columns["number"], "string")
+        self.assertNotIn("content_type_id", columns)
+
+    def test_csv_download(self):
+        response = self.client.get("/columnar_export/FiveChamberDeposition/five_chamber_deposition__layers.csv")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"id,"))
+
+    @unittest.skipUnless(pyarrow, "pyarrow is not installed")
+    def test_parquet_and_arrow_download(self):
+        for format_, read in (("parquet", pyarrow.parquet.read_table),
+                              ("arrow", lambda infile: pyarrow.ipc.open_file(infile).read_all())):
+            response = self.client.get(
+                "/columnar_export/FiveChamberDeposition/five_chamber_deposition__layers." + format_)
+            self.assertEqual(response.status_code, 200)
+            table = read(io.BytesIO(b"".join(response.streaming_content)))
+            self.assertEqual(table.schema.field("sih4").type, pyarrow.float64())
+            self.assertTrue(any(value is not None for value in table.column("sih4").to_pylist()))
+
+    def test_unknown_table(self):
+        response = self.client.get("/columnar_export/FiveChamberDeposition/samples.csv")
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+import os.path, shutil, tempfile, codecs
+from django.test import SimpleTestCase
+from samples.utils.crawler_logs import CrawlerLog
+
+
+def append_run(filepath, timestamp):
+    with codecs.open(filepath, "a", encoding="utf-8") as log_file:
+        log_file.write("{0} INFO     started crawling\n"
+                       "{0} WARNING  Sample “14-JS-1” not found\n"
+                       "Traceback (most recent call last):\n"
+                       "{0} INFO     finished crawling\n".format(timestamp))
+
+
+class CrawlerLogTest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.directory, "five_chamber_deposition.log")
+        append_run(self.filepath, "2015-01-01 10:00:00")
+        append_run(self.filepath, "2015-01-02 10:00:00")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_runs(self):
+        with CrawlerLog(self.filepath) as log:
+            self.assertEqual([timestamp.day for __, timestamp in log.runs], [1, 2])
+            self.assertEqual(len(list(log.get_lines())), 4)
+            self.assertEqual([line.text for line in log.get_lines(0, "WARNING")],
+                             ["WARNING  Sample “14-JS-1” not found\n", "Traceback (most recent call last):\n"])
+
+    def test_incremental_index(self):
+        CrawlerLog(self.filepath).close()
+        self.assertTrue(os.path.exists(self.filepath + ".index"))
+        append_run(self.filepath, "2015-01-03 10:00:00")
+        with CrawlerLog(self.filepath) as log:
+            self.assertEqual([timestamp.day for __, timestamp in log.runs], [1, 2, 3])
+        open(self.filepath, "w").close()
+        append_run(self.filepath, "2015-02-01 10:00:00")
+        with CrawlerLog(self.filepath) as log:
+            self.assertEqual([timestamp.month for __, timestamp in log.runs], [2])
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+import shutil, tempfile
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from samples.models import Sample, FeedEditedSamples
+from samples.utils.views import feed
+
+
+class FeedDeliveryTest(TestCase):
+    fixtures = ["test_main"]
+
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp()
+        self.originator = User.objects.get(username="juliabase")
+        self.watcher = User.objects.get(username="s.renard")
+        self.sample = Sample.objects.get(name="14-JS-1")
+        self.responsible_person = self.sample.currently_responsible_person
+        self.sample.watchers.add(self.watcher)
+        self.watcher.samples_user_details.subscribed_feeds.add(ContentType.objects.get_for_model(Sample))
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_root)
+
+    def report(self, important=True):
+        feed.Reporter(self.originator).report_edited_samples(
+            [self.sample], {"description": "Edited.", "important": important})
+        return FeedEditedSamples.objects.filter(samples=self.sample).order_by("-id").first()
+
+    def test_immediate_fan_out(self):
+        entry = self.report()
+        self.assertEqual(set(entry.users.all()), {self.responsible_person, self.watcher})
+        self.watcher.samples_user_details.only_important_news = True
+        self.watcher.samples_user_details.save()
+        entry = self.report(important=False)
+        self.assertEqual(set(entry.users.all()), {self.responsible_person})
+
+    def test_deferred_fan_out(self):
+        with override_settings(DEFERRED_FEED_FAN_OUT=True, CACHE_ROOT=self.cache_root):
+            entry = self.report()
+            self.assertEqual(list(entry.users.all()), [])
+            call_command("deliver_feed_entries", once=True)
+        self.assertEqual(set(entry.users.all()), {self.responsible_person, self.watcher})
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+
+
+from __future__ import absolute_import, unicode_literals
+
+import decimal, datetime
+from django.test import TestCase
+from django.db.models import F
+from samples.models import Sample, Process
+from institute.models import FiveChamberDeposition, InformalLayer
+from institute.utils import informal_layers
+
+
+def update_informal_layers(self, sample, process, informal_layers, process_layers, modified_layers, informal_layer):
+    """Stack hook for the tests: Every process contributes one layer with its
+    comments.
+    """
+    if process_layers:
+        layer = process_layers[0]
+        if layer.comments != self.comments:
+            layer.comments = self.comments
+            modified_layers.add(layer)
+    else:
+        layer = informal_layer(comments=self.comments, color="red", thickness=decimal.Decimal("100"))
+    informal_layers.append(layer)
+
+
+class InformalLayersTest(TestCase):
+    fixtures = ["test_main"]
+
+    def setUp(self):
+        FiveChamberDeposition.update_informal_layers = update_informal_layers
+        self.sample = Sample.objects.get(pk=1)
+        self.sample.sample_details.informal_layers.all().delete()
+        self.depositions = dict((deposition.pk, deposition) for deposition in FiveChamberDeposition.objects.all())
+        self.depositions[2].save()
+        self.depositions[4].samples.add(self.sample)
+        self.depositions[6].samples.add(self.sample)
+
+    def tearDown(self):
+        del FiveChamberDeposition.update_informal_layers
+
+    def stack(self):
+        return list(self.sample.sample_details.informal_layers.values_list("process", "comments"))
+
+    def assert_stack(self, process_ids):
+        stack = self.stack()
+        self.assertEqual([process_id for process_id, __ in stack], process_ids)
+        self.sample.sample_details.informal_layers.all().delete()
+        first_process = FiveChamberDeposition.objects.filter(samples=self.sample).order_by("timestamp")[0]
+        informal_layers.update_stack(self.sample, first_process)
+        self.assertEqual(self.stack(), stack)
+
+    def test_added_samples(self):
+        self.assert_stack([2, 4, 6])
+
+    def test_removed_samples(self):
+        self.depositions[4].samples.remove(self.sample)
+        self.assert_stack([2, 6])
+        self.depositions[6].samples.clear()
+        self.assert_stack([2])
+
+    def test_edited_middle_process(self):
+        self.depositions[4].comments = "Edited"
+        self.depositions[4].save()
+        self.assertEqual(self.stack()[1], (4, "Edited"))
+        self.assert_stack([2, 4, 6])
+
+    def test_added_later_process(self):
+        self.depositions[8].samples.add(self.sample)
+        self.assert_stack([2, 4, 6, 8])
+
+    def test_added_back_dated_process(self):
+        FiveChamberDeposition.objects.filter(pk=8).update(timestamp=datetime.datetime(2014, 9, 1))
+        FiveChamberDeposition.objects.get(pk=8).samples.add(self.sample)
+        self.assert_stack([8, 2, 4, 6])
+
+    def test_reordered_timestamps(self):
+        self.depositions[6].timestamp = datetime.datetime(2014, 10, 2, 11)
+        self.depositions[6].save()
+        self.assert_stack([2, 6, 4])
+
+    def test_earlier_process_without_hook(self):
+        self.sample.sample_details.informal_layers.update(index=F("index") + 10)
+        InformalLayer.objects.create(sample_details=self.sample.sample_details, index=1, process=Process.objects.get(pk=1),
+                                     color="blue", thickness=decimal.Decimal("1000"))
+        self.depositions[4].save()
+        self.assert_stack([2, 4, 6])
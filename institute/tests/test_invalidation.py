@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import, unicode_literals
+
+import datetime
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from jb_common.utils.base import get_cache_version
+from samples.models import Sample, SampleSplit, SampleGenealogy
+from samples.utils.invalidation import coalesced_touches, begin_request, end_request
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class SplitFamilyTest(TestCase):
+    fixtures = ["test_main"]
+
+    def setUp(self):
+        self.user = user = User.objects.get(username="juliabase")
+        self.parent = Sample.objects.get(name="14-JS-1")
+        self.split = split = SampleSplit.objects.create(operator=user, timestamp=datetime.datetime.now(), parent=self.parent)
+        self.piece = Sample.objects.create(name="14-JS-1-a", current_location="Office", currently_responsible_person=user,
+                                           split_origin=split, topic=self.parent.topic)
+        self.long_ago = datetime.datetime(2000, 1, 1)
+        Sample.objects.filter(pk=self.parent.pk).update(last_modified=self.long_ago)
+
+    def parent_last_modified(self):
+        return Sample.objects.get(pk=self.parent.pk).last_modified
+
+    def test_piece_touches_parent(self):
+        version = get_cache_version("sample:{0}".format(self.parent.pk))
+        self.piece.save()
+        self.assertGreater(self.parent_last_modified(), self.long_ago)
+        self.assertNotEqual(get_cache_version("sample:{0}".format(self.parent.pk)), version)
+
+    def test_coalesced_touches(self):
+        with coalesced_touches():
+            self.piece.save()
+            self.piece.save()
+            self.assertEqual(self.parent_last_modified(), self.long_ago)
+        self.assertGreater(self.parent_last_modified(), self.long_ago)
+
+    def test_deferred_expiry(self):
+        version = get_cache_version("sample:{0}".format(self.parent.pk))
+        begin_request()
+        try:
+            self.piece.save()
+            self.assertGreater(self.parent_last_modified(), self.long_ago)
+            self.assertEqual(get_cache_version("sample:{0}".format(self.parent.pk)), version)
+        finally:
+            end_request()
+        self.assertNotEqual(get_cache_version("sample:{0}".format(self.parent.pk)), version)
+
+    def test_expiry_after_exception(self):
+        version = get_cache_version("sample:{0}".format(self.parent.pk))
+        with self.assertRaises(ZeroDivisionError):
+            with coalesced_touches():
+                self.piece.save()
+                1 / 0
+        self.assertEqual(self.parent_last_modified(), self.long_ago)
+        self.assertNotEqual(get_cache_version("sample:{0}".format(self.parent.pk)), version)
+
+    def test_genealogy(self):
+        split = SampleSplit.objects.create(operator=self.user, timestamp=datetime.datetime.now(), parent=self.piece)
+        grandchild = Sample.objects.create(name="14-JS-1-a-1", current_location="Office",
+                                           currently_responsible_person=self.user, split_origin=split)
+        self.assertEqual(set(SampleGenealogy.objects.filter(descendant=grandchild).
+                             values_list("ancestor", "depth", "cutoff_timestamp")),
+                         {(self.piece.pk, 1, split.timestamp), (self.parent.pk, 2, self.split.timestamp)})
+        self.piece.split_origin = None
+        self.piece.save()
+        self.assertEqual(list(SampleGenealogy.objects.filter(descendant=grandchild).values_list("ancestor", flat=True)),
+                         [self.piece.pk])
@@ -121,6 +121,11 @@ class MainFeaturesTest(TestCase):
         response = self.client.get("/feeds/juliabase+b45a8775d0")
         self.assertEqual(response.status_code, 200)
 
+    def test_newsfeed_not_modified(self):
+        response = self.client.get("/feeds/juliabase+b45a8775d0")
+        response = self.client.get("/feeds/juliabase+b45a8775d0", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
     def test_my_layers(self):
         response = self.client.get("/my_layers/juliabase")
         self.assertEqual(response.status_code, 200)
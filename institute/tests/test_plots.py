@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import, unicode_literals
+
+import os, io, shutil, tempfile, math
+from django.test import SimpleTestCase
+from samples.utils.plots import PlotError, read_plot_file_without_comments
+from institute.utils.base import read_solarsimulator_plot_file
+
+
+class PlotFileTest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "measurement.dat")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, content):
+        with io.open(self.filename, "w", encoding="cp1252") as outfile:
+            outfile.write(content)
+
+    def test_invalid_cells(self):
+        self.write("# Positions: 1 2\n0.1 1,5 n/a\n0.2 2.5 3.5\n")
+        voltages, currents = read_plot_file_without_comments(self.filename, (0, 2))
+        self.assertTrue(math.isnan(currents[0]))
+        self.assertEqual(currents[1], 3.5)
+        with self.assertRaises(PlotError):
+            read_solarsimulator_plot_file(self.filename, "2")
+        voltages, currents = read_solarsimulator_plot_file(self.filename, "1")
+        self.assertEqual(list(currents), [1.5, 2.5])
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+import json
+from django.test import TestCase, override_settings
+from django.test.client import Client
+from django.contrib.auth.models import User
+from samples.models import Sample, SampleAlias
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class PrimaryKeysVersionsTest(TestCase):
+    fixtures = ["test_main"]
+    urls = "institute.tests.urls"
+
+    def setUp(self):
+        self.client = Client()
+        assert self.client.login(username="juliabase", password="12345")
+        self.sample = Sample.objects.get(name="14-JS-1")
+
+    def get_versions(self):
+        response = self.client.get("/primary_keys/versions", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode("utf-8"))
+
+    def test_rename(self):
+        versions = self.get_versions()
+        self.sample.name = "14-JS-1a"
+        self.sample.save()
+        new_versions = self.get_versions()
+        self.assertNotEqual(new_versions["samples"], versions["samples"])
+        self.assertEqual(new_versions["users"], versions["users"])
+
+    def test_other_changes(self):
+        versions = self.get_versions()
+        self.sample.current_location = "Basement"
+        self.sample.save()
+        self.assertEqual(self.get_versions(), versions)
+
+    def test_new_user(self):
+        versions = self.get_versions()
+        User.objects.create(username="n.newcomer")
+        new_versions = self.get_versions()
+        self.assertNotEqual(new_versions["users"], versions["users"])
+        self.assertEqual(new_versions["samples"], versions["samples"])
+
+    def test_alias(self):
+        versions = self.get_versions()
+        alias = SampleAlias.objects.create(name="14-JS-1-old", sample=self.sample)
+        new_versions = self.get_versions()
+        self.assertNotEqual(new_versions["samples"], versions["samples"])
+        alias.delete()
+        self.assertNotEqual(self.get_versions()["samples"], new_versions["samples"])
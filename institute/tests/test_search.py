@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+import json
+from django.test import TestCase, SimpleTestCase
+from django.test.client import Client
+from django.http import QueryDict
+from django.contrib.auth.models import User
+from jb_common.utils.base import get_all_models
+from samples.management.commands.benchmark_search import nested_query_set
+from samples.models import Sample
+from samples.utils import sample_search
+from samples.utils.sample_search import NgramIndex
+from institute.models import PDSMeasurement
+
+
+class SearchTreeTest(TestCase):
+    fixtures = ["test_main"]
+
+    def assert_same_results(self, query_string):
+        """Asserts that the compiled query of a search finds the same objects as
+        the nested subqueries, and returns the primary keys of the found
+        objects.
+        """
+        data = QueryDict(query_string)
+        search_tree = get_all_models()[data["_model"]].get_search_tree_node()
+        search_tree.parse_data(data, "")
+        self.assertTrue(search_tree.is_valid())
+        compiled = set(search_tree.get_query_set().values_list("pk", flat=True))
+        self.assertEqual(compiled, set(nested_query_set(search_tree).values_list("pk", flat=True)))
+        return compiled
+
+    def test_process_subclass(self):
+        self.assertTrue(self.assert_same_results(
+            "_model=Sample&1-_model=FiveChamberDeposition&1-_old_model=FiveChamberDeposition"))
+
+    def test_nested_relations(self):
+        self.assertTrue(self.assert_same_results(
+            "_model=Sample&1-_model=FiveChamberDeposition&1-_old_model=FiveChamberDeposition"
+            "&1-1-_model=FiveChamberLayer&1-1-_old_model=FiveChamberLayer"))
+
+    def test_same_relation_twice(self):
+        PDSMeasurement.objects.get(pk=25).samples.add(Sample.objects.get(pk=1))
+        self.assertEqual(self.assert_same_results(
+            "_model=Sample&1-_model=FiveChamberDeposition&1-_old_model=FiveChamberDeposition"
+            "&2-_model=PDSMeasurement&2-_old_model=PDSMeasurement"), {1})
+
+    def test_no_conditions(self):
+        self.assertEqual(self.assert_same_results("_model=Sample"), set(range(1, 13)))
+
+
+class NgramIndexTest(SimpleTestCase):
+
+    def test_find(self):
+        index = NgramIndex()
+        index.add(1, "14S-001")
+        index.add(2, "14-JS-1")
+        index.add(2, "old-name")
+        self.assertEqual(index.find("s-00"), {1})
+        self.assertEqual(index.find("OLD"), {2})
+        self.assertEqual(index.find("1"), {1, 2})
+        self.assertEqual(index.find("14-js-2"), set())
+
+
+class SampleSearchTest(TestCase):
+    fixtures = ["test_main"]
+    urls = "institute.tests.urls"
+
+    def setUp(self):
+        self.client = Client()
+        assert self.client.login(username="juliabase", password="12345")
+
+    def autocomplete(self, query_string):
+        response = self.client.get("/autocomplete/samples?" + query_string)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode("utf-8"))
+
+    def test_ranking(self):
+        self.assertEqual(self.autocomplete("q=js-1"), ["14-JS-1"])
+        self.assertEqual(self.autocomplete("q=14S-00&limit=3"), ["14S-001", "14S-002", "14S-003"])
+        self.assertEqual(self.autocomplete("q=14")[:2], ["14-JS-1", "14-JS-2"])
+
+    def test_chunks(self):
+        results = self.autocomplete("q=14&limit=5")
+        old_chunk_size, sample_search.chunk_size = sample_search.chunk_size, 2
+        try:
+            self.assertEqual(self.autocomplete("q=14&limit=5"), results)
+        finally:
+            sample_search.chunk_size = old_chunk_size
+
+    def test_outdated_index(self):
+        names, aliases = NgramIndex(), NgramIndex()
+        aliases.add(1, "renamed")
+        old_get_ngram_indices = sample_search.get_ngram_indices
+        sample_search.get_ngram_indices = lambda: (names, aliases)
+        try:
+            found_samples, more = sample_search.search_samples(User.objects.get(username="juliabase"), "renamed",
+                                                               aliases=True)
+        finally:
+            sample_search.get_ngram_indices = old_get_ngram_indices
+        self.assertEqual([sample.name for sample in found_samples], ["14S-001"])
+
+    def test_search_view(self):
+        response = self.client.get("/samples/", {"name_pattern": "14S-002", "aliases": "on"})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "14S-002")
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import, unicode_literals
+
+import decimal
+from django.test import SimpleTestCase
+from institute import informal_stacks
+from institute.models import InformalLayer
+
+
+class StackDiagramsTest(SimpleTestCase):
+
+    def layers(self, thickness):
+        return [informal_stacks.Layer(InformalLayer(classification="glass", color="lightblue",
+                                                    thickness=decimal.Decimal("1100000"), verified=True)),
+                informal_stacks.Layer(InformalLayer(comments="ZnO", color="lightgrey", thickness=thickness,
+                                                    verified=True))]
+
+    def test_stack_hash(self):
+        self.assertEqual(informal_stacks.get_stack_hash(self.layers(decimal.Decimal("800"))),
+                         informal_stacks.get_stack_hash(self.layers(decimal.Decimal("800"))))
+        self.assertNotEqual(informal_stacks.get_stack_hash(self.layers(decimal.Decimal("800"))),
+                            informal_stacks.get_stack_hash(self.layers(decimal.Decimal("900"))))
+
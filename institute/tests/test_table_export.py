@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+from django.test import SimpleTestCase
+from samples.data_tree import DataNode, DataItem
+from samples.views.table_export import build_column_group_list, build_column_group_list_for_rows, flatten_tree, \
+    generate_table_rows, prepare_row_trees, iterate_table_rows
+
+
+def create_row_trees():
+    for i in range(3):
+        row_tree = DataNode("sample", "sample {0}".format(i))
+        row_tree.items = [DataItem("name", "sample {0}".format(i))]
+        for j in range(i + 1):
+            layer = DataNode("layer")
+            layer.items = [DataItem("thickness", 10 * j)]
+            if i == 2:
+                layer.items.append(DataItem("remarks", "thick"))
+            row_tree.children.append(layer)
+        yield row_tree
+
+
+class StreamingTableExportTest(SimpleTestCase):
+
+    def test_same_as_table(self):
+        root = DataNode("samples")
+        root.children = list(create_row_trees())
+        root.find_unambiguous_names()
+        root.complete_items_in_children()
+        column_groups, columns = build_column_group_list(root)
+        selected_columns = list(range(len(columns)))
+        table = generate_table_rows(flatten_tree(root), columns, selected_columns,
+                                    [row.descriptive_name for row in root.children], "sample")
+        streaming_column_groups, streaming_columns = \
+            build_column_group_list_for_rows(prepare_row_trees(create_row_trees()))
+        self.assertEqual([column.heading for column in streaming_columns], [column.heading for column in columns])
+        rows = iterate_table_rows(prepare_row_trees(create_row_trees()), streaming_columns, selected_columns,
+                                  True, "sample")
+        self.assertEqual(list(rows), table)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import, unicode_literals
+import django.utils.six as six
+
+import struct, zlib
+from PIL import Image
+from django.test import SimpleTestCase
+from samples.utils import thumbnails
+
+
+def png(width):
+    def chunk(type_, data):
+        checksum = zlib.crc32(type_ + data) & 0xffffffff
+        return struct.pack(str(">I"), len(data)) + type_ + data + struct.pack(str(">I"), checksum)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(str(">IIBBBBB"), width, 1, 8, 0, 0, 0, 0)) + \
+        chunk(b"IDAT", zlib.compress((width + 1) * b"\0")) + chunk(b"IEND", b"")
+
+
+class ThumbnailsTest(SimpleTestCase):
+
+    def image_file(self, size, mode, format_):
+        infile = six.BytesIO()
+        Image.new(mode, size).save(infile, format_)
+        infile.seek(0)
+        return infile
+
+    def test_split_png_stream(self):
+        images = [png(1), png(5), png(3)]
+        self.assertEqual(thumbnails._split_png_stream(b"".join(images)), images)
+
+    def test_jpeg(self):
+        thumbnail = thumbnails.generate_thumbnail(self.image_file((2000, 1000), "RGB", "JPEG"), "jpeg", 400)
+        image = Image.open(six.BytesIO(thumbnail))
+        self.assertEqual((image.format, image.size), ("JPEG", (400, 200)))
+
+    def test_small_palette_png(self):
+        thumbnail = thumbnails.generate_thumbnail(self.image_file((100, 300), "P", "PNG"), "png", 400)
+        image = Image.open(six.BytesIO(thumbnail))
+        self.assertEqual((image.format, image.size), ("PNG", (100, 300)))
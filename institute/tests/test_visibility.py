@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from __future__ import absolute_import, unicode_literals
+
+from django.test import TestCase
+from django.contrib.auth.models import User, Group, Permission
+from samples.models import Sample, Clearance, SampleVisibility
+from samples.utils import visibility
+
+
+class SampleVisibilityTest(TestCase):
+    fixtures = ["test_main"]
+
+    def setUp(self):
+        self.user = User.objects.get(username="s.renard")
+        self.sample = Sample.objects.get(name="14-JS-1")
+        self.topic = self.sample.topic
+
+    def test_consistent_after_loading(self):
+        self.assertEqual(visibility.check(), [])
+
+    def test_confidential_topic(self):
+        self.topic.confidential = True
+        self.topic.save()
+        self.assertIsNone(visibility.get_level(self.user, self.sample))
+        self.topic.members.add(self.user)
+        self.assertEqual(visibility.get_level(self.user, self.sample), SampleVisibility.full)
+        self.topic.members.remove(self.user)
+        Clearance.objects.create(user=self.user, sample=self.sample)
+        self.assertEqual(visibility.get_level(self.user, self.sample), SampleVisibility.via_clearance)
+        self.assertEqual(visibility.check(), [])
+
+    def test_responsible_person(self):
+        self.sample.currently_responsible_person = self.user
+        self.sample.save()
+        self.assertEqual(visibility.get_level(self.user, self.sample), SampleVisibility.full)
+        self.assertEqual(visibility.check(), [])
+
+    def test_group_permission(self):
+        user = User.objects.get(username="r.calvert")
+        self.assertEqual(visibility.get_level(user, self.sample), SampleVisibility.name_only)
+        group = Group.objects.create(name="Sample viewers")
+        group.permissions.add(Permission.objects.get(codename="view_every_sample", content_type__app_label="samples"))
+        group.user_set.add(user)
+        self.assertEqual(visibility.get_level(user, self.sample), SampleVisibility.full)
+        group.user_set.remove(user)
+        self.assertEqual(visibility.get_level(user, self.sample), SampleVisibility.name_only)
+        group.user_set.add(user)
+        group.user_set.clear()
+        self.assertEqual(visibility.get_level(user, self.sample), SampleVisibility.name_only)
+        user.groups.add(group)
+        group.permissions.clear()
+        self.assertEqual(visibility.get_level(user, self.sample), SampleVisibility.name_only)
+        self.assertEqual(visibility.check(), [])
@@ -22,12 +22,10 @@
 
 
 from __future__ import absolute_import, unicode_literals, division
-from django.utils.six.moves import cStringIO as StringIO
 
-import datetime, re
-import numpy
+import datetime, re, codecs
 from samples import models
-from samples.utils.plots import PlotError
+from samples.utils.plots import PlotError, read_plot_file_without_comments
 from institute.views.samples import json_client
 
 
@@ -95,27 +93,22 @@ def read_solarsimulator_plot_file(filename, position):
     :return:
       all voltages in Volt, then all currents in Ampere
 
-    :rtype: list of float, list of float
+    :rtype: numpy.ndarray, numpy.ndarray
 
     :raises PlotError: if something wents wrong with interpreting the file (I/O,
         unparseble data)
     """
+    positions = []
     try:
-        datafile_content = StringIO(open(filename).read())
+        with codecs.open(filename, encoding="cp1252") as datafile:
+            for line in datafile:
+                if line.startswith("# Positions:"):
+                    positions = line.partition(":")[2].split()
+                    break
     except IOError:
         raise PlotError("Data file could not be read.")
-    for line in datafile_content:
-        if line.startswith("# Positions:"):
-            positions = line.partition(":")[2].split()
-            break
-    else:
-        positions = []
     try:
         column = positions.index(position) + 1
     except ValueError:
         raise PlotError("Cell position not found in the datafile.")
-    datafile_content.seek(0)
-    try:
-        return numpy.loadtxt(datafile_content, usecols=(0, column), unpack=True)
-    except ValueError:
-        raise PlotError("Data file format was invalid.")
+    return read_plot_file_without_comments(filename, (0, column), strict=True)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Incremental maintenance of the informal layer stacks of samples.  When a
+physical process is changed, only the slice of the stack which belongs to this
+process and to all later processes of the sample is recomputed.  The layers
+below this slice are left untouched.  Thus, the ``update_informal_layers``
+methods of the processes before the changed one are not called; their layers
+are kept as they are.  Only if the stored stack is not in the order of the
+processes, the whole stack is recomputed.
+
+See :py:func:`institute.signals.update_informal_layers` for the signature of
+the ``update_informal_layers`` methods of the process classes.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F, Case, When, Value, PositiveIntegerField
+from jb_common.utils.base import resolve_actual_instances
+import samples.models
+from institute import models
+
+
+def _append_non_process_layers(informal_layers, non_process_layers, consumed_layers=None):
+    """Appends old informal layers not connected with a process to the new
+    informal stack.  First, the `consumed_layers` are marked as “already added
+    to the stack”, so that the non-process layers know which of them is next
+    for being added to the stack.
+
+    :param informal_layers: the new informal stack; it is extended in place
+    :param non_process_layers: the not yet added layers not connected with a
+        process, mapping to the old layers below them which have not been
+        added yet; it is modified in place
+    :param consumed_layers: the layers which have just been added to the stack
+
+    :type informal_layers: list of `institute.models.InformalLayer`
+    :type non_process_layers: dict mapping `institute.models.InformalLayer` to
+      set of `institute.models.InformalLayer`
+    :type consumed_layers: list of `institute.models.InformalLayer`
+    """
+    if consumed_layers:
+        for sub_layers in non_process_layers.values():
+            sub_layers.difference_update(consumed_layers)
+    while non_process_layers:
+        next_layers = [layer for layer, sub_layers in non_process_layers.items() if not sub_layers]
+        if not next_layers:
+            break
+        assert len(next_layers) == 1
+        next_layer = next_layers[0]
+        informal_layers.append(next_layer)
+        del non_process_layers[next_layer]
+        one_removed = False
+        for sub_layers in non_process_layers.values():
+            if next_layer in sub_layers:
+                sub_layers.remove(next_layer)
+                one_removed = True
+        assert not non_process_layers or one_removed
+
+
+def _has_stack_hook(content_type_id):
+    """Returns whether the process class of the content type contributes to
+    informal stacks.
+    """
+    return hasattr(ContentType.objects.get_for_id(content_type_id).model_class(), "update_informal_layers")
+
+
+def _write_stack(sample_details, old_layers, informal_layers, modified_layers):
+    """Writes a recomputed informal stack to the database.  Layers which are
+    not part of the stack anymore are deleted, and the indices of all other
+    layers are updated with two ``UPDATE`` queries: The first one moves them
+    above all existing indices, the second one sets the new indices.  This
+    way, the uniqueness of the indices is never violated.  Only modified
+    layers are saved one by one, and new layers are created at once.
+    """
+    sample_details.informal_layers.exclude(pk__in=[layer.pk for layer in informal_layers if layer.pk]).delete()
+    new_indices = {}
+    new_layers = []
+    for index, layer in enumerate(informal_layers, 1):
+        if layer.pk is None:
+            new_layers.append(layer)
+        elif layer.index != index:
+            new_indices[layer.pk] = index
+        layer.index = index
+    if new_indices:
+        offset = max([layer.index for layer in old_layers] + [len(informal_layers)]) + 1
+        changed_layers = models.InformalLayer.objects.filter(pk__in=list(new_indices))
+        changed_layers.update(index=F("index") + offset)
+        changed_layers.update(index=Case(*[When(pk=pk, then=Value(index)) for pk, index in new_indices.items()],
+                                         output_field=PositiveIntegerField()))
+    for layer in modified_layers:
+        if layer.pk is not None:
+            layer.verified = False
+            layer.save(with_relations=False)
+    models.InformalLayer.objects.bulk_create(new_layers)
+
+
+def update_stack(sample, process):
+    """Recomputes the informal stack of a sample after a process of it has
+    changed, or after a process was added to or removed from the sample.  If
+    the process was removed, its layers are dropped, and the whole stack is
+    recomputed.
+
+    :param sample: the sample the stack of which should be updated
+    :param process: the process which was changed; it must be the actual
+        instance
+
+    :type sample: `samples.models.Sample`
+    :type process: `samples.models.PhysicalProcess`
+    """
+    sample_details = sample.sample_details
+    old_layers = list(sample_details.informal_layers.all())
+    sample_processes = list(sample.processes.values_list("id", "content_type_id"))
+    process_ids = [process_id for process_id, __ in sample_processes]
+    try:
+        position = process_ids.index(process.id)
+    except ValueError:
+        if not any(layer.process_id == process.id for layer in old_layers):
+            return
+        position = 0
+    earlier_process_ids = set(process_id for process_id, content_type_id in sample_processes[:position]
+                              if _has_stack_hook(content_type_id))
+    later_process_ids = set(process_ids[position:])
+    boundary = min([layer.index for layer in old_layers if layer.process_id in later_process_ids] or
+                   [max([layer.index for layer in old_layers] or [0]) + 1])
+    if any(layer.process_id in earlier_process_ids for layer in old_layers if layer.index >= boundary):
+        position, boundary = 0, min([layer.index for layer in old_layers] or [0])
+        earlier_process_ids = set()
+    informal_layers = [layer for layer in old_layers if layer.index < boundary and
+                       (layer.process_id is None or layer.process_id in earlier_process_ids)]
+    old_slice = [layer for layer in old_layers if layer.index >= boundary]
+    non_process_layers = dict((layer, set(sub_layer for sub_layer in old_slice if sub_layer.index < layer.index))
+                              for layer in old_slice if not layer.process_id)
+    _append_non_process_layers(informal_layers, non_process_layers)
+    hook_process_ids = [process_id for process_id, content_type_id in sample_processes[position:]
+                        if _has_stack_hook(content_type_id)]
+    other_processes = resolve_actual_instances(samples.models.Process.objects.filter(
+        pk__in=[process_id for process_id in hook_process_ids if process_id != process.id]))
+    other_processes = dict((other_process.id, other_process) for other_process in other_processes)
+    modified_layers = set()
+    for process_id in hook_process_ids:
+        current_process = process if process_id == process.id else other_processes.get(process_id)
+        if current_process is None:
+            continue
+        process_layers = [layer for layer in old_slice if layer.process_id == process_id]
+        current_process.update_informal_layers(
+            sample, process, informal_layers, process_layers, modified_layers,
+            lambda **kwargs: models.InformalLayer(sample_details=sample_details, process=current_process, **kwargs))
+        _append_non_process_layers(informal_layers, non_process_layers, process_layers)
+    informal_layers.extend(sorted(non_process_layers, key=lambda layer: layer.index))
+    with transaction.atomic():
+        _write_stack(sample_details, old_layers, informal_layers, modified_layers)
+
+
+def update_stacks(process):
+    """Recomputes the informal stacks of all samples of a process after it has
+    changed.
+
+    :param process: the process which was changed; it must be the actual
+        instance
+
+    :type process: `samples.models.PhysicalProcess`
+    """
+    for sample in process.samples.select_related("sample_details"):
+        update_stack(sample, process)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase-Institute, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# In particular, you may modify this file freely and even remove this license,
+# and offer it as part of a web service, as long as you do not distribute it.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Rendering and caching of the informal layer stack diagrams of samples, see
+:py:mod:`institute.informal_stacks`.  PDFs are rendered in memory on every
+request, which takes only a few milliseconds.  Thumbnails are stored in the
+file cache below ``settings.CACHE_ROOT``.  Their file name is the hash of the
+appearance of the stack (see
+:py:func:`institute.informal_stacks.get_stack_hash`) rather than the
+modification timestamp of the sample.  Thus, they survive changes of the
+sample which don't affect its stack, and samples with identical stacks share
+their thumbnail.  Missing thumbnails of many samples are rendered in one
+pass, so that a page with many thumbnails doesn't start one Ghostscript process
+per thumbnail.
+"""
+
+from __future__ import absolute_import, unicode_literals
+import django.utils.six as six
+
+import os.path, collections
+from django.conf import settings
+from django.utils.translation import ugettext as _
+from jb_common.utils.base import write_file_atomically
+from samples.utils.thumbnails import rasterize_pdf
+from institute import models, informal_stacks
+
+
+thumbnail_resolution = 100
+"""Resolution of the thumbnails in dpi.
+"""
+
+cache_max_size = 100 * 1024**2
+"""Maximal total size in bytes of the thumbnails in the file cache.  If it is
+exceeded, the least recently used thumbnails are removed by the
+``maintenance`` management command.
+"""
+
+
+def get_layers(sample_details_list):
+    """Returns the layers of the stack diagrams of many samples.  All informal
+    layers are fetched with one query.  Samples without informal layers are
+    left out.
+
+    :param sample_details_list: the sample details of the samples
+
+    :type sample_details_list: iterable of `institute.models.SampleDetails`
+
+    :return:
+      the layers of the stacks in chronological order, mapping the primary keys
+      of the sample details to them
+
+    :rtype: dict mapping int to list of `institute.informal_stacks.Layer`
+    """
+    stacks = collections.OrderedDict()
+    for informal_layer in models.InformalLayer.objects.filter(
+            sample_details__in=[sample_details.pk for sample_details in sample_details_list]):
+        stacks.setdefault(informal_layer.sample_details_id, []).append(informal_stacks.Layer(informal_layer))
+    return stacks
+
+
+def generate_pdf(sample_details):
+    """Renders the stack diagram of a sample as a PDF.
+
+    :param sample_details: the sample details of the sample
+
+    :type sample_details: `institute.models.SampleDetails`
+
+    :return:
+      the PDF document
+
+    :rtype: bytes
+    """
+    sample = sample_details.sample
+    outfile = six.BytesIO()
+    informal_stacks.generate_diagram(outfile, get_layers([sample_details])[sample_details.pk],
+                                     six.text_type(sample), _("Layer stack of {0}").format(sample))
+    return outfile.getvalue()
+
+
+def get_thumbnail_path(layers):
+    """Returns the absolute path of the thumbnail of a stack in the file cache.
+    The file may not exist yet.
+
+    :param layers: the layers of the stack in chronological order
+
+    :type layers: list of `institute.informal_stacks.Layer`
+
+    :return:
+      the absolute path of the thumbnail
+
+    :rtype: unicode
+    """
+    return os.path.join(settings.CACHE_ROOT, "stacks", str(thumbnail_resolution),
+                        informal_stacks.get_stack_hash(layers) + ".png")
+
+
+def get_thumbnails(sample_details_list):
+    """Returns the thumbnails of the stack diagrams of many samples.  All
+    thumbnails which are not in the file cache yet are rendered into one PDF,
+    which is rasterized in one go.  Samples without informal layers are left
+    out.
+
+    :param sample_details_list: the sample details of the samples
+
+    :type sample_details_list: iterable of `institute.models.SampleDetails`
+
+    :return:
+      the absolute paths of the thumbnails in the file cache, mapping the
+      primary keys of the sample details to them
+
+    :rtype: dict mapping int to unicode
+    """
+    paths = {}
+    missing_stacks = collections.OrderedDict()
+    for sample_details_id, layers in get_layers(sample_details_list).items():
+        path = paths[sample_details_id] = get_thumbnail_path(layers)
+        if path not in missing_stacks:
+            try:
+                os.utime(path, None)
+            except OSError:
+                missing_stacks[path] = layers
+    if missing_stacks:
+        pdf = six.BytesIO()
+        informal_stacks.generate_diagrams(pdf, list(missing_stacks.values()), "Layer stacks", "Thumbnails")
+        for path, thumbnail in zip(missing_stacks, rasterize_pdf(pdf.getvalue(), thumbnail_resolution)):
+            write_file_atomically(path, thumbnail)
+    return paths
@@ -27,32 +27,15 @@
 from __future__ import absolute_import, unicode_literals
 import django.utils.six as six
 
-import subprocess, uuid, os
-from functools import partial
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.template import defaultfilters
-from django.utils.translation import ugettext as _
 import jb_common.utils.base
 from samples import permissions
 import samples.utils.views as utils
-from institute import models, informal_stacks
-
-
-def generate_stack(thumbnail, locations, sample, sample_details):
-    # FixMe: This should be implemented without writing to the disk.
-    pdf_filename = "/tmp/stack_{}.pdf".format(uuid.uuid4())
-    informal_stacks.generate_diagram(
-        pdf_filename, [informal_stacks.Layer(layer) for layer in sample_details.informal_layers.all()],
-        six.text_type(sample), _("Layer stack of {0}").format(sample))
-    if thumbnail:
-        content = subprocess.check_output(["gs", "-q", "-dNOPAUSE", "-dBATCH", "-sDEVICE=pngalpha", "-r100", "-dEPSCrop",
-                                           "-sOutputFile=-", pdf_filename])
-    else:
-        content = open(pdf_filename, "rb").read()
-    os.unlink(pdf_filename)
-    return content
+from institute import models
+from institute.utils import stack_diagrams
 
 
 @login_required
@@ -79,10 +62,10 @@ def show_stack(request, sample_id, thumbnail):
     permissions.get_sample_clearance(request.user, sample)
     if not sample_details.has_producible_stack_diagram():
         raise Http404("No stack diagram available.")
-    locations = sample_details.get_stack_diagram_locations()
-    filepath = locations["thumbnail_file" if thumbnail else "diagram_file"]
-    content = jb_common.utils.base.get_cached_file_content(
-        filepath, partial(generate_stack, thumbnail, locations, sample, sample_details), timestamps=[sample.last_modified])
-    return jb_common.utils.base.static_response(
-        content, None if thumbnail else "{0}_stack.pdf".format(defaultfilters.slugify(six.text_type(sample))),
-        "image/png" if thumbnail else "application/pdf")
+    if thumbnail:
+        return jb_common.utils.base.static_file_response(
+            stack_diagrams.get_thumbnails([sample_details])[sample_details.pk])
+    else:
+        return jb_common.utils.base.static_response(
+            stack_diagrams.generate_pdf(sample_details),
+            "{0}_stack.pdf".format(defaultfilters.slugify(six.text_type(sample))), "application/pdf")
@@ -25,14 +25,15 @@ from __future__ import absolute_import, unicode_literals
 import django.utils.six as six
 from django.utils.encoding import python_2_unicode_compatible
 
-import re, datetime, calendar, copy
+import re, datetime, calendar, copy, json
 from django import forms
 from django.utils.safestring import mark_safe
 from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _, ugettext
 from django.conf import settings
-from django.db import models
+from django.db import models, connections
 from django.db.models import Q
+from django.core.exceptions import FieldDoesNotExist
 import jb_common.utils.base as utils
 from jb_common import model_fields
 
@@ -487,13 +488,16 @@ def get_search_results(search_tree, max_results, base_query=None):
     wrapper around the ``get_query_set`` method of the top-level node in the
     search tree, and it serves three purposes:
 
-        1. It limits the number of found instances
+        1. It limits the number of found instances to the ``max_results`` ones
+           with the highest primary keys, i.e. the newest ones.
 
         2. It converts the result query into a list of model instances.
 
         3. If the top-level node is abstract, it finds the actual instance for
            each found object.
 
+    No exact count of all found instances is necessary for this.
+
     :param search_tree: the complete search tree of the search
     :param max_results: the maximal number of results to be returned
     :param base_query: the query set to be used as the starting point of the
@@ -512,15 +516,206 @@ def get_search_results(search_tree, max_results, base_query=None):
     # FixMe: The order_by() is necessary until
     # https://code.djangoproject.com/ticket/24254 is fixed.
     results = search_tree.get_query_set(base_query).order_by().distinct()
-    too_many_results = results.count() > max_results
-    if too_many_results:
-        results = results[:max_results]
-    results = search_tree.model_class.objects.filter(pk__in=results)
+    primary_keys = list(results.order_by("-pk").values_list("pk", flat=True)[:max_results + 1])
+    too_many_results = len(primary_keys) > max_results
+    results = search_tree.model_class.objects.filter(pk__in=primary_keys[:max_results])
     if isinstance(search_tree, AbstractSearchTreeNode):
-        results = [result.actual_instance for result in results]
+        results = utils.resolve_actual_instances(results)
     return results, too_many_results
 
 
+def iterate_search_results(search_tree, base_query=None, batch_size=200):
+    """Yields all found model instances for the given search, in the order of
+    their primary keys.  In contrast to `get_search_results`, there is no
+    limit, and the results are not held in memory all at once.  Instead, they
+    are fetched in batches with keyset pagination, i.e. every batch starts
+    after the highest primary key of the previous one.  This way, no batch is
+    more expensive than the first.  If the top-level node is abstract, the
+    actual instances are fetched with one query per model and batch.
+
+    :param search_tree: the complete search tree of the search
+    :param base_query: the query set to be used as the starting point of the
+        query; it is used to restrict the found items to what the user is
+        allowed to see
+    :param batch_size: the number of instances fetched with one query
+
+    :type search_tree: `SearchTreeNode`
+    :type base_query: QuerySet
+    :type batch_size: int
+
+    :return:
+      generator for the found model instances
+
+    :rtype: generator
+    """
+    results = search_tree.get_query_set(base_query).order_by().distinct()
+    last_primary_key = None
+    while True:
+        batch = results if last_primary_key is None else results.filter(pk__gt=last_primary_key)
+        primary_keys = list(batch.order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if not primary_keys:
+            break
+        instances = search_tree.model_class.objects.in_bulk(primary_keys)
+        instances = [instances[primary_key] for primary_key in primary_keys if primary_key in instances]
+        if isinstance(search_tree, AbstractSearchTreeNode):
+            instances = utils.resolve_actual_instances(instances)
+        for instance in instances:
+            yield instance
+        if len(primary_keys) < batch_size:
+            break
+        last_primary_key = primary_keys[-1]
+
+
+def estimate_count(query_set):
+    """Returns the number of rows of a query set as estimated by the database.
+    On PostgreSQL, this is the row estimate of the query planner, which is
+    much cheaper than a ``COUNT(*)`` but may be quite inaccurate.  On other
+    databases, the exact count is returned.
+
+    :param query_set: the query set whose rows should be counted
+
+    :type query_set: QuerySet
+
+    :return:
+      the (estimated) number of rows of the query set
+
+    :rtype: int
+    """
+    connection = connections[query_set.db]
+    if connection.vendor != "postgresql":
+        return query_set.count()
+    sql, params = query_set.values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, six.string_types):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def explain(query_set):
+    """Returns the plan of the database for a query set.
+
+    :param query_set: the query set whose plan should be returned
+
+    :type query_set: QuerySet
+
+    :return:
+      the query plan, as printed by the database's ``EXPLAIN`` command
+
+    :rtype: unicode
+    """
+    connection = connections[query_set.db]
+    sql, params = query_set.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(("EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN ") + sql, params)
+        return "\n".join(" ".join(six.text_type(column) for column in row) for row in cursor.fetchall())
+
+
+def _get_relation_path(model_class, relation, related_model_class):
+    """Returns the query path from a model to a related model.  This is the
+    name of the relation, possibly extended by the path from the model the
+    relation points to, down to one of its (multi-table inheritance)
+    descendants.  For example, the path from ``Sample`` to ``Result`` is
+    ``"processes__result"``.
+
+    :param model_class: the model class from which the relation starts
+    :param relation: the name of the relation, as given in
+        :py:attr:`SearchTreeNode.related_models`
+    :param related_model_class: the model at the other end of the path
+
+    :type model_class: class (decendant of models.Model)
+    :type relation: str
+    :type related_model_class: class (decendant of models.Model)
+
+    :return:
+      the query path, or ``None`` if it could not be determined
+
+    :rtype: str or NoneType
+    """
+    try:
+        target = model_class._meta.get_field(relation).related_model
+    except FieldDoesNotExist:
+        return None
+    if target is None:
+        return None
+    target = target._meta.concrete_model
+    path = []
+    current_model = related_model_class._meta.concrete_model
+    while current_model is not target:
+        for parent, link in current_model._meta.parents.items():
+            if link is not None and issubclass(parent, target):
+                # ``link.related_query_name()`` is wrong for parent links
+                # inherited from abstract models, so the name is taken from
+                # `current_model`.
+                path.insert(0, link.rel.related_query_name or link.rel.related_name or
+                            current_model._meta.model_name)
+                current_model = parent._meta.concrete_model
+                break
+        else:
+            return None
+    return "__".join([relation] + path)
+
+
+def _is_compilable(node):
+    """Returns whether a search tree node can be merged into the query of its
+    parent.  This is not the case for derived classes which override
+    `SearchTreeNode.get_query_set` but not `SearchTreeNode.compile_query`.
+    """
+    node_class = type(node)
+    return node_class.compile_query != SearchTreeNode.compile_query or \
+        node_class.get_query_set == SearchTreeNode.get_query_set
+
+
+def compile_related_nodes(model_class, related_models, nodes, prefix=""):
+    """Returns the conditions for related search tree nodes as one ``Q``
+    object.  The subtree of a related node is merged into the query with a
+    join, so that the database can plan the whole search at once instead of
+    one nested ``pk__in`` subquery per node.  All conditions of one subtree
+    refer to the same related row because they are part of the same
+    ``filter`` call.
+
+    However, if more than one related node uses the same relation, only the
+    first one is joined.  The others are added as subqueries, because two
+    nodes must be allowed to match different rows.  Such a subquery must not
+    refer to the relation itself: Within one ``filter`` call, Django would
+    reuse the join of the first node, so both nodes would have to match the
+    same related row.  Therefore, the subquery selects the primary keys of
+    `model_class`.  Subqueries are also used for nodes that cannot be merged at
+    all (see `_is_compilable`).
+
+    :param model_class: the model class of the parent node
+    :param related_models: the related models of the parent node, see
+        :py:attr:`SearchTreeNode.related_models`
+    :param nodes: the related nodes
+    :param prefix: the query path from the model of the query set to the
+        parent node, with a trailing ``"__"``
+
+    :type model_class: class (decendant of models.Model)
+    :type related_models: dict mapping class (decendant of models.Model) to str
+    :type nodes: list of `SearchTreeNode`
+    :type prefix: str
+
+    :return:
+      the conditions for the related nodes
+
+    :rtype: ``Q``
+    """
+    Q_expression = Q()
+    joined_relations = set()
+    for node in nodes:
+        relation = related_models[node.model_class]
+        path = _get_relation_path(model_class, relation, node.model_class)
+        if path is None or relation in joined_relations or not _is_compilable(node):
+            matching_parents = model_class._default_manager.filter(**{relation + "__pk__in": node.get_query_set()})
+            Q_expression &= Q(**{prefix + "pk__in": matching_parents.values("pk")})
+        else:
+            joined_relations.add(relation)
+            Q_expression &= Q(**{prefix + path + "__pk__isnull": False})
+            Q_expression &= node.compile_query(prefix + path + "__")
+    return Q_expression
+
+
 @python_2_unicode_compatible
 class SearchTreeNode(object):
     """Class which represents one node in the seach tree.  It is associated
@@ -618,8 +813,67 @@ class SearchTreeNode(object):
         if self.related_models:
             self.children.append((SearchModelForm(self.related_models.keys(), prefix=new_prefix), None))
 
+    def get_filter_kwargs(self):
+        """Returns the conditions of the search fields of this node (without its
+        children).
+
+        :return:
+          the keyword arguments for a ``filter`` call on a QuerySet of
+          `model_class`
+
+        :rtype: dict mapping str to object
+        """
+        kwargs = {}
+        for search_field in self.search_fields:
+            values = search_field.get_values()
+            if values:
+                kwargs.update(values)
+        return kwargs
+
+    def compile_children(self, prefix=""):
+        """Returns the conditions of the children of this node and their
+        subtrees, see `compile_related_nodes`.
+
+        :param prefix: the query path from the model of the query set to this
+            node, with a trailing ``"__"``; empty for the top-level node
+
+        :type prefix: str
+
+        :return:
+          the conditions for the children
+
+        :rtype: ``Q``
+        """
+        return compile_related_nodes(self.model_class, self.related_models,
+                                     [node for __, node in self.children if node], prefix)
+
+    def compile_query(self, prefix=""):
+        """Returns the conditions of this node and its whole subtree as one
+        ``Q`` object.  All query paths in it start with ``prefix``, so the
+        subtree of a child can be merged into the query of its parent.
+
+        Derived classes which override `get_query_set` must override this
+        method, too.  Otherwise, they are included as a subquery (see
+        `compile_related_nodes`).
+
+        :param prefix: the query path from the model of the query set to this
+            node, with a trailing ``"__"``; empty for the top-level node
+
+        :type prefix: str
+
+        :return:
+          the conditions for the subtree
+
+        :rtype: ``Q``
+        """
+        return Q(**dict((prefix + key, value) for key, value in self.get_filter_kwargs().items())) & \
+            self.compile_children(prefix)
+
     def get_query_set(self, base_query=None):
-        """Returns all model instances matching the search.
+        """Returns all model instances matching the search.  The whole tree is
+        compiled into one query, see `compile_related_nodes`.  The conditions
+        for the children are applied in a subquery, so the result contains no
+        duplicates.
 
         :param base_query: the query set to be used as the starting point of the
             query; it is only given at top level, and even then, it is
@@ -634,18 +888,28 @@ class SearchTreeNode(object):
         :rtype: QuerySet
         """
         result = base_query if base_query is not None else self.model_class.objects
-        kwargs = {}
-        for search_field in self.search_fields:
-            values = search_field.get_values()
-            if values:
-                kwargs.update(values)
-        result = result.filter(**kwargs)
-        for __, node in self.children:
-            if node:
-                name = self.related_models[node.model_class] + "__pk__in"
-                result = result.filter(**{name: node.get_query_set()})
+        result = result.filter(**self.get_filter_kwargs())
+        Q_expression = self.compile_children()
+        if Q_expression:
+            result = result.filter(pk__in=self.model_class.objects.filter(Q_expression).values("pk"))
         return result.only("pk")
 
+    def explain(self, base_query=None):
+        """Returns the plan of the database for the query of this search tree.
+        This is useful to check how the database executes a certain search.
+
+        :param base_query: the query set to be used as the starting point of the
+            query, see `get_query_set`
+
+        :type base_query: QuerySet
+
+        :return:
+          the query plan, as printed by the database's ``EXPLAIN`` command
+
+        :rtype: unicode
+        """
+        return explain(self.get_query_set(base_query))
+
     def is_valid(self):
         """Returns whether the whole tree contains only bound and valid
         forms.  Note that the last children of each node – or, more precisely,
@@ -771,22 +1035,25 @@ class AbstractSearchTreeNode(SearchTreeNode):
         # derivatives because they have copies of ``self.search_fields``.
         self.search_fields.append(self.derivative_choice)
 
-    def get_query_set(self, base_query=None):
-        """Returns all model instances matching the search.  This is heavily changed
-        from :py:meth:`SearchTreeNode.get_query_set`.  By and large it only
-        “or”s the returned search results from the derivatives.
+    def get_filter_kwargs(self):
+        # The search fields are evaluated by the derivatives.
+        return {}
 
-        :param base_query: the query set to be used as the starting point of the
-            query, see :py:meth:`SearchTreeNode.get_query_set`
+    def compile_query(self, prefix=""):
+        """Returns the conditions of this node and its subtree.  This is
+        heavily changed from :py:meth:`SearchTreeNode.compile_query`.  By and
+        large it only “or”s subqueries for the derivatives.
 
-        :type base_query: QuerySet
+        :param prefix: the query path from the model of the query set to this
+            node, with a trailing ``"__"``; empty for the top-level node
+
+        :type prefix: str
 
         :return:
-          the search results
+          the conditions for the subtree
 
-        :rtype: QuerySet
+        :rtype: ``Q``
         """
-        result = base_query if base_query is not None else self.model_class.objects
         selected_derivative = self.derivative_choice.form.cleaned_data["derivative"]
         if selected_derivative:
             selected_derivatives = [derivative for derivative in self.derivatives
@@ -796,13 +1063,28 @@ class AbstractSearchTreeNode(SearchTreeNode):
         assert selected_derivatives
         Q_expression = None
         for node in selected_derivatives:
-            current_Q = Q(pk__in=node.get_query_set())
+            current_Q = Q(**{prefix + "pk__in": node.get_query_set()})
             if Q_expression:
                 Q_expression |= current_Q
             else:
                 Q_expression = current_Q
-        result = result.filter(Q_expression).distinct()
-        return result.only("pk")
+        return Q_expression
+
+    def get_query_set(self, base_query=None):
+        """Returns all model instances matching the search.
+
+        :param base_query: the query set to be used as the starting point of the
+            query, see :py:meth:`SearchTreeNode.get_query_set`
+
+        :type base_query: QuerySet
+
+        :return:
+          the search results
+
+        :rtype: QuerySet
+        """
+        result = base_query if base_query is not None else self.model_class.objects
+        return result.filter(self.compile_query()).only("pk")
 
 
 class DetailsSearchTreeNode(SearchTreeNode):
@@ -846,34 +1128,39 @@ class DetailsSearchTreeNode(SearchTreeNode):
         self.related_models.update(self.details_node.related_models)
         self.search_fields.extend(self.details_node.search_fields)
 
-    def get_query_set(self, base_query=None):
+    def get_filter_kwargs(self):
+        kwargs = {}
+        for search_field in self.search_fields:
+            if search_field not in self.details_node.search_fields:
+                values = search_field.get_values()
+                if values:
+                    kwargs.update(values)
+        return kwargs
+
+    def compile_children(self, prefix=""):
         # The basic idea here is the following: The search fields and the
         # related models of the details model were merged with the ones of the
         # main model.  During `parse_data`, they are read in as if they were
         # part of the main model.
         #
         # Here, however, we have to untangle this.  The search fields of the
-        # details model are simply skipped over here – the details model still
-        # has its own references to them and can use them after all.  The
-        # children which actually belong to the details model are skipped over
-        # and injected into the details model's node.  Finally, this node is
-        # used in the query as a filter.
-        result = base_query if base_query is not None else self.model_class.objects
-        kwargs = {}
-        for search_field in (field for field in self.search_fields if field not in self.details_node.search_fields):
-            values = search_field.get_values()
-            if values:
-                kwargs.update(values)
-        result = result.filter(**kwargs)
-        for __, node in self.children:
-            if node:
-                if node.model_class not in self.details_node.related_models:
-                    name = self.related_models[node.model_class] + "__pk__in"
-                    result = result.filter(**{name: node.get_query_set()})
-                else:
-                    self.details_node.children.append((None, node))
-        result = result.filter(pk__in=self.details_node.get_query_set())
-        return result.only("pk")
+        # details model are skipped over in `get_filter_kwargs` – the details
+        # model still has its own references to them and can use them after
+        # all.  The children which actually belong to the details model are
+        # compiled relative to the details model.  Since the relationship is
+        # O2O, this doesn't add rows.
+        children = [node for __, node in self.children if node]
+        details_prefix = prefix + self.details_model_attribute + "__"
+        Q_expression = compile_related_nodes(
+            self.model_class, self.related_models,
+            [node for node in children if node.model_class not in self.details_node.related_models], prefix)
+        Q_expression &= Q(**{details_prefix + "pk__isnull": False})
+        Q_expression &= Q(**dict((details_prefix + key, value)
+                                 for key, value in self.details_node.get_filter_kwargs().items()))
+        Q_expression &= compile_related_nodes(
+            self.details_model_class, self.details_node.related_models,
+            [node for node in children if node.model_class in self.details_node.related_models], details_prefix)
+        return Q_expression
 
 
 _ = ugettext
@@ -35,6 +35,13 @@
 :ivar storage_changed: This is sent if the files on harddisk were changed.  In
   a former version of the deployment at IEK-5/FZJ, this signal is used for
   triggering sychronisation of both nodes.
+
+:ivar lock_waited: This is sent every time a
+  :py:class:`jb_common.utils.base.CacheLock` tried to acquire its lock.  The
+  sender is the ``CacheLock`` class, the keyword arguments are ``key``,
+  ``waited`` (the waiting time in seconds as a float), and ``acquired``
+  (whether the lock could be acquired).  Connect to it in order to collect
+  metrics about lock contention.
 """
 
 from __future__ import absolute_import, unicode_literals
@@ -51,6 +58,8 @@ maintain = django.dispatch.Signal()
 
 storage_changed = django.dispatch.Signal()
 
+lock_waited = django.dispatch.Signal()
+
 
 @receiver(signals.post_save, sender=User)
 def add_user_details(sender, instance, created=True, **kwargs):
@@ -68,3 +68,25 @@ $.ajaxSetup({
         }
     }
 });
+
+// Thumbnails which are still being rendered on the server are answered with
+// an empty response (status 202), so that the browser fires an error event
+// for them.  For images with the class "pending-thumbnail", a placeholder
+// (given in the attribute "data-placeholder") is shown instead, and the
+// thumbnail is requested again a couple of seconds later with a cache-busting
+// query string.
+juliabase.maxThumbnailRetries = 20;
+document.addEventListener("error", function(event) {
+    var image = event.target;
+    if (image.tagName != "IMG" || !$(image).hasClass("pending-thumbnail")) return;
+    var url = image.src.replace(/[?&]retry=\d+$/, "");
+    if (url == $(image).data("placeholder")) return;
+    var retries = $(image).data("url") == url ? $(image).data("retries") : 0;
+    if (retries >= juliabase.maxThumbnailRetries) return;
+    $(image).data({url: url, retries: retries + 1});
+    image.src = $(image).data("placeholder");
+    setTimeout(function() {
+        if ($(image).data("url") == url)
+            image.src = url + (url.indexOf("?") == -1 ? "?" : "&") + "retry=" + (retries + 1);
+    }, 5000);
+}, true);
@@ -22,7 +22,7 @@ from __future__ import absolute_import, division, unicode_literals
 import django.utils.six as six
 from django.utils.six.moves import urllib
 
-import codecs, re, os, os.path, time, json, datetime, copy, mimetypes, string, hashlib
+import codecs, re, os, os.path, time, json, datetime, copy, mimetypes, string, hashlib, collections, random, uuid, tempfile
 from contextlib import contextmanager
 from functools import wraps
 from smtplib import SMTPException
@@ -31,6 +31,7 @@ import dateutil.tz
 import django.http
 import django.contrib.auth.models
 import django.core.urlresolvers
+from django.contrib.contenttypes.models import ContentType
 from django.core.cache import cache
 from django.core.serializers.json import DjangoJSONEncoder
 from django.apps.registry import apps
@@ -586,6 +587,166 @@ def is_update_necessary(destination, source_files=[], timestamps=[], additional_
         datetime.datetime.fromtimestamp(os.path.getmtime(destination) + additional_inaccuracy + 1) < max(all_timestamps)
 
 
+def _get_timestamp_hash(source_files, timestamps):
+    """Returns a short hash of the modification timestamps of ``source_files``
+    and of ``timestamps``.  See `get_file_cache_key` for the parameters.
+    """
+    all_timestamps = copy.copy(timestamps)
+    if all(os.path.isabs(path) for path in source_files):
+        getmtime = lambda path: datetime.datetime.fromtimestamp(os.path.getmtime(path))
+    else:
+        getmtime = blobs.storage.getmtime
+    all_timestamps.extend(getmtime(filename) for filename in source_files)
+    hash_ = hashlib.sha1()
+    hash_.update(";".join(six.text_type(timestamp) for timestamp in sorted(all_timestamps)).encode("ascii"))
+    return hash_.hexdigest()[:10]
+
+
+def get_file_cache_key(path, source_files=[], timestamps=[]):
+    """Returns the cache key under which `get_cached_file_content` stores the
+    content of the file denoted by ``path``.  It changes whenever one of the
+    ``source_files`` or ``timestamps`` changes.
+
+    :param path: the path to the destination file
+    :param source_files: the paths of the source files; if relative, they are
+        assumed to be in the blob storage.
+    :param timestamps: timestamps of non-file source objects
+
+    :type path: unicode
+    :type source_files: list of unicode
+    :type timestamps: list of datetime.datetime
+
+    :return:
+      the cache key of the file content
+
+    :rtype: str
+
+    :raises OSError: if one of the source paths is not found
+    """
+    return "file:{timestamp_hash}:{path}".format(timestamp_hash=_get_timestamp_hash(source_files, timestamps), path=path)
+
+
+def get_file_cache_path(path, source_files=[], timestamps=[]):
+    """Returns the absolute path under which `get_cached_file` stores the file
+    denoted by ``path``.  It is below ``settings.CACHE_ROOT``, and the hash of
+    the timestamps of all sources is inserted before the file extension.  Thus,
+    a changed source leads to a new file, and an existing file is never
+    outdated.
+
+    :param path: the path to the destination file, relative to
+        ``settings.CACHE_ROOT``
+    :param source_files: the paths of the source files; if relative, they are
+        assumed to be in the blob storage.
+    :param timestamps: timestamps of non-file source objects
+
+    :type path: unicode
+    :type source_files: list of unicode
+    :type timestamps: list of datetime.datetime
+
+    :return:
+      the absolute path of the cached file
+
+    :rtype: unicode
+
+    :raises OSError: if one of the source paths is not found
+    """
+    root, extension = os.path.splitext(path)
+    return os.path.join(settings.CACHE_ROOT, "{0}.{1}{2}".format(root, _get_timestamp_hash(source_files, timestamps),
+                                                                extension))
+
+
+def write_file_atomically(path, content):
+    """Writes a file so that nobody ever sees it half-written.  The content is
+    written to a temporary file in the same directory, which is then renamed.
+    Missing directories are created.
+
+    :param path: the absolute path to the file
+    :param content: the content of the file
+
+    :type path: unicode
+    :type content: bytes
+    """
+    mkdirs(path)
+    with tempfile.NamedTemporaryFile("wb", dir=os.path.dirname(path), suffix=".tmp", delete=False) as outfile:
+        outfile.write(content)
+    os.rename(outfile.name, path)
+
+
+def get_cached_file(path, generator, source_files=[], timestamps=[]):
+    """Returns the path to an up-to-date version of the file denoted by ``path``
+    in the file cache.  If it is not there, ``generator`` is called (without
+    arguments!) to generate the file content, which is then written to the
+    file cache.  In contrast to `get_cached_file_content`, the file content
+    never touches the memory cache, and you can serve the result with
+    `static_file_response`.
+
+    The modification time of the file is updated with every access, so that
+    `prune_file_cache` can remove the least recently used files.
+
+    :param path: the path to the destination file, relative to
+        ``settings.CACHE_ROOT``
+    :param generator: callable which returns the file content; it is only
+      called if the file is not in the cache
+    :param source_files: the paths of the source files; if relative, they are
+        assumed to be in the blob storage.
+    :param timestamps: timestamps of non-file source objects
+
+    :type path: unicode
+    :type generator: callable with no arguments returning bytes
+    :type source_files: list of unicode
+    :type timestamps: list of datetime.datetime
+
+    :return:
+      the absolute path to the cached file
+
+    :rtype: unicode
+
+    :raises OSError: if one of the source paths is not found
+    """
+    filepath = get_file_cache_path(path, source_files, timestamps)
+    try:
+        os.utime(filepath, None)
+    except OSError:
+        write_file_atomically(filepath, generator())
+    return filepath
+
+
+def prune_file_cache(directory, max_size):
+    """Removes the least recently used files from a directory of the file cache
+    until its total size does not exceed ``max_size`` anymore.  It is meant to
+    be called in a handler of the :py:data:`jb_common.signals.maintain`
+    signal.
+
+    :param directory: the directory to be pruned, relative to
+        ``settings.CACHE_ROOT``
+    :param max_size: the maximal total size of the files in the directory in
+        bytes
+
+    :type directory: unicode
+    :type max_size: int
+    """
+    files = []
+    total_size = 0
+    for dirpath, __, filenames in os.walk(os.path.join(settings.CACHE_ROOT, directory)):
+        for filename in filenames:
+            filepath = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, filepath))
+            total_size += stat.st_size
+    files.sort()
+    for __, size, filepath in files:
+        if total_size <= max_size:
+            break
+        try:
+            os.unlink(filepath)
+        except OSError:
+            pass
+        total_size -= size
+
+
 def get_cached_file_content(path, generator, source_files=[], timestamps=[]):
     """Returns the content of the file denoted by ``path``.  It tries to get this
     from cache, taking the timestamps of all ``source_files`` and the
@@ -612,15 +773,7 @@ def get_cached_file_content(path, generator, source_files=[], timestamps=[]):
 
     :raises OSError: if one of the source paths is not found
     """
-    all_timestamps = copy.copy(timestamps)
-    if all(os.path.isabs(path) for path in source_files):
-        getmtime = lambda path: datetime.datetime.fromtimestamp(os.path.getmtime(path))
-    else:
-        getmtime = blobs.storage.getmtime
-    all_timestamps.extend(getmtime(filename) for filename in source_files)
-    hash_ = hashlib.sha1()
-    hash_.update(";".join(six.text_type(timestamp) for timestamp in sorted(all_timestamps)).encode("ascii"))
-    key = "file:{timestamp_hash}:{path}".format(timestamp_hash=hash_.hexdigest()[:10], path=path)
+    key = get_file_cache_key(path, source_files, timestamps)
     content = get_from_cache(key)
     if content is None:
         content = generator()
@@ -702,6 +855,36 @@ def static_file_response(filepath, served_filename=None):
     return response
 
 
+def static_blob_response(path, served_filename=None):
+    """Serves a file of the blob storage without copying it.  If the blob
+    storage backend keeps the file in the local file system and
+    ``settings.USE_X_SENDFILE`` is ``True``, the Web server serves the file
+    directly.  Otherwise, it is streamed chunk by chunk, so that it is never
+    completely in memory.
+
+    :param path: full path to the file in the blob storage
+    :param served_filename: the filename the should be transmitted; if given,
+        the response will be an "attachment"
+
+    :type path: str
+    :type served_filename: str
+
+    :return:
+      the HTTP response with the file
+
+    :rype: ``django.http.HttpResponse`` or ``django.http.StreamingHttpResponse``
+    """
+    local_path = blobs.storage.local_path(path)
+    if local_path and settings.USE_X_SENDFILE:
+        return static_file_response(local_path, served_filename)
+    response = django.http.StreamingHttpResponse(blobs.storage.read_chunks(path))
+    response["Content-Type"] = mimetypes.guess_type(served_filename or path)[0] or "application/octet-stream"
+    response["Content-Length"] = blobs.storage.getsize(path)
+    if served_filename:
+        response["Content-Disposition"] = 'attachment; filename="{0}"'.format(served_filename)
+    return response
+
+
 def mkdirs(path):
     """Creates a directory and all of its parents if necessary.  If the given
     path doesn't end with a slash, it's interpreted as a filename and removed.
@@ -722,31 +905,123 @@ def mkdirs(path):
                 raise
 
 
+class LockTimeout(Exception):
+    """Raised if a `CacheLock` could not be acquired in the given time.
+    """
+    pass
+
+
+class CacheLock(object):
+    """Lock which is shared by all processes using the same cache.  It works
+    with every cache backend with an atomic ``add`` operation, i.e. memcached,
+    the database cache, and the local-memory cache (the latter only within one
+    process, which is enough for tests).
+
+    The lock is owned by a random token, so that nobody else can release it.
+    It expires after ``ttl`` seconds, so that a crashed process cannot block
+    the lock forever.  While waiting for the lock, the polling interval grows
+    exponentially with random jitter.  You can use it as a context manager::
+
+        with CacheLock("my_lock_name"):
+            ...
+
+    This raises `LockTimeout` if the lock could not be acquired within
+    ``timeout`` seconds.  If you rather want to skip some work than to wait
+    for it, use the non-blocking mode::
+
+        with CacheLock("my_lock_name", blocking=False) as lock:
+            if lock.acquired:
+                ...
+
+    After every acquisition attempt, the signal
+    :py:data:`jb_common.signals.lock_waited` is sent so that wait times can be
+    monitored.
+    """
+    initial_delay = 0.01
+    maximal_delay = 0.5
+
+    def __init__(self, key, ttl=30, timeout=6, blocking=True):
+        """Class constructor.
+
+        :param key: name of the lock
+        :param ttl: number of seconds after which the lock expires even if it
+            was not released
+        :param timeout: maximal number of seconds to wait for the lock in
+            blocking mode
+        :param blocking: whether to wait for the lock in the context manager;
+            if ``False``, the context is entered in any case, and you must
+            check the `acquired` attribute
+
+        :type key: unicode
+        :type ttl: int
+        :type timeout: float
+        :type blocking: bool
+        """
+        self.key = "lock:" + key
+        self.ttl, self.timeout, self.blocking = ttl, timeout, blocking
+        self.token = uuid.uuid4().hex
+        self.acquired = False
+
+    def acquire(self, blocking=True, timeout=None):
+        """Tries to acquire the lock.
+
+        :param blocking: whether to wait for the lock if it is held by someone
+            else
+        :param timeout: maximal number of seconds to wait; if ``None``, the
+            timeout given to the constructor is used
+
+        :type blocking: bool
+        :type timeout: float or NoneType
+
+        :return:
+          whether the lock was acquired
+
+        :rtype: bool
+        """
+        from jb_common.signals import lock_waited
+        if timeout is None:
+            timeout = self.timeout
+        start = time.time()
+        delay = self.initial_delay
+        while True:
+            self.acquired = cache.add(self.key, self.token, self.ttl)
+            remaining = start + timeout - time.time()
+            if self.acquired or not blocking or remaining <= 0:
+                break
+            time.sleep(min(random.uniform(0, delay), remaining))
+            delay = min(2 * delay, self.maximal_delay)
+        lock_waited.send(CacheLock, key=self.key, waited=time.time() - start, acquired=self.acquired)
+        return self.acquired
+
+    def release(self):
+        """Releases the lock if it is still held by this instance.  If the lock
+        has expired in the meantime and was acquired by someone else, it is
+        left alone.  Note that there is a small window between checking the
+        token and deleting the key because caches have no atomic
+        compare-and-delete.
+        """
+        if self.acquired:
+            if cache.get(self.key) == self.token:
+                cache.delete(self.key)
+            self.acquired = False
+
+    def __enter__(self):
+        if not self.acquire(self.blocking) and self.blocking:
+            raise LockTimeout("Could not acquire lock \"{0}\" within {1} seconds.".format(self.key, self.timeout))
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.release()
+
+
 @contextmanager
 def cache_key_locked(key):
     """Locks the ``key`` in the cache.  If ``key`` already exists, it waits for
-    max. 6 seconds.  If it's still not released, the whole cache is cleared.
-    In all cases, ``key`` is hold in the context.  After the context is left
-    (even via an exception), the key is deleted, i.e. the lock is removed.  Use
-    it like this::
-
-        with cache_key_locked("my_lock_name"):
-            ...
+    max. 6 seconds, and raises `LockTimeout` if it is still not released.
+    This function is deprecated; use `CacheLock` instead.
     """
-    cycles = 20
-    while cycles:
-        if cache.add(key, 1):
-            break
-        cycles -= 1
-        time.sleep(0.3)
-    else:
-        cache.clear()
-        successful = cache.add(key, 1)
-        assert successful
-    try:
+    with CacheLock(key):
         yield
-    finally:
-        cache.delete(key)
 
 
 class MyNone:
@@ -788,6 +1063,135 @@ def get_from_cache(key, default=None, hits=1, misses=1):
         return result
 
 
+def get_many_from_cache(keys, hits=1, misses=1):
+    """Gets many items from the cache at once and records statistics for
+    `cache_hit_rate`.  The semantics of this routine are the same as for
+    Django's `cache.get_many`, i.e. it returns a dictionary which contains only
+    the keys that were found.  It is the batch counterpart of `get_from_cache`;
+    `hits` and `misses` are counted per key.
+
+    :param keys: the cache keys to be looked up
+    :param hits: number of hits equivalent with every found key
+    :param misses: number of misses equivalent with every missing key
+
+    :type keys: iterable of str
+    :type hits: int
+    :type misses: int
+
+    :return:
+      all found cache items
+
+    :rtype: dict mapping str to ``object``
+    """
+    keys = set(keys)
+    if not keys:
+        return {}
+    result = cache.get_many(keys)
+    if result:
+        _incr_cache_item("samples-cache-hits", hits * len(result))
+    if len(result) < len(keys):
+        _incr_cache_item("samples-cache-misses", misses * (len(keys) - len(result)))
+    return result
+
+
+def _initial_cache_version():
+    """Returns the value with which a generation counter is created in the
+    cache.  It is derived from the current time so that a counter which was
+    evicted from the cache does not start again at a value which is still
+    folded into existing cache keys.
+    """
+    return int(time.time() * 1000)
+
+
+def get_cache_versions(namespaces):
+    """Returns the current generation counters of many cache namespaces.  A
+    namespace is something like ``"sample:42"``.  The returned version number
+    must be folded into all cache keys of items that depend on the namespace.
+    Then, `expire_cache_namespace` invalidates all these items at once, without
+    having to know their keys.  Missing counters are created.
+
+    :param namespaces: the namespaces whose versions should be returned
+
+    :type namespaces: iterable of unicode
+
+    :return:
+      the current version of every namespace
+
+    :rtype: dict mapping unicode to int
+    """
+    keys = dict(("cache-version:" + namespace, namespace) for namespace in namespaces)
+    if not keys:
+        return {}
+    versions = cache.get_many(keys)
+    for key in set(keys) - set(versions):
+        initial_version = _initial_cache_version()
+        # If another process was faster, we must use its version.
+        if not cache.add(key, initial_version, None):
+            versions[key] = cache.get(key, initial_version)
+        else:
+            versions[key] = initial_version
+    return dict((keys[key], version) for key, version in versions.items())
+
+
+def get_cache_version(namespace):
+    """Returns the current generation counter of a cache namespace.  See
+    `get_cache_versions` for further details.
+
+    :param namespace: the namespace whose version should be returned
+
+    :type namespace: unicode
+
+    :return:
+      the current version of the namespace
+
+    :rtype: int
+    """
+    return get_cache_versions([namespace])[namespace]
+
+
+def expire_cache_namespace(namespace):
+    """Invalidates all cache items of a namespace by incrementing its
+    generation counter.  This is one atomic operation; no locking is
+    necessary.  The old items are not deleted but simply never requested
+    anymore, so they vanish from the cache eventually.
+
+    :param namespace: the namespace to be expired, e.g. ``"sample:42"``
+
+    :type namespace: unicode
+
+    :return:
+      the new version of the namespace
+
+    :rtype: int
+    """
+    key = "cache-version:" + namespace
+    try:
+        return cache.incr(key)
+    except ValueError:
+        initial_version = _initial_cache_version()
+        if cache.add(key, initial_version, None):
+            return initial_version
+        return cache.incr(key)
+
+
+def expire_cache_namespaces(namespaces):
+    """Invalidates all cache items of many namespaces at once.  In contrast to
+    `expire_cache_namespace`, the generation counters are not incremented but
+    overwritten with fresh values in one batched cache write.  These values
+    are derived from the current time in microseconds plus a random part, so
+    they don't coincide with any version used before.
+
+    :param namespaces: the namespaces to be expired, e.g. ``["sample:42",
+        "process:5"]``
+
+    :type namespaces: iterable of unicode
+    """
+    now = int(time.time() * 1000000) * 1000
+    versions = dict(("cache-version:" + namespace, now + random.randrange(1000)) for namespace in namespaces)
+    if versions:
+        cache.set_many(versions, None)
+
+
 def cache_hit_rate():
     """Returns the current cache hit rate.  This value is between 0 and 1.  It
     returns ``None`` is no such value could be calculated.
@@ -824,6 +1228,44 @@ def unlazy_object(lazy_object):
     return lazy_object._wrapped
 
 
+def resolve_actual_instances(instances, select_related=()):
+    """Returns the actual instances of many instances of a
+    :py:class:`jb_common.models.PolymorphicModel` at once.  In contrast to
+    reading ``actual_instance`` of every instance, this needs only one database
+    query per occuring content type.  Instances whose actual instance cannot be
+    resolved (e.g. because it has vanished in the meantime) are returned
+    unchanged.
+
+    :param instances: the instances to be resolved, e.g. a QuerySet of
+        `samples.models.Process`
+    :param select_related: related fields which should be fetched together
+        with the actual instances
+
+    :type instances: iterable of `jb_common.models.PolymorphicModel`
+    :type select_related: iterable of str
+
+    :return:
+      the actual instances, in the same order as `instances`
+
+    :rtype: list of `jb_common.models.PolymorphicModel`
+    """
+    instances = list(instances)
+    ids_by_content_type = collections.defaultdict(set)
+    for instance in instances:
+        if instance.content_type_id is not None and instance.actual_object_id is not None:
+            ids_by_content_type[instance.content_type_id].add(instance.actual_object_id)
+    actual_instances = {}
+    for content_type_id, ids in ids_by_content_type.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is None:
+            continue
+        query_set = model.objects.select_related(*select_related) if select_related else model.objects
+        for pk, actual_instance in query_set.in_bulk(ids).items():
+            actual_instances[content_type_id, pk] = actual_instance
+    return [actual_instances.get((instance.content_type_id, instance.actual_object_id), instance)
+            for instance in instances]
+
+
 def convert_bytes_to_str(byte_array):
     """Converts an array of bytes representing the string literals as decimal
     integers to unicode letters.
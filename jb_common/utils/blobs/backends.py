@@ -44,7 +44,8 @@ if six.PY2:
 class BlobStorage(object):
     """Abstract base class for blob storage backends.  It lists all methods that
     may be implemented and their signatures.  Currently, core JuliaBase only
-    calls the methods `open` and `export`.
+    calls the methods `open`, `getmtime`, `getsize`, `local_path`, and
+    `read_chunks`.
 
     Note the “full path” means that it must be complete.  *Important*: Any
     paths in the blob storage must not start with a slash.
@@ -89,12 +90,29 @@ class BlobStorage(object):
         """
         raise NotImplementedError
 
+    def getsize(self, path):
+        """Returns the size of the file at ``path``.
+
+        :param path: full path to a file
+
+        :type path: str
+
+        :return:
+          the size of the file in bytes
+
+        :rtype: int
+        """
+        raise NotImplementedError
+
     def open(self, path, mode="r"):
-        """Opens the file at ``path``.  This must be a regular file.  The returned
-        objects is guaranteed to have two simple methods: ``write(data)``
-        writes ``data`` to the file and can be called multiple times.  And
-        ``close()`` closes the file and should be called when all data is
-        written.
+        """Opens the file at ``path``.  This must be a regular file.  If opened
+        for writing, the returned objects is guaranteed to have two simple
+        methods: ``write(data)`` writes ``data`` to the file and can be called
+        multiple times.  And ``close()`` closes the file and should be called
+        when all data is written.  If opened for reading, the returned object
+        has the methods ``read(size=-1)``, ``seek(offset, whence=0)``,
+        ``tell()``, and ``close()``, which is enough for e.g. Pillow.  The
+        content is read in binary mode in both cases.
 
         :param path: full path to a file
         :param mode: mode in which the file should be opened; may be ``"r"`` or
@@ -109,6 +127,58 @@ class BlobStorage(object):
         """
         raise NotImplementedError
 
+    def read_chunks(self, path, start=0, length=None, chunk_size=64 * 1024):
+        """Reads the file at ``path``, or a range of it, chunk by chunk.  This way,
+        even big files can be served without having them in memory or copying
+        them.  The file is opened when the first chunk is requested, and closed
+        after the last one.
+
+        :param path: full path to a file
+        :param start: offset of the first byte to be read
+        :param length: number of bytes to be read; if ``None``, the file is
+          read up to its end
+        :param chunk_size: maximal size of one chunk in bytes
+
+        :type path: str
+        :type start: int
+        :type length: int or NoneType
+        :type chunk_size: int
+
+        :return:
+          generator of the chunks
+
+        :rtype: generator of bytes
+        """
+        file_ = self.open(path, "r")
+        try:
+            file_.seek(start)
+            while length is None or length > 0:
+                chunk = file_.read(chunk_size if length is None else min(chunk_size, length))
+                if not chunk:
+                    break
+                if length is not None:
+                    length -= len(chunk)
+                yield chunk
+        finally:
+            file_.close()
+
+    def local_path(self, path):
+        """Returns the path to the file in the local filesystem, if the backend
+        stores its blobs there.  Such a file may be served directly by the Web
+        server via ``X-Sendfile``.  It must not be modified or removed, though.
+
+        :param path: full path to a file
+
+        :type path: str
+
+        :return:
+          the absolute path to the file in the local filesystem, or ``None`` if
+          the blob is not stored in the local filesystem
+
+        :rtype: str or NoneType
+        """
+        return None
+
     def export(self, path):
         """Returns a removable path to the file.  This is used when serving files.  The
         Web server gets the result of this method in the ``X-Sendfile`` header,
@@ -174,6 +244,9 @@ class Filesystem(BlobStorage):
     def getmtime(self, path):
         return datetime.datetime.fromtimestamp(os.path.getmtime(os.path.join(self.root, path)))
 
+    def getsize(self, path):
+        return os.path.getsize(os.path.join(self.root, path))
+
     def unlink(self, path):
         os.unlink(os.path.join(self.root, path))
 
@@ -181,7 +254,11 @@ class Filesystem(BlobStorage):
         filepath = os.path.join(self.root, path)
         if mode == "w":
             mkdirs(filepath)
-        return Filesystem.File(open(filepath, mode + "b"))
+            return Filesystem.File(open(filepath, "wb"))
+        return open(filepath, "rb")
+
+    def local_path(self, path):
+        return os.path.join(self.root, path)
 
     def export(self, path):
         """Create a hard link to the file.  Three directories are tried, in this order:
@@ -235,6 +312,29 @@ class PostgreSQL(BlobStorage):
             self.connection.close()
 
 
+    class BlobReader(object):
+        """A very simplistic read-only file-like object.  It defines the methods
+        `read`, `seek`, `tell`, and `close`, and closes the database connection
+        in `close`.
+        """
+
+        def __init__(self, connection, large_object):
+            self.connection, self.large_object = connection, large_object
+
+        def read(self, size=-1):
+            return self.large_object.read(size)
+
+        def seek(self, offset, whence=0):
+            return self.large_object.seek(offset, whence)
+
+        def tell(self):
+            return self.large_object.tell()
+
+        def close(self):
+            self.large_object.close()
+            self.connection.close()
+
+
     def __init__(self, database, user, password, host):
         """Class constructor.  It creates the table “blobs” in the database if
         it doesn't exist yet.
@@ -309,14 +409,25 @@ class PostgreSQL(BlobStorage):
             cursor.execute("SELECT mtime FROM blobs WHERE large_object_id=%s;", (large_object.oid,))
             return cursor.fetchone()[0]
 
+    def getsize(self, path):
+        with self.existing_large_object(path) as (large_object, cursor):
+            return large_object.seek(0, 2)
+
     def unlink(self, path):
         with self.existing_large_object(path) as (large_object, cursor):
             cursor.execute("DELETE FROM blobs WHERE large_object_id=%s;", (large_object.oid,))
             large_object.unlink()
 
     def open(self, path, mode):
-        assert mode == "w"
+        assert mode in ("r", "w")
         connection = psycopg2.connect(database=self.database, user=self.user, password=self.password, host=self.host)
+        if mode == "r":
+            with connection.cursor() as cursor:
+                oid = self.get_oid(cursor, path)
+            if oid is None:
+                connection.close()
+                raise FileNotFoundError("No such blob: {}".format(repr(path)))
+            return PostgreSQL.BlobReader(connection, connection.lobject(oid, mode="rb"))
         cursor = connection.cursor()
         oid = self.get_oid(cursor, path)
         if oid is None:
@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""In-memory rating engine of the kicker app.  The kicker numbers are Elo
+numbers of the players.  The current numbers of all players are read from the
+database with one query and cached, keyed by the ID of the latest
+``KickerNumber``, so that they are only read again after a new match.  For
+replaying the whole history, all finished matches are loaded once into NumPy
+arrays; the parts of the computation which do not depend on the numbers are
+done for all matches at once, and only the actual Elo updates are done match
+by match.  New ``KickerNumber`` and ``StockValue`` rows are written with
+``bulk_create``.
+"""
+
+from __future__ import division, absolute_import, unicode_literals
+
+import datetime
+import numpy
+from django.core.cache import cache
+from django.db.models import Q
+from kicker import models
+
+
+start_number = 1300
+
+
+class NoKickerNumber(Exception):
+    pass
+
+
+def average_goal_frequency(two_player_game):
+    return 0.0310 if two_player_game else 0.0253
+
+
+def average_match_duration(two_player_game):
+    return 226 if two_player_game else 261
+
+
+def get_score(goals_a, goals_b, seconds, two_player_game):
+    """Returns the actual score of team A, i.e. 1 for a clear victory, 0 for a
+    clear defeat, and 1/2 for a draw.
+    """
+    return 1 / 2 + 1 / 2 * (goals_a - goals_b) / (seconds * average_goal_frequency(two_player_game))
+
+
+def get_weight(seconds, two_player_game):
+    """Returns the weight of a match, which is proportional to its duration.
+    """
+    return seconds / average_match_duration(two_player_game)
+
+
+def get_expected_score(number_a_1, number_a_2, number_b_1, number_b_2):
+    """Returns the expected score of team A according to the kicker numbers of
+    the players.
+    """
+    return 1 / (1 + 10 ** ((number_b_1 + number_b_2 - number_a_1 - number_a_2) / 800))
+
+
+def get_elo_delta(goals_a, goals_b, number_player_a_1, number_player_a_2, number_player_b_1, number_player_b_2,
+                  seconds, two_player_game):
+    return get_weight(seconds, two_player_game) * \
+        (get_score(goals_a, goals_b, seconds, two_player_game) -
+         get_expected_score(number_player_a_1, number_player_a_2, number_player_b_1, number_player_b_2))
+
+
+class Matches(object):
+    """Finished matches as arrays in chronological order.
+
+    :ivar players: the IDs of the players; every row contains the players A 1,
+      A 2, B 1, and B 2 of one match
+    :ivar timestamps: the timestamps of the matches
+    :ivar scores: the actual scores of team A, see `get_score`
+    :ivar weights: the weights of the matches, see `get_weight`
+
+    :type players: ``numpy.ndarray``
+    :type timestamps: list of ``datetime.datetime``
+    :type scores: ``numpy.ndarray``
+    :type weights: ``numpy.ndarray``
+    """
+
+    def __init__(self, queryset=None):
+        """
+        :param queryset: the matches to be loaded; if ``None``, all finished
+            matches are loaded
+
+        :type queryset: QuerySet
+        """
+        queryset = models.Match.objects.filter(finished=True) if queryset is None else queryset
+        rows = list(queryset.order_by("timestamp", "id").values_list(
+            "player_a_1", "player_a_2", "player_b_1", "player_b_2", "goals_a", "goals_b", "seconds", "timestamp"))
+        self.players = numpy.array([row[:4] for row in rows], dtype=int).reshape(-1, 4)
+        goals_a = numpy.array([row[4] for row in rows], dtype=float)
+        goals_b = numpy.array([row[5] for row in rows], dtype=float)
+        seconds = numpy.array([row[6] for row in rows], dtype=float)
+        self.timestamps = [row[7] for row in rows]
+        two_player_game = self.players[:, 0] == self.players[:, 1]
+        self.scores = 1 / 2 + 1 / 2 * (goals_a - goals_b) / (seconds * numpy.where(two_player_game, 0.0310, 0.0253))
+        self.weights = seconds / numpy.where(two_player_game, 226, 261)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def get_player_matches(self, player_id):
+        """Returns the matches of a player.
+
+        :param player_id: the ID of the player
+
+        :type player_id: int
+
+        :return:
+          the players, the scores, and the weights of the matches of the player
+
+        :rtype: ``numpy.ndarray``, ``numpy.ndarray``, ``numpy.ndarray``
+        """
+        mask = (self.players == player_id).any(axis=1)
+        return self.players[mask], self.scores[mask], self.weights[mask]
+
+
+class Ratings(object):
+    """The current kicker numbers of all players.
+
+    :ivar numbers: the current kicker numbers of the players
+    :ivar counts: the number of ``KickerNumber`` rows of the players
+
+    :type numbers: dict mapping int to float
+    :type counts: dict mapping int to int
+    """
+
+    def __init__(self, numbers=None, counts=None):
+        self.numbers, self.counts = numbers or {}, counts or {}
+
+    def add(self, player_id, number):
+        self.numbers[player_id] = number
+        self.counts[player_id] = self.counts.get(player_id, 0) + 1
+
+    def get_k(self, player_id=None):
+        return 24 if player_id is None or self.counts.get(player_id, 0) > 30 else 30
+
+    def get_number_or_estimate(self, player_id, matches=None):
+        """Returns the current kicker number of a player.  If the player
+        doesn't have one yet, it is estimated from their matches.
+
+        :param player_id: the ID of the player
+        :param matches: all finished matches; if ``None``, the matches of the
+            player are read from the database
+
+        :type player_id: int
+        :type matches: `Matches` or NoneType
+
+        :return:
+          the kicker number of the player
+
+        :rtype: float
+
+        :raises NoKickerNumber: if the player doesn't have a kicker number,
+          and less than seven of their matches were played with players who
+          have one
+        """
+        try:
+            return self.numbers[player_id]
+        except KeyError:
+            return self.estimate(player_id, matches)
+
+    def estimate(self, player_id, matches=None):
+        """Estimates the kicker number of a player who doesn't have one.  The
+        number is changed by all their matches with players who do have kicker
+        numbers, until it converges.  See `get_number_or_estimate`.
+        """
+        if matches is None:
+            matches = Matches(models.Match.objects.filter(
+                Q(player_a_1=player_id) | Q(player_a_2=player_id) | Q(player_b_1=player_id) | Q(player_b_2=player_id)).
+                              filter(finished=True))
+        players, scores, weights = matches.get_player_matches(player_id)
+        is_player = players == player_id
+        others = numpy.vectorize(lambda other_id: self.numbers.get(other_id, numpy.nan), otypes=[float])(players) \
+                 if len(players) else numpy.zeros((0, 4))
+        others[is_player] = 0
+        valid = ~numpy.isnan(others).any(axis=1)
+        if valid.sum() < 7:
+            raise NoKickerNumber
+        # Sum of the other players' numbers of team B minus team A, and how
+        # often the player counts for team B minus team A.
+        known_differences = (others[valid, 2:].sum(axis=1) - others[valid, :2].sum(axis=1)).tolist()
+        own_factors = (is_player[valid, 2:].sum(axis=1) - is_player[valid, :2].sum(axis=1)).tolist()
+        signs = numpy.where(is_player[valid, 2:].any(axis=1), -40, 40).tolist()
+        scores, weights = scores[valid].tolist(), weights[valid].tolist()
+        number = 1500
+        for __ in range(50):
+            old_number = number
+            for known_difference, own_factor, sign, score, weight in \
+                    zip(known_differences, own_factors, signs, scores, weights):
+                expected_score = 1 / (1 + 10 ** ((known_difference + own_factor * number) / 800))
+                number += sign * weight * (score - expected_score)
+            if abs(old_number - number) < 1:
+                break
+        return number
+
+    def rate(self, players, score, weight, matches=None):
+        """Calculates the changes of the kicker numbers of the players of one
+        match.
+
+        :param players: the IDs of the players A 1, A 2, B 1, and B 2
+        :param score: the actual score of team A, see `get_score`
+        :param weight: the weight of the match, see `get_weight`
+        :param matches: all finished matches, for estimating the kicker
+            numbers of new players; see `get_number_or_estimate`
+
+        :type players: list of int
+        :type score: float
+        :type weight: float
+        :type matches: `Matches` or NoneType
+
+        :return:
+          the current kicker numbers of the players, the changes of the kicker
+          numbers of the players, and the Elo delta without the player's K
+          factor
+
+        :rtype: list of float, list of float, float
+
+        :raises NoKickerNumber: if one of the players has no kicker number and
+          it can't be estimated
+        """
+        numbers = [self.get_number_or_estimate(player_id, matches) for player_id in players]
+        delta = weight * (score - get_expected_score(*numbers))
+        deltas = [sign * self.get_k(player_id) * delta for player_id, sign in zip(players, (1, 1, -1, -1))]
+        return numbers, deltas, delta
+
+
+def _get_ratings_cache_key():
+    latest_id = models.KickerNumber.objects.order_by("-id").values_list("id", flat=True).first()
+    return "kicker-ratings:{0}".format(latest_id)
+
+
+def get_current_ratings():
+    """Returns the current kicker numbers of all players.  They are cached
+    until the next ``KickerNumber`` is added.
+
+    :return:
+      the current kicker numbers
+
+    :rtype: `Ratings`
+    """
+    cache_key = _get_ratings_cache_key()
+    numbers_and_counts = cache.get(cache_key)
+    if numbers_and_counts is None:
+        ratings = Ratings()
+        for player_id, number in models.KickerNumber.objects.order_by("timestamp", "id"). \
+            values_list("player", "number").iterator():
+            ratings.add(player_id, number)
+        cache.set(cache_key, (ratings.numbers, ratings.counts))
+        return ratings
+    return Ratings(*numbers_and_counts)
+
+
+def add_kicker_numbers(ratings, kicker_numbers):
+    """Writes new kicker numbers to the database, and updates `ratings` and
+    their cached version accordingly.
+
+    :param ratings: the current kicker numbers
+    :param kicker_numbers: the new kicker numbers, in chronological order
+
+    :type ratings: `Ratings`
+    :type kicker_numbers: list of ``kicker.models.KickerNumber``
+    """
+    models.KickerNumber.objects.bulk_create(kicker_numbers, batch_size=1000)
+    for kicker_number in kicker_numbers:
+        ratings.add(kicker_number.player_id, kicker_number.number)
+    cache.set(_get_ratings_cache_key(), (ratings.numbers, ratings.counts))
+
+
+def add_stock_values(players, deltas, timestamp):
+    """Writes the new stock values of all gamblers who own shares of the
+    players of a match.
+
+    :param players: the IDs of the players A 1, A 2, B 1, and B 2
+    :param deltas: the changes of the kicker numbers of the players
+    :param timestamp: the timestamp of the match
+
+    :type players: list of int
+    :type deltas: list of float
+    :type timestamp: ``datetime.datetime``
+    """
+    shares = {}
+    for bought_person_id, owner_id, number in models.Shares.objects.filter(bought_person__in=players). \
+        order_by("timestamp", "id").values_list("bought_person", "owner", "number"):
+        shares.setdefault(bought_person_id, []).append((owner_id, number))
+    owners = {owner_id for player_shares in shares.values() for owner_id, __ in player_shares}
+    values = dict.fromkeys(owners, 100)
+    values.update(models.StockValue.objects.filter(gambler__in=owners).order_by("timestamp", "id").
+                  values_list("gambler", "value"))
+    stock_values = []
+    for player_id, delta in zip(players, deltas):
+        for owner_id, number in shares.get(player_id, []):
+            values[owner_id] += number / 100 * delta
+            stock_values.append(models.StockValue(gambler_id=owner_id, value=values[owner_id], timestamp=timestamp))
+    models.StockValue.objects.bulk_create(stock_values)
+
+
+def get_start_numbers(matches):
+    """Calculates the start numbers of the players of the first matches, so
+    that their kicker numbers are consistent with these matches.
+
+    :param matches: all finished matches
+
+    :type matches: `Matches`
+
+    :return:
+      the start numbers of the players, or ``None`` if there are too few
+      matches per player or the numbers don't converge
+
+    :rtype: dict mapping int to float or NoneType
+    """
+    players = {}
+    for i, match_players in enumerate(matches.players[:50].tolist()):
+        for player_id in match_players:
+            players[player_id] = start_number
+        if i / len(players) > 7:
+            break
+    else:
+        if len(matches) < 50:
+            return None
+    first_players = matches.players[:i + 1].tolist()
+    scores, weights = matches.scores[:i + 1].tolist(), matches.weights[:i + 1].tolist()
+    for __ in range(1000):
+        old_players = players.copy()
+        for (player_a_1, player_a_2, player_b_1, player_b_2), score, weight in zip(first_players, scores, weights):
+            delta_player = 40 * weight * (score - get_expected_score(players[player_a_1], players[player_a_2],
+                                                                     players[player_b_1], players[player_b_2]))
+            players[player_a_1] += delta_player
+            players[player_a_2] += delta_player
+            players[player_b_1] -= delta_player
+            players[player_b_2] -= delta_player
+        if all(abs(players[player_id] - old_players[player_id]) < 1 for player_id in players):
+            return players
+    return None
+
+
+def replay():
+    """Recalculates all kicker numbers from the finished matches.
+    """
+    models.KickerNumber.objects.all().delete()
+    matches = Matches()
+    players = get_start_numbers(matches)
+    if not players:
+        return
+    ratings = Ratings()
+    zero_timestamp = matches.timestamps[0] - datetime.timedelta(seconds=1)
+    kicker_numbers = []
+    for player_id, number in players.items():
+        kicker_numbers.append(models.KickerNumber(player_id=player_id, number=number, timestamp=zero_timestamp))
+        ratings.add(player_id, number)
+    for match_players, score, weight, timestamp in zip(matches.players.tolist(), matches.scores.tolist(),
+                                                        matches.weights.tolist(), matches.timestamps):
+        try:
+            numbers, deltas, __ = ratings.rate(match_players, score, weight, matches)
+        except NoKickerNumber:
+            continue
+        for player_id, number, delta in zip(match_players, numbers, deltas):
+            kicker_numbers.append(models.KickerNumber(player_id=player_id, number=number + delta, timestamp=timestamp))
+            ratings.add(player_id, number + delta)
+    add_kicker_numbers(Ratings(), kicker_numbers)
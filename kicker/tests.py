@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Tests for the rating engine of the kicker app.  Its results are compared
+with the original computation, which queried the database for every match and
+player.  This is reproduced here in the ``old_…`` functions.
+"""
+
+from __future__ import division, absolute_import, unicode_literals
+
+import datetime, random, unittest
+from django.apps import apps
+from django.test import TestCase
+from django.db.models import Q
+from django.contrib.auth.models import User
+from kicker import models, rating
+from kicker.rating import NoKickerNumber, get_elo_delta
+
+
+def old_get_current_kicker_number(player):
+    try:
+        return models.KickerNumber.objects.filter(player=player).latest().number
+    except models.KickerNumber.DoesNotExist:
+        raise NoKickerNumber
+
+
+def old_get_current_kicker_number_or_estimate(player):
+    try:
+        return old_get_current_kicker_number(player)
+    except NoKickerNumber:
+        preliminary_kicker_number = 1500
+        matches = list(models.Match.objects.filter(Q(player_a_1=player) | Q(player_a_2=player) | Q(player_b_1=player) |
+                                                   Q(player_b_2=player)).filter(finished=True).distinct())
+        cycles_left = 50
+        while cycles_left:
+            cycles_left -= 1
+            old_kicker_number = preliminary_kicker_number
+            number_of_matches = 0
+            for match in matches:
+                try:
+                    numbers = [old_get_current_kicker_number(match_player) if match_player != player
+                               else preliminary_kicker_number for match_player in
+                               (match.player_a_1, match.player_a_2, match.player_b_1, match.player_b_2)]
+                except NoKickerNumber:
+                    continue
+                delta = get_elo_delta(match.goals_a, match.goals_b, *numbers, seconds=match.seconds,
+                                      two_player_game=match.player_a_1 == match.player_a_2)
+                delta_player = 40 * delta
+                if player in [match.player_b_1, match.player_b_2]:
+                    delta_player = -delta_player
+                preliminary_kicker_number += delta_player
+                number_of_matches += 1
+            if number_of_matches < 7:
+                raise NoKickerNumber
+            if abs(old_kicker_number - preliminary_kicker_number) < 1:
+                break
+        return preliminary_kicker_number
+
+
+def old_get_k(player=None):
+    return 24 if not player or models.KickerNumber.objects.filter(player=player).count() > 30 else 30
+
+
+def old_add_kicker_numbers(match):
+    players = [match.player_a_1, match.player_a_2, match.player_b_1, match.player_b_2]
+    try:
+        numbers = [old_get_current_kicker_number_or_estimate(player) for player in players]
+    except NoKickerNumber:
+        return
+    delta = get_elo_delta(match.goals_a, match.goals_b, *numbers, seconds=match.seconds,
+                          two_player_game=match.player_a_1 == match.player_a_2)
+    new_numbers = [number + sign * old_get_k(player) * delta
+                   for player, number, sign in zip(players, numbers, (1, 1, -1, -1))]
+    for player, number in zip(players, new_numbers):
+        models.KickerNumber.objects.create(player=player, number=number, timestamp=match.timestamp)
+
+
+def old_get_start_numbers():
+    players = {}
+    for i, match in enumerate(models.Match.objects.all()[:50]):
+        players[match.player_a_1] = players[match.player_a_2] = \
+            players[match.player_b_1] = players[match.player_b_2] = rating.start_number
+        if i / len(players) > 7:
+            break
+    if i / len(players) <= 7 and i < 49:
+        return
+    matches = list(models.Match.objects.all()[:i + 1])
+    cycles_left = 1000
+    while cycles_left:
+        cycles_left -= 1
+        old_players = players.copy()
+        for match in matches:
+            delta = get_elo_delta(match.goals_a, match.goals_b,
+                                  players[match.player_a_1], players[match.player_a_2], players[match.player_b_1],
+                                  players[match.player_b_2],
+                                  match.seconds, two_player_game=match.player_a_1 == match.player_a_2)
+            delta_player = 40 * delta
+            players[match.player_a_1] += delta_player
+            players[match.player_a_2] += delta_player
+            players[match.player_b_1] -= delta_player
+            players[match.player_b_2] -= delta_player
+        if all(abs(players[player] - old_players[player]) < 1 for player in players):
+            break
+    else:
+        return
+    return players
+
+
+def old_replay():
+    models.KickerNumber.objects.all().delete()
+    players = old_get_start_numbers()
+    if not players:
+        return
+    zero_timestamp = models.Match.objects.all()[0].timestamp - datetime.timedelta(seconds=1)
+    for player, start_number in players.items():
+        models.KickerNumber.objects.create(player=player, number=start_number, timestamp=zero_timestamp)
+    for match in models.Match.objects.iterator():
+        old_add_kicker_numbers(match)
+
+
+@unittest.skipUnless(apps.is_installed("kicker"), "kicker is not installed")
+class RatingTest(TestCase):
+
+    def setUp(self):
+        """Creates 52 matches: 40 between four regulars, and then 12 in which
+        a newcomer replaces one of them.  The newcomer has no start number, so
+        their first kicker number is estimated.
+        """
+        players = [User.objects.create(username="player{0}".format(i)) for i in range(5)]
+        regulars, newcomer = players[:4], players[4]
+        randomness = random.Random(42)
+        timestamp = datetime.datetime(2015, 1, 1, 12)
+        for i in range(52):
+            match_players = regulars[:]
+            randomness.shuffle(match_players)
+            if i >= 40:
+                match_players[randomness.randrange(4)] = newcomer
+            timestamp += datetime.timedelta(minutes=10)
+            models.Match.objects.create(
+                player_a_1=match_players[0], player_a_2=match_players[1],
+                player_b_1=match_players[2], player_b_2=match_players[3],
+                goals_a=randomness.randint(0, 4), goals_b=randomness.randint(0, 4),
+                seconds=randomness.uniform(240, 320), timestamp=timestamp, finished=True, reporter=players[0])
+        self.newcomer = newcomer
+
+    def get_kicker_numbers(self):
+        return list(models.KickerNumber.objects.order_by("timestamp", "player").
+                    values_list("player", "timestamp", "number"))
+
+    def assert_kicker_numbers_equal(self, kicker_numbers, reference):
+        self.assertEqual([row[:2] for row in kicker_numbers], [row[:2] for row in reference])
+        for row, reference_row in zip(kicker_numbers, reference):
+            self.assertAlmostEqual(row[2], reference_row[2], places=6)
+
+    def test_replay(self):
+        old_replay()
+        reference = self.get_kicker_numbers()
+        self.assertTrue(models.KickerNumber.objects.filter(player=self.newcomer).exists())
+        rating.replay()
+        self.assert_kicker_numbers_equal(self.get_kicker_numbers(), reference)
+
+    def test_next_match(self):
+        rating.replay()
+        match = models.Match.objects.latest()
+        match.pk = None
+        match.timestamp += datetime.timedelta(minutes=10)
+        match.save()
+        old_add_kicker_numbers(match)
+        reference = self.get_kicker_numbers()
+        models.KickerNumber.objects.filter(timestamp=match.timestamp).delete()
+        ratings = rating.get_current_ratings()
+        players = [match.player_a_1_id, match.player_a_2_id, match.player_b_1_id, match.player_b_2_id]
+        two_player_game = match.player_a_1_id == match.player_a_2_id
+        numbers, deltas, __ = ratings.rate(players, rating.get_score(match.goals_a, match.goals_b, match.seconds,
+                                                                     two_player_game),
+                                           rating.get_weight(match.seconds, two_player_game))
+        rating.add_kicker_numbers(ratings, [models.KickerNumber(player_id=player_id, number=number + delta,
+                                                                timestamp=match.timestamp)
+                                            for player_id, number, delta in zip(players, numbers, deltas)])
+        self.assert_kicker_numbers_equal(self.get_kicker_numbers(), reference)
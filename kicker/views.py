@@ -30,7 +30,6 @@ from django import forms
 from django.forms.utils import ValidationError
 from django.http import Http404
 from django.conf import settings
-from django.db.models import Q
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
@@ -40,151 +39,55 @@ from django.utils.translation import ugettext_lazy as _, ugettext
 from jb_common.utils.base import respond_in_json, JSONRequestException, get_really_full_name, successful_response, \
     int_or_zero, static_response, get_cached_file_content
 import samples.utils.views as utils
-from kicker import models
-
-
-class NoKickerNumber(Exception):
-    pass
+from kicker import models, rating
+from kicker.rating import NoKickerNumber, average_goal_frequency, average_match_duration, get_score, get_weight, \
+    get_expected_score
 
 
 def get_current_kicker_number(player):
     try:
-        return models.KickerNumber.objects.filter(player=player).latest().number
-    except models.KickerNumber.DoesNotExist:
+        return rating.get_current_ratings().numbers[player.pk]
+    except KeyError:
         raise NoKickerNumber
 
 
-def average_goal_frequency(two_player_game):
-    return 0.0310 if two_player_game else 0.0253
-
-
-def average_match_duration(two_player_game):
-    return 226 if two_player_game else 261
-
-
-def get_elo_delta(goals_a, goals_b, number_player_a_1, number_player_a_2, number_player_b_1, number_player_b_2,
-                  seconds, two_player_game):
-    S = 1 / 2 + 1 / 2 * (goals_a - goals_b) / (seconds * average_goal_frequency(two_player_game))
-    E = 1 / (1 + 10 ** ((number_player_b_1 + number_player_b_2 - number_player_a_1 - number_player_a_2) / 800))
-    delta = seconds / average_match_duration(two_player_game) * (S - E)
-    return delta
-
-
 def get_current_kicker_number_or_estimate(player):
-    try:
-        return get_current_kicker_number(player)
-    except NoKickerNumber:
-        preliminary_kicker_number = 1500
-        matches = list(models.Match.objects.filter(Q(player_a_1=player) | Q(player_a_2=player) | Q(player_b_1=player) |
-                                                   Q(player_b_2=player)).filter(finished=True).distinct())
-        # FixMe: This part is very inefficient.  One should collect the matches
-        # *before* one enters the while loop.  This way, one avoids unnecessary
-        # doubling of many operations.  On the other hand, one needs a new data
-        # structure that holds the matches.  Fortunately, this is only rarely
-        # needed.
-        cycles_left = 50
-        while cycles_left:
-            cycles_left -= 1
-            old_kicker_number = preliminary_kicker_number
-            number_of_matches = 0
-            for match in matches:
-                try:
-                    number_player_a_1 = get_current_kicker_number(match.player_a_1) if match.player_a_1 != player \
-                        else preliminary_kicker_number
-                    number_player_a_2 = get_current_kicker_number(match.player_a_2) if match.player_a_2 != player \
-                        else preliminary_kicker_number
-                    number_player_b_1 = get_current_kicker_number(match.player_b_1) if match.player_b_1 != player \
-                        else preliminary_kicker_number
-                    number_player_b_2 = get_current_kicker_number(match.player_b_2) if match.player_b_2 != player \
-                        else preliminary_kicker_number
-                except NoKickerNumber:
-                    continue
-                delta = get_elo_delta(match.goals_a, match.goals_b,
-                                      number_player_a_1, number_player_a_2, number_player_b_1, number_player_b_2,
-                                      match.seconds, two_player_game=match.player_a_1 == match.player_a_2)
-                delta_player = 40 * delta
-                if player in [match.player_b_1, match.player_b_2]:
-                    delta_player = -delta_player
-                preliminary_kicker_number += delta_player
-                number_of_matches += 1
-            if number_of_matches < 7:
-                raise NoKickerNumber
-            if abs(old_kicker_number - preliminary_kicker_number) < 1:
-                break
-        return preliminary_kicker_number
+    return rating.get_current_ratings().get_number_or_estimate(player.pk)
 
 
 def get_k(player=None):
-    return 24 if not player or models.KickerNumber.objects.filter(player=player).count() > 30 else 30
-
-
-def get_old_stock_value(player):
-    try:
-        return models.StockValue.objects.filter(gambler=player).latest()
-    except models.StockValue.DoesNotExist:
-        return 100
+    return rating.get_current_ratings().get_k(player and player.pk)
 
 
 class MatchResult(object):
 
-    def __init__(self, match):
-        self.player_a_1, self.player_a_2, self.player_b_1, self.player_b_2 = \
-            match.player_a_1, match.player_a_2, match.player_b_1, match.player_b_2
+    def __init__(self, match, ratings=None):
+        self.ratings = ratings or rating.get_current_ratings()
+        self.players = [match.player_a_1_id, match.player_a_2_id, match.player_b_1_id, match.player_b_2_id]
         self.timestamp = match.timestamp
-        self.two_player_game = match.player_a_1 == match.player_a_2
+        self.two_player_game = match.player_a_1_id == match.player_a_2_id
         try:
-            self.number_player_a_1 = get_current_kicker_number_or_estimate(self.player_a_1)
-            self.number_player_a_2 = get_current_kicker_number_or_estimate(self.player_a_2)
-            self.number_player_b_1 = get_current_kicker_number_or_estimate(self.player_b_1)
-            self.number_player_b_2 = get_current_kicker_number_or_estimate(self.player_b_2)
+            self.numbers, self.deltas, delta = self.ratings.rate(
+                self.players, get_score(match.goals_a, match.goals_b, match.seconds, self.two_player_game),
+                get_weight(match.seconds, self.two_player_game))
         except NoKickerNumber:
             self.result_available = False
             self.expected_goal_difference = self.estimated_win_team_1 = None
         else:
             self.result_available = True
-            delta = get_elo_delta(
-                match.goals_a, match.goals_b,
-                self.number_player_a_1, self.number_player_a_2, self.number_player_b_1, self.number_player_b_2,
-                match.seconds, self.two_player_game)
-            self.delta_a_1 = get_k(match.player_a_1) * delta
-            self.delta_a_2 = get_k(match.player_a_2) * delta
-            self.delta_b_1 = -get_k(match.player_b_1) * delta
-            self.delta_b_2 = -get_k(match.player_b_2) * delta
-            self.new_number_a_1 = self.number_player_a_1 + self.delta_a_1
-            self.new_number_a_2 = self.number_player_a_2 + self.delta_a_2
-            self.new_number_b_1 = self.number_player_b_1 + self.delta_b_1
-            self.new_number_b_2 = self.number_player_b_2 + self.delta_b_2
-            B = 10 ** ((self.number_player_b_1 + self.number_player_b_2 - self.number_player_a_1 - self.number_player_a_2)
-                     / 800)
-            self.expected_goal_difference = (1 / (1 + B) - 1 / 2) * \
+            self.expected_goal_difference = (get_expected_score(*self.numbers) - 1 / 2) * \
                 2 * average_goal_frequency(self.two_player_game) * average_match_duration(self.two_player_game)
-            self.estimated_win_team_1 = get_k() * delta
+            self.estimated_win_team_1 = self.ratings.get_k() * delta
 
     def add_kicker_numbers(self):
         if self.result_available:
-            models.KickerNumber.objects.create(player=self.player_a_1, number=self.new_number_a_1, timestamp=self.timestamp)
-            models.KickerNumber.objects.create(player=self.player_a_2, number=self.new_number_a_2, timestamp=self.timestamp)
-            models.KickerNumber.objects.create(player=self.player_b_1, number=self.new_number_b_1, timestamp=self.timestamp)
-            models.KickerNumber.objects.create(player=self.player_b_2, number=self.new_number_b_2, timestamp=self.timestamp)
+            rating.add_kicker_numbers(self.ratings, [
+                models.KickerNumber(player_id=player_id, number=number + delta, timestamp=self.timestamp)
+                for player_id, number, delta in zip(self.players, self.numbers, self.deltas)])
 
     def add_stock_values(self):
         if self.result_available:
-            for shares in self.player_a_1.sold_shares.all():
-                models.StockValue.objects.create(
-                    gambler=shares.owner,
-                    value=get_old_stock_value(shares.owner) + shares.number / 100 * self.delta_a_1, timestamp=self.timestamp)
-            for shares in self.player_a_2.sold_shares.all():
-                models.StockValue.objects.create(
-                    gambler=shares.owner,
-                    value=get_old_stock_value(shares.owner) + shares.number / 100 * self.delta_a_2, timestamp=self.timestamp)
-            for shares in self.player_b_1.sold_shares.all():
-                models.StockValue.objects.create(
-                    gambler=shares.owner,
-                    value=get_old_stock_value(shares.owner) + shares.number / 100 * self.delta_b_1, timestamp=self.timestamp)
-            for shares in self.player_b_2.sold_shares.all():
-                models.StockValue.objects.create(
-                    gambler=shares.owner,
-                    value=get_old_stock_value(shares.owner) + shares.number / 100 * self.delta_b_2, timestamp=self.timestamp)
+            rating.add_stock_values(self.players, self.deltas, self.timestamp)
 
 
 @login_required
@@ -290,26 +193,31 @@ def set_start_kicker_number(request, username):
 
 def get_eligible_players():
     two_weeks_ago = datetime.datetime.now() - datetime.timedelta(weeks=2)
-    ids = list(models.KickerNumber.objects.filter(timestamp__gt=two_weeks_ago).values_list("player", flat=True))
-    eligible_players = list(django.contrib.auth.models.User.objects.in_bulk(ids).values())
-    result = [(get_current_kicker_number_or_estimate(player), player) for player in eligible_players]
-    result.sort(reverse=True)
+    ids = set(models.KickerNumber.objects.filter(timestamp__gt=two_weeks_ago).values_list("player", flat=True))
+    eligible_players = django.contrib.auth.models.User.objects.select_related("kicker_user_details").in_bulk(ids)
+    ratings = rating.get_current_ratings()
+    result = [(ratings.get_number_or_estimate(player_id), player) for player_id, player in eligible_players.items()]
+    result.sort(key=lambda entry: entry[0], reverse=True)
     return [(entry[1], int(round(entry[0]))) for entry in result]
 
 
 def generate_plot(image_format):
     eligible_players = [entry[0] for entry in get_eligible_players()]
     hundred_days_ago = datetime.datetime.now() - datetime.timedelta(days=100)
+    kicker_numbers = {}
+    for player_id, timestamp, number in models.KickerNumber.objects. \
+        filter(player__in=eligible_players, timestamp__gt=hundred_days_ago).order_by("timestamp", "id"). \
+        values_list("player", "timestamp", "number"):
+        kicker_numbers.setdefault(player_id, []).append((timestamp, number))
     plot_data = []
     for player in eligible_players:
         x_values, y_values = [], []
-        latest_day = None
-        kicker_numbers = list(models.KickerNumber.objects.filter(player=player, timestamp__gt=hundred_days_ago))
-        for i, kicker_number in enumerate(kicker_numbers):
-            if i == len(kicker_numbers) - 1 or \
-                    kicker_numbers[i + 1].timestamp.toordinal() != kicker_number.timestamp.toordinal():
-                x_values.append(kicker_number.timestamp)
-                y_values.append(kicker_number.number)
+        player_kicker_numbers = kicker_numbers.get(player.pk, [])
+        for i, (timestamp, number) in enumerate(player_kicker_numbers):
+            if i == len(player_kicker_numbers) - 1 or \
+                    player_kicker_numbers[i + 1][0].toordinal() != timestamp.toordinal():
+                x_values.append(timestamp)
+                y_values.append(number)
         plot_data.append((x_values, y_values, player.kicker_user_details.nickname or player.username))
     if image_format == "png":
         figsize, position, legend_loc, legend_bbox, ncol = (8, 12), (0.1, 0.5, 0.8, 0.45), "upper center", [0.5, -0.1], 3
@@ -353,7 +261,10 @@ def summary(request):
     eligible_players = get_eligible_players()
     return render(request, "kicker/summary.html",
                   {"title": _("Kicker summary"), "kicker_numbers": eligible_players, "username": request.user.username,
-                   "latest_matches": models.Match.objects.reverse()[:20]})
+                   "latest_matches": models.Match.objects.select_related(
+                       "player_a_1__kicker_user_details", "player_a_2__kicker_user_details",
+                       "player_b_1__kicker_user_details", "player_b_2__kicker_user_details",
+                       "reporter__kicker_user_details").reverse()[:20]})
 
 
 class UserDetailsForm(forms.ModelForm):
@@ -414,51 +325,4 @@ def get_player(request):
         (user_details.user.username, user_details.nickname or user_details.user.first_name or user_details.user.username))
 
 
-start_number = 1300
-
-def get_start_numbers():
-    players = {}
-    # FixMe: Exclude all matches for which is not 0 < S < 1 because they thwart
-    # convergence.  They should be only a few.
-    for i, match in enumerate(models.Match.objects.all()[:50]):
-        players[match.player_a_1] = players[match.player_a_2] = \
-            players[match.player_b_1] = players[match.player_b_2] = start_number
-        if i / len(players) > 7:
-            break
-    if i / len(players) <= 7 and i < 49:
-        return
-    matches = list(models.Match.objects.all()[:i + 1])
-    cycles_left = 1000
-    while cycles_left:
-        cycles_left -= 1
-        old_players = players.copy()
-        for match in matches:
-            delta = get_elo_delta(match.goals_a, match.goals_b,
-                                  players[match.player_a_1], players[match.player_a_2], players[match.player_b_1],
-                                  players[match.player_b_2],
-                                  match.seconds, two_player_game=match.player_a_1 == match.player_a_2)
-            delta_player = 40 * delta
-            players[match.player_a_1] += delta_player
-            players[match.player_a_2] += delta_player
-            players[match.player_b_1] -= delta_player
-            players[match.player_b_2] -= delta_player
-        if all(abs(players[player] - old_players[player]) < 1 for player in players):
-            break
-    else:
-        return
-    return players
-
-
-def replay():
-    models.KickerNumber.objects.all().delete()
-    players = get_start_numbers()
-    if not players:
-        return
-    zero_timestamp = models.Match.objects.all()[0].timestamp - datetime.timedelta(seconds=1)
-    for player, start_number in players.items():
-        models.KickerNumber.objects.create(player=player, number=start_number, timestamp=zero_timestamp)
-    for match in models.Match.objects.iterator():
-        MatchResult(match).add_kicker_numbers()
-
-
 _ = ugettext
@@ -81,11 +81,13 @@ def create_depo(timestamp, deposition_number, sample_name, comments=None):
 
     deposition.submit()
 
-create_depo(datetime.datetime(2014, 10, 1, 10, 30), "14C-001", "14-JS-1")
-create_depo(datetime.datetime(2014, 10, 2, 11, 10), "14C-002", "14-JS-2")
-create_depo(datetime.datetime(2014, 10, 2, 12, 10), "14C-003", "14-JS-3")
-create_depo(datetime.datetime(2014, 10, 2, 13, 10), "14C-004", "14-JS-4")
-create_depo(datetime.datetime(2014, 10, 2, 14, 10), "14C-005", "14-JS-5")
-create_depo(datetime.datetime(2014, 10, 2, 15, 10), "14C-006", "14-JS-6")
+# All depositions are sent to the server in one request.
+with Batch():
+    create_depo(datetime.datetime(2014, 10, 1, 10, 30), "14C-001", "14-JS-1")
+    create_depo(datetime.datetime(2014, 10, 2, 11, 10), "14C-002", "14-JS-2")
+    create_depo(datetime.datetime(2014, 10, 2, 12, 10), "14C-003", "14-JS-3")
+    create_depo(datetime.datetime(2014, 10, 2, 13, 10), "14C-004", "14-JS-4")
+    create_depo(datetime.datetime(2014, 10, 2, 14, 10), "14C-005", "14-JS-5")
+    create_depo(datetime.datetime(2014, 10, 2, 15, 10), "14C-006", "14-JS-6")
 
 logout()
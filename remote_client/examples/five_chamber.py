@@ -83,11 +83,13 @@ def create_depo(timestamp, deposition_number, comments=None):
 
     deposition.submit()
 
-create_depo(datetime.datetime(2014, 10, 1, 10, 30), "14S-001")
-create_depo(datetime.datetime(2014, 10, 2, 11, 10), "14S-002")
-create_depo(datetime.datetime(2014, 10, 2, 12, 10), "14S-003","AFTER: chamber cleaned!")
-create_depo(datetime.datetime(2014, 10, 2, 13, 10), "14S-004")
-create_depo(datetime.datetime(2014, 10, 2, 14, 10), "14S-005")
-create_depo(datetime.datetime(2014, 10, 2, 15, 10), "14S-006")
+# All depositions are sent to the server in one request.
+with Batch():
+    create_depo(datetime.datetime(2014, 10, 1, 10, 30), "14S-001")
+    create_depo(datetime.datetime(2014, 10, 2, 11, 10), "14S-002")
+    create_depo(datetime.datetime(2014, 10, 2, 12, 10), "14S-003","AFTER: chamber cleaned!")
+    create_depo(datetime.datetime(2014, 10, 2, 13, 10), "14S-004")
+    create_depo(datetime.datetime(2014, 10, 2, 14, 10), "14S-005")
+    create_depo(datetime.datetime(2014, 10, 2, 15, 10), "14S-006")
 
 logout()
@@ -1,6 +1,8 @@
 #!/bin/sh
 if [ "$1" = "build_test_main" ]
 then
+    # Keep the order of the processes, and thus their IDs, reproducible.
+    export JULIABASE_SUBMISSION_THREADS=1
     ./five_chamber.py
     ./cluster_tool.py
     ./pds.py
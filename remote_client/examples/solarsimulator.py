@@ -74,12 +74,14 @@ def read_solarsimulator_file(filepath):
 setup_logging("console")
 login("juliabase", "12345")
 
-for filepath in sorted(glob.glob("solarsimulator_raw_data/measurement-*.dat")):
-    header_data, evaluated_data = read_solarsimulator_file(filepath)
-    try:
-        sample_id = get_sample(header_data["sample"])
-    except SampleNotFound as exception:
-        sample = exception.sample
+measurements = [(filepath,) + read_solarsimulator_file(filepath)
+                for filepath in sorted(glob.glob("solarsimulator_raw_data/measurement-*.dat"))]
+sample_ids = get_samples(header_data["sample"] for __, header_data, __ in measurements)
+
+for filepath, header_data, evaluated_data in measurements:
+    sample_id = sample_ids[header_data["sample"]]
+    if isinstance(sample_id, Sample):
+        sample = sample_id
         sample.currently_responsible_person = header_data["operator"]
         sample.current_location = "Solar simulator lab"
         sample.topic = "Legacy"
@@ -92,6 +94,7 @@ for filepath in sorted(glob.glob("solarsimulator_raw_data/measurement-*.dat")):
         substrate.material = "corning"
         substrate.operator = header_data["operator"]
         substrate.submit()
+        sample_ids[header_data["sample"]] = sample_id
 
     structuring = connection.open("structurings/by_sample/{0}?timestamp={1}".format(
         urllib.parse.quote_plus(str(sample_id)),
@@ -40,9 +40,9 @@
 
 from __future__ import absolute_import, unicode_literals, division
 from . import six
-from .six.moves import urllib, http_cookiejar, _thread
+from .six.moves import urllib, http_cookiejar, http_client, _thread, queue
 
-import mimetypes, json, logging, os, datetime, time, random, re, decimal
+import mimetypes, json, logging, os, datetime, time, random, re, decimal, socket, threading, io, sqlite3
 from io import IOBase
 if six.PY3:
     file = IOBase
@@ -50,8 +50,8 @@ if six.PY3:
 from . import settings
 
 
-__all__ = ["login", "logout", "connection", "primary_keys", "JuliaBaseError", "setup_logging",
-           "format_timestamp", "parse_timestamp", "as_json"]
+__all__ = ["login", "logout", "connection", "primary_keys", "primary_key_cache", "JuliaBaseError", "setup_logging",
+           "format_timestamp", "parse_timestamp", "as_json", "SubmissionPool", "Batch"]
 
 
 def setup_logging(destination=None):
@@ -105,7 +105,7 @@ def clean_header(value):
     """
     if isinstance(value, bool):
         return "on" if value else None
-    elif isinstance(value, file):
+    elif isinstance(value, (file, BatchResult, JoinedIds)):
         return value
     else:
         if six.PY2:
@@ -115,6 +115,8 @@ def clean_header(value):
 
 
 def comma_separated_ids(ids):
+    if isinstance(ids, BatchResult) or any(isinstance(id_, BatchResult) for id_ in ids):
+        return JoinedIds(ids)
     return ",".join(str(id_) for id_ in ids)
 
 
@@ -316,21 +318,170 @@ class JuliaBaseError(Exception):
         return "({0}) {1}".format(self.error_code, self.error_message)
 
 
+class Response(object):
+    """Class for a completely read HTTP response.  It is returned by
+    `JuliaBaseConnection._do_http_request`.  Since the body is read
+    immediately, the HTTP connection can be re-used for the next request.
+
+    :ivar status: the HTTP status code
+    :ivar headers: the HTTP headers of the response
+    :ivar body: the body of the response
+
+    :type status: int
+    :type headers: ``http.client.HTTPMessage``
+    :type body: bytes
+    """
+
+    def __init__(self, http_response):
+        self.status, self.headers, self.body = http_response.status, http_response.msg, http_response.read()
+
+    def info(self):
+        return self.headers
+
+    def read(self):
+        return self.body
+
+
+class ConnectionPool(object):
+    """Class for keeping idle HTTP connections alive so that they can be
+    re-used.  This saves the TCP and TLS handshakes of all but the first
+    requests.  The pool is thread-safe.  At most ``settings.HTTP_POOL_SIZE``
+    idle connections per server are kept.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle_connections = {}
+
+    def get(self, scheme, netloc):
+        """Returns an idle connection to the server, or a new one if there is
+        no idle connection.
+
+        :param scheme: the URL scheme; either ``"http"`` or ``"https"``
+        :param netloc: the host name with optional port
+
+        :type scheme: str
+        :type netloc: str
+
+        :return:
+          the HTTP connection
+
+        :rtype: ``http.client.HTTPConnection``
+        """
+        with self.lock:
+            connections = self.idle_connections.get((scheme, netloc))
+            if connections:
+                return connections.pop()
+        connection_class = http_client.HTTPSConnection if scheme == "https" else http_client.HTTPConnection
+        return connection_class(netloc, timeout=settings.HTTP_TIMEOUT)
+
+    def put(self, scheme, netloc, http_connection):
+        """Returns a connection to the pool after its response was read
+        completely.
+
+        :param scheme: the URL scheme; either ``"http"`` or ``"https"``
+        :param netloc: the host name with optional port
+        :param http_connection: the HTTP connection
+
+        :type scheme: str
+        :type netloc: str
+        :type http_connection: ``http.client.HTTPConnection``
+        """
+        with self.lock:
+            connections = self.idle_connections.setdefault((scheme, netloc), [])
+            if len(connections) < settings.HTTP_POOL_SIZE:
+                connections.append(http_connection)
+                return
+        http_connection.close()
+
+    def clear(self):
+        """Closes all idle connections.
+        """
+        with self.lock:
+            for connections in self.idle_connections.values():
+                for http_connection in connections:
+                    http_connection.close()
+            self.idle_connections = {}
+
+
+def get_retry_delay(attempt):
+    """Returns the time to wait before the next try of a failed request.  It
+    grows exponentially with the number of attempts, up to
+    ``settings.HTTP_RETRY_MAX_DELAY``.  The actual delay is random between
+    zero and this value (“full jitter”), so that many crawlers whose
+    connections broke down at the same time don't return at the same time.
+
+    :param attempt: the number of failed attempts so far, starting at 1
+
+    :type attempt: int
+
+    :return:
+      the delay in seconds
+
+    :rtype: float
+    """
+    return random.uniform(0, min(settings.HTTP_RETRY_MAX_DELAY, settings.HTTP_RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+
+
 class JuliaBaseConnection(object):
     """Class for the routines that connect to the database at HTTP level.
     This is a singleton class, and its only instance resides at top-level in
-    this module.
+    this module.  It is thread-safe, so that processes can be submitted
+    concurrently, see `SubmissionPool`.  The HTTP connections are kept alive
+    and re-used.
     """
     cookie_jar = http_cookiejar.CookieJar()
-    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookie_jar))
     http_headers = [("User-agent", "JuliaBase-Remote/1.0"),
                     ("X-requested-with", "XMLHttpRequest"),
                     ("Accept", "application/json,text/html;q=0.9,application/xhtml+xml;q=0.9,text/*;q=0.8,*/*;q=0.7")]
-    opener.addheaders = http_headers
+    max_redirections = 5
 
     def __init__(self):
         self.username = None
         self.root_url = None
+        self.csrf_token = None
+        self.pool = ConnectionPool()
+        self.local = threading.local()
+
+    def _send(self, request):
+        """Sends an HTTP request over a pooled connection and reads the
+        response.  Cookies are sent and received with `cookie_jar`.
+
+        :param request: the HTTP request
+
+        :type request: ``urllib.request.Request``
+
+        :return:
+          the response
+
+        :rtype: `Response`
+
+        :raises socket.error: if a lower-level error occured, e.g. the HTTP
+            connection couldn't be established.
+        :raises http.client.HTTPException: if the HTTP response was invalid,
+            e.g. because the server closed a kept-alive connection.
+        """
+        self.cookie_jar.add_cookie_header(request)
+        headers = dict(self.http_headers)
+        if self.csrf_token:
+            headers["X-CSRFToken"] = self.csrf_token
+        headers.update(request.header_items())
+        components = urllib.parse.urlsplit(request.get_full_url())
+        selector = urllib.parse.urlunsplit(("", "", components.path or "/", components.query, ""))
+        http_connection = self.pool.get(components.scheme, components.netloc)
+        try:
+            http_connection.request(request.get_method(), selector, request.data, headers)
+            http_response = http_connection.getresponse()
+            response = Response(http_response)
+        except:
+            http_connection.close()
+            raise
+        if http_response.will_close:
+            http_connection.close()
+        else:
+            self.pool.put(components.scheme, components.netloc, http_connection)
+        self.cookie_jar.extract_cookies(response, request)
+        return response
 
     def _do_http_request(self, url, data=None):
         logging.debug("{0} {1!r}".format(url, data))
@@ -340,25 +491,35 @@ class JuliaBaseConnection(object):
             content_type, body = encode_multipart_formdata(data)
             headers = {"Content-Type": content_type, "Referer": url}
             request = urllib.request.Request(url, body, headers)
-        max_cycles = 10
-        while max_cycles > 0:
-            max_cycles -= 1
+        attempt = 0
+        redirections = 0
+        while True:
             try:
-                return self.opener.open(request)
-            except urllib.error.HTTPError as error:
-                if error.code in [404, 422] and error.info()["Content-Type"].startswith("application/json"):
-                    error_code, error_message = json.loads(error.read().decode("utf-8"))
+                response = self._send(request)
+            except (socket.error, http_client.HTTPException) as error:
+                attempt += 1
+                if attempt >= settings.HTTP_MAX_RETRIES:
+                    logging.error("Request failed.")
+                    raise urllib.error.URLError(error)
+                time.sleep(get_retry_delay(attempt))
+                continue
+            if response.status in (301, 302, 303, 307) and redirections < self.max_redirections:
+                redirections += 1
+                url = urllib.parse.urljoin(url, response.info()["Location"])
+                request = urllib.request.Request(url, request.data, dict(request.header_items())) \
+                          if response.status == 307 else urllib.request.Request(url)
+                continue
+            if response.status >= 400:
+                if response.status in [404, 422] and response.info()["Content-Type"].startswith("application/json"):
+                    error_code, error_message = json.loads(response.read().decode("utf-8"))
                     raise JuliaBaseError(error_code, error_message)
-                server_error_message = error.read().decode("utf-8")
-                error.msg = "{}\n\n{}".format(error.msg, server_error_message)
+                server_error_message = response.read().decode("utf-8")
+                message = "{}\n\n{}".format(http_client.responses.get(response.status, ""), server_error_message)
                 if six.PY2:
-                    error.msg = error.msg.encode("utf-8")
-                raise error
-            except urllib.error.URLError:
-                if max_cycles == 0:
-                    logging.error("Request failed.")
-                    raise
-            time.sleep(3 * random.random())
+                    message = message.encode("utf-8")
+                raise urllib.error.HTTPError(url, response.status, message, response.info(),
+                                             io.BytesIO(response.read()))
+            return response
 
     def open(self, relative_url, data=None, response_is_json=True):
         """Do an HTTP request with the JuliaBase server.  If ``data`` is not
@@ -386,12 +547,15 @@ class JuliaBaseConnection(object):
             because it contained errors.  For example, you requested a sample
             that doesn't exist, or the transmitted measurement data was
             incomplete.
+        :raises urllib.error.HTTPError: if the server returned an HTTP error.
         :raises urllib.error.URLError: if a lower-level error occured, e.g. the
-            HTTP connection couldn't be established.
+            HTTP connection couldn't be established, even after
+            ``settings.HTTP_MAX_RETRIES`` attempts.
         """
         if not self.root_url:
             raise Exception("No root URL defined.  Maybe not logged-in?")
         if data is not None:
+            # In a `Batch`, the POST request is only recorded.
             cleaned_data = {}
             for key, value in data.items():
                 key = clean_header(key)
@@ -404,6 +568,9 @@ class JuliaBaseConnection(object):
                         cleaned_list = [clean_header(item) for item in value if value is not None]
                         if cleaned_list:
                             cleaned_data[key] = cleaned_list
+            batch = getattr(self.local, "batch", None)
+            if batch is not None:
+                return batch.add(relative_url, cleaned_data)
             response = self._do_http_request(self.root_url + relative_url, cleaned_data)
         else:
             response = self._do_http_request(self.root_url + relative_url)
@@ -417,7 +584,7 @@ class JuliaBaseConnection(object):
         csrf_cookies = {cookie for cookie in self.cookie_jar if cookie.name == "csrftoken"}
         if csrf_cookies:
             assert len(csrf_cookies) == 1
-            self.opener.addheaders = self.http_headers + [("X-CSRFToken", csrf_cookies.pop().value)]
+            self.csrf_token = csrf_cookies.pop().value
 
     def login(self, root_url, username, password):
         self.root_url = root_url
@@ -432,7 +599,9 @@ class JuliaBaseConnection(object):
 
     def logout(self):
         self.open("logout_remote_client")
-        self.username = self.root_url = None
+        self.username = self.root_url = self.csrf_token = None
+        self.pool.clear()
+        primary_key_cache.close()
 
 connection = JuliaBaseConnection()
 
@@ -465,11 +634,169 @@ def logout():
     logging.info("Successfully logged-out.")
 
 
+class PrimaryKeyCache(object):
+    """Persistent cache of the primary keys of samples, users, topics, and
+    external operators.  It is stored in the SQLite file
+    ``settings.PRIMARY_KEY_CACHE``, e.g. next to the diff file of a crawler,
+    so that the primary keys need not be looked up again in the next run.  If
+    this setting is ``None``, nothing is cached.  It is a singleton.
+
+    Entries older than ``settings.PRIMARY_KEY_CACHE_TTL`` seconds are ignored.
+    Moreover, the cache is validated against the server once per run: If a
+    sample, user, topic, or external operator was renamed or deleted on the
+    server since the entries of that component were stored, they are dropped.
+    Only names that were found are cached.
+
+    All methods are thread-safe.
+    """
+
+    def __init__(self):
+        self.database = None
+        self.lock = threading.Lock()
+
+    def _open(self):
+        """Opens the SQLite file, and validates its contents against the
+        server.  This must be called with `lock` acquired.
+
+        :return:
+          whether the cache is enabled
+
+        :rtype: bool
+        """
+        if self.database is None:
+            if not settings.PRIMARY_KEY_CACHE:
+                return False
+            database = sqlite3.connect(settings.PRIMARY_KEY_CACHE, check_same_thread=False)
+            with database:
+                database.execute("CREATE TABLE IF NOT EXISTS primary_keys (component TEXT, name TEXT, id INTEGER, "
+                                 "timestamp REAL, PRIMARY KEY (component, name))")
+                database.execute("CREATE TABLE IF NOT EXISTS components (component TEXT PRIMARY KEY, version INTEGER, "
+                                 "complete_timestamp REAL)")
+                database.execute("CREATE TABLE IF NOT EXISTS owner (root_url TEXT, username TEXT)")
+                # Which names are visible depends on the user.
+                owner = (connection.root_url, connection.username)
+                if database.execute("SELECT root_url, username FROM owner").fetchall() != [owner]:
+                    for table in ("primary_keys", "components", "owner"):
+                        database.execute("DELETE FROM " + table)
+                    database.execute("INSERT INTO owner VALUES (?, ?)", owner)
+                versions = connection.open("primary_keys/versions")
+                old_versions = dict(database.execute("SELECT component, version FROM components"))
+                for component, version in versions.items():
+                    if old_versions.get(component) != version:
+                        database.execute("DELETE FROM primary_keys WHERE component=?", (component,))
+                        database.execute("INSERT OR REPLACE INTO components VALUES (?, ?, NULL)", (component, version))
+                database.execute("DELETE FROM primary_keys WHERE timestamp<?", (time.time() - settings.PRIMARY_KEY_CACHE_TTL,))
+            self.database = database
+        return True
+
+    def get(self, component, names):
+        """Returns the cached primary keys of the given names.
+
+        :param component: the kind of the names; one of ``"samples"``,
+            ``"users"``, ``"topics"``, and ``"external_operators"``
+        :param names: the names to be looked up
+
+        :type component: str
+        :type names: iterable of unicode
+
+        :return:
+          mapping of the cached names to their primary keys; names which are
+          not in the cache are missing
+
+        :rtype: dict mapping unicode to int
+        """
+        names = list(names)
+        result = {}
+        with self.lock:
+            if self._open():
+                for i in range(0, len(names), 500):
+                    chunk = names[i:i + 500]
+                    result.update(self.database.execute(
+                        "SELECT name, id FROM primary_keys WHERE component=? AND name IN ({0})".format(
+                            ",".join(len(chunk) * "?")), [component] + chunk))
+        return result
+
+    def get_all(self, component):
+        """Returns all primary keys of a component if they were stored with
+        `set_all` and are still valid.
+
+        :param component: the kind of the names; one of ``"users"``,
+            ``"topics"``, and ``"external_operators"``
+
+        :type component: str
+
+        :return:
+          mapping of all names to their primary keys, or ``None`` if they are
+          not in the cache
+
+        :rtype: dict mapping unicode to int or NoneType
+        """
+        with self.lock:
+            if self._open():
+                complete_timestamp = self.database.execute("SELECT complete_timestamp FROM components WHERE component=?",
+                                                           (component,)).fetchone()
+                if complete_timestamp and complete_timestamp[0] and \
+                   complete_timestamp[0] >= time.time() - settings.PRIMARY_KEY_CACHE_TTL:
+                    return dict(self.database.execute("SELECT name, id FROM primary_keys WHERE component=?", (component,)))
+
+    def update(self, component, primary_keys):
+        """Stores primary keys in the cache.  Aliases of samples, which are
+        mapped to lists of IDs, are ignored.
+
+        :param component: the kind of the names; one of ``"samples"``,
+            ``"users"``, ``"topics"``, and ``"external_operators"``
+        :param primary_keys: mapping of names to primary keys
+
+        :type component: str
+        :type primary_keys: dict mapping unicode to int
+        """
+        with self.lock:
+            if self._open():
+                now = time.time()
+                with self.database:
+                    self.database.executemany("INSERT OR REPLACE INTO primary_keys VALUES (?, ?, ?, ?)",
+                                              ((component, name, id_, now) for name, id_ in primary_keys.items()
+                                               if isinstance(id_, six.integer_types)))
+
+    def set_all(self, component, primary_keys):
+        """Stores all primary keys of a component in the cache, so that they
+        are returned by `get_all`.
+
+        :param component: the kind of the names; one of ``"users"``,
+            ``"topics"``, and ``"external_operators"``
+        :param primary_keys: mapping of all names to primary keys
+
+        :type component: str
+        :type primary_keys: dict mapping unicode to int
+        """
+        with self.lock:
+            if self._open():
+                now = time.time()
+                with self.database:
+                    self.database.execute("DELETE FROM primary_keys WHERE component=?", (component,))
+                    self.database.executemany("INSERT INTO primary_keys VALUES (?, ?, ?, ?)",
+                                              ((component, name, id_, now) for name, id_ in primary_keys.items()))
+                    self.database.execute("UPDATE components SET complete_timestamp=? WHERE component=?",
+                                          (now, component))
+
+    def close(self):
+        """Closes the SQLite file.  It is re-opened and re-validated on next
+        use.
+        """
+        with self.lock:
+            if self.database is not None:
+                self.database.close()
+                self.database = None
+
+primary_key_cache = PrimaryKeyCache()
+
+
 class PrimaryKeys(object):
     """Dictionary-like class for storing primary keys.  I use this class only
     to delay the costly loading of the primary keys until they are really
     accessed.  This way, GET-request-only usage of the Remote Client becomes
-    faster.  It is a singleton.
+    faster.  It is a singleton.  Components found in the `primary_key_cache`
+    are not fetched from the server at all.
 
     :ivar components: set of types of primary keys that should be fetched.  For
         example, it may contain ``"external_operators=*"`` if all external
@@ -483,15 +810,343 @@ class PrimaryKeys(object):
     def __init__(self):
         self.primary_keys = None
         self.components = {"topics=*", "users=*"}
+        self.lock = threading.Lock()
 
     def __getitem__(self, key):
         if self.primary_keys is None:
-            self.primary_keys = connection.open("primary_keys?" + "&".join(self.components))
+            with self.lock:
+                if self.primary_keys is None:
+                    primary_keys, missing_components = {}, []
+                    for component in sorted(self.components):
+                        cached_primary_keys = primary_key_cache.get_all(component.partition("=")[0])
+                        if cached_primary_keys is None:
+                            missing_components.append(component)
+                        else:
+                            primary_keys[component.partition("=")[0]] = cached_primary_keys
+                    if missing_components:
+                        fetched_primary_keys = connection.open("primary_keys?" + "&".join(missing_components))
+                        for component, component_primary_keys in fetched_primary_keys.items():
+                            primary_key_cache.set_all(component, component_primary_keys)
+                        primary_keys.update(fetched_primary_keys)
+                    self.primary_keys = primary_keys
         return self.primary_keys[key]
 
 primary_keys = PrimaryKeys()
 
 
+class BatchResult(object):
+    """Class for the result of a POST request within a `Batch`.  It is
+    returned by :py:meth:`JuliaBaseConnection.open` instead of the actual
+    result, which is only known after the batch was sent to the server.  It
+    can be used in the data of later requests of the same batch, e.g. the ID
+    of a new sample can be used for adding a substrate to it.
+
+    :ivar index: the index of the request in its batch
+    :ivar done: whether the batch was sent to the server
+
+    :type index: int
+    :type done: bool
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.done = False
+        self._value = self.error = None
+
+    @property
+    def value(self):
+        """Contains the actual result of the request.  Accessing it raises the
+        exception of a failed request.
+        """
+        if not self.done:
+            raise Exception("The batch has not been submitted yet.")
+        if self.error:
+            raise self.error
+        return self._value
+
+    def as_json(self):
+        if self.done:
+            # A failed request of an earlier batch is an invalid reference, so
+            # that requests depending on it fail, too.
+            return {"$result": -1} if self.error else self._value
+        return {"$result": self.index}
+
+    def __repr__(self):
+        return "<BatchResult {0}>".format(self.index)
+
+
+class JoinedIds(object):
+    """Class for a comma-separated list of IDs within a `Batch`, some of which
+    are `BatchResult` instances.  The server joins the IDs after having
+    resolved the batch results.
+    """
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def as_json(self):
+        ids = self.ids.as_json() if isinstance(self.ids, BatchResult) else \
+              [id_.as_json() if isinstance(id_, BatchResult) else id_ for id_ in self.ids]
+        return {"$join": ids if isinstance(ids, list) else [ids]}
+
+
+class Batch(object):
+    """Context manager for sending many POST requests to the server at once.
+    This is much faster for crawlers which add hundreds of processes.  Use it
+    like this::
+
+        with Batch():
+            for filepath in filepaths:
+                measurement = PDSMeasurement()
+                ...
+                measurement.submit()
+
+    Within the ``with`` block, POST requests of the current thread are not
+    sent immediately but recorded, and
+    :py:meth:`JuliaBaseConnection.open` returns a `BatchResult` instead of
+    the result.  GET requests are sent immediately, so they don't see the
+    effects of the recorded requests; for example, new deposition numbers
+    cannot be requested within a batch because all depositions would get the
+    same number.  Every
+    ``settings.BATCH_SIZE`` requests, and at the end of the ``with`` block,
+    the recorded requests are sent to the server in one request.  There, they
+    are executed in one transaction, but every request in its own savepoint.
+    A failed request doesn't prevent the others from being executed, unless
+    ``all_or_nothing`` is ``True``.  At the end of the ``with`` block, the
+    exception of the first failed request is raised, if any.
+
+    Note that files cannot be uploaded within a batch.
+    """
+
+    def __init__(self, all_or_nothing=False):
+        """
+        :param all_or_nothing: whether nothing should be committed if one
+            request of a batch sent to the server fails
+
+        :type all_or_nothing: bool
+        """
+        self.all_or_nothing = all_or_nothing
+        self.items = []
+        self.results = []
+        self.first_error = None
+
+    def add(self, relative_url, data):
+        """Records a POST request.  This is called by
+        :py:meth:`JuliaBaseConnection.open`.
+
+        :param relative_url: the non-domain part of the URL
+        :param data: the cleaned POST data
+
+        :type relative_url: str
+        :type data: dict mapping unicode to unicode, list, `BatchResult`, or
+          `JoinedIds`
+
+        :return:
+          the placeholder for the result of the request
+
+        :rtype: `BatchResult`
+        """
+        for value in data.values():
+            if isinstance(value, file):
+                raise ValueError("Files cannot be uploaded within a batch.")
+        result = BatchResult(len(self.items))
+        self.items.append({"url": relative_url, "data": data})
+        self.results.append(result)
+        if len(self.items) >= settings.BATCH_SIZE:
+            self.flush()
+        return result
+
+    def flush(self):
+        """Sends all recorded requests to the server.
+        """
+        if not self.items:
+            return
+        items = json.dumps(self.items, default=lambda value: value.as_json())
+        results, self.items = self.results, []
+        self.results = []
+        previous_batch, connection.local.batch = connection.local.batch, None
+        try:
+            data = {"items": items}
+            if self.all_or_nothing:
+                data["all_or_nothing"] = True
+            response = connection.open("bulk_submit", data)
+        finally:
+            connection.local.batch = previous_batch
+        for result, (status, value) in zip(results, response["results"]):
+            result.done = True
+            if status == 200 and response["committed"]:
+                result._value = value
+            else:
+                result.error = JuliaBaseError(*value) if isinstance(value, list) and len(value) == 2 else \
+                               JuliaBaseError(0, "HTTP status {0}".format(status) if status != 200 else "Not committed")
+                logging.error("Request {0} of batch failed: {1}".format(result.index, result.error))
+                self.first_error = self.first_error or result.error
+
+    def __enter__(self):
+        if getattr(connection.local, "batch", None) is not None:
+            raise Exception("Batches cannot be nested.")
+        connection.local.batch = self
+        return self
+
+    def __exit__(self, type_, value, tb):
+        try:
+            if type_ is None:
+                self.flush()
+        finally:
+            connection.local.batch = None
+        if type_ is None and self.first_error:
+            raise self.first_error
+
+
+class PendingSubmission(object):
+    """Class for a submission which was given to a `SubmissionPool`.  It is
+    executed by one of the worker threads of the pool after all of its
+    predecessors are finished.
+
+    :ivar predecessors: the submissions which must be finished before this one
+      may start
+
+    :type predecessors: list of `PendingSubmission`
+    """
+
+    def __init__(self, instance, predecessors):
+        self.instance, self.predecessors = instance, predecessors
+        self.finished = threading.Event()
+        self.value = self.error = None
+
+    def run(self):
+        for predecessor in self.predecessors:
+            predecessor.finished.wait()
+        # Release the references so that long chains of submissions don't
+        # keep all instances in memory.
+        self.predecessors = []
+        try:
+            self.value = self.instance.submit()
+        except Exception as error:
+            logging.error("Submission of {0!r} failed: {1}".format(self.instance, error))
+            self.error = error
+        finally:
+            self.finished.set()
+
+    def result(self):
+        """Waits until the submission is finished and returns the return
+        value of the ``submit()`` method, which is usually the ID of the new
+        process.
+
+        :return:
+          the return value of ``submit()``
+
+        :rtype: ``object``
+
+        :raises Exception: the exception raised by ``submit()``
+        """
+        self.finished.wait()
+        if self.error:
+            raise self.error
+        return self.value
+
+
+class SubmissionPool(object):
+    """Context manager for submitting processes concurrently.  This is useful
+    for crawlers which add many processes because most of the time of a
+    submission is spent waiting for the server.  Use it like this::
+
+        with SubmissionPool() as pool:
+            for filepath in filepaths:
+                measurement = PDSMeasurement()
+                ...
+                pool.submit(measurement)
+
+    ``pool.submit`` calls the ``submit()`` method of the instance in one of
+    ``settings.SUBMISSION_THREADS`` worker threads and returns a
+    `PendingSubmission` immediately.  Submissions which share a sample are
+    executed in the order in which they were given to the pool, so that e.g.
+    the substrate of a new sample is added before its first measurement.  The
+    sample IDs are taken from the ``sample_ids`` or ``sample_id`` attribute of
+    the instance, unless given explicitly.  Submissions with an unknown sample
+    ID, e.g. of a new sample, must be done outside of the pool.
+
+    If a submission fails, the others are continued nevertheless.  At the end
+    of the ``with`` block, the pool waits for all submissions, and raises the
+    exception of the first failed submission, if any.
+    """
+
+    def __init__(self, number_of_threads=None):
+        """
+        :param number_of_threads: the number of worker threads; defaults to
+            ``settings.SUBMISSION_THREADS``
+
+        :type number_of_threads: int
+        """
+        self.number_of_threads = number_of_threads or settings.SUBMISSION_THREADS
+        # The queue is bounded so that the crawler doesn't read all of its data
+        # files before the first one is submitted.
+        self.queue = queue.Queue(2 * self.number_of_threads)
+        self.last_submissions = {}
+        self.submissions = []
+        self.threads = []
+
+    def _work(self):
+        while True:
+            submission = self.queue.get()
+            if submission is None:
+                break
+            submission.run()
+
+    def __enter__(self):
+        for __ in range(self.number_of_threads):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def submit(self, instance, sample_ids=None):
+        """Submits an instance concurrently.
+
+        :param instance: the process or sample to be submitted; it must have a
+            ``submit()`` method
+        :param sample_ids: the IDs of the samples affected by the submission;
+            if not given, they are taken from the instance
+
+        :type instance: ``object``
+        :type sample_ids: list of int
+
+        :return:
+          the pending submission
+
+        :rtype: `PendingSubmission`
+        """
+        if sample_ids is None:
+            sample_ids = getattr(instance, "sample_ids", None)
+            if sample_ids is None:
+                sample_id = getattr(instance, "sample_id", None)
+                sample_ids = [sample_id] if sample_id is not None else []
+        predecessors = [self.last_submissions[sample_id] for sample_id in set(sample_ids)
+                        if sample_id in self.last_submissions]
+        submission = PendingSubmission(instance, predecessors)
+        for sample_id in sample_ids:
+            self.last_submissions[sample_id] = submission
+        self.submissions = [pending for pending in self.submissions if not pending.finished.is_set() or pending.error]
+        self.submissions.append(submission)
+        # Since the queue is processed in order, all predecessors have already
+        # been taken by a worker thread when this submission is taken.
+        # Therefore, waiting for them cannot dead-lock.
+        self.queue.put(submission)
+        return submission
+
+    def __exit__(self, type_, value, tb):
+        for __ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if type_ is None:
+            for submission in self.submissions:
+                if submission.error:
+                    raise submission.error
+
+
 def sanitize_for_markdown(text):
     """Convert a raw string to Markdown syntax.  This is used when external
     (legacy) strings are imported.  For example, comments found in data files
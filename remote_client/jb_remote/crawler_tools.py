@@ -22,11 +22,33 @@ from six.moves import cPickle as pickle
 from six.moves.email_mime_multipart import MIMEMultipart
 from six.moves.email_mime_text import MIMEText
 
-import os, sys, re, subprocess, time, smtplib, email, logging
+import os, sys, re, time, smtplib, email, logging, hashlib, sqlite3, threading
+from multiprocessing.pool import ThreadPool
+from six.moves import queue
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
 
 from . import settings
 
 
+hash_algorithm = "xxh64" if xxhash else "blake2b" if hasattr(hashlib, "blake2b") else "md5"
+"""Hash algorithm for new files in the diff files of `find_changed_files`.
+"""
+
+
 class PIDLock(object):
     """Class for process locking in with statements.  It works only on UNIX.  You
     can use this class like this::
@@ -99,6 +121,325 @@ class PIDLock(object):
             logging.info("Removed lock {0}".format(self.lockfile_path))
 
 
+def _list_directory(dirname):
+    """Lists a directory like ``os.walk`` does, i.e. symbolic links to
+    directories are neither descended into nor returned as files.  Broken
+    symbolic links are skipped.
+
+    :param dirname: path to the directory
+
+    :type dirname: str
+
+    :return:
+      generator of the entries of the directory as tuples of the name, the
+      path, and the modification time (``None`` for directories)
+
+    :rtype: generator of (str, str, float or NoneType)
+    """
+    if scandir:
+        for entry in scandir(dirname):
+            try:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        yield entry.name, entry.path, None
+                else:
+                    yield entry.name, entry.path, entry.stat().st_mtime
+            except OSError:
+                pass
+    else:
+        for name in os.listdir(dirname):
+            path = os.path.join(dirname, name)
+            try:
+                if os.path.isdir(path):
+                    if not os.path.islink(path):
+                        yield name, path, None
+                else:
+                    yield name, path, os.path.getmtime(path)
+            except OSError:
+                pass
+
+
+def _scan_directory_tree(root, directory, compiled_pattern):
+    """Returns the modification times of all files in a directory tree.  The
+    directories are listed in ``settings.CRAWLER_THREADS`` threads, so that
+    the latencies of network filesystems overlap.
+
+    :param root: absolute root path of the files to be scanned
+    :param directory: absolute path of the directory tree to be scanned; it
+        must be `root` or a directory in it
+    :param compiled_pattern: regular expression for filenames (without path)
+        that should be scanned
+
+    :type root: str
+    :type directory: str
+    :type compiled_pattern: ``_sre.SRE_Pattern``
+
+    :return:
+      the modification times of the found files, with the paths relative to
+      `root`
+
+    :rtype: dict mapping str to float
+    """
+    directories = queue.Queue()
+    directories.put(directory)
+    found = {}
+    lock = threading.Lock()
+
+    def scan_directories():
+        while True:
+            dirname = directories.get()
+            if dirname is None:
+                break
+            mtimes = {}
+            try:
+                for name, path, mtime in _list_directory(dirname):
+                    if mtime is None:
+                        directories.put(path)
+                    elif compiled_pattern.match(name):
+                        mtimes[os.path.relpath(path, root)] = mtime
+            except OSError as error:
+                # Like ``os.walk``, ignore directories which cannot be listed.
+                logging.warning("Could not scan {0}: {1}".format(dirname, error))
+            finally:
+                with lock:
+                    found.update(mtimes)
+                directories.task_done()
+
+    threads = [threading.Thread(target=scan_directories) for __ in range(settings.CRAWLER_THREADS)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    directories.join()
+    for thread in threads:
+        directories.put(None)
+    for thread in threads:
+        thread.join()
+    return found
+
+
+def _get_hasher(algorithm):
+    """Returns a new hash object for the given algorithm, or ``None`` if the
+    algorithm is not available (anymore).
+    """
+    if algorithm == "xxh64":
+        return xxhash and xxhash.xxh64()
+    try:
+        return hashlib.new(algorithm)
+    except ValueError:
+        return None
+
+
+def _hash_file(filepath, algorithm):
+    """Returns the hash of a file's contents.
+
+    :param filepath: absolute path to the file
+    :param algorithm: name of the hash algorithm; if it is not available,
+        `hash_algorithm` is used
+
+    :type filepath: str
+    :type algorithm: str
+
+    :return:
+      the used algorithm, the hex digest of the file; the latter is ``None`` if
+      the file could not be read
+
+    :rtype: str, str or NoneType
+    """
+    hasher = _get_hasher(algorithm)
+    if hasher is None:
+        algorithm, hasher = hash_algorithm, _get_hasher(hash_algorithm)
+    try:
+        with open(filepath, "rb") as file_:
+            for chunk in iter(lambda: file_.read(1024 * 1024), b""):
+                hasher.update(chunk)
+    except (IOError, OSError):
+        return algorithm, None
+    return algorithm, hasher.hexdigest()
+
+
+class FileStatuses(object):
+    """Class for the modification status of all files of a crawler, as stored
+    in the diff file.  The diff file is an SQLite database, so that only the
+    statuses of touched files need to be written after a run.  Diff files
+    written by earlier versions of this module (pickles) are converted
+    transparently.
+
+    For every file, its path relative to the root, its modification time, and
+    the hash of its contents are stored, together with the name of the hash
+    algorithm.  Files keep their algorithm, so that converted diff files (with
+    MD5 sums) don't make all files look changed.
+    """
+
+    def __init__(self, diff_file, pattern=None):
+        """
+        :param diff_file: path to a writable SQLite file which contains the
+            modification status of all files of the last run; it is created if
+            it doesn't exist yet
+        :param pattern: Regular expression for filenames (without path) that
+            should be scanned.  If it differs from the pattern of the last run,
+            all files not matching it are forgotten.  If ``None``, the pattern
+            is not changed.
+
+        :type diff_file: str
+        :type pattern: unicode or NoneType
+        """
+        if os.path.exists(diff_file):
+            with open(diff_file, "rb") as file_:
+                is_pickle = file_.read(16) not in {b"SQLite format 3\0", b""}
+            if is_pickle:
+                self._convert_pickle(diff_file)
+        self.database = sqlite3.connect(diff_file, check_same_thread=False)
+        with self.database:
+            self._create_tables(self.database)
+        self.pattern = self._get_pattern()
+        self.pattern_changed = pattern is not None and pattern != self.pattern
+        if self.pattern_changed:
+            compiled_pattern = re.compile(pattern, re.IGNORECASE)
+            with self.database:
+                self.database.executemany("DELETE FROM statuses WHERE path=?",
+                                          ((relative_filepath,) for relative_filepath, __ in self.get_mtimes().items()
+                                           if not compiled_pattern.match(os.path.basename(relative_filepath))))
+                self.database.execute("INSERT OR REPLACE INTO meta VALUES ('pattern', ?)", (pattern,))
+            self.pattern = pattern
+
+    @staticmethod
+    def _create_tables(database):
+        database.execute("CREATE TABLE IF NOT EXISTS statuses (path TEXT PRIMARY KEY, mtime REAL, hash TEXT, "
+                         "algorithm TEXT)")
+        database.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    @classmethod
+    def _convert_pickle(cls, diff_file):
+        """Converts a pickled diff file into the SQLite format.  The new file is
+        built next to the old one and then moved over it, so that an
+        interruption does not lose the statuses.
+        """
+        statuses, pattern = pickle.load(open(diff_file, "rb"))
+        new_diff_file = diff_file + ".new"
+        if os.path.exists(new_diff_file):
+            os.remove(new_diff_file)
+        database = sqlite3.connect(new_diff_file)
+        with database:
+            cls._create_tables(database)
+            database.executemany("INSERT INTO statuses VALUES (?, ?, ?, 'md5')",
+                                 ((relative_filepath, mtime, md5sum.decode("ascii") if isinstance(md5sum, bytes) else md5sum)
+                                  for relative_filepath, (mtime, md5sum) in statuses.items()))
+            database.execute("INSERT INTO meta VALUES ('pattern', ?)", (pattern,))
+        database.close()
+        os.rename(new_diff_file, diff_file)
+        logging.info("Converted {0} to SQLite.".format(diff_file))
+
+    def _get_pattern(self):
+        row = self.database.execute("SELECT value FROM meta WHERE key='pattern'").fetchone()
+        return row and row[0]
+
+    def get_mtimes(self, paths=None, subtrees=()):
+        """Returns the stored modification times of files.
+
+        :param paths: the relative paths of the files; if ``None``, all files
+            are returned
+        :param subtrees: relative paths of directories all files in which
+            should be returned, too
+
+        :type paths: iterable of str or NoneType
+        :type subtrees: iterable of str
+
+        :return:
+          the modification times of the files, with the paths relative to the
+          root
+
+        :rtype: dict mapping str to float
+        """
+        if paths is None:
+            return dict(self.database.execute("SELECT path, mtime FROM statuses"))
+        mtimes = {}
+        paths = list(paths)
+        for i in range(0, len(paths), 500):
+            chunk = paths[i:i + 500]
+            mtimes.update(self.database.execute("SELECT path, mtime FROM statuses WHERE path IN ({0})".format(
+                ",".join(len(chunk) * "?")), chunk))
+        for subtree in subtrees:
+            prefix = os.path.join(subtree, "")
+            mtimes.update(self.database.execute("SELECT path, mtime FROM statuses WHERE substr(path, 1, ?)=?",
+                                                (len(prefix), prefix)))
+        return mtimes
+
+    def _get_hashes(self, paths):
+        hashes = {}
+        for i in range(0, len(paths), 500):
+            chunk = paths[i:i + 500]
+            for path, hash_, algorithm in self.database.execute(
+                    "SELECT path, hash, algorithm FROM statuses WHERE path IN ({0})".format(",".join(len(chunk) * "?")),
+                    chunk):
+                hashes[path] = (hash_, algorithm)
+        return hashes
+
+    def update(self, root, found, stored):
+        """Compares found files with the stored statuses, and writes the new
+        statuses.  Touched files, i.e. files with a new modification time, are
+        hashed in ``settings.CRAWLER_THREADS`` threads.
+
+        :param root: absolute root path of the files
+        :param found: the modification times of the files found on disk, with
+            the paths relative to `root`
+        :param stored: the stored modification times of the same files, see
+            `get_mtimes`; stored files which are missing in `found` are
+            considered removed
+
+        :type root: str
+        :type found: dict mapping str to float
+        :type stored: dict mapping str to float
+
+        :return:
+          files changed, files removed; both as absolute paths, and the
+          changed files sorted by timestamp, oldest first
+
+        :rtype: list of str, list of str
+        """
+        touched = [relative_filepath for relative_filepath, mtime in found.items() if stored.get(relative_filepath) != mtime]
+        removed = set(stored) - set(found)
+        old_hashes = self._get_hashes(touched)
+
+        def hash_file(relative_filepath):
+            old_hash, old_algorithm = old_hashes.get(relative_filepath, (None, hash_algorithm))
+            return (relative_filepath,) + _hash_file(os.path.join(root, relative_filepath), old_algorithm or hash_algorithm)
+
+        changed, rows = [], []
+        if touched:
+            pool = ThreadPool(settings.CRAWLER_THREADS)
+            try:
+                for relative_filepath, algorithm, hash_ in pool.imap_unordered(hash_file, touched, 64):
+                    if hash_ is None:
+                        # Vanished or unreadable; re-visited in the next run.
+                        continue
+                    if old_hashes.get(relative_filepath) != (hash_, algorithm):
+                        changed.append(relative_filepath)
+                    rows.append((relative_filepath, found[relative_filepath], hash_, algorithm))
+            finally:
+                pool.close()
+                pool.join()
+        if rows or removed:
+            with self.database:
+                self.database.executemany("INSERT OR REPLACE INTO statuses VALUES (?, ?, ?, ?)", rows)
+                self.database.executemany("DELETE FROM statuses WHERE path=?",
+                                          ((relative_filepath,) for relative_filepath in removed))
+        changed.sort(key=lambda relative_filepath: found[relative_filepath])
+        return [os.path.join(root, relative_filepath) for relative_filepath in changed], \
+            [os.path.join(root, relative_filepath) for relative_filepath in removed]
+
+    def defer(self, filepaths, max_age):
+        """Removes the statuses of files, so that they are considered changed
+        in the next run.  See `defer_files`.
+        """
+        oldest_mtime = time.time() - max_age
+        with self.database:
+            self.database.executemany("DELETE FROM statuses WHERE path=? AND mtime>?",
+                                      ((filepath, oldest_mtime) for filepath in filepaths))
+
+    def close(self):
+        self.database.close()
+
+
 def find_changed_files(root, diff_file, pattern=""):
     """Returns the files changed or removed since the last run of this
     function.  The files are given as a list of absolute paths.  Changed files
@@ -111,10 +452,16 @@ def find_changed_files(root, diff_file, pattern=""):
     modification status of the last run only refers to file paths relative to
     ``root``.
 
+    The directory tree is scanned, and the contents of files with a new
+    modification time are hashed, in ``settings.CRAWLER_THREADS`` threads.
+    Only the statuses of touched and removed files are written to the diff
+    file.
+
     :param root: absolute root path of the files to be scanned
-    :param diff_file: path to a writable pickle file which contains the
+    :param diff_file: path to a writable SQLite file which contains the
         modification status of all files of the last run; it is created if it
-        doesn't exist yet
+        doesn't exist yet, and converted if it is a pickle file of earlier
+        versions of this function
     :param pattern: Regular expression for filenames (without path) that should
         be scanned.  By default, all files are scanned.
 
@@ -127,50 +474,12 @@ def find_changed_files(root, diff_file, pattern=""):
 
     :rtype: list of str, list of str
     """
-    compiled_pattern = re.compile(pattern, re.IGNORECASE)
-    if os.path.exists(diff_file):
-        statuses, last_pattern = pickle.load(open(diff_file, "rb"))
-        if last_pattern != pattern:
-            for relative_filepath in [relative_filepath for relative_filepath in statuses
-                                      if not compiled_pattern.match(os.path.basename(relative_filepath))]:
-                del statuses[relative_filepath]
-    else:
-        statuses, last_pattern = {}, None
-    touched = []
-    found = set()
-    for dirname, __, filenames in os.walk(root):
-        for filename in filenames:
-            if compiled_pattern.match(filename):
-                filepath = os.path.join(dirname, filename)
-                relative_filepath = os.path.relpath(filepath, root)
-                found.add(relative_filepath)
-                mtime = os.path.getmtime(filepath)
-                status = statuses.setdefault(relative_filepath, [None, None])
-                if mtime != status[0]:
-                    status[0] = mtime
-                    touched.append(filepath)
-    removed = set(statuses) - found
-    for relative_filepath in removed:
-        del statuses[relative_filepath]
-    removed = [os.path.join(root, relative_filepath) for relative_filepath in removed]
-    changed = []
-    timestamps = {}
-    if touched:
-        xargs_process = subprocess.Popen(["xargs", "-0", "md5sum"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-        xargs_output = xargs_process.communicate(b"\0".join(touched))[0]
-        if xargs_process.returncode != 0:
-            raise subprocess.CalledProcessError(xargs_process.returncode, "xargs")
-        for line in xargs_output.splitlines():
-            md5sum, __, filepath = line.partition(b"  ")
-            status = statuses[os.path.relpath(filepath, root)]
-            if md5sum != status[1]:
-                status[1] = md5sum
-                changed.append(filepath)
-                timestamps[filepath] = status[0]
-    changed.sort(key=lambda filepath: timestamps[filepath])
-    if touched or removed or last_pattern != pattern:
-        pickle.dump((statuses, pattern), open(diff_file, "wb"), pickle.HIGHEST_PROTOCOL)
-    return changed, removed
+    statuses = FileStatuses(diff_file, pattern)
+    try:
+        found = _scan_directory_tree(root, root, re.compile(pattern, re.IGNORECASE))
+        return statuses.update(root, found, statuses.get_mtimes())
+    finally:
+        statuses.close()
 
 
 def defer_files(diff_file, filepaths):
@@ -185,7 +494,7 @@ def defer_files(diff_file, filepaths):
 
     If a filepath is not found in the diff file, this is ignored.
 
-    :param diff_file: path to a writable pickle file which contains the
+    :param diff_file: path to a writable SQLite file which contains the
         modification status of all files of the last run; it is created if it
         doesn't exist yet
     :param filepaths: all relative paths that should be removed from the diff
@@ -195,12 +504,126 @@ def defer_files(diff_file, filepaths):
     :type diff_file: str
     :type filepaths: iterable of str
     """
-    statuses, pattern = pickle.load(open(diff_file, "rb"))
-    twelve_weeks_ago = time.time() - 12 * 7 * 24 * 3600
-    for filepath in filepaths:
-        if filepath in statuses and statuses[filepath][0] > twelve_weeks_ago:
-            del statuses[filepath]
-    pickle.dump((statuses, pattern), open(diff_file, "wb"), pickle.HIGHEST_PROTOCOL)
+    statuses = FileStatuses(diff_file)
+    try:
+        statuses.defer(filepaths, 12 * 7 * 24 * 3600)
+    finally:
+        statuses.close()
+
+
+class ChangeWatcher(object):
+    """Class for detecting changed files with inotify instead of scanning the
+    whole directory tree.  This works only on Linux with local filesystems
+    (not with NFS) and needs the package ``inotify_simple``.  It is meant for
+    crawlers which run permanently::
+
+        with ChangeWatcher(root, diff_file, pattern) as watcher:
+            while True:
+                changed, removed = watcher.get_changed_files()
+                ...
+
+    The first call of `get_changed_files` scans the whole tree like
+    `find_changed_files`, so that changes made while no watcher was running
+    are found, too.  Later calls only look at the files and directories
+    reported by inotify.  The diff file is the same as for
+    `find_changed_files`, so both can be used alternately.
+    """
+
+    def __init__(self, root, diff_file, pattern=""):
+        """
+        :param root: absolute root path of the files to be watched
+        :param diff_file: path to a writable SQLite file which contains the
+            modification status of all files; see `find_changed_files`
+        :param pattern: Regular expression for filenames (without path) that
+            should be watched.  By default, all files are watched.
+
+        :type root: str
+        :type diff_file: str
+        :type pattern: unicode
+        """
+        if inotify_simple is None:
+            raise ImportError("ChangeWatcher needs the package inotify_simple.")
+        self.root, self.diff_file, self.pattern = root, diff_file, pattern
+        self.compiled_pattern = re.compile(pattern, re.IGNORECASE)
+        self.inotify = self.watches = None
+        self.full_scan_necessary = True
+
+    def __enter__(self):
+        self.inotify = inotify_simple.INotify()
+        self.watches = {}
+        self._add_watches(self.root)
+        return self
+
+    def __exit__(self, type_, value, tb):
+        self.inotify.close()
+
+    def _add_watches(self, directory):
+        """Watches a directory and all directories in it.
+        """
+        flags = inotify_simple.flags
+        mask = flags.CLOSE_WRITE | flags.ATTRIB | flags.CREATE | flags.DELETE | flags.MOVED_FROM | flags.MOVED_TO
+        for dirname, __, __ in os.walk(directory):
+            try:
+                self.watches[self.inotify.add_watch(dirname, mask)] = os.path.relpath(dirname, self.root)
+            except OSError as error:
+                logging.warning("Could not watch {0}: {1}".format(dirname, error))
+
+    def get_changed_files(self, timeout=None):
+        """Waits for changes, and returns the files changed or removed since
+        the last call.  See `find_changed_files` for details.
+
+        :param timeout: maximal time in seconds to wait for changes; if
+            ``None``, wait forever
+
+        :type timeout: float or NoneType
+
+        :return:
+          files changed, files removed; both lists are empty if the timeout
+          was reached
+
+        :rtype: list of str, list of str
+        """
+        if self.full_scan_necessary:
+            self.full_scan_necessary = False
+            return find_changed_files(self.root, self.diff_file, self.pattern)
+        flags = inotify_simple.flags
+        paths, subtrees = set(), set()
+        # Wait one second more for coalescing the events of bursts of changes.
+        for event in self.inotify.read(timeout=None if timeout is None else int(timeout * 1000), read_delay=1000):
+            if event.mask & flags.Q_OVERFLOW:
+                logging.warning("inotify queue overflow, re-scanning {0}".format(self.root))
+                return find_changed_files(self.root, self.diff_file, self.pattern)
+            dirname = self.watches.get(event.wd)
+            if dirname is None:
+                continue
+            if event.mask & flags.IGNORED:
+                del self.watches[event.wd]
+                continue
+            relative_path = os.path.normpath(os.path.join(dirname, event.name))
+            if event.mask & flags.ISDIR:
+                if event.mask & (flags.CREATE | flags.MOVED_TO):
+                    self._add_watches(os.path.join(self.root, relative_path))
+                subtrees.add(relative_path)
+            else:
+                paths.add(relative_path)
+        if not paths and not subtrees:
+            return [], []
+        found = {}
+        for relative_path in paths:
+            if self.compiled_pattern.match(os.path.basename(relative_path)):
+                try:
+                    found[relative_path] = os.path.getmtime(os.path.join(self.root, relative_path))
+                except OSError:
+                    pass
+        for subtree in subtrees:
+            directory = os.path.join(self.root, subtree)
+            if os.path.isdir(directory):
+                found.update(_scan_directory_tree(self.root, directory, self.compiled_pattern))
+        statuses = FileStatuses(self.diff_file, self.pattern)
+        try:
+            return statuses.update(self.root, found, statuses.get_mtimes(paths, subtrees))
+        finally:
+            statuses.close()
 
 
 def send_error_mail(from_, subject, text, html=None):
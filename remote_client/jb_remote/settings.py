@@ -40,6 +40,27 @@ from __future__ import absolute_import, unicode_literals, division
 ROOT_URL = None
 TESTSERVER_ROOT_URL = "https://demo.juliabase.org/"
 
+# Timeout of HTTP connections in seconds.
+HTTP_TIMEOUT = 60
+# Maximal number of idle HTTP connections kept alive for re-use.
+HTTP_POOL_SIZE = 8
+# Failed requests are repeated with an exponentially growing random delay.
+HTTP_MAX_RETRIES = 10
+HTTP_RETRY_BASE_DELAY = 0.5
+HTTP_RETRY_MAX_DELAY = 60
+# Number of worker threads of a ``SubmissionPool``.
+SUBMISSION_THREADS = 4
+# Maximal number of requests sent at once by a ``Batch``.
+BATCH_SIZE = 200
+# Path to an SQLite file in which primary keys are cached across runs, e.g.
+# next to the diff file of a crawler.  ``None`` disables the cache.
+PRIMARY_KEY_CACHE = None
+# Maximal age of cached primary keys in seconds.
+PRIMARY_KEY_CACHE_TTL = 7 * 24 * 3600
+# Number of threads for scanning directories and hashing files in
+# ``find_changed_files``.
+CRAWLER_THREADS = 8
+
 SMTP_SERVER = "mailrelay.example.com:587"
 # If not empty, TLS is used.
 SMTP_LOGIN = "username"
@@ -43,6 +43,29 @@ from jb_remote import *
 
 
 settings.ROOT_URL = settings.TESTSERVER_ROOT_URL = os.environ.get("JULIABASE_SERVER_URL", "http://localhost/")
+settings.SUBMISSION_THREADS = int(os.environ.get("JULIABASE_SUBMISSION_THREADS", settings.SUBMISSION_THREADS))
+
+
+def get_next_deposition_number(letter):
+    """Requests the next free deposition number from the server.  This is not
+    possible within a `Batch`, because the depositions recorded in the batch
+    are not yet known to the server, so all of them would get the same number.
+
+    :param letter: the letter of the deposition system, e.g. ``"C"`` for the
+        cluster tool
+
+    :type letter: str
+
+    :return:
+      the next free deposition number
+
+    :rtype: unicode
+
+    :raises Exception: if called within a `Batch`
+    """
+    if getattr(connection.local, "batch", None) is not None:
+        raise Exception("Deposition numbers cannot be requested within a batch.  Set the number explicitly.")
+    return connection.open("next_deposition_number/" + letter)
 
 
 class ClusterToolDeposition(object):
@@ -84,7 +107,7 @@ class ClusterToolDeposition(object):
         if not self.operator:
             self.operator = connection.username
         if self.id is None and self.number is None:
-            self.number = connection.open("next_deposition_number/C")
+            self.number = get_next_deposition_number("C")
         data = {"number": self.number,
                 "operator": primary_keys["users"][self.operator],
                 "timestamp": format_timestamp(self.timestamp),
@@ -314,6 +337,30 @@ name_pattern = re.compile(r"\d\d[A-Z]-\d{3,4}([-A-Za-z_/][-A-Za-z_/0-9#()]*)?"
                           r"|(\d\d-[A-Z]{2}[A-Z0-9]{0,2}|[A-Z]{2}[A-Z0-9]{2})-[-A-Za-z_/0-9#()]+")
 allowed_character_pattern = re.compile("[-A-Za-z_/0-9#()]")
 
+def get_legacy_sample_name(sample_name):
+    """Returns the sample name as it is stored in the database.  If the sample
+    name doesn't fit into the naming scheme, a legacy sample name accoring to
+    ``{short_year}-LGCY-...`` is generated.
+
+    :param sample_name: the name of the sample
+
+    :type sample_name: unicode
+
+    :return:
+      the sample name in the database
+
+    :rtype: unicode
+    """
+    if not name_pattern.match(sample_name):
+        # Build a legacy name with the ``{short_year}-LGCY-`` prefix.
+        allowed_sample_name_characters = []
+        for character in sample_name:
+            if allowed_character_pattern.match(character):
+                allowed_sample_name_characters.append(character)
+        sample_name = "{}-LGCY-{}".format(str(datetime.datetime.now().year)[2:], "".join(allowed_sample_name_characters)[:30])
+    return sample_name
+
+
 def get_sample(sample_name):
     """Looks up a sample name in the database, and returns its ID.  (No full
     `Sample` instance is returned to spare ressources.  Mostly, only the ID is
@@ -337,21 +384,49 @@ def get_sample(sample_name):
         newly created sample and substrate for your convenience.  See the
         documentation of this exception class for more information.
     """
+    sample_id = get_samples([sample_name])[sample_name]
+    if isinstance(sample_id, Sample):
+        raise SampleNotFound(sample_id)
+    return sample_id
 
-    if not name_pattern.match(sample_name):
-        # Build a legacy name with the ``{short_year}-LGCY-`` prefix.
-        allowed_sample_name_characters = []
-        for character in sample_name:
-            if allowed_character_pattern.match(character):
-                allowed_sample_name_characters.append(character)
-        sample_name = "{}-LGCY-{}".format(str(datetime.datetime.now().year)[2:], "".join(allowed_sample_name_characters)[:30])
-    sample_id = connection.open("primary_keys?samples=" + urllib.parse.quote_plus(sample_name))["samples"].get(sample_name)
-    if sample_id is not None and not isinstance(sample_id, list):
-        return sample_id
-    else:
-        new_sample = Sample()
-        new_sample.name = sample_name
-        raise SampleNotFound(new_sample)
+
+def get_samples(sample_names, chunk_size=100):
+    """Looks up many sample names in the database at once.  This is the bulk
+    version of `get_sample`, which needs only one request per `chunk_size`
+    sample names.  Sample names found in the
+    :py:class:`~jb_remote.common.PrimaryKeyCache` are not looked up at all.
+
+    :param sample_names: the names of the samples
+    :param chunk_size: the maximal number of sample names per request
+
+    :type sample_names: iterable of unicode
+    :type chunk_size: int
+
+    :return:
+      mapping of the given sample names to the IDs of the samples.  If a
+      sample was not found, the name is mapped to a newly created `Sample`
+      instance with only the name set, like in `SampleNotFound`.
+
+    :rtype: dict mapping unicode to int or `jb_remote.Sample`
+    """
+    legacy_names = dict((sample_name, get_legacy_sample_name(sample_name)) for sample_name in set(sample_names))
+    all_names = set(legacy_names.values())
+    sample_ids = primary_key_cache.get("samples", all_names)
+    missing_names = sorted(all_names - set(sample_ids))
+    for i in range(0, len(missing_names), chunk_size):
+        chunk = missing_names[i:i + chunk_size]
+        fetched_sample_ids = connection.open("primary_keys?samples=" + urllib.parse.quote_plus(",".join(chunk)))["samples"]
+        primary_key_cache.update("samples", fetched_sample_ids)
+        sample_ids.update(fetched_sample_ids)
+    result = {}
+    for sample_name, legacy_name in legacy_names.items():
+        sample_id = sample_ids.get(legacy_name)
+        if sample_id is not None and not isinstance(sample_id, list):
+            result[sample_name] = sample_id
+        else:
+            result[sample_name] = Sample()
+            result[sample_name].name = legacy_name
+    return result
 
 
 class SolarsimulatorMeasurement(object):
@@ -513,7 +588,7 @@ class FiveChamberDeposition(object):
         if not self.operator:
             self.operator = connection.username
         if self.number is None:
-            self.number = connection.open("next_deposition_number/S")
+            self.number = get_next_deposition_number("S")
         data = {"number": self.number,
                 "operator": primary_keys["users"][self.operator],
                 "timestamp": format_timestamp(self.timestamp),
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Module which defines the command ``benchmark_search``.  It compares the
+queries of the advanced search as compiled by :py:mod:`jb_common.search` with
+the nested ``pk__in`` subqueries which were used before.  For this, it creates
+a test database (like the test runner does) and fills it with random samples
+and results::
+
+    ./manage.py benchmark_search --samples 100000 --processes 1000000 --explain
+
+Use ``--keepdb`` to re-use the generated database in the next run.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import random, time, datetime
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.http import QueryDict
+from jb_common.search import DetailsSearchTreeNode, explain
+from samples.models import Sample, Process, Result
+
+
+words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta", "iota", "kappa", "lambda", "mu"]
+
+searches = [
+    ("sample name", "_model=Sample&name=123"),
+    ("sample with result", "_model=Sample&name=12&1-_model=Result&1-_old_model=Result&1-title=alpha"),
+    ("sample with two results", "_model=Sample&1-_model=Result&1-_old_model=Result&1-title=alpha"
+     "&2-_model=Result&2-_old_model=Result&2-title=beta"),
+    ("result with sample with result", "_model=Result&title=gamma&1-_model=Sample&1-_old_model=Sample&1-name=3"
+     "&1-1-_model=Result&1-1-_old_model=Result&1-1-title=delta"),
+]
+
+
+def nested_query_set(node, base_query=None):
+    """Builds the query of a search tree the way JuliaBase 1.0 did, i.e. with
+    one nested ``pk__in`` subquery per node.  Abstract nodes are not
+    supported.
+
+    :param node: the search tree node
+    :param base_query: the query set to be used as the starting point of the
+        query
+
+    :type node: `jb_common.search.SearchTreeNode`
+    :type base_query: QuerySet
+
+    :return:
+      the search results
+
+    :rtype: QuerySet
+    """
+    result = base_query if base_query is not None else node.model_class.objects
+    result = result.filter(**node.get_filter_kwargs())
+    children = [child for __, child in node.children if child]
+    if isinstance(node, DetailsSearchTreeNode):
+        details_query = node.details_model_class.objects.filter(**node.details_node.get_filter_kwargs())
+        for child in children:
+            if child.model_class in node.details_node.related_models:
+                name = node.details_node.related_models[child.model_class] + "__pk__in"
+                details_query = details_query.filter(**{name: nested_query_set(child)})
+        children = [child for child in children if child.model_class not in node.details_node.related_models]
+    for child in children:
+        result = result.filter(**{node.related_models[child.model_class] + "__pk__in": nested_query_set(child)})
+    if isinstance(node, DetailsSearchTreeNode):
+        result = result.filter(pk__in=details_query.only("pk"))
+    return result.only("pk")
+
+
+def insert_rows(model, instances):
+    """Inserts model instances with their primary keys already set.  In
+    contrast to ``bulk_create``, this works for models with multi-table
+    inheritance, too.  Only the local fields of the model are written, so the
+    rows of the parent models must be inserted separately.
+
+    :param model: the model class
+    :param instances: the instances to be inserted
+
+    :type model: class (decendant of models.Model)
+    :type instances: list of models.Model
+    """
+    fields = model._meta.local_concrete_fields
+    sql = "INSERT INTO {0} ({1}) VALUES ({2})".format(
+        connection.ops.quote_name(model._meta.db_table), ", ".join(connection.ops.quote_name(field.column)
+                                                                   for field in fields),
+        ", ".join(len(fields) * ["%s"]))
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [[field.get_db_prep_save(field.pre_save(instance, True), connection)
+                                  for field in fields] for instance in instances])
+
+
+class Command(BaseCommand):
+    help = "Compares the queries of the advanced search on a generated test database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", type=int, default=100000, help="Number of samples.  Default: 100000")
+        parser.add_argument("--processes", type=int, default=1000000, help="Number of results.  Default: 1000000")
+        parser.add_argument("--repetitions", type=int, default=3,
+                            help="Number of runs per query; the fastest one is reported.  Default: 3")
+        parser.add_argument("--explain", action="store_true", help="Print the query plans")
+        parser.add_argument("--keepdb", action="store_true", help="Keep the test database for the next run")
+
+    def generate(self, number_of_samples, number_of_processes, batch_size=10000):
+        random.seed(8765432)
+        user = User.objects.create(username="benchmark")
+        for start in range(1, number_of_samples + 1, batch_size):
+            Sample.objects.bulk_create(
+                Sample(id=i, name="{0:06}-{1}".format(i, random.choice(words)), current_location="lab",
+                       currently_responsible_person=user)
+                for i in range(start, min(start + batch_size, number_of_samples + 1)))
+        if hasattr(Sample, "sample_details"):
+            details_model = Sample.sample_details.related.related_model
+            details_model.objects.bulk_create(details_model(sample_id=i) for i in range(1, number_of_samples + 1))
+        content_type = ContentType.objects.get_for_model(Result)
+        timestamp = datetime.datetime(2015, 1, 1)
+        for start in range(1, number_of_processes + 1, batch_size):
+            ids = range(start, min(start + batch_size, number_of_processes + 1))
+            results = [Result(id=i, process_ptr_id=i, timestamp=timestamp, operator=user, content_type=content_type,
+                              actual_object_id=i, title=" ".join(random.sample(words, 2))) for i in ids]
+            insert_rows(Process, results)
+            insert_rows(Result, results)
+            Sample.processes.through.objects.bulk_create(
+                Sample.processes.through(sample_id=random.randint(1, number_of_samples), process_id=i) for i in ids)
+            self.stdout.write("{0} of {1} results generated".format(ids[-1], number_of_processes), ending="\r")
+            self.stdout.flush()
+        self.stdout.write("")
+
+    def measure(self, query_set, repetitions):
+        query_set = query_set.order_by().distinct()
+        best_time = None
+        for __ in range(repetitions):
+            start = time.time()
+            number = query_set.count()
+            list(query_set.order_by("-pk").values_list("pk", flat=True)[:1001])
+            duration = time.time() - start
+            best_time = duration if best_time is None else min(best_time, duration)
+        return number, best_time
+
+    def handle(self, *args, **options):
+        old_database_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=options["keepdb"])
+        try:
+            if not Sample.objects.exists():
+                self.generate(options["samples"], options["processes"])
+            for name, query_string in searches:
+                data = QueryDict(query_string)
+                search_tree = (Sample if data["_model"] == "Sample" else Result).get_search_tree_node()
+                search_tree.parse_data(data, "")
+                assert search_tree.is_valid(), query_string
+                compiled, nested = search_tree.get_query_set(), nested_query_set(search_tree)
+                compiled_number, compiled_time = self.measure(compiled, options["repetitions"])
+                nested_number, nested_time = self.measure(nested, options["repetitions"])
+                assert compiled_number == nested_number, name
+                self.stdout.write("{0:35} {1:8} hits   nested: {2:8.3f} s   compiled: {3:8.3f} s".format(
+                    name, compiled_number, nested_time, compiled_time))
+                if options["explain"]:
+                    self.stdout.write("\nNested plan:\n" + explain(nested.order_by().distinct()))
+                    self.stdout.write("\nCompiled plan:\n" + explain(compiled.order_by().distinct()) + "\n")
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0, keepdb=options["keepdb"])
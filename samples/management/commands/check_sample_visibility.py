@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Module which defines the command ``check_sample_visibility``.  It compares
+the precomputed visibility of samples (see :py:mod:`samples.utils.visibility`)
+with the visibility derived from the topics, departments, permissions, and
+clearances, and prints all differences.  It exits with status 1 if there are
+any.  Use ``rebuild_sample_visibility`` to fix them.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+from samples.models import SampleVisibility
+from samples.utils import visibility
+
+
+class Command(BaseCommand):
+    help = "Checks the precomputed visibility of samples for consistency."
+
+    def handle(self, *args, **options):
+        level_names = dict(SampleVisibility.level_choices)
+        inconsistencies = visibility.check()
+        for user_id, sample_id, stored_level, level in inconsistencies:
+            self.stdout.write("user {0}, sample {1}: stored {2}, expected {3}".format(
+                user_id, sample_id, level_names.get(stored_level, "nothing"), level_names.get(level, "nothing")))
+        if inconsistencies:
+            raise CommandError("{0} inconsistencies found.".format(len(inconsistencies)))
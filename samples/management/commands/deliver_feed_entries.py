@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Module which defines the command ``deliver_feed_entries``.  It connects the
+feed entries which were queued by :py:mod:`samples.utils.feed_delivery` with
+their recipients and should run permanently if
+``settings.DEFERRED_FEED_FAN_OUT`` is ``True``, e.g. as a systemd service::
+
+    /home/juliabase/juliabase/manage.py deliver_feed_entries
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os, time
+from django.core.management.base import BaseCommand
+from samples.utils import feed_delivery
+
+
+class Command(BaseCommand):
+    help = "Delivers queued feed entries to their recipients."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=1,
+                            help="Seconds between two scans of the queue.  Default: 1")
+        parser.add_argument("--max-age", type=float, default=60,
+                            help="Seconds after which queue entries of non-existing feed entries are dropped.  "
+                            "Default: 60")
+        parser.add_argument("--once", action="store_true",
+                            help="Deliver the currently queued feed entries and exit")
+
+    def handle(self, *args, **options):
+        directory = feed_delivery.get_queue_directory()
+        while True:
+            try:
+                filenames = sorted(os.listdir(directory))
+            except OSError:
+                filenames = []
+            for filename in filenames:
+                if filename.endswith(".json"):
+                    path = os.path.join(directory, filename)
+                    error = feed_delivery.deliver_queued_entry(path, options["max_age"])
+                    if error:
+                        self.stderr.write("Error while delivering {0}:\n{1}".format(path, error))
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
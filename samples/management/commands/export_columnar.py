@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Module which defines the command ``export_columnar``.  It writes all tables
+of the given process classes into columnar files, one file per table, see
+:py:mod:`samples.utils.columnar_export`::
+
+    ./manage.py export_columnar FiveChamberDeposition SolarsimulatorMeasurement --output-dir /tmp/export
+
+If no process class is given, all physical process classes are exported.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os, os.path
+from django.core.management.base import BaseCommand, CommandError
+from jb_common.utils.base import get_all_models
+from samples import models
+from samples.utils import columnar_export
+
+
+class Command(BaseCommand):
+    help = "Exports processes into columnar files (Parquet, Arrow IPC, or CSV)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("process_names", nargs="*", metavar="process_name",
+                            help="Class names of the processes to be exported.  Default: all physical processes")
+        parser.add_argument("--format", choices=columnar_export.formats,
+                            default="parquet" if columnar_export.pyarrow else "csv",
+                            help="File format.  Default: parquet if pyarrow is installed, csv otherwise")
+        parser.add_argument("--output-dir", default=".", help="Directory for the files.  Default: current directory")
+        parser.add_argument("--batch-size", type=int, default=10000,
+                            help="Number of rows read from the database at once.  Default: 10000")
+
+    def handle(self, *args, **options):
+        if options["format"] != "csv" and columnar_export.pyarrow is None:
+            raise CommandError("The format {0} needs pyarrow, which is not installed.".format(options["format"]))
+        all_models = get_all_models()
+        if options["process_names"]:
+            try:
+                process_classes = [all_models[process_name] for process_name in options["process_names"]]
+            except KeyError as error:
+                raise CommandError("Unknown process class {0}.".format(error))
+        else:
+            process_classes = sorted((model for model in all_models.values() if issubclass(model, models.PhysicalProcess)
+                                      and not model._meta.abstract), key=lambda model: model.__name__)
+        if not os.path.isdir(options["output_dir"]):
+            os.makedirs(options["output_dir"])
+        for process_class in process_classes:
+            processes = process_class.objects.all()
+            for table in columnar_export.get_tables(process_class):
+                filepath = os.path.join(options["output_dir"], "{0}.{1}".format(table.name, options["format"]))
+                with open(filepath, "wb") as outfile:
+                    number_of_rows = columnar_export.write_table(table, processes, outfile, options["format"],
+                                                                 options["batch_size"])
+                if options["verbosity"] > 0:
+                    self.stdout.write("{0}: {1} rows".format(filepath, number_of_rows))
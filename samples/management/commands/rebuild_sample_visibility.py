@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Module which defines the command ``rebuild_sample_visibility``.  It
+recomputes the precomputed visibility of all samples for all users (see
+:py:mod:`samples.utils.visibility`).  This is only necessary if the database
+was changed without sending signals, e.g. by raw SQL or by ``update()`` calls
+on query sets.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand
+from samples.utils import visibility
+
+
+class Command(BaseCommand):
+    help = "Recomputes the visibility of all samples for all users."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000,
+                            help="Number of samples processed at once.  Default: 1000")
+
+    def handle(self, *args, **options):
+        number_of_changes = visibility.update(chunk_size=options["chunk_size"])
+        self.stdout.write("{0} rows changed.".format(number_of_changes))
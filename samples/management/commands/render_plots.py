@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Module which defines the command ``render_plots``.  It renders the plots
+which were queued by :py:mod:`samples.utils.plot_rendering` and should run
+permanently if ``settings.ASYNCHRONOUS_PLOT_RENDERING`` is ``True``, e.g. as a
+systemd service::
+
+    /home/juliabase/juliabase/manage.py render_plots --workers 4
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os, time, multiprocessing
+from django.core.management.base import BaseCommand
+from django.db import connections
+from samples.utils import plot_rendering
+
+
+class Command(BaseCommand):
+    help = "Renders queued plots in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                            help="Number of worker processes.  Default: number of CPUs")
+        parser.add_argument("--interval", type=float, default=1,
+                            help="Seconds between two scans of the queue.  Default: 1")
+        parser.add_argument("--once", action="store_true",
+                            help="Render the currently queued plots and exit")
+
+    def handle(self, *args, **options):
+        directory = plot_rendering.get_queue_directory()
+        # The workers must not share the database connections of this process.
+        connections.close_all()
+        pool = multiprocessing.Pool(options["workers"])
+        in_progress = set()
+
+        def finished(result):
+            path, error = result
+            in_progress.discard(path)
+            if error:
+                self.stderr.write("Error while rendering {0}:\n{1}".format(path, error))
+
+        try:
+            while True:
+                try:
+                    filenames = sorted(os.listdir(directory))
+                except OSError:
+                    filenames = []
+                for filename in filenames:
+                    path = os.path.join(directory, filename)
+                    if filename.endswith(".json") and path not in in_progress:
+                        in_progress.add(path)
+                        pool.apply_async(plot_rendering.render_queued_plot, (path,), callback=finished)
+                if options["once"] and not in_progress:
+                    break
+                time.sleep(options["interval"])
+        finally:
+            pool.close()
+            pool.join()
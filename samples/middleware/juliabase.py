@@ -27,8 +27,10 @@ from django.shortcuts import render
 from jb_common.utils.base import HttpResponseUnauthorized
 import samples.utils.views as utils
 from samples.permissions import PermissionError
+from samples.utils import invalidation
 
-"""Middleware for handling samples-database-specific exceptions.
+"""Middleware for handling samples-database-specific exceptions, and for
+coalescing cache invalidation.
 """
 
 
@@ -55,3 +57,21 @@ class ExceptionsMiddleware(object):
             return render(request, "samples/disambiguation.html",
                           {"alias": exception.sample_name, "samples": exception.samples,
                            "title": _("Ambiguous sample name")})
+
+
+class CoalescedTouchesMiddleware(object):
+    """Middleware which defers the expiry of cache namespaces of touched
+    samples, processes, and sample series to the end of the request, see
+    :py:mod:`samples.utils.invalidation`.  Since this happens in
+    `process_response`, the transaction of the view (``ATOMIC_REQUESTS``) has
+    already been committed or rolled back then, whereas the ``last_modified``
+    timestamps have been updated within this transaction.
+    """
+
+    def process_request(self, request):
+        invalidation.reset()
+        invalidation.begin_request()
+
+    def process_response(self, request, response):
+        invalidation.end_request()
+        return response
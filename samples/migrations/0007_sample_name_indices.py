@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, transaction, DatabaseError
+
+
+def create_indices(apps, schema_editor):
+    """Creates the indices for the case-insensitive search in sample names and
+    aliases on PostgreSQL.  The expressions must match the SQL which Django
+    generates for ``icontains`` and ``istartswith``.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    quote_name = connection.ops.quote_name
+    sample_table = quote_name(apps.get_model("samples", "Sample")._meta.db_table)
+    alias_table = quote_name(apps.get_model("samples", "SampleAlias")._meta.db_table)
+    schema_editor.execute("CREATE INDEX samples_sample_name_upper_like ON {0} (UPPER(name::text) text_pattern_ops)".
+                          format(sample_table))
+    try:
+        with transaction.atomic(using=connection.alias):
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except DatabaseError:
+        # Before PostgreSQL 13, only superusers may do this.  The sample search
+        # works without the trigram indices, albeit slower.
+        return
+    schema_editor.execute("CREATE INDEX samples_sample_name_trgm ON {0} USING gin (UPPER(name::text) gin_trgm_ops)".
+                          format(sample_table))
+    schema_editor.execute("CREATE INDEX samples_samplealias_name_trgm ON {0} USING gin (UPPER(name::text) gin_trgm_ops)".
+                          format(alias_table))
+
+
+def drop_indices(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        for index in ["samples_sample_name_upper_like", "samples_sample_name_trgm", "samples_samplealias_name_trgm"]:
+            schema_editor.execute("DROP INDEX IF EXISTS {0}".format(index))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samples', '0006_verbose_name_in_userdetails_field'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indices, drop_indices),
+    ]
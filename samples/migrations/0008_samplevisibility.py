@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('samples', '0007_sample_name_indices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SampleVisibility',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('level', models.PositiveSmallIntegerField(verbose_name='level', choices=[(1, 'name only'), (2, 'via clearance'), (3, 'full')])),
+                ('sample', models.ForeignKey(related_name='visibilities', verbose_name='sample', to='samples.Sample')),
+                ('user', models.ForeignKey(related_name='sample_visibilities', verbose_name='user', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'sample visibility',
+                'verbose_name_plural': 'sample visibilities',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='samplevisibility',
+            unique_together=set([('user', 'sample')]),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samples', '0008_samplevisibility'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SampleGenealogy',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('depth', models.PositiveSmallIntegerField(verbose_name='depth')),
+                ('cutoff_timestamp', models.DateTimeField(verbose_name='cutoff timestamp')),
+                ('ancestor', models.ForeignKey(related_name='descendant_links', verbose_name='ancestor', to='samples.Sample')),
+                ('descendant', models.ForeignKey(related_name='ancestor_links', verbose_name='descendant', to='samples.Sample')),
+            ],
+            options={
+                'verbose_name': 'sample genealogy link',
+                'verbose_name_plural': 'sample genealogy links',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='samplegenealogy',
+            unique_together=set([('ancestor', 'descendant')]),
+        ),
+    ]
@@ -42,12 +42,13 @@ from django.template.loader import render_to_string
 import django.core.urlresolvers
 from django.conf import settings
 from django.db import models
-from django.core.cache import cache
-from jb_common.utils.base import get_really_full_name, cache_key_locked, format_enumeration, camel_case_to_underscores
+from jb_common.utils.base import get_really_full_name, format_enumeration, \
+    camel_case_to_underscores
 from jb_common.models import Topic, PolymorphicModel, Department
 import samples.permissions
 from jb_common import search
 from samples.data_tree import DataNode, DataItem
+from samples.utils import invalidation
 
 if six.PY2:
     import HTMLParser
@@ -137,8 +138,7 @@ class ExternalOperator(models.Model):
 
     def save(self, *args, **kwargs):
         super(ExternalOperator, self).save(*args, **kwargs)
-        for process in self.processes.all():
-            process.actual_instance.save()
+        invalidation.touch_processes(self.processes.values_list("id", flat=True), with_samples=True)
 
     def __str__(self):
         return self.name
@@ -205,22 +205,14 @@ class Process(PolymorphicModel):
         """Saves the instance and clears stalled cache items.
 
         :param with_relations: If ``True`` (default), also touch the related
-            samples.  Should be set to ``False`` if called from another
-            ``save`` method in order to avoid endless recursion.
+            samples, and for results, the related sample series and their
+            samples.  See :py:func:`samples.utils.invalidation.touch_processes`.
 
         :type with_relations: bool
         """
-        keys_list_key = "process-keys:{0}".format(self.id)
-        with cache_key_locked("process-lock:{0}".format(self.id)):
-            keys = cache.get(keys_list_key)
-            if keys:
-                cache.delete_many(keys)
-            cache.delete(keys_list_key)
         with_relations = kwargs.pop("with_relations", True)
         super(Process, self).save(*args, **kwargs)
-        if with_relations:
-            for sample in self.samples.all():
-                sample.save(with_relations=False)
+        invalidation.touch_processes([self.id], with_samples=with_relations, saved=True)
 
     def __str__(self):
         self = self.actual_instance
@@ -376,6 +368,25 @@ class Process(PolymorphicModel):
         """
         raise NotImplementedError
 
+    def get_plot_ids(self):
+        """Get the IDs of all plots of this process.  They are used for
+        rendering the thumbnails in advance when the process is saved (see
+        ``settings.ASYNCHRONOUS_PLOT_RENDERING``).
+
+        The default behaviour is to return only the default plot ID ``""`` if
+        there is a datafile for it.  Override this method if your process has
+        more than one plot.
+
+        :return:
+          the IDs of all plots of this process
+
+        :rtype: list of unicode
+        """
+        try:
+            return [""] if self.get_datafile_name("") is not None else []
+        except NotImplementedError:
+            return []
+
     def get_plotfile_basename(self, plot_id):
         """Get the name of the plot files with the given ``plot_id``.  For
         example, for the PDS measurement for the sample 01B410, this may be
@@ -641,15 +652,23 @@ class PhysicalProcess(Process):
         except django.core.urlresolvers.NoReverseMatch:
             return None
 
+    @classmethod
+    def get_lab_notebook_rows(cls, year, month):
+        """Generates the row trees for all processes in the given month, one
+        at a time.  This is used by the streaming export of lab notebooks.
+        This is a default implementation which may be overridden in derived
+        classes, in particular in classes with sub-objects.
+        """
+        for measurement in cls.get_lab_notebook_context(year, month)["processes"].iterator():
+            yield measurement.get_data_for_table_export()
+
     @classmethod
     def get_lab_notebook_data(cls, year, month):
-        """Returns the data tree for all processes in the given month.  This
-        is a default implementation which may be overridden in derived classes,
-        in particular in classes with sub-objects.
+        """Returns the data tree for all processes in the given month.  By
+        default, its children are the row trees of `get_lab_notebook_rows`.
         """
-        measurements = cls.get_lab_notebook_context(year, month)["processes"]
         data = DataNode(_("lab notebook for {process_name}").format(process_name=cls._meta.verbose_name_plural))
-        data.children.extend(measurement.get_data_for_table_export() for measurement in measurements)
+        data.children.extend(cls.get_lab_notebook_rows(year, month))
         return data
 
 
@@ -704,47 +723,20 @@ class Sample(models.Model):
         """Saves the instance and clears stalled cache items.
 
         It also touches all ancestors and children and the associated split
-        processes.
+        processes, see :py:func:`samples.utils.invalidation.touch_samples`.
 
-        :param with_relations: If ``True`` (default), also touch the related
-            samples.  Should be set to ``False`` if called from another
-            ``save`` method in order to avoid endless recursion.
-        :param from_split: When walking through the decendents, this is set to
-            the originating split so that the child sample knows which of its
-            splits should be followed, too.  Thus, only the timestamp of
-            ``from_split`` is actually used.  It must be ``None`` (default)
-            when this method is called from outside this method, or while
-            walking through the ancestors.
+        :param with_relations: If ``True`` (default), also touch the sample
+            series of this sample.
+        :param from_split: Ignored.  It is only accepted for backwards
+            compatibility; the split family is determined in one go now.
 
         :type with_relations: bool
         :type from_split: `SampleSplit` or NoneType
         """
-        keys_list_key = "sample-keys:{0}".format(self.pk)
-        with cache_key_locked("sample-lock:{0}".format(self.pk)):
-            keys = cache.get(keys_list_key)
-            if keys:
-                cache.delete_many(keys)
-            cache.delete(keys_list_key)
         with_relations = kwargs.pop("with_relations", True)
-        from_split = kwargs.pop("from_split", None)
+        kwargs.pop("from_split", None)
         super(Sample, self).save(*args, **kwargs)
-        UserDetails.objects.filter(user__in=self.watchers.all()).update(my_samples_list_timestamp=datetime.datetime.now())
-        if with_relations:
-            for series in self.series.all():
-                series.save()
-        # Now we touch the decendents ...
-        if from_split:
-            splits = SampleSplit.objects.filter(parent=self, timestamp__gt=from_split.timestamp)
-        else:
-            splits = SampleSplit.objects.filter(parent=self)
-        for split in splits:
-            split.save(with_relations=False)
-            for child in split.pieces.all():
-                child.save(from_split=split, with_relations=False)
-        # ... and the ancestors
-        if not from_split and self.split_origin:
-            self.split_origin.save(with_relations=False)
-            self.split_origin.parent.save(with_relations=False)
+        invalidation.touch_samples([self.pk], with_series=with_relations, saved=True)
 
     def __str__(self):
         """Here, I realise the peculiar naming scheme of provisional sample
@@ -837,12 +829,10 @@ class Sample(models.Model):
 
         :rtype: `SampleSplit` or NoneType
         """
-        for process in self.processes.order_by("-timestamp"):
-            process = process.actual_instance
-            if isinstance(process, SampleSplit):
-                return process
-            if not isinstance(process, Result):
-                break
+        latest_process = self.processes.exclude(content_type=ContentType.objects.get_for_model(Result)). \
+                         order_by("-timestamp").values_list("id", "content_type").first()
+        if latest_process and latest_process[1] == ContentType.objects.get_for_model(SampleSplit).id:
+            return SampleSplit.objects.get(pk=latest_process[0])
         return None
 
     def get_sample_details(self):
@@ -977,7 +967,7 @@ class SampleAlias(models.Model):
         """Saves the instance and touches the affected sample.
         """
         super(SampleAlias, self).save(*args, **kwargs)
-        self.sample.save(with_relations=False)
+        invalidation.touch_samples([self.sample_id])
 
     def __str__(self):
         return self.name
@@ -1062,6 +1052,60 @@ class Clearance(models.Model):
         return _("clearance of {sample} for {user}").format(sample=self.sample, user=self.user)
 
 
+@python_2_unicode_compatible
+class SampleVisibility(models.Model):
+    """Model for the precomputed visibility of samples for users.  It contains
+    one row for every user and every sample the name of which the user is
+    allowed to see, with the level of access.  It is maintained by the signal
+    receivers in :py:mod:`samples.signals`, see
+    :py:mod:`samples.utils.visibility`.  Note that it grows with the number of
+    users times the number of samples.
+    """
+    name_only = 1
+    via_clearance = 2
+    full = 3
+    level_choices = ((name_only, _("name only")), (via_clearance, _("via clearance")), (full, _("full")))
+
+    user = models.ForeignKey(django.contrib.auth.models.User, verbose_name=_("user"), related_name="sample_visibilities")
+    sample = models.ForeignKey(Sample, verbose_name=_("sample"), related_name="visibilities")
+    level = models.PositiveSmallIntegerField(_("level"), choices=level_choices)
+
+    class Meta:
+        unique_together = ("user", "sample")
+        verbose_name = _("sample visibility")
+        verbose_name_plural = _("sample visibilities")
+
+    def __str__(self):
+        return _("visibility of {sample} for {user}").format(sample=self.sample, user=self.user)
+
+
+@python_2_unicode_compatible
+class SampleGenealogy(models.Model):
+    """Model for the precomputed split genealogy of samples (a “closure
+    table”).  It contains one row for every sample and each of its ancestors,
+    i.e. its parent, the parent of its parent etc.  It is maintained by the
+    signal receivers in :py:mod:`samples.signals`, see
+    :py:mod:`samples.utils.genealogy`.  This way, all ancestors or all
+    descendants of a sample are found with one indexed lookup.
+
+    The `cutoff_timestamp` is the timestamp of the split of the ancestor which
+    lies on the path to the descendant.  Processes of the ancestor after this
+    timestamp don't belong to the history of the descendant.
+    """
+    ancestor = models.ForeignKey(Sample, verbose_name=_("ancestor"), related_name="descendant_links")
+    descendant = models.ForeignKey(Sample, verbose_name=_("descendant"), related_name="ancestor_links")
+    depth = models.PositiveSmallIntegerField(_("depth"))
+    cutoff_timestamp = models.DateTimeField(_("cutoff timestamp"))
+
+    class Meta:
+        unique_together = ("ancestor", "descendant")
+        verbose_name = _("sample genealogy link")
+        verbose_name_plural = _("sample genealogy links")
+
+    def __str__(self):
+        return _("{ancestor} is ancestor of {descendant}").format(ancestor=self.ancestor, descendant=self.descendant)
+
+
 @python_2_unicode_compatible
 class SampleClaim(models.Model):
         # Translators: someone who assert a claim to samples
@@ -1142,16 +1186,6 @@ class Result(Process):
             # Translators: experimental results
         verbose_name_plural = _("results")
 
-    def save(self, *args, **kwargs):
-        """Do everything in :py:meth:`Process.save`, plus touching all samples in all
-        connected sample series and the series themselves.
-        """
-        with_relations = kwargs.get("with_relations", True)
-        super(Result, self).save(*args, **kwargs)
-        if with_relations:
-            for sample_series in self.sample_series.all():
-                sample_series.save(touch_samples=True)
-
     def __str__(self):
         try:
             # Translators: experimental result
@@ -1186,7 +1220,8 @@ class Result(Process):
         storage backend.
 
         Secondly, there are the thumbnails as either a JPEG or a PNG, depending
-        on the original file type, and stored in the cache.
+        on the original file type, and stored in the file cache below
+        ``settings.CACHE_ROOT`` (see :py:mod:`samples.utils.thumbnails`).
 
         :return:
           a dictionary containing the following keys:
@@ -1197,7 +1232,8 @@ class Result(Process):
           ``"image_file"``           path to the original image file in the
                                      blob storage backend
           ``"image_url"``            full relative URL to the image
-          ``"thumbnail_file"``       full path to the thumbnail file
+          ``"thumbnail_file"``       path to the thumbnail file, relative to
+                                     ``settings.CACHE_ROOT``
           ``"thumbnail_url"``        full relative URL to the thumbnail (i.e.,
                                      without domain)
           =========================  =========================================
@@ -1315,9 +1351,7 @@ class SampleSeries(models.Model):
         """
         touch_samples = kwargs.pop("touch_samples", False)
         super(SampleSeries, self).save(*args, **kwargs)
-        if touch_samples:
-            for sample in self.samples.all():
-                sample.save(with_relations=False)
+        invalidation.touch_sample_series([self.pk], with_samples=touch_samples, saved=True)
 
     def __str__(self):
         return self.name
@@ -1365,8 +1399,7 @@ class SampleSeries(models.Model):
         information about the sample series that may change (note that the
         sample series' name never changes).
         """
-        for sample in self.samples.all():
-            sample.save(with_relations=False)
+        invalidation.touch_samples(self.samples.values_list("id", flat=True))
 
     @classmethod
     def get_search_tree_node(cls):
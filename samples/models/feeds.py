@@ -58,6 +58,15 @@ class FeedEntry(PolymorphicModel):
     sha1_hash = models.CharField(_("SHA1 hex digest"), max_length=40, blank=True, editable=False)
     """You'll never calculate the SHA-1 hash yourself.  It is done in
     `save`."""
+    user_dependent_template_context = False
+    """Whether `get_additional_template_context` depends on the user.  If
+    ``False``, the rendered entry is cached for all users at once."""
+    last_modified_field = None
+    """Lookup path of the timestamp of the last modification of the object this
+    entry refers to, e.g. ``"process__last_modified"``.  It is part of the
+    cache key of the rendered entry, so that the entry is rendered anew after
+    the object has been edited.  ``None`` if the entry doesn't refer to such an
+    object."""
 
     class Meta:
         verbose_name = _("feed entry")
@@ -132,6 +141,8 @@ class FeedNewSamples(FeedEntry):
     purpose = models.CharField(_("purpose"), max_length=80, blank=True)
     auto_adders = models.ManyToManyField(django.contrib.auth.models.User, verbose_name=_("auto adders"), blank=True)
 
+    user_dependent_template_context = True
+
     class Meta(PolymorphicModel.Meta):
         # FixMe: The labels are gramatically unfortunate.  “feed entry for new
         # samples” is better.
@@ -159,6 +170,8 @@ class FeedMovedSamples(FeedEntry):
     auto_adders = models.ManyToManyField(django.contrib.auth.models.User, verbose_name=_("auto adders"), blank=True)
     description = models.TextField(_("description"))
 
+    user_dependent_template_context = True
+
     class Meta(PolymorphicModel.Meta):
         verbose_name = _("moved samples feed entry")
         verbose_name_plural = _("moved samples feed entries")
@@ -180,6 +193,8 @@ class FeedNewPhysicalProcess(FeedEntry):
     """
     process = models.OneToOneField(Process, verbose_name=_("process"))
 
+    last_modified_field = "process__last_modified"
+
     class Meta(PolymorphicModel.Meta):
         verbose_name = _("new physical process feed entry")
         verbose_name_plural = _("new physical process feed entries")
@@ -203,6 +218,8 @@ class FeedEditedPhysicalProcess(FeedEntry):
     process = models.ForeignKey(Process, verbose_name=_("process"))
     description = models.TextField(_("description"))
 
+    last_modified_field = "process__last_modified"
+
     class Meta(PolymorphicModel.Meta):
         verbose_name = _("edited physical process feed entry")
         verbose_name_plural = _("edited physical process feed entries")
@@ -230,6 +247,8 @@ class FeedResult(FeedEntry):
     description = models.TextField(_("description"), blank=True)
     is_new = models.BooleanField(_("result is new"), default=False)
 
+    last_modified_field = "result__last_modified"
+
     class Meta(PolymorphicModel.Meta):
         verbose_name = _("result feed entry")
         verbose_name_plural = _("result feed entries")
@@ -306,6 +325,8 @@ class FeedSampleSplit(FeedEntry):
     sample_split = models.ForeignKey(SampleSplit, verbose_name=_("sample split"))
     sample_completely_split = models.BooleanField(_("sample was completely split"), default=False)
 
+    last_modified_field = "sample_split__last_modified"
+
     class Meta(PolymorphicModel.Meta):
             # Translators: Feed entry for a split of a sample
         verbose_name = _("sample split feed entry")
@@ -329,6 +350,8 @@ class FeedEditedSampleSeries(FeedEntry):
     description = models.TextField(_("description"))
     responsible_person_changed = models.BooleanField(_("has responsible person changed"), default=False)
 
+    last_modified_field = "sample_series__last_modified"
+
     class Meta(PolymorphicModel.Meta):
         verbose_name = _("edited sample series feed entry")
         verbose_name_plural = _("edited sample series feed entries")
@@ -349,6 +372,9 @@ class FeedNewSampleSeries(FeedEntry):
     topic = models.ForeignKey(Topic, verbose_name=_("topic"))
     subscribers = models.ManyToManyField(django.contrib.auth.models.User, verbose_name=_("subscribers"), blank=True)
 
+    user_dependent_template_context = True
+    last_modified_field = "sample_series__last_modified"
+
     class Meta(PolymorphicModel.Meta):
         verbose_name = _("new sample series feed entry")
         verbose_name_plural = _("new sample series feed entries")
@@ -376,6 +402,9 @@ class FeedMovedSampleSeries(FeedEntry):
     description = models.TextField(_("description"))
     subscribers = models.ManyToManyField(django.contrib.auth.models.User, verbose_name=_("subscribers"), blank=True)
 
+    user_dependent_template_context = True
+    last_modified_field = "sample_series__last_modified"
+
     class Meta(PolymorphicModel.Meta):
         verbose_name = _("moved sample series feed entry")
         verbose_name_plural = _("moved sample series feed entries")
@@ -464,6 +493,8 @@ class FeedNewTask(FeedEntry):
     """
     task = models.ForeignKey(Task, verbose_name=_("task"), related_name="feed_entries_for_new_tasks")
 
+    last_modified_field = "task__last_modified"
+
     class Meta(PolymorphicModel.Meta):
         verbose_name = _("new task feed entry")
         verbose_name_plural = _("new task feed entries")
@@ -483,6 +514,8 @@ class FeedEditedTask(FeedEntry):
     task = models.ForeignKey(Task, verbose_name=_("task"), related_name="feed_entries_for_edited_tasks")
     description = models.TextField(_("description"))
 
+    last_modified_field = "task__last_modified"
+
     class Meta(PolymorphicModel.Meta):
         verbose_name = _("edited task feed entry")
         verbose_name_plural = _("edited task feed entries")
@@ -516,4 +549,10 @@ class FeedRemovedTask(FeedEntry):
         return metadata
 
 
+sample_feed_entry_models = (FeedNewSamples, FeedMovedSamples, FeedCopiedMySamples, FeedEditedSamples)
+"""Feed entry models which are about samples.  If all of the samples of such an
+entry have been deleted, the entry is orphaned and is removed by the
+maintenance."""
+
+
 _ = ugettext
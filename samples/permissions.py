@@ -371,6 +371,11 @@ def assert_can_fully_view_sample(user, sample):
     :raises PermissionError: if the user is not allowed to fully view the
         sample.
     """
+    # The precomputed visibility only serves as a shortcut.  The rules below
+    # are still needed for the error message.
+    if samples.models.SampleVisibility.objects.filter(user=user, sample=sample,
+                                                      level=samples.models.SampleVisibility.full).exists():
+        return
     currently_responsible_person = sample.currently_responsible_person
     sample_department = currently_responsible_person.jb_user_details.department or NoDepartment()
     user_department = user.jb_user_details.department or NoDepartment()
@@ -571,6 +576,54 @@ def assert_can_view_lab_notebook(user, process_class):
         raise PermissionError(user, description)
 
 
+def _has_permission_to_view_all_processes(user, process_class):
+    """Tests whether the user can view all processes of the given class.
+
+    :param user: the user whose permission should be checked
+    :param process_class: the process class to be viewed
+
+    :type user: django.contrib.auth.models.User
+    :type process_class: ``type`` (class ``samples.models.Process``)
+
+    :return:
+      whether the user can view all processes of this class, and the full name
+      of the “view every …” permission
+
+    :rtype: bool, str
+    """
+    codename = "view_every_{0}".format(process_class.__name__.lower())
+    permission_name_to_view_all = "{app_label}.{codename}".format(app_label=process_class._meta.app_label, codename=codename)
+    if Permission.objects.filter(codename=codename, content_type=ContentType.objects.get_for_model(process_class)).exists():
+        return user.has_perm(permission_name_to_view_all), permission_name_to_view_all
+    else:
+        return user.is_superuser, permission_name_to_view_all
+
+
+def get_viewable_physical_processes(user, process_class):
+    """Returns all processes of the given class that the user can view.  This
+    is the set-based equivalent of :py:func:`assert_can_view_physical_process`,
+    for views which process many processes at once.
+
+    :param user: the user whose permission should be checked
+    :param process_class: the physical process class
+
+    :type user: django.contrib.auth.models.User
+    :type process_class: ``type`` (class ``samples.models.PhysicalProcess``)
+
+    :return:
+      all processes of this class that the user is allowed to view
+
+    :rtype: QuerySet
+    """
+    if _has_permission_to_view_all_processes(user, process_class)[0]:
+        return process_class.objects.all()
+    viewable_process_ids = process_class.objects.filter(
+        Q(operator=user) | Q(clearances__user=user) |
+        Q(samples__visibilities__user=user, samples__visibilities__level=samples.models.SampleVisibility.full)). \
+        values("pk")
+    return process_class.objects.filter(pk__in=viewable_process_ids)
+
+
 def assert_can_view_physical_process(user, process):
     """Tests whether the user can view a physical process (i.e. deposition,
     measurement, etching process, clean room work etc).  You can view a process
@@ -590,12 +643,7 @@ def assert_can_view_physical_process(user, process):
         process.
     """
     process_class = process.content_type.model_class()
-    codename = "view_every_{0}".format(process_class.__name__.lower())
-    permission_name_to_view_all = "{app_label}.{codename}".format(app_label=process_class._meta.app_label, codename=codename)
-    if Permission.objects.filter(codename=codename, content_type=ContentType.objects.get_for_model(process_class)).exists():
-        has_view_all_permission = user.has_perm(permission_name_to_view_all)
-    else:
-        has_view_all_permission = user.is_superuser
+    has_view_all_permission, permission_name_to_view_all = _has_permission_to_view_all_processes(user, process_class)
     if not has_view_all_permission and process.operator != user and \
             not any(has_permission_to_fully_view_sample(user, sample) for sample in process.samples.all()) and \
             not samples.models.Clearance.objects.filter(user=user, processes=process).exists():
@@ -25,9 +25,11 @@ from __future__ import absolute_import, unicode_literals
 from django.utils.translation import ugettext_lazy as _, ugettext
 
 ADD_SAMPLES_VIEW = ""
+ASYNCHRONOUS_PLOT_RENDERING = False
 CACHE_ROOT = str("/tmp/juliabase_cache")
 CRAWLER_LOGS_ROOT = ""
 CRAWLER_LOGS_WHITELIST = ()
+DEFERRED_FEED_FAN_OUT = False
 INITIALS_FORMATS = {"user": {"pattern": r"[A-Z]{2,4}|[A-Z]{2,3}\d|[A-Z]{2}\d{2}",
                              "description": _("The initials start with two uppercase letters.  "
                                               "They contain uppercase letters and digits only.  Digits are at the end.")},
@@ -39,6 +41,7 @@ INITIALS_FORMATS = {"user": {"pattern": r"[A-Z]{2,4}|[A-Z]{2,3}\d|[A-Z]{2}\d{2}"
                     }
 MERGE_CLEANUP_FUNCTION = ""
 NAME_PREFIX_TEMPLATES = ()
+PLOT_CACHE_MAX_SIZE = 1024**3
 SAMPLE_NAME_FORMATS = {"provisional": {"possible_renames": {"default"}},
                        "default":     {"pattern": r"[-A-Za-z_/0-9#()]*"}}
 THUMBNAIL_WIDTH = 400
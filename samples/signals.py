@@ -63,7 +63,7 @@ Cache invalidation
 ..................
 
 Of course, the server must never serve outdated data to the user.  In order to
-prevent that, every change in the database triggers deletion of those cache
+prevent that, every change in the database triggers invalidation of those cache
 items which have become obsolete.  This is very difficult to achive because
 JuliaBase-Samples contains so many inter-model dependencies (partly indirect).
 
@@ -77,13 +77,23 @@ one must go through all models and determine those cached models which are
 affected by changes in the first models.  There is not even a good general
 strategy for this.  I myself made a big table with paper and pencil.
 
+Cache items are not deleted explicitly.  Instead, every sample and every
+process has a generation counter in the cache, which is folded into the keys of
+all cache items derived from it (see
+:py:func:`jb_common.utils.base.get_cache_versions`).  Expiring all these items
+is a single atomic increment of the counter
+(:py:func:`jb_common.utils.base.expire_cache_namespace`), without locks and
+without having to know the keys of the items.  Items with outdated versions are
+never requested again and are eventually evicted by the cache backend.
+
 The best approach is to have in mind the six models that need to be “touched”
-in order to delete cache items or to update a last-modified timestamp:
+in order to expire cache items or to update a last-modified timestamp:
 
-1. ``Sample``.  This contains both a ``last_modified`` timestamp and a list of
-   cache items.
+1. ``Sample``.  This contains both a ``last_modified`` timestamp and a cache
+   namespace ``"sample:<id>"``.
 
-2. ``Process``.  The same as with ``Sample``.
+2. ``Process``.  The same as with ``Sample``; its namespace is
+   ``"process:<id>"``.
 
 3. ``Clearance``.  This contains a ``last_modified``.  ``Clearance`` is very
    low-maintenance: ``last_modified`` is auto-updated whenever the respective
@@ -123,8 +133,15 @@ invalidation more convenient.
 First, a couple of models have custom ``save()`` methods which update the
 ``last_modified`` timestamps.  Some of them have a ``with_relations`` keyword
 parameter.  If this is ``True`` (the default), all dependent instances (via
-foreign-key or M2M relationships) are touched too.  However normally, the
-maximal nesting depth is 1 in order to prevent endless loops.
+foreign-key or M2M relationships) are touched too.
+
+Neither these methods nor the signal functions in this module touch other
+instances by saving them.  Instead, they pass IDs to
+:py:mod:`samples.utils.invalidation`, which collects them within every
+cascade of saves and touches everything in a couple of bulk queries in the same
+transaction.  The expiry of the cache namespaces is deferred until the end of
+the request.  In particular, the split family of a sample (its ancestors, descendants, and the
+splits in between) is looked up there in the precomputed split genealogy.
 
 The special ``save()`` parameters should only be used by other ``save()``
 methods or the cache-related signal function in this module.  In particular,
@@ -169,12 +186,15 @@ from __future__ import absolute_import, unicode_literals
 import datetime, hashlib
 from django.db.models import signals
 from django.dispatch import receiver
-from django.contrib.auth.models import User
+from django.contrib.auth.models import User, Group
 import django.contrib.contenttypes.management
 from django.contrib.contenttypes.models import ContentType
+from django.conf import settings
 from jb_common import models as jb_common_app
 import jb_common.signals
+from jb_common.utils.base import prune_file_cache, expire_cache_namespace
 from samples import models as samples_app
+from samples.utils import plot_rendering, sample_search, visibility, invalidation, genealogy
 
 
 @receiver(signals.m2m_changed, sender=samples_app.Sample.watchers.through)
@@ -283,12 +303,10 @@ def touch_user_samples_and_processes(sender, instance, created, **kwargs):
     if former_identifying_data_hash != instance.samples_user_details.identifying_data_hash:
         instance.samples_user_details.identifying_data_hash = former_identifying_data_hash
         instance.samples_user_details.save()
-        for sample in instance.samples.all():
-            sample.save(with_relations=False)
-        for process in instance.processes.all():
-            process.actual_instance.save()
-        for sample_series in instance.sample_series.all():
-            sample_series.save()
+        with invalidation.coalesced_touches():
+            invalidation.touch_samples(instance.samples.values_list("id", flat=True))
+            invalidation.touch_processes(instance.processes.values_list("id", flat=True), with_samples=True)
+            invalidation.touch_sample_series(instance.sample_series.values_list("pk", flat=True))
 
 
 @receiver(signals.m2m_changed, sender=samples_app.Sample.processes.through)
@@ -297,24 +315,21 @@ def touch_process_samples(sender, instance, action, reverse, model, pk_set, **kw
     For example, if the samples connected with a process are changed, both the
     process and all affected samples are marked as “modified”.
     """
-    if reverse:
-        # `instance` is a process
-        instance.save()
-        if action == "pre_clear":
-            for sample in instance.samples.all():
-                sample.save()
-        elif action in ["post_add", "post_remove"]:
-            for sample in samples_app.Sample.objects.in_bulk(pk_set).values():
-                sample.save()
-    else:
-        # `instance` is a sample; shouldn't actually occur in JuliaBase's code
-        instance.save()
-        if action == "pre_clear":
-            for process in instance.processes.all():
-                process.save(with_relations=False)
-        elif action in ["post_add", "post_remove"]:
-            for process in samples_app.Process.objects.in_bulk(pk_set).values():
-                process.save(with_relations=False)
+    with invalidation.coalesced_touches():
+        if reverse:
+            # `instance` is a process
+            invalidation.touch_processes([instance.pk], with_samples=True)
+            if action == "pre_clear":
+                invalidation.touch_samples(instance.samples.values_list("id", flat=True), with_series=True)
+            elif action in ["post_add", "post_remove"]:
+                invalidation.touch_samples(pk_set, with_series=True)
+        else:
+            # `instance` is a sample; shouldn't actually occur in JuliaBase's code
+            invalidation.touch_samples([instance.pk], with_series=True)
+            if action == "pre_clear":
+                invalidation.touch_processes(instance.processes.values_list("id", flat=True))
+            elif action in ["post_add", "post_remove"]:
+                invalidation.touch_processes(pk_set)
 
 
 @receiver(signals.m2m_changed, sender=samples_app.SampleSeries.samples.through)
@@ -323,24 +338,21 @@ def touch_sample_series_samples(sender, instance, action, reverse, model, pk_set
     For example, if the members of a sample series are changed, all affected
     samples are marked as “modified”.
     """
-    if reverse:
-        # `instance` is a sample; shouldn't actually occur in JuliaBase's code
-        instance.save()
-        if action == "pre_clear":
-            for sample_series in instance.series.all():
-                sample_series.save()
-        elif action in ["post_add", "post_remove"]:
-            for sample_series in samples_app.SampleSeries.objects.in_bulk(pk_set).values():
-                sample_series.save()
-    else:
-        # `instance` is a sample series
-        instance.save()
-        if action == "pre_clear":
-            for sample in instance.samples.all():
-                sample.save()
-        elif action in ["post_add", "post_remove"]:
-            for sample in samples_app.Sample.objects.in_bulk(pk_set).values():
-                sample.save()
+    with invalidation.coalesced_touches():
+        if reverse:
+            # `instance` is a sample; shouldn't actually occur in JuliaBase's code
+            invalidation.touch_samples([instance.pk], with_series=True)
+            if action == "pre_clear":
+                invalidation.touch_sample_series(instance.series.values_list("pk", flat=True))
+            elif action in ["post_add", "post_remove"]:
+                invalidation.touch_sample_series(pk_set)
+        else:
+            # `instance` is a sample series
+            invalidation.touch_sample_series([instance.pk])
+            if action == "pre_clear":
+                invalidation.touch_samples(instance.samples.values_list("id", flat=True), with_series=True)
+            elif action in ["post_add", "post_remove"]:
+                invalidation.touch_samples(pk_set, with_series=True)
 
 
 @receiver(signals.m2m_changed, sender=samples_app.SampleSeries.results.through)
@@ -352,14 +364,12 @@ def touch_sample_series_results(sender, instance, action, reverse, model, pk_set
     if reverse:
         # `instance` is a result
         if action == "pre_clear":
-            for sample_series in instance.sample_series.all():
-                sample_series.save(touch_samples=True)
+            invalidation.touch_sample_series(instance.sample_series.values_list("pk", flat=True), with_samples=True)
         elif action in ["post_add", "post_remove"]:
-            for sample_series in samples_app.SampleSeries.objects.in_bulk(pk_set).values():
-                sample_series.save(touch_samples=True)
+            invalidation.touch_sample_series(pk_set, with_samples=True)
     else:
         # `instance` is a sample series
-        instance.save()
+        invalidation.touch_sample_series([instance.pk])
 
 
 @receiver(signals.pre_save, sender=jb_common_app.Topic)
@@ -448,6 +458,281 @@ def touch_display_settings_by_group_or_permission(sender, instance, action, reve
             instance.samples_user_details.touch_display_settings()
 
 
+@receiver(signals.post_save)
+def prewarm_plot_thumbnails(sender, instance, raw, **kwargs):
+    """Queues the thumbnails of a process for rendering as soon as it is saved,
+    so that they are ready when the sample data sheet is shown.  This only
+    happens if ``settings.ASYNCHRONOUS_PLOT_RENDERING`` is ``True``.
+    """
+    if not raw and settings.ASYNCHRONOUS_PLOT_RENDERING and isinstance(instance, samples_app.Process):
+        plot_rendering.prewarm_plots(instance)
+
+
+@receiver(signals.post_save, sender=samples_app.Sample)
+@receiver(signals.post_delete, sender=samples_app.Sample)
+@receiver(signals.post_save, sender=samples_app.SampleAlias)
+@receiver(signals.post_delete, sender=samples_app.SampleAlias)
+def expire_sample_name_indices(sender, instance, **kwargs):
+    """Marks the in-memory indices of sample names and aliases as outdated if a
+    name was added, changed, or deleted, see
+    :py:mod:`samples.utils.sample_search`.
+    """
+    if getattr(instance, "_sample_name_changed", True):
+        sample_search.expire_ngram_indices()
+
+
+sample_name_fields = {samples_app.Sample: ("name",),
+                      samples_app.SampleAlias: ("name", "sample_id")}
+"""Fields which are contained in the in-memory indices of
+:py:mod:`samples.utils.sample_search`.
+"""
+
+
+def check_sample_name(sender, instance, old_values):
+    """Notes in the instance whether the save changes fields which are
+    contained in the in-memory indices of sample names and aliases.  Then,
+    `expire_sample_name_indices` need not do anything for most saves.  This is
+    called by `check_changed_fields`.
+    """
+    instance._sample_name_changed = old_values is None or \
+        any(old_values[field] != getattr(instance, field) for field in sample_name_fields[sender])
+
+
+primary_key_name_fields = {samples_app.Sample: ("name", "samples"),
+                           User: ("username", "users"),
+                           jb_common_app.Topic: ("name", "topics"),
+                           samples_app.ExternalOperator: ("name", "external_operators")}
+"""Fields which are mapped to primary keys by
+:py:func:`samples.views.json_client.primary_keys`, together with the name of
+the respective component.  The remote client caches these mappings
+persistently; it learns about outdated mappings through the cache namespaces
+``"primary-keys:<component>"``, see
+:py:func:`samples.views.json_client.primary_keys_versions`.
+"""
+
+def check_primary_key_name(sender, instance, raw, update_fields, old_values):
+    """Notes in the instance whether the save changes the mappings cached by
+    remote clients, i.e. whether it renames the instance.  New users, topics,
+    and external operators change them, too, because the remote client caches
+    the complete lists of them.  New samples only change them if their name is
+    already used by an alias, because the remote client caches only the names
+    it has looked up.  This is called by `check_changed_fields`.
+    """
+    field, __ = primary_key_name_fields[sender]
+    if raw or update_fields is not None and field not in update_fields:
+        instance._primary_key_name_changed = False
+    elif not instance.pk:
+        instance._primary_key_name_changed = sender != samples_app.Sample or \
+            samples_app.SampleAlias.objects.filter(name=instance.name).exists()
+    else:
+        instance._primary_key_name_changed = old_values is not None and old_values[field] != getattr(instance, field)
+
+
+@receiver(signals.post_save, sender=samples_app.Sample)
+@receiver(signals.post_save, sender=User)
+@receiver(signals.post_save, sender=jb_common_app.Topic)
+@receiver(signals.post_save, sender=samples_app.ExternalOperator)
+@receiver(signals.post_delete, sender=samples_app.Sample)
+@receiver(signals.post_delete, sender=User)
+@receiver(signals.post_delete, sender=jb_common_app.Topic)
+@receiver(signals.post_delete, sender=samples_app.ExternalOperator)
+def expire_primary_keys(sender, instance, **kwargs):
+    """Expires the primary keys cached by remote clients if an instance was
+    renamed or deleted.
+    """
+    if getattr(instance, "_primary_key_name_changed", True):
+        expire_cache_namespace("primary-keys:" + primary_key_name_fields[sender][1])
+
+
+@receiver(signals.post_save, sender=samples_app.SampleAlias)
+@receiver(signals.post_delete, sender=samples_app.SampleAlias)
+def expire_primary_keys_by_alias(sender, instance, **kwargs):
+    """Expires the sample IDs cached by remote clients if an alias was added,
+    changed, or deleted, because sample names are also looked up as aliases.
+    """
+    expire_cache_namespace("primary-keys:samples")
+
+
+visibility_fields = {samples_app.Sample: ("topic_id", "currently_responsible_person_id"),
+                     jb_common_app.Topic: ("confidential",),
+                     jb_common_app.UserDetails: ("department_id",),
+                     User: ("is_superuser", "is_active")}
+"""Fields which affect the precomputed visibility of samples, see
+:py:mod:`samples.utils.visibility`.
+"""
+
+def check_visibility_fields(sender, instance, old_values):
+    """Notes in the instance whether the save changes fields which affect the
+    visibility of samples.  Then, `update_sample_visibility` need not do
+    anything for most saves.  This is called by `check_changed_fields`.
+    """
+    fields = visibility_fields[sender]
+    instance._visibility_fields_changed = old_values is None or \
+        any(old_values[field] != getattr(instance, field) for field in fields)
+
+
+@receiver(signals.post_save, sender=samples_app.Sample)
+@receiver(signals.post_save, sender=jb_common_app.Topic)
+@receiver(signals.post_save, sender=jb_common_app.UserDetails)
+@receiver(signals.post_save, sender=User)
+def update_sample_visibility(sender, instance, **kwargs):
+    """Updates the precomputed visibility of samples if a sample was moved to
+    another topic or person, if the confidentiality of a topic has changed, or
+    if the department or the status of a user has changed.
+    """
+    if getattr(instance, "_visibility_fields_changed", True):
+        if sender == samples_app.Sample:
+            visibility.update(sample_ids=[instance.pk])
+        elif sender == jb_common_app.Topic:
+            visibility.update(sample_ids=instance.samples.values_list("id", flat=True))
+        elif sender == jb_common_app.UserDetails:
+            # The department of the user is also the department of their
+            # samples.
+            visibility.update(user_ids=[instance.user_id])
+            visibility.update(sample_ids=samples_app.Sample.objects.filter(currently_responsible_person=instance.user_id).
+                              values_list("id", flat=True))
+        else:
+            visibility.update(user_ids=[instance.pk])
+
+
+@receiver(signals.m2m_changed, sender=jb_common_app.Topic.members.through)
+def update_sample_visibility_by_topic_memberships(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Updates the precomputed visibility of the samples in topics the
+    memberships of which have changed.
+    """
+    if reverse:
+        # `instance` is a user
+        if action in ["post_add", "post_remove"]:
+            visibility.update(sample_ids=samples_app.Sample.objects.filter(topic__pk__in=pk_set).values_list("id", flat=True),
+                              user_ids=[instance.pk])
+        elif action == "post_clear":
+            visibility.update(user_ids=[instance.pk])
+    else:
+        # `instance` is a topic
+        sample_ids = instance.samples.values_list("id", flat=True)
+        if action in ["post_add", "post_remove"]:
+            visibility.update(sample_ids=sample_ids, user_ids=pk_set)
+        elif action == "post_clear":
+            visibility.update(sample_ids=sample_ids)
+
+
+@receiver(signals.m2m_changed, sender=User.groups.through)
+@receiver(signals.m2m_changed, sender=User.user_permissions.through)
+@receiver(signals.m2m_changed, sender=Group.permissions.through)
+def update_sample_visibility_by_permissions(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Updates the precomputed visibility of samples for users whose
+    permissions have changed, because they may have got or lost the permission
+    to view all samples of their department.  On ``clear()`` of a reverse
+    relation, the affected users or groups are recorded in the ``pre_clear``
+    signal, because the ``post_clear`` signal doesn't contain them.
+    """
+    if reverse and action == "pre_clear":
+        instance._visibility_cleared_pks = set(sender.objects.filter(**{instance._meta.model_name: instance}).
+                                               values_list(model._meta.model_name, flat=True))
+    elif action in ["post_add", "post_remove", "post_clear"]:
+        if reverse and action == "post_clear":
+            pk_set = instance.__dict__.pop("_visibility_cleared_pks", set())
+        if isinstance(instance, User):
+            user_ids = [instance.pk]
+        elif model is User:
+            user_ids = pk_set
+        elif isinstance(instance, Group):
+            user_ids = instance.user_set.values_list("id", flat=True)
+        else:
+            # `instance` is a permission, `pk_set` contains groups
+            user_ids = User.objects.filter(groups__pk__in=pk_set).values_list("id", flat=True) if pk_set else []
+        if user_ids:
+            visibility.update(user_ids=user_ids)
+
+
+@receiver(signals.post_save, sender=samples_app.Clearance)
+@receiver(signals.post_delete, sender=samples_app.Clearance)
+def update_sample_visibility_by_clearance(sender, instance, **kwargs):
+    """Updates the precomputed visibility of a sample for a user who has got or
+    lost a clearance for it.
+    """
+    visibility.update(sample_ids=[instance.sample_id], user_ids=[instance.user_id])
+
+
+@receiver(signals.post_migrate)
+def build_sample_visibility(sender, **kwargs):
+    """Builds the precomputed visibility of samples if it is empty, e.g. after
+    the migration which introduced it.  This is needed because during data
+    migrations, no signals are sent.
+    """
+    if not samples_app.SampleVisibility.objects.exists() and samples_app.Sample.objects.exists():
+        visibility.update()
+
+
+def check_split_origin(instance, old_values):
+    """Notes in the instance whether the save changes its split origin.  Then,
+    `update_sample_genealogy` need not do anything for most saves.  This is
+    called by `check_changed_fields`.
+    """
+    old_split_origin_id = old_values["split_origin_id"] if old_values else None
+    instance._split_origin_changed = old_split_origin_id != instance.split_origin_id
+
+
+@receiver(signals.pre_save, sender=samples_app.Sample)
+@receiver(signals.pre_save, sender=User)
+@receiver(signals.pre_save, sender=jb_common_app.Topic)
+@receiver(signals.pre_save, sender=jb_common_app.UserDetails)
+@receiver(signals.pre_save, sender=samples_app.ExternalOperator)
+@receiver(signals.pre_save, sender=samples_app.SampleAlias)
+def check_changed_fields(sender, instance, raw, update_fields=None, **kwargs):
+    """Notes in the instance which changes of the save affect the primary keys
+    cached by remote clients, the in-memory indices of sample names, the
+    precomputed visibility of samples, and the precomputed split genealogy.
+    All old values needed for that are read with one query.
+    """
+    fields = set()
+    if sender in sample_name_fields:
+        fields.update(sample_name_fields[sender])
+    if sender in primary_key_name_fields:
+        fields.add(primary_key_name_fields[sender][0])
+    if sender in visibility_fields:
+        fields.update(visibility_fields[sender])
+    if sender == samples_app.Sample:
+        fields.add("split_origin_id")
+    old_values = sender.objects.filter(pk=instance.pk).values(*fields).first() if instance.pk else None
+    if sender in sample_name_fields:
+        check_sample_name(sender, instance, old_values)
+    if sender in primary_key_name_fields:
+        check_primary_key_name(sender, instance, raw, update_fields, old_values)
+    if sender in visibility_fields:
+        check_visibility_fields(sender, instance, old_values)
+    if sender == samples_app.Sample:
+        check_split_origin(instance, old_values)
+
+
+@receiver(signals.post_save, sender=samples_app.Sample)
+def update_sample_genealogy(sender, instance, **kwargs):
+    """Updates the precomputed split genealogy if a sample got a new split
+    origin, see :py:mod:`samples.utils.genealogy`.
+    """
+    if getattr(instance, "_split_origin_changed", True):
+        genealogy.update([instance.pk])
+
+
+@receiver(signals.post_save, sender=samples_app.SampleSplit)
+def update_sample_genealogy_by_split(sender, instance, created, **kwargs):
+    """Updates the precomputed split genealogy of the pieces of a split if the
+    split was changed, e.g. its timestamp.  New splits don't have pieces yet.
+    """
+    if not created:
+        genealogy.update(instance.pieces.values_list("id", flat=True))
+
+
+@receiver(signals.post_migrate)
+def build_sample_genealogy(sender, **kwargs):
+    """Builds the precomputed split genealogy if it is empty, e.g. after the
+    migration which introduced it.
+    """
+    if not samples_app.SampleGenealogy.objects.exists() and \
+       samples_app.Sample.objects.filter(split_origin__isnull=False).exists():
+        genealogy.rebuild()
+
+
 @receiver(jb_common.signals.maintain)
 def expire_feed_entries(sender, **kwargs):
     """Deletes all feed entries which are older than six weeks.
@@ -455,3 +740,21 @@ def expire_feed_entries(sender, **kwargs):
     now = datetime.datetime.now()
     six_weeks_ago = now - datetime.timedelta(weeks=6)
     samples_app.FeedEntry.objects.filter(timestamp__lt=six_weeks_ago).delete()
+
+
+@receiver(jb_common.signals.maintain)
+def remove_orphaned_feed_entries(sender, **kwargs):
+    """Deletes all feed entries about samples whose samples have all been
+    deleted.  The feed view skips them anyway.
+    """
+    for model in samples_app.sample_feed_entry_models:
+        model.objects.filter(samples=None).delete()
+
+
+@receiver(jb_common.signals.maintain)
+def prune_plot_cache(sender, **kwargs):
+    """Removes the least recently used plots and result thumbnails from the file
+    cache if they have grown beyond ``settings.PLOT_CACHE_MAX_SIZE``.
+    """
+    prune_file_cache("plots", settings.PLOT_CACHE_MAX_SIZE)
+    prune_file_cache("results_thumbnails", settings.PLOT_CACHE_MAX_SIZE)
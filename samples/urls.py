@@ -62,7 +62,7 @@ from __future__ import absolute_import, unicode_literals
 from django.conf.urls import url
 from samples.views import statistics, main, feed, my_samples, split_after_deposition, sample, split_and_rename, \
     sample_death, bulk_rename, sample_series, result, plots, external_operator, user_details, permissions, topic, \
-    claim, json_client, status, merge_samples, log_viewer, task_lists
+    claim, json_client, status, merge_samples, log_viewer, task_lists, columnar_export
 
 
 urlpatterns = [
@@ -79,7 +79,9 @@ urlpatterns = [
 
     url(r"^samples/by_id/(?P<sample_id>\d+)(?P<path_suffix>.*)", sample.by_id, name="show_sample_by_id"),
     url(r"^samples/$", sample.search),
+    url(r"^autocomplete/samples$", sample.autocomplete),
     url(r"^advanced_search$", sample.advanced_search),
+    url(r"^advanced_search/stream$", sample.advanced_search_stream),
     # FixMe: Must be regenerated with a minimal add-sample form
  #   url(r"^samples/add/$", sample.add),
     url(r"^samples/(?P<parent_name>.+)/split/$", split_and_rename.split_and_rename),
@@ -94,6 +96,8 @@ urlpatterns = [
     url(r"^resplit/(?P<old_split_id>.+)", split_and_rename.split_and_rename),
 
     url(r"^processes/(?P<process_id>\d+)$", main.show_process),
+    url(r"^columnar_export/(?P<process_name>[A-Za-z_][A-Za-z_0-9]*)/(?P<table_name>\w+)\.(?P<format_>parquet|arrow|csv)$",
+        columnar_export.export),
 
     url(r"^sample_series/add/$", sample_series.new),
     url(r"^sample_series/(?P<name>.+)/edit/$", sample_series.edit),
@@ -135,6 +139,8 @@ urlpatterns = [
 
     url(r"^add_sample$", json_client.add_sample),
     url(r"^primary_keys$", json_client.primary_keys),
+    url(r"^primary_keys/versions$", json_client.primary_keys_versions),
+    url(r"^bulk_submit$", json_client.bulk_submit),
     url(r"^available_items/(?P<model_name>[A-Za-z_][A-Za-z_0-9]*)$", json_client.available_items),
     url(r"^latest_split/(?P<sample_name>.+)", split_and_rename.latest_split),
     url(r"^login_remote_client$", json_client.login_remote_client),
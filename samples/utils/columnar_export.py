@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Export of the processes of one class into typed columnar files for data
+analysis.  Every process class is mapped to several *tables*: The main table
+contains one row per process, and every further table contains the rows of a
+model which points to the process class with a foreign key, e.g. the layers of
+a deposition or the cells of a solarsimulator measurement.  If such a model
+has derived models (like the layers of the cluster tool), every derived model
+gets its own table, too.
+
+The rows are read with ``values_list`` in batches of ascending primary keys,
+so that no model instances are created and the memory consumption does not
+depend on the number of processes.  The files are written in the Parquet or
+Arrow IPC format if ``pyarrow`` is installed, and as CSV otherwise.
+"""
+
+from __future__ import absolute_import, unicode_literals
+import django.utils.six as six
+
+import csv, codecs, datetime
+from jb_common.utils.base import camel_case_to_underscores
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+formats = ("parquet", "arrow", "csv")
+"""All export formats.  The first two need ``pyarrow``.
+"""
+
+mime_types = {"parquet": "application/octet-stream", "arrow": "application/vnd.apache.arrow.file",
+              "csv": "text/csv; charset=utf-8"}
+
+
+integer_fields = {"AutoField", "BigIntegerField", "IntegerField", "PositiveIntegerField", "PositiveSmallIntegerField",
+                  "SmallIntegerField", "ForeignKey", "OneToOneField"}
+
+def get_column_type(field):
+    """Returns the column type of a model field.  Foreign keys are exported as
+    the primary key they point to.  Decimals are exported as floats, because
+    they are only used for physical quantities in JuliaBase.
+
+    :param field: the model field
+
+    :type field: ``django.db.models.Field``
+
+    :return:
+      the column type; one of ``"int64"``, ``"float64"``, ``"bool"``,
+      ``"timestamp"``, ``"date"``, and ``"string"``
+
+    :rtype: str
+    """
+    internal_type = field.get_internal_type()
+    if internal_type in integer_fields:
+        return "int64"
+    elif internal_type in {"FloatField", "DecimalField"}:
+        return "float64"
+    elif internal_type in {"BooleanField", "NullBooleanField"}:
+        return "bool"
+    elif internal_type == "DateTimeField":
+        return "timestamp"
+    elif internal_type == "DateField":
+        return "date"
+    else:
+        return "string"
+
+
+class Table(object):
+    """Class for one table of the export of a process class.
+
+    :ivar name: the name of the table, which is also used for the file name
+    :ivar model: the model the rows of which are exported
+    :ivar columns: the exported columns as tuples of the column name, the
+      attribute name of the field, and the column type (see
+      :py:func:`get_column_type`)
+    :ivar process_lookup: the field lookup from `model` to the primary key of
+      the process
+
+    :type name: str
+    :type model: ``type`` (class ``django.db.models.Model``)
+    :type columns: list of (str, str, str)
+    :type process_lookup: str
+    """
+
+    def __init__(self, name, model, fields, process_lookup):
+        """
+        :param name: the name of the table
+        :param model: the model the rows of which are exported
+        :param fields: the model fields to be exported; the primary key is
+            always exported as the first column ``"id"``
+        :param process_lookup: the field lookup from `model` to the primary
+            key of the process
+
+        :type name: str
+        :type model: ``type`` (class ``django.db.models.Model``)
+        :type fields: list of ``django.db.models.Field``
+        :type process_lookup: str
+        """
+        self.name, self.model, self.process_lookup = name, model, process_lookup
+        self.columns = [("id", "pk", "int64")]
+        self.columns.extend((field.attname, field.attname, get_column_type(field)) for field in fields
+                            if not field.primary_key)
+
+    def get_queryset(self, processes):
+        """Returns the rows of this table which belong to the given processes.
+
+        :param processes: the processes to be exported
+
+        :type processes: QuerySet
+
+        :return:
+          the rows of the table
+
+        :rtype: QuerySet
+        """
+        return self.model.objects.filter(**{self.process_lookup + "__in": processes.values("pk")})
+
+    def iterate_batches(self, processes, batch_size=10000):
+        """Reads the rows of this table which belong to the given processes.
+        The rows are read in batches of ascending primary keys (“keyset
+        pagination”), so that even huge tables are read without an expensive
+        ``OFFSET``.
+
+        :param processes: the processes to be exported
+        :param batch_size: the maximal number of rows in one batch
+
+        :type processes: QuerySet
+        :type batch_size: int
+
+        :return:
+          generator of the batches; every batch is a list of rows, and every row
+          is a tuple with one value per column
+
+        :rtype: generator of list of tuple
+        """
+        queryset = self.get_queryset(processes).values_list(*[attname for __, attname, __ in self.columns]). \
+                   order_by("pk")
+        last_pk = None
+        while True:
+            batch = list((queryset if last_pk is None else queryset.filter(pk__gt=last_pk))[:batch_size])
+            if not batch:
+                break
+            yield batch
+            if len(batch) < batch_size:
+                break
+            last_pk = batch[-1][0]
+
+
+def _is_exported_field(field):
+    """Returns whether a concrete field of a process class is exported into the
+    main table.  Parent links and the fields of the polymorphism machinery are
+    left out.
+    """
+    return not (field.one_to_one and field.rel.parent_link) and field.name not in {"content_type", "actual_object_id"}
+
+
+def _add_related_tables(tables, name, model, process_lookup):
+    """Adds the table of a model pointing to the process class, and the tables
+    of all models derived from it, to `tables`.  The tables of derived models
+    contain only the fields which are added by the derived model, with the
+    column ``id`` pointing to the row in the parent table.
+    """
+    tables.append(Table(name, model, [field for field in model._meta.local_concrete_fields
+                                      if _is_exported_field(field)], process_lookup))
+    for child_model in model.__subclasses__():
+        if child_model._meta.abstract or child_model._meta.proxy:
+            continue
+        parent_link = child_model._meta.get_ancestor_link(model)
+        if parent_link:
+            _add_related_tables(tables, "{0}__{1}".format(name, camel_case_to_underscores(child_model.__name__)),
+                                child_model, parent_link.name + "__" + process_lookup)
+
+
+def get_tables(process_class):
+    """Returns all tables of a process class.  The first table is the main
+    table with one row per process.  It contains all concrete fields of the
+    process class, including those inherited from
+    :py:class:`~samples.models.Process`.  Then, one table per model pointing
+    to the process class with a foreign key follows, e.g. the layers of a
+    deposition, named like ``five_chamber_deposition__layers``.
+
+    :param process_class: the process class
+
+    :type process_class: ``type`` (class ``samples.models.Process``)
+
+    :return:
+      all tables of the process class
+
+    :rtype: list of `Table`
+    """
+    main_table_name = camel_case_to_underscores(process_class.__name__)
+    tables = [Table(main_table_name, process_class,
+                    [field for field in process_class._meta.concrete_fields if _is_exported_field(field)], "pk")]
+    for field in process_class._meta.get_fields(include_parents=False):
+        if field.one_to_many and field.auto_created and not field.concrete:
+            _add_related_tables(tables, "{0}__{1}".format(main_table_name, field.get_accessor_name()),
+                                field.related_model, field.field.name)
+    return tables
+
+
+def get_table(process_class, name):
+    """Returns one table of a process class.
+
+    :param process_class: the process class
+    :param name: the name of the table
+
+    :type process_class: ``type`` (class ``samples.models.Process``)
+    :type name: str
+
+    :return:
+      the table
+
+    :rtype: `Table`
+
+    :raises KeyError: if the process class has no table of that name
+    """
+    for table in get_tables(process_class):
+        if table.name == name:
+            return table
+    raise KeyError(name)
+
+
+def _get_arrow_schema(table):
+    """Returns the Arrow schema of a table.
+    """
+    types = {"int64": pyarrow.int64(), "float64": pyarrow.float64(), "bool": pyarrow.bool_(),
+             "timestamp": pyarrow.timestamp("us"), "date": pyarrow.date32(), "string": pyarrow.string()}
+    return pyarrow.schema([pyarrow.field(name, types[type_]) for name, __, type_ in table.columns])
+
+
+def _get_record_batch(schema, batch):
+    """Converts a batch of rows into an Arrow record batch.  Decimals are
+    converted to floats because Arrow doesn't convert them to ``float64``
+    itself.
+    """
+    arrays = []
+    for field, values in zip(schema, zip(*batch)):
+        if pyarrow.types.is_floating(field.type):
+            values = [None if value is None else float(value) for value in values]
+        arrays.append(pyarrow.array(list(values), type=field.type))
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _format_csv_value(value):
+    """Converts a database value into a string for the CSV export.  Datetimes
+    and dates are written in ISO 8601, and ``None`` as an empty field.
+    """
+    if value is None:
+        return ""
+    elif isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    elif isinstance(value, bool):
+        return "1" if value else "0"
+    return six.text_type(value)
+
+
+def write_table(table, processes, outfile, format_, batch_size=10000):
+    """Writes one table of the given processes into a file.
+
+    :param table: the table to be exported
+    :param processes: the processes to be exported; they must be of the
+        process class of the table
+    :param outfile: the binary file-like object to be written to
+    :param format_: the file format; must be one of `formats`
+    :param batch_size: the maximal number of rows which are read from the
+        database at once
+
+    :type table: `Table`
+    :type processes: QuerySet
+    :type outfile: file
+    :type format_: str
+    :type batch_size: int
+
+    :return:
+      the number of rows written
+
+    :rtype: int
+
+    :raises ValueError: if the format is unknown, or if it needs ``pyarrow``
+        but ``pyarrow`` is not installed
+    """
+    if format_ not in formats:
+        raise ValueError("Unknown format {0}".format(repr(format_)))
+    if format_ != "csv" and pyarrow is None:
+        raise ValueError("The format {0} needs pyarrow, which is not installed".format(repr(format_)))
+    number_of_rows = 0
+    if format_ == "csv":
+        writer = csv.writer(codecs.getwriter("utf-8")(outfile) if six.PY3 else outfile)
+        writer.writerow([name for name, __, __ in table.columns])
+        for batch in table.iterate_batches(processes, batch_size):
+            for row in batch:
+                row = [_format_csv_value(value) for value in row]
+                writer.writerow(row if six.PY3 else [value.encode("utf-8") for value in row])
+            number_of_rows += len(batch)
+    else:
+        schema = _get_arrow_schema(table)
+        writer = pyarrow.parquet.ParquetWriter(outfile, schema) if format_ == "parquet" else \
+                 pyarrow.ipc.new_file(outfile, schema)
+        try:
+            for batch in table.iterate_batches(processes, batch_size):
+                record_batch = _get_record_batch(schema, batch)
+                if format_ == "parquet":
+                    writer.write_table(pyarrow.Table.from_batches([record_batch]))
+                else:
+                    writer.write_batch(record_batch)
+                number_of_rows += len(batch)
+        finally:
+            writer.close()
+    return number_of_rows
+
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Access to the log files of crawlers, see :py:mod:`samples.views.log_viewer`.
+Crawler logs grow to hundreds of megabytes, so they are never read as a whole.
+Instead, the byte offsets of all *runs*, i.e. the lines ``started crawling``
+which every crawler logs at its start, are kept in a small index file.  It is
+stored beside the log file, or below ``settings.CACHE_ROOT`` if the log
+directory is not writable, and on every access, only the part of the log
+written since the last access is scanned.  If the index cannot be stored at
+all, the start of the last run is searched backwards from the end of the log.
+
+The lines of a run are read lazily, so they can be streamed into a template.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os, os.path, re, json, datetime, errno, tempfile
+from django.conf import settings
+
+
+levels = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+"""Log levels in ascending order of severity.
+"""
+
+start_pattern = re.compile(br"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d) INFO     started crawling", re.MULTILINE)
+line_pattern = re.compile(r"(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d) ([A-Z]+) +")
+
+block_size = 1024 * 1024
+
+
+class LogLine(object):
+    """Class for one line of a crawler log.  Continuation lines, e.g. of
+    tracebacks, get the level of their log record.
+
+    :ivar level: the log level of the line, or ``None`` if the line precedes
+      the first log record
+    :ivar text: the line without the timestamp, including the newline
+
+    :type level: unicode or NoneType
+    :type text: unicode
+    """
+
+    def __init__(self, level, text):
+        self.level, self.text = level, text
+
+
+class CrawlerLog(object):
+    """Class for the log file of a crawler.
+
+    :ivar runs: the runs of the crawler in chronological order, as tuples of
+      the byte offset of the run in the log file and the start timestamp
+
+    :type runs: list of (int, ``datetime.datetime``)
+    """
+
+    def __init__(self, filepath):
+        """
+        :param filepath: path to the log file
+
+        :type filepath: str
+
+        :raises IOError: if the log file cannot be read
+        """
+        self.filepath = filepath
+        self.file = open(filepath, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.runs = self._get_runs()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, tb):
+        self.close()
+
+    def _get_index_paths(self):
+        """Returns the candidates for the path of the index file, in order of
+        preference.
+        """
+        return [self.filepath + ".index",
+                os.path.join(settings.CACHE_ROOT, "crawler_logs", os.path.basename(self.filepath) + ".index")]
+
+    def _read_index(self, inode):
+        """Returns the stored index of the log file, if it is still valid.  It
+        is invalid if the log file was replaced or truncated (log rotation).
+
+        :return:
+          the number of bytes of the log file indexed so far, the runs in them
+          as tuples of the offset and the timestamp string; (0, []) if there is
+          no valid index
+
+        :rtype: int, list of (int, unicode)
+        """
+        for index_path in self._get_index_paths():
+            try:
+                with open(index_path) as index_file:
+                    index = json.load(index_file)
+            except (IOError, ValueError):
+                continue
+            if index["inode"] == inode and index["size"] <= self.size and \
+               index["check"] == self._get_check(index["size"]):
+                return index["size"], index["runs"]
+        return 0, []
+
+    def _get_check(self, size):
+        """Returns the last bytes of the indexed part of the log file, for
+        detecting log files which were truncated and have grown again since.
+        """
+        self.file.seek(max(0, size - 64))
+        return self.file.read(min(size, 64)).decode("latin-1")
+
+    def _write_index(self, inode, size, runs):
+        """Writes the index atomically to the first writable index path.
+
+        :return:
+          whether the index could be written
+
+        :rtype: bool
+        """
+        for index_path in self._get_index_paths():
+            dirname = os.path.dirname(index_path)
+            try:
+                try:
+                    os.makedirs(dirname)
+                except OSError as error:
+                    if error.errno != errno.EEXIST:
+                        raise
+                with tempfile.NamedTemporaryFile("w", dir=dirname, delete=False) as index_file:
+                    json.dump({"inode": inode, "size": size, "check": self._get_check(size), "runs": runs},
+                              index_file)
+                os.rename(index_file.name, index_path)
+            except (IOError, OSError):
+                continue
+            return True
+        return False
+
+    def _scan(self, offset):
+        """Finds all runs in the log file after `offset`.  Only complete
+        lines are scanned.
+
+        :param offset: the byte offset at which the scan starts; it must be
+            the beginning of a line
+
+        :type offset: int
+
+        :return:
+          the offset after the last complete line, the found runs as tuples of
+          the offset and the timestamp string
+
+        :rtype: int, list of (int, unicode)
+        """
+        runs = []
+        self.file.seek(offset)
+        rest = b""
+        while True:
+            block = self.file.read(block_size)
+            if not block:
+                break
+            block = rest + block
+            end = block.rfind(b"\n") + 1
+            block, rest = block[:end], block[end:]
+            for match in start_pattern.finditer(block):
+                runs.append((offset + match.start(), match.group(1).decode("ascii")))
+            offset += len(block)
+        return offset, runs
+
+    def _find_last_run(self):
+        """Searches the start of the last run backwards from the end of the
+        log file, block by block.
+
+        :return:
+          the last run as a tuple of the offset and the timestamp string, or
+          ``None`` if there is no run in the file
+
+        :rtype: (int, unicode) or NoneType
+        """
+        position, data = self.size, b""
+        while position > 0:
+            position = max(0, position - block_size)
+            self.file.seek(position)
+            data = self.file.read(block_size) + data
+            # A match must begin at the beginning of a line.
+            start = 0 if position == 0 else data.find(b"\n") + 1
+            matches = list(start_pattern.finditer(data, start))
+            if matches:
+                return position + matches[-1].start(), matches[-1].group(1).decode("ascii")
+            # Keep the incomplete first line for the next block.
+            data = data[:start]
+        return None
+
+    def _index_writable(self):
+        """Returns whether the index can be stored at one of its paths.
+        """
+        cache_dirname = os.path.dirname(self._get_index_paths()[1])
+        try:
+            os.makedirs(cache_dirname)
+        except OSError:
+            pass
+        return any(os.access(os.path.dirname(index_path), os.W_OK) for index_path in self._get_index_paths())
+
+    def _get_runs(self):
+        inode = os.fstat(self.file.fileno()).st_ino
+        indexed_size, runs = self._read_index(inode)
+        if not indexed_size and not self._index_writable():
+            # Without a stored index, a full scan would be necessary on every
+            # access.
+            last_run = self._find_last_run()
+            runs = [last_run] if last_run else []
+        elif indexed_size < self.size:
+            new_size, new_runs = self._scan(indexed_size)
+            runs.extend(new_runs)
+            if new_size != indexed_size:
+                self._write_index(inode, new_size, runs)
+        return [(offset, datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")) for offset, timestamp in runs]
+
+    def get_lines(self, run_index=-1, minimal_level=None):
+        """Reads the lines of one run lazily.  The leading timestamps of the
+        lines are removed.
+
+        :param run_index: the index of the run in `runs`; negative values
+            count from the last run
+        :param minimal_level: the minimal log level of lines to be returned,
+            one of `levels`; if ``None``, all lines are returned
+
+        :type run_index: int
+        :type minimal_level: unicode or NoneType
+
+        :return:
+          generator of the lines of the run
+
+        :rtype: generator of `LogLine`
+
+        :raises IndexError: if there is no such run
+        """
+        start = self.runs[run_index][0]
+        run_index %= len(self.runs)
+        end = self.runs[run_index + 1][0] if run_index + 1 < len(self.runs) else self.size
+        minimal_level_index = levels.index(minimal_level) if minimal_level else 0
+
+        def read_lines():
+            self.file.seek(start)
+            position, level = start, None
+            for line in self.file:
+                if position >= end:
+                    break
+                position += len(line)
+                line = line.decode("utf-8", "replace")
+                match = line_pattern.match(line)
+                if match:
+                    level = match.group(2)
+                    line = line[20:]
+                if level not in levels or levels.index(level) >= minimal_level_index:
+                    yield LogLine(level, line)
+        return read_lines()
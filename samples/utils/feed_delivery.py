@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Delivery of feed entries to their recipients.  The
+:py:class:`samples.utils.views.feed.Reporter` describes the recipients of a
+feed entry by a list of *sources*, which are JSON-serialisable tuples:
+
+``("samples", sample_ids, important)``
+    all users who watch one of the samples and may fully view it; if
+    ``important`` is false, only those who also want to get non-important news
+
+``("topic", topic_id)``
+    all members of the topic who want to get non-important news
+
+``("users", user_ids)``
+    exactly these users
+
+A *step* is a dictionary with the keys ``"entry_id"``, ``"content_type_id"``
+(the sending model, or ``None``), and ``"sources"``.  The recipients of a
+source are found with a few set-based queries, and the rows of the
+many-to-many table of ``FeedEntry.users`` are written with one
+``bulk_create``.
+
+If ``settings.DEFERRED_FEED_FAN_OUT`` is ``True``, the reporter only puts the
+steps into a queue, which is a directory in ``settings.CACHE_ROOT`` with one
+file per feed entry.  The queue is processed by the ``deliver_feed_entries``
+management command.  Since no user may get two feed entries from the same
+reporter, every queue entry contains also the steps of the earlier feed
+entries of its reporter, whose recipients are excluded.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import os, os.path, json, time, uuid, traceback
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from jb_common.utils.base import write_file_atomically
+from samples import models
+
+
+def get_recipients(sources):
+    """Returns the users described by the given recipient sources.  See the
+    module docstring for the format of the sources.
+
+    :param sources: the recipient sources
+
+    :type sources: list of tuple
+
+    :return:
+      the IDs of the users
+
+    :rtype: set of int
+    """
+    user_ids = set()
+    for source in sources:
+        kind = source[0]
+        if kind == "samples":
+            sample_ids, important = source[1], source[2]
+            if not sample_ids:
+                continue
+            watchers = set(models.Sample.watchers.through.objects.filter(sample__in=sample_ids).
+                           values_list("user_id", "sample_id"))
+            if not watchers:
+                continue
+            fully_viewing_users = set(models.SampleVisibility.objects.filter(
+                sample__in=sample_ids, level=models.SampleVisibility.full).values_list("user_id", "sample_id"))
+            watcher_ids = set(user_id for user_id, sample_id in watchers & fully_viewing_users)
+            if watcher_ids and not important:
+                watcher_ids = set(models.UserDetails.objects.filter(user__in=watcher_ids, only_important_news=False).
+                                  values_list("user_id", flat=True))
+            user_ids.update(watcher_ids)
+        elif kind == "topic":
+            user_ids.update(User.objects.filter(topics=source[1], samples_user_details__only_important_news=False).
+                            values_list("id", flat=True))
+        elif kind == "users":
+            user_ids.update(source[1])
+        else:
+            raise ValueError("Invalid recipient source {0}".format(repr(kind)))
+    return user_ids
+
+
+def fan_out(step, originator_id, already_informed_user_ids, deliver=True):
+    """Determines the recipients of a feed entry and connects them with it.
+    Neither the originator nor users who have already received an earlier feed
+    entry of the same reporter are recipients.  If the entry has no
+    recipients, it is deleted.
+
+    :param step: the feed entry and its recipient sources, see the module
+        docstring
+    :param originator_id: the ID of the user who caused the feed entry
+    :param already_informed_user_ids: the IDs of the users who have already
+        received a feed entry from the same reporter; this set is not modified
+    :param deliver: whether the entry should actually be connected with its
+        recipients; if ``False``, only the return value is computed, which is
+        used for replaying earlier steps of a reporter
+
+    :type step: dict mapping str to ``object``
+    :type originator_id: int
+    :type already_informed_user_ids: set of int
+    :type deliver: bool
+
+    :return:
+      the IDs of all users who have received a feed entry from the reporter
+      after this step
+
+    :rtype: set of int
+    """
+    user_ids = get_recipients(step["sources"]) - already_informed_user_ids
+    if user_ids and step["content_type_id"]:
+        # The primary key of ``UserDetails`` is the user ID.
+        user_ids &= set(models.UserDetails.subscribed_feeds.through.objects.filter(
+            contenttype=step["content_type_id"], userdetails__in=user_ids).values_list("userdetails_id", flat=True))
+    already_informed_user_ids = already_informed_user_ids | user_ids
+    user_ids.discard(originator_id)
+    if deliver:
+        if user_ids:
+            through_model = models.FeedEntry.users.through
+            through_model.objects.bulk_create(through_model(feedentry_id=step["entry_id"], user_id=user_id)
+                                              for user_id in user_ids)
+        else:
+            models.FeedEntry.objects.filter(pk=step["entry_id"]).delete()
+    return already_informed_user_ids
+
+
+def get_queue_directory():
+    """Returns the directory of the queue of feed entries to be delivered.
+
+    :return:
+      the absolute path to the queue directory, with a trailing slash
+
+    :rtype: str
+    """
+    return os.path.join(settings.CACHE_ROOT, "feed_queue", "")
+
+
+def enqueue(steps, originator_id):
+    """Puts the last of the given steps into the delivery queue.  The file name
+    starts with the current time, so that the queue is processed roughly in
+    order.
+
+    :param steps: all steps of a reporter so far; the last one is the one to
+        be delivered
+    :param originator_id: the ID of the user who caused the feed entries
+
+    :type steps: list of dict
+    :type originator_id: int
+    """
+    job = {"originator_id": originator_id, "steps": steps, "created": time.time()}
+    filename = "{0:017.6f}-{1}.json".format(job["created"], uuid.uuid4().hex)
+    write_file_atomically(os.path.join(get_queue_directory(), filename), json.dumps(job).encode("utf-8"))
+
+
+def deliver_queued_entry(path, max_age=60):
+    """Delivers a feed entry from the queue and removes it from the queue.
+    This is called by the ``deliver_feed_entries`` management command.  If the
+    feed entry does not exist (yet), the transaction that created it may not
+    have been committed; then, the queue entry is kept for ``max_age``
+    seconds.  All errors are caught, so that a broken queue entry cannot stop
+    the delivery.
+
+    :param path: the path to the queue entry
+    :param max_age: the number of seconds after which a queue entry with a
+        missing feed entry is dropped
+
+    :type path: str
+    :type max_age: float
+
+    :return:
+      the traceback of an unexpected error, or ``None``
+
+    :rtype: unicode or NoneType
+    """
+    error = None
+    keep = False
+    try:
+        with open(path) as infile:
+            job = json.load(infile)
+        earlier_steps, step = job["steps"][:-1], job["steps"][-1]
+        with transaction.atomic():
+            if models.FeedEntry.objects.filter(pk=step["entry_id"]).exists():
+                already_informed_user_ids = set()
+                for earlier_step in earlier_steps:
+                    already_informed_user_ids = fan_out(earlier_step, job["originator_id"], already_informed_user_ids,
+                                                        deliver=False)
+                fan_out(step, job["originator_id"], already_informed_user_ids)
+            else:
+                keep = time.time() - job["created"] < max_age
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        if not keep:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+    return error
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Maintenance of the precomputed split genealogy of samples, see
+:py:class:`samples.models.SampleGenealogy`.  The signal receivers in
+:py:mod:`samples.signals` call `update` whenever a sample gets a new split
+origin, or a split is changed.  Deleted samples and splits need no treatment
+because their rows are deleted by the database cascade.  The management command
+``rebuild_sample_genealogy`` recomputes the whole table.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+from django.db import transaction
+from samples import models
+
+
+def _chunks(ids, chunk_size=500):
+    ids = list(ids)
+    for i in range(0, len(ids), chunk_size):
+        yield ids[i:i + chunk_size]
+
+
+def compute_rows(split_origins, splits):
+    """Computes the genealogy of all samples from scratch.
+
+    :param split_origins: the ID of the split origin of every sample, or
+        ``None`` if it has none
+    :param splits: the ID of the parent and the timestamp of every split
+
+    :type split_origins: dict mapping int to int or NoneType
+    :type splits: dict mapping int to (int, datetime.datetime)
+
+    :return:
+      the rows of the genealogy table as tuples of ancestor ID, descendant ID,
+      depth, and cutoff timestamp
+
+    :rtype: list of (int, int, int, datetime.datetime)
+    """
+    rows = []
+    for sample_id in split_origins:
+        current_id, depth, seen = sample_id, 0, {sample_id}
+        while split_origins.get(current_id) in splits:
+            parent_id, timestamp = splits[split_origins[current_id]]
+            if parent_id in seen:
+                break
+            depth += 1
+            rows.append((parent_id, sample_id, depth, timestamp))
+            seen.add(parent_id)
+            current_id = parent_id
+    return rows
+
+
+def rebuild(chunk_size=1000):
+    """Recomputes the whole genealogy table.  This is only necessary if the
+    database was changed without sending signals.
+
+    :param chunk_size: number of rows which are written at once
+
+    :type chunk_size: int
+
+    :return:
+      the number of rows in the genealogy table
+
+    :rtype: int
+    """
+    split_origins = dict(models.Sample.objects.values_list("id", "split_origin_id"))
+    splits = dict((id_, (parent_id, timestamp)) for id_, parent_id, timestamp
+                  in models.SampleSplit.objects.values_list("id", "parent_id", "timestamp"))
+    rows = compute_rows(split_origins, splits)
+    with transaction.atomic():
+        models.SampleGenealogy.objects.all().delete()
+        models.SampleGenealogy.objects.bulk_create(
+            (models.SampleGenealogy(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth,
+                                    cutoff_timestamp=cutoff_timestamp)
+             for ancestor_id, descendant_id, depth, cutoff_timestamp in rows), batch_size=chunk_size)
+    return len(rows)
+
+
+def update(sample_ids):
+    """Recomputes the ancestors of samples and of all their descendants.  This
+    must be called after the split origin of the samples has changed
+    (including newly created samples with a split origin), or after the
+    timestamp or the parent of their split origin has changed.  The samples
+    must not be descendants of each other; typically, they are pieces of the
+    same split.
+
+    :param sample_ids: the IDs of the samples
+
+    :type sample_ids: iterable of int
+    """
+    for sample_id, split_origin_id in models.Sample.objects.filter(pk__in=list(sample_ids)). \
+            values_list("id", "split_origin_id"):
+        subtree = dict(models.SampleGenealogy.objects.filter(ancestor=sample_id).values_list("descendant_id", "depth"))
+        subtree[sample_id] = 0
+        ancestors = []
+        split = models.SampleSplit.objects.filter(pk=split_origin_id).values_list("parent_id", "timestamp").first() \
+                if split_origin_id else None
+        if split:
+            parent_id, timestamp = split
+            ancestors.append((parent_id, 1, timestamp))
+            ancestors.extend((ancestor_id, depth + 1, cutoff_timestamp) for ancestor_id, depth, cutoff_timestamp
+                             in models.SampleGenealogy.objects.filter(descendant=parent_id).
+                             values_list("ancestor_id", "depth", "cutoff_timestamp"))
+        with transaction.atomic():
+            obsolete_rows = set()
+            for chunk in _chunks(subtree):
+                obsolete_rows.update(id_ for id_, ancestor_id in models.SampleGenealogy.objects.
+                                     filter(descendant__in=chunk).values_list("id", "ancestor_id")
+                                     if ancestor_id not in subtree)
+            for chunk in _chunks(obsolete_rows):
+                models.SampleGenealogy.objects.filter(pk__in=chunk).delete()
+            models.SampleGenealogy.objects.bulk_create(
+                (models.SampleGenealogy(ancestor_id=ancestor_id, descendant_id=descendant_id,
+                                        depth=ancestor_depth + descendant_depth, cutoff_timestamp=cutoff_timestamp)
+                 for ancestor_id, ancestor_depth, cutoff_timestamp in ancestors if ancestor_id not in subtree
+                 for descendant_id, descendant_depth in subtree.items()), batch_size=500)
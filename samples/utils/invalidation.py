@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Coordinator for “touching” samples, processes, and sample series, i.e. for
+updating their ``last_modified`` timestamps and expiring their cache
+namespaces.  See :py:mod:`samples.signals` for the big picture.
+
+The ``save()`` methods of the core models and the cache-related signal
+receivers don't touch the related instances themselves.  Instead, they call
+`touch_samples`, `touch_processes`, or `touch_sample_series`.  Within
+`coalesced_touches`, these calls only collect IDs.  When the outermost
+`coalesced_touches` is left, all collected IDs are resolved at once:  The
+relations are followed with one query per relation, the split family of the
+samples is looked up in the precomputed split genealogy, and then every table
+gets one bulk ``UPDATE`` of ``last_modified``, and the cache gets one batched
+write of new namespace versions.  Outside of `coalesced_touches`, every call is
+processed immediately in the same way.
+
+The ``UPDATE`` queries are executed in the current transaction, so they are
+committed or rolled back together with the change which caused them.  The
+expiry of cache namespaces, however, must happen after the commit; otherwise,
+another process could re-populate the cache with data which is outdated by the
+end of the transaction.  Therefore,
+:py:class:`samples.middleware.juliabase.CoalescedTouchesMiddleware` calls
+`begin_request` and `end_request` around every request, which defers all
+expiries to the end of the request and collects them into one batched cache
+write.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import threading, contextlib, datetime
+from django.db import transaction, DatabaseError
+from jb_common.utils.base import expire_cache_namespaces
+
+
+chunk_size = 500
+"""Maximal number of IDs in one SQL query.  This keeps the number of query
+parameters within the limits of all database backends.
+"""
+
+
+class Touches(object):
+    """Class for the collected IDs of samples, processes, and sample series that
+    are to be touched.  The ``*_saved`` sets contain the IDs of instances
+    which have just been saved, so that their ``last_modified`` is already up
+    to date; only their cache namespaces must be expired, and their relations
+    must be followed.
+
+    :ivar samples: IDs of samples to be touched
+    :ivar samples_with_series: IDs of samples the sample series of which must
+      be touched, too
+    :ivar samples_saved: IDs of samples which have just been saved
+    :ivar processes: IDs of processes to be touched
+    :ivar processes_with_samples: IDs of processes the samples of which must be
+      touched, too; if they are results, their sample series (and their
+      samples) are touched, too
+    :ivar processes_saved: IDs of processes which have just been saved
+    :ivar sample_series: names of sample series to be touched
+    :ivar sample_series_with_samples: names of sample series the samples of
+      which must be touched, too
+    :ivar sample_series_saved: names of sample series which have just been
+      saved
+
+    :type samples: set of int
+    :type samples_with_series: set of int
+    :type samples_saved: set of int
+    :type processes: set of int
+    :type processes_with_samples: set of int
+    :type processes_saved: set of int
+    :type sample_series: set of str
+    :type sample_series_with_samples: set of str
+    :type sample_series_saved: set of str
+    """
+
+    def __init__(self):
+        self.samples, self.samples_with_series, self.samples_saved = set(), set(), set()
+        self.processes, self.processes_with_samples, self.processes_saved = set(), set(), set()
+        self.sample_series, self.sample_series_with_samples, self.sample_series_saved = set(), set(), set()
+
+    def __bool__(self):
+        return bool(self.samples or self.processes or self.sample_series)
+
+    __nonzero__ = __bool__
+
+
+_local = threading.local()
+
+
+def _add(ids, target, with_relations, target_with_relations, saved, target_saved):
+    """Adds IDs to a `Touches` instance, or processes them immediately if there
+    is no active `coalesced_touches`.
+    """
+    touches = getattr(_local, "touches", None)
+    immediately = touches is None
+    if immediately:
+        touches = Touches()
+    ids = set(ids)
+    getattr(touches, target).update(ids)
+    if with_relations:
+        getattr(touches, target_with_relations).update(ids)
+    if saved:
+        getattr(touches, target_saved).update(ids)
+    if immediately:
+        flush(touches)
+
+
+def touch_samples(sample_ids, with_series=False, saved=False):
+    """Touches samples, i.e. updates their ``last_modified`` and expires their
+    cache namespaces.  Additionally, the whole split family of every sample
+    (ancestors, descendants, and the splits in between) is touched, as well as
+    the “My Samples” list timestamps of their watchers.
+
+    :param sample_ids: the IDs of the samples to be touched
+    :param with_series: whether the sample series containing the samples
+        should be touched, too
+    :param saved: whether the samples have just been saved, so that their
+        ``last_modified`` is already up to date
+
+    :type sample_ids: iterable of int
+    :type with_series: bool
+    :type saved: bool
+    """
+    _add(sample_ids, "samples", with_series, "samples_with_series", saved, "samples_saved")
+
+
+def touch_processes(process_ids, with_samples=False, saved=False):
+    """Touches processes, i.e. updates their ``last_modified`` and expires their
+    cache namespaces.
+
+    :param process_ids: the IDs of the processes to be touched
+    :param with_samples: whether the samples of the processes should be
+        touched, too; for results, also the connected sample series and their
+        samples are touched then
+    :param saved: whether the processes have just been saved, so that their
+        ``last_modified`` is already up to date
+
+    :type process_ids: iterable of int
+    :type with_samples: bool
+    :type saved: bool
+    """
+    _add(process_ids, "processes", with_samples, "processes_with_samples", saved, "processes_saved")
+
+
+def touch_sample_series(sample_series_ids, with_samples=False, saved=False):
+    """Touches sample series, i.e. updates their ``last_modified``.
+
+    :param sample_series_ids: the names of the sample series to be touched
+    :param with_samples: whether the samples in the series should be touched,
+        too
+    :param saved: whether the sample series have just been saved, so that their
+        ``last_modified`` is already up to date
+
+    :type sample_series_ids: iterable of str
+    :type with_samples: bool
+    :type saved: bool
+    """
+    _add(sample_series_ids, "sample_series", with_samples, "sample_series_with_samples", saved,
+         "sample_series_saved")
+
+
+def _chunks(ids):
+    """Splits a set of primary keys into sorted lists of at most `chunk_size` items.
+    """
+    ids = sorted(ids)
+    for i in range(0, len(ids), chunk_size):
+        yield ids[i:i + chunk_size]
+
+
+def _values_in_chunks(queryset, field, lookup, ids):
+    """Returns the values of one field of all rows of `queryset` for which
+    `lookup` is one of `ids`.
+    """
+    result = set()
+    for chunk in _chunks(ids):
+        result.update(queryset.filter(**{lookup + "__in": chunk}).values_list(field, flat=True))
+    return result
+
+
+def _get_split_family(sample_ids):
+    """Returns the split family of samples.  This consists of all their
+    ancestors, and all descendants of these ancestors, together with the splits
+    of all of them.  Both are looked up in the precomputed split genealogy
+    (see :py:class:`samples.models.SampleGenealogy`).  In contrast to former
+    versions of ``Sample.save()``, descendants of pieces are included even if
+    the piece was split before the split which created it; this can only
+    happen with inconsistent timestamps anyway.
+
+    :param sample_ids: the IDs of the samples
+
+    :type sample_ids: set of int
+
+    :return:
+      the IDs of all samples of the family (including `sample_ids`), the IDs of
+      all their splits
+
+    :rtype: set of int, set of int
+    """
+    from samples.models import SampleGenealogy, SampleSplit
+    family = set(sample_ids)
+    family.update(_values_in_chunks(SampleGenealogy.objects, "ancestor", "descendant", sample_ids))
+    family.update(_values_in_chunks(SampleGenealogy.objects, "descendant", "ancestor", family))
+    return family, _values_in_chunks(SampleSplit.objects, "pk", "parent", family)
+
+
+def _resolve(touches):
+    """Follows all relations of the collected IDs and adds the related IDs to
+    `touches`.  Afterwards, only the sets ``samples``, ``processes``,
+    ``sample_series``, and the ``*_saved`` sets are meaningful.
+    """
+    from samples.models import Sample, SampleSeries
+    if touches.processes_with_samples:
+        touches.samples.update(_values_in_chunks(Sample.objects, "pk", "processes", touches.processes_with_samples))
+        result_series = _values_in_chunks(SampleSeries.objects, "pk", "results", touches.processes_with_samples)
+        touches.sample_series.update(result_series)
+        touches.sample_series_with_samples.update(result_series)
+    if touches.sample_series_with_samples:
+        touches.samples.update(_values_in_chunks(Sample.objects, "pk", "series", touches.sample_series_with_samples))
+    if touches.samples_with_series:
+        touches.sample_series.update(_values_in_chunks(SampleSeries.objects, "pk", "samples",
+                                                       touches.samples_with_series))
+    if touches.samples:
+        family, splits = _get_split_family(touches.samples)
+        touches.samples.update(family)
+        touches.processes.update(splits)
+
+
+def flush(touches, update_database=True):
+    """Touches everything collected in `touches`.  Normally, you don't call
+    this function yourself but use `coalesced_touches`.
+
+    :param touches: the collected IDs
+    :param update_database: whether the ``last_modified`` timestamps should be
+        updated; if ``False``, only the cache namespaces are expired
+
+    :type touches: `Touches`
+    :type update_database: bool
+    """
+    from samples.models import Sample, Process, SampleSeries, UserDetails
+    if not touches:
+        return
+    if update_database:
+        with transaction.atomic():
+            _resolve(touches)
+            now = datetime.datetime.now()
+            for model, ids in ((Sample, touches.samples - touches.samples_saved),
+                               (Process, touches.processes - touches.processes_saved),
+                               (SampleSeries, touches.sample_series - touches.sample_series_saved)):
+                for chunk in _chunks(ids):
+                    model.objects.filter(pk__in=chunk).update(last_modified=now)
+            for chunk in _chunks(touches.samples):
+                UserDetails.objects.filter(user__my_samples__in=chunk).update(my_samples_list_timestamp=now)
+    else:
+        try:
+            with transaction.atomic():
+                _resolve(touches)
+        except DatabaseError:
+            # The current transaction is broken, so the relations cannot be
+            # followed anymore.  At least the directly touched instances are
+            # expired below.
+            pass
+    namespaces = ["sample:{0}".format(sample_id) for sample_id in touches.samples] + \
+                 ["process:{0}".format(process_id) for process_id in touches.processes]
+    deferred_namespaces = getattr(_local, "deferred_namespaces", None)
+    if deferred_namespaces is None:
+        expire_cache_namespaces(namespaces)
+    else:
+        deferred_namespaces.update(namespaces)
+
+
+def begin_request():
+    """Defers the expiry of cache namespaces until `end_request` is called.
+    This way, the expiry happens after the transaction of the request was
+    committed, and all expiries of the request are written to the cache at
+    once.  The ``last_modified`` timestamps, in contrast, are still updated
+    immediately.
+    """
+    _local.deferred_namespaces = set()
+
+
+def end_request():
+    """Expires all cache namespaces which have been collected since
+    `begin_request`, and stops deferring.  It is harmless to call this
+    function without a preceding `begin_request`.
+    """
+    deferred_namespaces = getattr(_local, "deferred_namespaces", None)
+    _local.deferred_namespaces = None
+    if deferred_namespaces:
+        expire_cache_namespaces(sorted(deferred_namespaces))
+
+
+def reset():
+    """Processes touches which are left over from `begin` calls without
+    matching `end`, or from a `begin_request` without matching `end_request`,
+    e.g. because the response of a request was never processed, and leaves the
+    collecting mode.
+    """
+    if getattr(_local, "depth", 0):
+        _local.depth = 1
+        end()
+    end_request()
+
+
+def begin():
+    """Starts collecting touches.  Calls may be nested; only the outermost
+    `end` processes the collected IDs.  Normally, you use `coalesced_touches`
+    instead.
+    """
+    _local.depth = getattr(_local, "depth", 0) + 1
+    if _local.depth == 1:
+        _local.touches = Touches()
+
+
+def end(update_database=True):
+    """Stops collecting touches.  If this is the outermost call, all collected
+    IDs are processed.  It is harmless to call this function without
+    a preceding `begin`.
+
+    :param update_database: whether the ``last_modified`` timestamps should be
+        updated; if ``False``, e.g. after a rollback, only the cache namespaces
+        are expired
+
+    :type update_database: bool
+    """
+    depth = getattr(_local, "depth", 0)
+    if depth == 0:
+        return
+    _local.depth = depth - 1
+    if depth == 1:
+        touches = _local.touches
+        del _local.touches
+        flush(touches, update_database)
+
+
+@contextlib.contextmanager
+def coalesced_touches():
+    """Context manager which collects all touches within its body, and
+    processes them at once at its end.  It may be nested.  If the body raises
+    an exception, the ``last_modified`` timestamps are not updated, but the
+    cache namespaces are expired nevertheless.  Use it like this::
+
+        with coalesced_touches():
+            for process in processes:
+                process.save()
+    """
+    begin()
+    try:
+        yield
+    except:
+        end(update_database=False)
+        raise
+    else:
+        end()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Rendering of process plots.  Plots are rendered with Matplotlib and stored
+in the file cache below ``settings.CACHE_ROOT``, at the paths returned by
+:py:meth:`samples.models.Process.calculate_plot_locations`.  The file names
+contain a hash which changes whenever the raw data or the process changes (see
+:py:func:`jb_common.utils.base.get_cached_file`).
+
+If ``settings.ASYNCHRONOUS_PLOT_RENDERING`` is ``True``, thumbnails are
+never rendered within a request.  Instead, they are put into a queue, which is
+a directory in ``settings.CACHE_ROOT`` with one file per plot.  The file name is
+derived from the plot file name, so every plot is queued only once, no matter how
+many requests ask for it.  The queue is processed by the ``render_plots``
+management command.
+"""
+
+from __future__ import absolute_import, unicode_literals
+import django.utils.six as six
+
+import os, os.path, json, hashlib, errno, tempfile, traceback
+from django.conf import settings
+from django.utils import translation
+from jb_common.utils.base import get_file_cache_path, write_file_atomically, mkdirs, CacheLock
+from samples import models
+from samples.utils.plots import PlotError
+
+
+def render_plot(process, plot_id, thumbnail, datafile_name):
+    """Renders a plot of a process with Matplotlib.
+
+    :param process: the process whose plot should be rendered; it must be the
+        actual instance
+    :param plot_id: the ID of the plot; mostly ``""``
+    :param thumbnail: whether a PNG thumbnail instead of a full PDF should be
+        rendered
+    :param datafile_name: the raw data file(s) as returned by
+        :py:meth:`samples.models.Process.get_datafile_name`
+
+    :type process: `samples.models.Process`
+    :type plot_id: unicode
+    :type thumbnail: bool
+    :type datafile_name: str or list of str
+
+    :return:
+      the content of the PNG or PDF file
+
+    :rtype: bytes
+
+    :raises PlotError: if the plot could not be generated
+    """
+    # Matplotlib is imported here because importing it takes long, and this
+    # module is imported by every process because of the signal handlers.
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    try:
+        output = six.BytesIO()
+        if thumbnail:
+            figure = Figure(frameon=False, figsize=(4, 3))
+            canvas = FigureCanvasAgg(figure)
+            axes = figure.add_subplot(111)
+            axes.set_position((0.17, 0.16, 0.78, 0.78))
+            axes.grid(True)
+            process.draw_plot(axes, plot_id, datafile_name, for_thumbnail=True)
+            canvas.print_figure(output, dpi=settings.THUMBNAIL_WIDTH / 4, format="png")
+        else:
+            figure = Figure()
+            canvas = FigureCanvasAgg(figure)
+            axes = figure.add_subplot(111)
+            axes.grid(True)
+            axes.set_title(six.text_type(process))
+            process.draw_plot(axes, plot_id, datafile_name, for_thumbnail=False)
+            # FixMe: Activate this line with Matplotlib 1.1.0.
+#                figure.tight_layout()
+            canvas.print_figure(output, format="pdf")
+    except ValueError as e:
+        raise PlotError("Plot could not be generated: " + e.args[0])
+    return output.getvalue()
+
+
+def get_plot_source(process, plot_id, thumbnail):
+    """Returns the path in the file cache and the raw data file(s) of a plot.
+
+    :param process: the process whose plot is requested; it must be the actual
+        instance
+    :param plot_id: the ID of the plot; mostly ``""``
+    :param thumbnail: whether the PNG thumbnail instead of the full PDF is
+        requested
+
+    :type process: `samples.models.Process`
+    :type plot_id: unicode
+    :type thumbnail: bool
+
+    :return:
+      the absolute path of the plot file in the file cache, the raw data
+      file(s) of the plot
+
+    :rtype: unicode, str or list of str
+
+    :raises PlotError: if the process has no such plot, or if a raw data file
+        is missing
+    """
+    plot_filepath = process.calculate_plot_locations(plot_id)["thumbnail_file" if thumbnail else "plot_file"]
+    datafile_name = process.get_datafile_name(plot_id)
+    if datafile_name is None:
+        raise PlotError("No such plot available.")
+    timestamps = [] if thumbnail else [sample.last_modified for sample in process.samples.all()]
+    timestamps.append(process.last_modified)
+    datafile_names = datafile_name if isinstance(datafile_name, list) else [datafile_name]
+    if not all(os.path.exists(filename) for filename in datafile_names):
+        raise PlotError("One of the raw datafiles was not found.")
+    return get_file_cache_path(plot_filepath, datafile_names, timestamps), datafile_name
+
+
+def _render_to_file(process, plot_id, thumbnail, filepath, datafile_name):
+    """Renders a plot and writes it to the file cache.  If the plot could not
+    be rendered, an empty file is written instead, so that the plot is not
+    tried again and again.
+    """
+    try:
+        content = render_plot(process, plot_id, thumbnail, datafile_name)
+    except PlotError:
+        content = b""
+    write_file_atomically(filepath, content)
+
+
+def is_rendered(filepath):
+    """Returns whether a plot file is in the file cache.  As a side effect,
+    its modification time is updated, so that it is not pruned soon.
+
+    :param filepath: the absolute path of the plot file, as returned by
+        `get_plot_source`
+
+    :type filepath: unicode
+
+    :return:
+      whether the plot file exists
+
+    :rtype: bool
+    """
+    try:
+        os.utime(filepath, None)
+    except OSError:
+        return False
+    return True
+
+
+def get_plot(process, plot_id, thumbnail):
+    """Returns the path to a plot, rendering it if it is not in the file cache.
+    Concurrent requests for the same plot wait for the first one instead of
+    rendering the plot again.
+
+    :param process: the process whose plot is requested; it must be the actual
+        instance
+    :param plot_id: the ID of the plot; mostly ``""``
+    :param thumbnail: whether the PNG thumbnail instead of the full PDF is
+        requested
+
+    :type process: `samples.models.Process`
+    :type plot_id: unicode
+    :type thumbnail: bool
+
+    :return:
+      the absolute path of the plot file; it is empty if the plot could not be
+      rendered
+
+    :rtype: unicode
+
+    :raises PlotError: if the process has no such plot, or if a raw data file
+        is missing
+    """
+    filepath, datafile_name = get_plot_source(process, plot_id, thumbnail)
+    if not is_rendered(filepath):
+        lock = CacheLock("plot:" + hashlib.sha1(filepath.encode("utf-8")).hexdigest(), ttl=60, timeout=30)
+        if lock.acquire():
+            try:
+                if not os.path.exists(filepath):
+                    _render_to_file(process, plot_id, thumbnail, filepath, datafile_name)
+            finally:
+                lock.release()
+        else:
+            _render_to_file(process, plot_id, thumbnail, filepath, datafile_name)
+    return filepath
+
+
+def get_queue_directory():
+    """Returns the directory of the queue of plots to be rendered.
+
+    :return:
+      the absolute path to the queue directory, with a trailing slash
+
+    :rtype: str
+    """
+    return os.path.join(settings.CACHE_ROOT, "plot_queue", "")
+
+
+def enqueue_plot(process, plot_id, thumbnail):
+    """Puts a plot into the rendering queue, unless it is already there.  The
+    queue entry is written to a temporary file first and then hard-linked to
+    its final name, so the ``render_plots`` command never sees half-written
+    entries.
+
+    :param process: the process whose plot should be rendered; it must be the
+        actual instance
+    :param plot_id: the ID of the plot; mostly ``""``
+    :param thumbnail: whether the PNG thumbnail instead of the full PDF should
+        be rendered
+
+    :type process: `samples.models.Process`
+    :type plot_id: unicode
+    :type thumbnail: bool
+
+    :raises PlotError: if the process has no such plot, or if a raw data file
+        is missing
+    """
+    filepath = get_plot_source(process, plot_id, thumbnail)[0]
+    directory = get_queue_directory()
+    mkdirs(directory)
+    path = os.path.join(directory, hashlib.sha1(filepath.encode("utf-8")).hexdigest() + ".json")
+    if not os.path.exists(path):
+        job = {"process_id": process.id, "plot_id": plot_id, "thumbnail": thumbnail,
+               "language": translation.get_language()}
+        with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as outfile:
+            json.dump(job, outfile)
+        try:
+            os.link(outfile.name, path)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+        finally:
+            os.unlink(outfile.name)
+
+
+def prewarm_plots(process, plot_ids=None):
+    """Queues all thumbnails of a process for rendering if asynchronous plot
+    rendering is enabled.  Plots which cannot be generated are silently
+    skipped.
+
+    :param process: the process whose thumbnails should be rendered; it must
+        be the actual instance
+    :param plot_ids: the IDs of the plots to be rendered; if ``None``, the
+        result of :py:meth:`samples.models.Process.get_plot_ids` is used
+
+    :type process: `samples.models.Process`
+    :type plot_ids: list of unicode
+    """
+    if settings.ASYNCHRONOUS_PLOT_RENDERING:
+        for plot_id in process.get_plot_ids() if plot_ids is None else plot_ids:
+            try:
+                enqueue_plot(process, plot_id, thumbnail=True)
+            except PlotError:
+                pass
+
+
+def render_queued_plot(path):
+    """Renders a plot from the queue and removes it from the queue.  This is
+    called by the workers of the ``render_plots`` management command.  All
+    errors are caught, so that a broken plot cannot stop a worker.
+
+    :param path: the path to the queue entry
+
+    :type path: str
+
+    :return:
+      the path to the queue entry, and the traceback of an unexpected error
+      (or ``None``)
+
+    :rtype: str, unicode or NoneType
+    """
+    error = None
+    try:
+        with open(path) as infile:
+            job = json.load(infile)
+        with translation.override(job["language"]):
+            process = models.Process.objects.get(pk=job["process_id"]).actual_instance
+            filepath, datafile_name = get_plot_source(process, job["plot_id"], job["thumbnail"])
+            if not os.path.exists(filepath):
+                _render_to_file(process, job["plot_id"], job["thumbnail"], filepath, datafile_name)
+    except (models.Process.DoesNotExist, PlotError):
+        pass
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    return path, error
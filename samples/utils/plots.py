@@ -18,9 +18,22 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+"""Functions for reading raw data files for plots.  The data block of a file is
+parsed into a NumPy array in one go.  The parsed arrays are kept in a small
+per-process cache, keyed by the file's path, modification time and size, and
+by the location of the data block.  So, if many plots are drawn from the same
+file – like the cells of a solarsimulator measurement – the file is read and
+parsed only once.  The lines of the file are not kept.
+
+Cells which are not numbers become NaN, unless the reading function is called
+with ``strict=True``.  Then, a `PlotError` is raised if one of the requested
+columns contains such cells.
+"""
+
 from __future__ import absolute_import, unicode_literals, division
 
-import codecs
+import os, codecs, collections
+import numpy
 
 
 class PlotError(Exception):
@@ -31,7 +44,164 @@ class PlotError(Exception):
     pass
 
 
-def read_plot_file_beginning_at_line_number(filename, columns, start_line_number, end_line_number=None, separator=None):
+_blocks_cache = collections.OrderedDict()
+
+
+def _lookup(cache, max_size, key, generator):
+    """Gets an item from one of the LRU caches of this module, or creates it
+    with ``generator`` if it is not there.
+    """
+    try:
+        value = cache.pop(key)
+    except KeyError:
+        value = generator()
+        while len(cache) >= max_size:
+            cache.popitem(last=False)
+    cache[key] = value
+    return value
+
+
+def _get_file_signature(filename):
+    """Returns a tuple which identifies the current version of a file.
+
+    :raises PlotError: if the file could not be accessed
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        raise PlotError("datafile could not be opened")
+    return filename, stat.st_mtime, stat.st_size
+
+
+def read_plot_file_lines(filename, encoding="cp1252"):
+    """Returns the lines of a datafile.
+
+    :param filename: full path to the data file
+    :param encoding: encoding of the data file
+
+    :type filename: str
+    :type encoding: str
+
+    :return:
+      all lines of the file, without line endings
+
+    :rtype: list of unicode
+
+    :raises PlotError: if the file could not be read
+    """
+    try:
+        with codecs.open(filename, encoding=encoding) as datafile:
+            return datafile.read().splitlines()
+    except IOError:
+        raise PlotError("datafile could not be opened")
+
+
+def _to_float(cell):
+    try:
+        return float(cell)
+    except ValueError:
+        return float("nan")
+
+
+def _parse_lines(lines, separator):
+    """Converts lines of a data block into a 2-d array.  Empty lines are
+    skipped, decimal commas are accepted, and cells which are not numbers
+    become NaN.  The array is as wide as the shortest line.
+
+    :param lines: the lines of the data block
+    :param separator: the separator which separates the values from each other
+
+    :type lines: list of unicode
+    :type separator: unicode or NoneType
+
+    :return:
+      the data block, with one row per line, and the indices of the columns
+      which contain cells that are not numbers
+
+    :rtype: numpy.ndarray, frozenset of int
+    """
+    text = "\n".join(lines)
+    if separator != ",":
+        text = text.replace(",", ".")
+    lines = [line for line in (line.strip() for line in text.splitlines()) if line]
+    if not lines:
+        return numpy.empty((0, 0)), frozenset()
+    if separator is None:
+        widths = [len(line.split()) for line in lines]
+    else:
+        widths = [line.count(separator) + 1 for line in lines]
+    width = min(widths)
+    if width == max(widths):
+        # Fast path: All lines have the same number of cells, so we can split
+        # the whole block at once.
+        cells = " ".join(lines).split() if separator is None else separator.join(lines).split(separator)
+    else:
+        cells = [cell for line in lines for cell in line.split(separator)[:width]]
+    columns = []
+    invalid_columns = set()
+    for i in range(width):
+        column = cells[i::width]
+        try:
+            columns.append(numpy.array(column, dtype=float))
+        except ValueError:
+            columns.append(numpy.array([_to_float(cell) for cell in column]))
+            invalid_columns.add(i)
+    return numpy.column_stack(columns), frozenset(invalid_columns)
+
+
+def _read_data_block(filename, block_key, find_block, separator):
+    """Returns a data block of a datafile as a 2-d array.  The result is cached
+    as long as the file is not modified.
+
+    :param filename: full path to the data file
+    :param block_key: hashable value which identifies the data block within
+        the file
+    :param find_block: callable which takes all lines of the file and returns
+        the lines of the data block
+    :param separator: the separator which separates the values from each other
+
+    :type filename: str
+    :type block_key: object
+    :type find_block: callable
+    :type separator: unicode or NoneType
+
+    :return:
+      the data block, with one row per line, and the indices of the columns
+      which contain cells that are not numbers
+
+    :rtype: numpy.ndarray, frozenset of int
+
+    :raises PlotError: if the file could not be read
+    """
+    def parse():
+        data, invalid_columns = _parse_lines(find_block(read_plot_file_lines(filename)), separator)
+        # The array is shared by all callers, so it must never be modified.
+        data.flags.writeable = False
+        return data, invalid_columns
+    return _lookup(_blocks_cache, 8, _get_file_signature(filename) + (block_key, separator), parse)
+
+
+def _select_columns(data_block, columns, strict):
+    """Returns the given columns of a data block.  The columns are copies, so
+    that callers may modify them in place without corrupting the cached data
+    block.
+
+    :raises PlotError: if the data block has too few columns, or if `strict`
+        is true and one of the columns contains cells which are not numbers
+    """
+    data, invalid_columns = data_block
+    if strict and invalid_columns.intersection(columns):
+        raise PlotError("Data file format was invalid.")
+    if data.size == 0:
+        return [numpy.empty(0) for column in columns]
+    try:
+        return [data[:, column].copy() for column in columns]
+    except IndexError:
+        raise PlotError("datafile contained too few columns")
+
+
+def read_plot_file_beginning_at_line_number(filename, columns, start_line_number, end_line_number=None, separator=None,
+                                            strict=False):
     """Read a datafile and returns the content of selected columns beginning at
     start_line_number.  You shouldn't use this function directly. Use the
     specific functions instead.
@@ -43,50 +213,33 @@ def read_plot_file_beginning_at_line_number(filename, columns, start_line_number
          The default is ``None``, means till end of file.
     :param separator: the separator which separates the values from each other.
         Default is ``None``
+    :param strict: whether cells which are not numbers are an error; if
+        ``False``, they become NaN
 
     :type filename: str
     :type columns: list of int
     :type start_line_number: int
     :type end_line_number: int or None
     :type separator: str or None
+    :type strict: bool
 
     :return:
-      List of all columns.  Every column is represented as a list of floating
-      point values.
+      List of all columns.  Every column is represented as an array of
+      floating point values.
 
-    :rtype: list of list of float
+    :rtype: list of numpy.ndarray
 
     :raises PlotError: if something wents wrong with interpreting the file (I/O,
-        unparseble data)
+        too few columns, or, if `strict` is true, cells which are not
+        numbers)
     """
-    start_values = False
-    try:
-        datafile = codecs.open(filename, encoding="cp1252")
-    except IOError:
-        raise PlotError("datafile could not be opened")
-    result = [[] for i in range(len(columns))]
-    for line_number, line in enumerate(datafile, start=1):
-        if start_values:
-            if end_line_number and line_number > end_line_number:
-                break
-            if not line.strip():
-                continue
-            cells = line.strip().split(separator)
-            for column, result_array in zip(columns, result):
-                try:
-                    value = float(cells[column].replace(",", "."))
-                except IndexError:
-                    raise PlotError("datafile contained too few columns")
-                except ValueError:
-                    value = float("nan")
-                result_array.append(value)
-        elif line_number == start_line_number - 1:
-            start_values = True
-    datafile.close()
-    return result
-
-
-def read_plot_file_beginning_after_start_value(filename, columns, start_value, end_value="", separator=None):
+    data = _read_data_block(filename, ("line", start_line_number, end_line_number),
+                            lambda lines: lines[max(start_line_number - 1, 0):end_line_number or None], separator)
+    return _select_columns(data, columns, strict)
+
+
+def read_plot_file_beginning_after_start_value(filename, columns, start_value, end_value="", separator=None,
+                                               strict=False):
     """Read a datafile and return the content of selected columns after the
     start_value was detected.  You shouldn't use this function directly. Use
     the specific functions instead.
@@ -99,44 +252,73 @@ def read_plot_file_beginning_after_start_value(filename, columns, start_value, e
         end.  The default is the empty string
     :param separator: the separator which separates the values from each
         other.  Default is ``None``
+    :param strict: whether cells which are not numbers are an error; if
+        ``False``, they become NaN
 
     :type filename: str
     :type columns: list of int
     :type start_value: str
     :type end_value: str
     :type separator: str or None
+    :type strict: bool
 
     :return:
-      List of all columns.  Every column is represented as a list of floating
-      point values.
+      List of all columns.  Every column is represented as an array of
+      floating point values.
 
-    :rtype: list of list of float
+    :rtype: list of numpy.ndarray
 
     :raises PlotError: if something wents wrong with interpreting the file (I/O,
-        unparseble data)
+        too few columns, or, if `strict` is true, cells which are not
+        numbers)
     """
-    start_values = False
-    try:
-        datafile = codecs.open(filename, encoding="cp1252")
-    except IOError:
-        raise PlotError("datafile could not be opened")
-    result = [[] for i in range(len(columns))]
-    for line in datafile:
-        if start_values:
-            if end_value and line.lower().startswith(end_value):
+    def find_block(lines):
+        for i, line in enumerate(lines):
+            if line.lower().startswith(start_value.lower()):
                 break
-            if not line.strip():
-                continue
-            cells = line.strip().split(separator)
-            for column, result_array in zip(columns, result):
-                try:
-                    value = float(cells[column].replace(",", "."))
-                except IndexError:
-                    raise PlotError("datafile contained too few columns")
-                except ValueError:
-                    value = float("nan")
-                result_array.append(value)
-        elif line.lower().startswith(start_value.lower()):
-            start_values = True
-    datafile.close()
-    return result
+        else:
+            return []
+        block = lines[i + 1:]
+        if end_value:
+            # Searching the whole block at once is much faster than testing
+            # every line.
+            lowercase_block = ("\n" + "\n".join(block)).lower()
+            position = lowercase_block.find("\n" + end_value)
+            if position != -1:
+                block = block[:lowercase_block.count("\n", 0, position)]
+        return block
+    data = _read_data_block(filename, ("value", start_value, end_value), find_block, separator)
+    return _select_columns(data, columns, strict)
+
+
+def read_plot_file_without_comments(filename, columns, comment="#", separator=None, strict=False):
+    """Read a datafile and return the content of selected columns of all lines
+    which don't start with ``comment``.
+
+    :param filename: full path to the data file
+    :param columns: the columns that should be read.
+    :param comment: the prefix of comment lines
+    :param separator: the separator which separates the values from each
+        other.  Default is ``None``
+    :param strict: whether cells which are not numbers are an error; if
+        ``False``, they become NaN
+
+    :type filename: str
+    :type columns: list of int
+    :type comment: str
+    :type separator: str or None
+    :type strict: bool
+
+    :return:
+      List of all columns.  Every column is represented as an array of
+      floating point values.
+
+    :rtype: list of numpy.ndarray
+
+    :raises PlotError: if something wents wrong with interpreting the file (I/O,
+        too few columns, or, if `strict` is true, cells which are not
+        numbers)
+    """
+    data = _read_data_block(filename, ("comment", comment),
+                            lambda lines: [line for line in lines if not line.lstrip().startswith(comment)], separator)
+    return _select_columns(data, columns, strict)
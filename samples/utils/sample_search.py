@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Search for samples by their names and aliases.  It is used by the sample
+search view and by the auto-completion of sample names.
+
+On PostgreSQL, the substring search uses the trigram indices created by the
+migration ``0007_sample_name_indices``.  On other databases, an n-gram index
+in the memory of the process is used instead, which is built from all sample
+names and aliases.  It is rebuilt whenever a sample name or alias changes.
+This is only meant for tests and small installations.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import collections
+from django.db import connection
+from django.db.models import Q, Case, When, Value, IntegerField
+from django.db.models.functions import Length
+from jb_common.utils.base import get_cache_version, expire_cache_namespace
+from samples import models
+import samples.utils.views as utils
+
+
+class NgramIndex(object):
+    """Index for substring search in short strings.  Every string is split
+    into all its substrings of length `n` (the n-grams).  A string contains
+    the pattern only if it contains all n-grams of the pattern, so the
+    candidates are the intersection of the strings containing these n-grams.
+    The candidates are checked afterwards.  The search is case-insensitive.
+
+    :ivar n: the length of the n-grams
+
+    :type n: int
+    """
+
+    def __init__(self, n=3):
+        self.n = n
+        self.texts = collections.defaultdict(set)
+        self.ngrams = collections.defaultdict(set)
+
+    def get_ngrams(self, text):
+        return set(text[i:i + self.n] for i in range(len(text) - self.n + 1))
+
+    def add(self, key, text):
+        """Adds a string to the index.
+
+        :param key: the key under which the string is found, e.g. the ID of the
+            sample; a key may have more than one string
+        :param text: the string to be added
+
+        :type key: object
+        :type text: unicode
+        """
+        text = text.lower()
+        self.texts[key].add(text)
+        for ngram in self.get_ngrams(text):
+            self.ngrams[ngram].add(key)
+
+    def find(self, pattern):
+        """Returns all keys which have a string containing the pattern.
+
+        :param pattern: the substring to look for
+
+        :type pattern: unicode
+
+        :return:
+          all matching keys
+
+        :rtype: set
+        """
+        pattern = pattern.lower()
+        if len(pattern) < self.n:
+            candidates = self.texts
+        else:
+            candidate_sets = sorted((self.ngrams.get(ngram, set()) for ngram in self.get_ngrams(pattern)), key=len)
+            candidates = candidate_sets[0].intersection(*candidate_sets[1:])
+        return set(key for key in candidates if any(pattern in text for text in self.texts[key]))
+
+
+chunk_size = 500
+"""Maximal number of sample IDs in one SQL query if the n-gram indices are
+used.  This keeps the number of query parameters within the limits of all
+database backends.
+"""
+
+_indices = {}
+
+def get_ngram_indices():
+    """Returns the in-memory indices of sample names and aliases.  They are
+    rebuilt if `expire_ngram_indices` was called since they were built.
+
+    :return:
+      the index of the sample names, the index of the aliases; both map to
+      sample IDs
+
+    :rtype: `NgramIndex`, `NgramIndex`
+    """
+    version = get_cache_version("sample-names")
+    if _indices.get("version") != version:
+        names, aliases = NgramIndex(), NgramIndex()
+        for id_, name in models.Sample.objects.values_list("id", "name").iterator():
+            names.add(id_, name)
+        for id_, name in models.SampleAlias.objects.values_list("sample_id", "name").iterator():
+            aliases.add(id_, name)
+        _indices.update(version=version, names=names, aliases=aliases)
+    return _indices["names"], _indices["aliases"]
+
+
+def expire_ngram_indices():
+    """Marks the in-memory indices of sample names and aliases as outdated.  It
+    must be called whenever a sample name or alias is changed.  On PostgreSQL,
+    this does nothing because the indices are not used there.
+    """
+    if connection.vendor != "postgresql":
+        expire_cache_namespace("sample-names")
+
+
+def _get_sort_key(name, name_pattern):
+    """Returns the sort key of a sample name in the search results, see
+    `search_samples`.
+    """
+    lowercase_name, name_pattern = name.lower(), name_pattern.lower()
+    rank = 0 if lowercase_name == name_pattern else 1 if lowercase_name.startswith(name_pattern) else 2
+    return rank, len(name), lowercase_name, name
+
+
+def search_samples(user, name_pattern, aliases=False, limit=100):
+    """Returns the samples whose names contain a pattern.  Only samples the
+    names of which the user is allowed to see are found.  The samples are
+    ordered by relevance: First an exact match, then the samples whose names
+    start with the pattern, then all others.  Within these groups, shorter
+    names come first.
+
+    :param user: the current user
+    :param name_pattern: the substring to look for; the search is
+        case-insensitive
+    :param aliases: whether aliases of the samples should be searched, too
+    :param limit: the maximal number of samples to be returned
+
+    :type user: django.contrib.auth.models.User
+    :type name_pattern: unicode
+    :type aliases: bool
+    :type limit: int
+
+    :return:
+      the found samples, whether there were more than ``limit`` results
+
+    :rtype: list of `samples.models.Sample`, bool
+    """
+    if connection.vendor == "postgresql":
+        condition = Q(name__icontains=name_pattern)
+        if aliases:
+            condition |= Q(pk__in=models.SampleAlias.objects.filter(name__icontains=name_pattern).values("sample"))
+        found_samples = utils.restricted_samples_query(user).filter(condition).annotate(
+            rank=Case(When(name__iexact=name_pattern, then=Value(0)), When(name__istartswith=name_pattern, then=Value(1)),
+                      default=Value(2), output_field=IntegerField()),
+            name_length=Length("name")).order_by("rank", "name_length", "name")
+        found_samples = list(found_samples[:limit + 1])
+    else:
+        # The candidates are ranked by means of the names in the index, and
+        # then looked up in chunks in this order, until enough samples were
+        # found which the user is allowed to see.
+        names, aliases_index = get_ngram_indices()
+        ids = names.find(name_pattern)
+        if aliases:
+            ids |= aliases_index.find(name_pattern)
+        def get_candidate_sort_key(id_):
+            # If the index is outdated, e.g. after a rename in another process,
+            # a candidate may have no name in it.  Then, it is looked up last.
+            texts = names.texts.get(id_)
+            return _get_sort_key(min(texts), name_pattern) if texts else (3,)
+        ids = sorted(ids, key=get_candidate_sort_key)
+        restricted_samples = utils.restricted_samples_query(user)
+        found_samples = []
+        for i in range(0, len(ids), chunk_size):
+            found_samples.extend(sorted(restricted_samples.filter(pk__in=ids[i:i + chunk_size]),
+                                        key=lambda sample: _get_sort_key(sample.name, name_pattern)))
+            if len(found_samples) > limit:
+                break
+    return found_samples[:limit], len(found_samples) > limit
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""Generation of thumbnails of images and PDFs.  Bitmaps are scaled down
+in-process with Pillow.  PDFs are rasterized with PyMuPDF if it is installed;
+otherwise, one Ghostscript process per call rasterizes all pages, reading the
+PDF from standard input.  Nothing is written to temporary files.
+
+The thumbnails of result images are stored in the file cache below
+``settings.CACHE_ROOT`` (see :py:func:`jb_common.utils.base.get_cached_file`).
+They are generated right after the upload, so that viewing a result never has
+to wait for them.
+"""
+
+from __future__ import absolute_import, unicode_literals
+import django.utils.six as six
+
+import struct, subprocess
+from PIL import Image
+from django.conf import settings
+from jb_common.utils.base import get_cached_file
+import jb_common.utils.blobs
+
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+
+pdf_resolution = 150
+"""Resolution in dpi with which PDFs are rasterized before they are scaled down
+to the thumbnail size.
+"""
+
+
+def _split_png_stream(data):
+    """Splits concatenated PNG files into the single files.  Ghostscript
+    writes all pages to standard output this way.
+    """
+    images = []
+    position = 0
+    while position < len(data):
+        start = position
+        position += 8
+        while True:
+            length, chunk_type = struct.unpack(str(">I4s"), data[position:position + 8])
+            position += length + 12
+            if chunk_type == b"IEND":
+                break
+        images.append(data[start:position])
+    return images
+
+
+def rasterize_pdf(pdf, resolution=100, first_page_only=False):
+    """Converts the pages of a PDF into PNG images with transparent background.
+    If PyMuPDF is installed, this happens in-process.  Otherwise, *one*
+    Ghostscript process converts all pages, so it pays off to pass many pages
+    in one PDF.
+
+    :param pdf: the PDF document
+    :param resolution: the resolution of the images in dpi
+    :param first_page_only: whether only the first page should be converted
+
+    :type pdf: bytes
+    :type resolution: int
+    :type first_page_only: bool
+
+    :return:
+      the PNG images, one per page
+
+    :rtype: list of bytes
+
+    :raises IOError: if the PDF could not be rasterized
+    """
+    if fitz:
+        try:
+            document = fitz.open(stream=pdf, filetype="pdf")
+        except RuntimeError as error:
+            raise IOError("PDF could not be read: {0}".format(error))
+        try:
+            pages = [document[0]] if first_page_only else document
+            return [page.get_pixmap(dpi=resolution, alpha=True).tobytes("png") for page in pages]
+        finally:
+            document.close()
+    command = ["gs", "-q", "-dNOPAUSE", "-dBATCH", "-dSAFER", "-sDEVICE=pngalpha", "-r{0}".format(resolution)]
+    if first_page_only:
+        command.extend(["-dFirstPage=1", "-dLastPage=1"])
+    command.extend(["-sOutputFile=-", "-"])
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    output, __ = process.communicate(pdf)
+    if process.returncode != 0:
+        raise IOError("Ghostscript returned with exit code {0}".format(process.returncode))
+    return _split_png_stream(output)
+
+
+def generate_thumbnail(infile, image_type, size=None):
+    """Generates the thumbnail of an image.  It fits into a square of ``size``
+    pixels and is never bigger than the original.  JPEGs are already scaled
+    down while they are decoded.
+
+    :param infile: the image file; it must be opened in binary mode and be
+        seekable
+    :param image_type: the type of the image; may be ``"png"``, ``"jpeg"``,
+        or ``"pdf"``; of a PDF, only the first page is used
+    :param size: the maximal width and height of the thumbnail in pixels;
+        defaults to ``settings.THUMBNAIL_WIDTH``
+
+    :type infile: file
+    :type image_type: str
+    :type size: int
+
+    :return:
+      the thumbnail, as a JPEG if the original is a JPEG, and as a PNG
+      otherwise
+
+    :rtype: bytes
+
+    :raises IOError: if the image could not be read
+    """
+    size = size or settings.THUMBNAIL_WIDTH
+    if image_type == "pdf":
+        image = Image.open(six.BytesIO(rasterize_pdf(infile.read(), pdf_resolution, first_page_only=True)[0]))
+    else:
+        image = Image.open(infile)
+        image.draft("RGB", (size, size))
+    if image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGB" if image_type == "jpeg" else "RGBA")
+    image.thumbnail((size, size), Image.LANCZOS)
+    output = six.BytesIO()
+    if image_type == "jpeg":
+        image.save(output, "JPEG", quality=90)
+    else:
+        image.save(output, "PNG", optimize=True)
+    return output.getvalue()
+
+
+def get_result_thumbnail(result):
+    """Returns the thumbnail of the image of a result in the file cache,
+    generating it if necessary.  The image is read from the blob storage
+    without copying it.
+
+    :param result: the result; it must have an image
+
+    :type result: `samples.models.Result`
+
+    :return:
+      the absolute path to the thumbnail in the file cache
+
+    :rtype: unicode
+
+    :raises IOError: if the image could not be read
+    """
+    image_locations = result.get_image_locations()
+    image_filename = image_locations["image_file"]
+
+    def generate():
+        infile = jb_common.utils.blobs.storage.open(image_filename, "r")
+        try:
+            return generate_thumbnail(infile, result.image_type)
+        finally:
+            infile.close()
+
+    return get_cached_file(image_locations["thumbnail_file"], generate, [image_filename])
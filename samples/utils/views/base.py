@@ -26,11 +26,9 @@ from __future__ import absolute_import, unicode_literals
 import django.utils.six as six
 from django.utils.six.moves import cStringIO as StringIO
 
-import copy, re, csv
-from django.conf import settings
+import copy, re, csv, json
 from django.core.cache import cache
-from django.db.models import Q
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.utils.translation import ugettext_lazy as _, ugettext
 from django.contrib.contenttypes.models import ContentType
 from django.template import defaultfilters
@@ -38,14 +36,16 @@ from jb_common import mimeparse
 from samples import models, permissions
 from samples.utils import sample_names
 from samples.views.table_export import build_column_group_list, ColumnGroupsForm, \
-    ColumnsForm, generate_table_rows, flatten_tree, OldDataForm, SwitchRowForm
+    ColumnsForm, generate_table_rows, flatten_tree, OldDataForm, SwitchRowForm, build_column_group_list_for_rows, \
+    prepare_row_trees, iterate_table_rows
 import jb_common.utils.base
 
 
 __all__ = ("AmbiguityException", "lookup_sample", "convert_id_to_int",
            "successful_response", "remove_samples_from_my_samples", "StructuredSeries", "StructuredTopic",
-           "build_structured_sample_list", "extract_preset_sample", "digest_process", "restricted_samples_query",
-           "enforce_clearance", "UnicodeWriter", "table_export", "median", "average")
+           "build_structured_sample_list", "extract_preset_sample", "digest_process", "digest_processes",
+           "restricted_samples_query", "enforce_clearance", "UnicodeWriter", "table_export", "streaming_table_export", "median",
+           "average")
 
 
 class AmbiguityException(Exception):
@@ -404,7 +404,8 @@ def extract_preset_sample(request):
 def digest_process(process, user, local_context={}):
     """Convert a process to a process context.  This conversion extracts the
     relevant information of the process and saves it in a form which can easily
-    be processed in a template.
+    be processed in a template.  If you have many processes, use
+    `digest_processes` instead.
 
     :param process: the process to be digest
     :param user: current user
@@ -421,22 +422,64 @@ def digest_process(process, user, local_context={}):
 
     :rtype: dict mapping str to ``object``
     """
-    process = process.actual_instance
-    cache_key = process.get_cache_key(user.jb_user_details.get_data_hash(), local_context)
-    cached_context = jb_common.utils.base.get_from_cache(cache_key) if cache_key else None
-    if cached_context is None:
-        process_context = process.get_context_for_user(user, local_context)
+    return digest_processes([(process, local_context)], user)[0]
+
+
+def digest_processes(processes_with_local_contexts, user):
+    """Convert many processes to process contexts at once.  This is the batch
+    variant of `digest_process`.  The concrete process instances are fetched
+    with one query per process class, and all cached process contexts are
+    fetched from the cache with one single lookup.  Only the cache misses are
+    rendered.
+
+    The cache keys contain the current version of the process' cache namespace
+    (see `jb_common.utils.base.get_cache_versions`), so that saving the process
+    invalidates all of its cached contexts at once.
+
+    :param processes_with_local_contexts: the processes to be digested, each
+      together with its local sample context (see `digest_process`)
+    :param user: current user
+
+    :type processes_with_local_contexts: list of (`samples.models.Process`,
+      dict mapping str to ``object``)
+    :type user: django.contrib.auth.models.User
+
+    :return:
+      the process contexts of the given processes, in the same order
+
+    :rtype: list of dict mapping str to ``object``
+    """
+    if not processes_with_local_contexts:
+        return []
+    processes, local_contexts = zip(*processes_with_local_contexts)
+    processes = jb_common.utils.base.resolve_actual_instances(
+        processes, select_related=("operator", "external_operator", "content_type"))
+    user_settings_hash = user.jb_user_details.get_data_hash()
+    versions = jb_common.utils.base.get_cache_versions("process:{0}".format(process.id) for process in processes)
+    cache_keys = []
+    for process, local_context in zip(processes, local_contexts):
+        cache_key = process.get_cache_key(user_settings_hash, local_context)
         if cache_key:
-            keys_list_key = "process-keys:{0}".format(process.id)
-            with jb_common.utils.base.cache_key_locked("process-lock:{0}".format(process.id)):
-                keys = cache.get(keys_list_key, [])
-                keys.append(cache_key)
-                cache.set(keys_list_key, keys, settings.CACHES["default"].get("TIMEOUT", 300) + 10)
-                cache.set(cache_key, process_context)
-    else:
-        cached_context.update(local_context)
-        process_context = process.get_context_for_user(user, cached_context)
-    return process_context
+            cache_key += ":{0}".format(versions["process:{0}".format(process.id)])
+        cache_keys.append(cache_key)
+    cached_contexts = jb_common.utils.base.get_many_from_cache(key for key in cache_keys if key)
+    process_contexts = []
+    new_cache_items = {}
+    for process, local_context, cache_key in zip(processes, local_contexts, cache_keys):
+        cached_context = cached_contexts.get(cache_key) if cache_key else None
+        if cached_context is None:
+            process_context = process.get_context_for_user(user, local_context)
+            if cache_key:
+                new_cache_items[cache_key] = process_context
+        else:
+            # Copy it because the same cache item may be used more than once.
+            cached_context = cached_context.copy()
+            cached_context.update(local_context)
+            process_context = process.get_context_for_user(user, cached_context)
+        process_contexts.append(process_context)
+    if new_cache_items:
+        cache.set_many(new_cache_items)
+    return process_contexts
 
 
 def restricted_samples_query(user):
@@ -458,9 +501,8 @@ def restricted_samples_query(user):
     """
     if user.is_superuser:
         return models.Sample.objects.all().order_by("name")
-    return models.Sample.objects.filter(Q(topic__confidential=False) | Q(topic__members=user) |
-                                        Q(currently_responsible_person=user) | Q(clearances__user=user) |
-                                        Q(topic__isnull=True)).order_by("name").distinct()
+    # See `samples.utils.visibility` for the rules.
+    return models.Sample.objects.filter(visibilities__user=user).order_by("name")
 
 
 def enforce_clearance(user, clearance_processes, destination_user, sample, clearance=None, cutoff_timestamp=None):
@@ -659,6 +701,90 @@ def table_export(request, data, label_column_heading):
     return (column_groups_form, columns_form, table, switch_row_forms, old_data_form)
 
 
+def streaming_table_export(request, name, get_row_trees, label_column_heading):
+    """Helper function for exporting big tables without ever having the whole
+    data tree or the whole table in memory.  In contrast to `table_export`,
+    there is no preview and no selection of rows: All rows with at least one
+    non-empty cell are exported.  The columns are the ones given in the query
+    string in the same way as for `table_export` (i.e. as indices), or all
+    columns if none are given.
+
+    The row trees are generated twice: The first time, the columns are
+    collected, so that they are fixed before the first row is sent.  The
+    second time, the rows are sent as they are produced.
+
+    The output format is CSV, JSON (the same as in `table_export`), or
+    newline-delimited JSON with one row object per line, depending on the
+    ``Accept`` header field in the HTTP request.
+
+    :param request: the current HTTP Request object
+    :param name: the name of the table, used for the file name of the CSV
+        file
+    :param get_row_trees: callable without parameters which returns a fresh
+        iterator over the row trees; it is called twice
+    :param label_column_heading: Description of the very first column with the
+        table row headings, see `generate_table_rows`.
+
+    :type request: HttpRequest
+    :type name: unicode
+    :type get_row_trees: callable returning iterator over
+      `samples.data_tree.DataNode`
+    :type label_column_heading: unicode
+
+    :return:
+      the HTTP response object
+
+    :rtype: StreamingHttpResponse
+    """
+    requested_mime_type = mimeparse.best_match(["text/csv", "application/json", "application/x-ndjson"],
+                                               request.META.get("HTTP_ACCEPT", "text/csv"))
+    labels_found = []
+
+    def collect_labels(row_trees):
+        for row_tree in row_trees:
+            if row_tree.descriptive_name and not labels_found:
+                labels_found.append(True)
+            yield row_tree
+
+    column_groups, columns = build_column_group_list_for_rows(collect_labels(prepare_row_trees(get_row_trees())))
+    columns_form = ColumnsForm(column_groups, columns, set(column_group.name for column_group in column_groups),
+                               request.GET)
+    selected_columns = columns_form.cleaned_data["columns"] if columns_form.is_valid() else range(len(columns))
+    rows = iterate_table_rows(prepare_row_trees(get_row_trees()), columns, sorted(selected_columns),
+                              bool(labels_found), label_column_heading)
+    head_row = next(rows)
+
+    def json_rows():
+        for row in rows:
+            yield json.dumps(dict((head_row[i], cell) for i, cell in enumerate(row) if cell),
+                             cls=jb_common.utils.base.JSONEncoder)
+
+    if requested_mime_type == "application/x-ndjson":
+        return StreamingHttpResponse((line + "\n" for line in json_rows()),
+                                     content_type="application/x-ndjson; charset=utf-8")
+    elif requested_mime_type == "application/json":
+        def json_chunks():
+            yield "["
+            for i, line in enumerate(json_rows()):
+                yield ",\n" + line if i else line
+            yield "]"
+        return StreamingHttpResponse(json_chunks(), content_type="application/json; charset=utf-8")
+    else:
+        def csv_chunks():
+            buffer_ = StringIO()
+            writer = UnicodeWriter(buffer_) if six.PY2 else csv.writer(buffer_, dialect=csv.excel_tab)
+            writer.writerow(head_row)
+            for row in rows:
+                writer.writerow(row)
+                yield buffer_.getvalue()
+                buffer_.seek(0)
+                buffer_.truncate(0)
+            yield buffer_.getvalue()
+        response = StreamingHttpResponse(csv_chunks(), content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = "attachment; filename=juliabase--{0}.txt".format(defaultfilters.slugify(name))
+        return response
+
+
 def median(numeric_values):
     """Calculates the median from a list of numeric values.
 
@@ -357,6 +357,27 @@ class ProcessWithoutSamplesView(TemplateView):
         return login_required(view)
 
 
+def _set_samples(process, samples):
+    """Sets the samples of a process.  In contrast to assigning to
+    ``process.samples``, which clears the relation and adds all samples again,
+    only the actually added and removed samples are passed to the
+    ``m2m_changed`` signal receivers.  Thus, e.g. the informal layers of
+    unchanged samples are neither dropped nor recomputed.
+
+    :param process: the process whose samples are set
+    :param samples: the new samples of the process
+
+    :type process: `samples.models.Process`
+    :type samples: iterable of `samples.models.Sample`
+    """
+    old_samples = set(process.samples.all())
+    samples = set(samples)
+    if old_samples - samples:
+        process.samples.remove(*(old_samples - samples))
+    if samples - old_samples:
+        process.samples.add(*(samples - old_samples))
+
+
 class ProcessView(ProcessWithoutSamplesView):
     """View class for physical processes with one sample each.  The HTML form for
     the sample is called ``sample`` in the template.  Typical usage can be very
@@ -386,7 +407,7 @@ class ProcessView(ProcessWithoutSamplesView):
     def save_to_database(self):
         process = super(ProcessView, self).save_to_database()
         if self.forms["sample"].is_bound:
-            process.samples = [self.forms["sample"].cleaned_data["sample"]]
+            _set_samples(process, [self.forms["sample"].cleaned_data["sample"]])
         return process
 
 
@@ -410,7 +431,7 @@ class ProcessMultipleSamplesView(ProcessWithoutSamplesView):
     def save_to_database(self):
         process = super(ProcessMultipleSamplesView, self).save_to_database()
         if self.forms["samples"].is_bound:
-            process.samples = self.forms["samples"].cleaned_data["sample_list"]
+            _set_samples(process, self.forms["samples"].cleaned_data["sample_list"])
         return process
 
 
@@ -24,9 +24,12 @@ the database was changed in one way or another.
 
 from __future__ import absolute_import, unicode_literals
 
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.db.models.query import QuerySet
 import jb_common.models
 from samples import models, permissions
+from samples.utils import feed_delivery
 
 
 __all__ = ("Reporter",)
@@ -61,18 +64,28 @@ class Reporter(object):
         feed_utils.Reporter(request.user).report_result_process(
                 result, edit_description=None)
 
-    :ivar interested_users: all users that get informed with the next generated
-      feed entry by a call to `__connect_with_users`
+    If ``settings.DEFERRED_FEED_FAN_OUT`` is ``True``, the feed entries are
+    created immediately, but they are connected with their recipients by the
+    ``deliver_feed_entries`` management command, see
+    :py:mod:`samples.utils.feed_delivery`.
 
-    :ivar already_informed_users: All users who have already received a feed
-      entry from this instance of ``Reporter``.  They won't get a second
-      entry.
+    :ivar sources: the recipient sources of the next generated feed entry, see
+      :py:mod:`samples.utils.feed_delivery`; they are consumed by a call to
+      `__connect_with_users`
+
+    :ivar steps: all feed entries generated by this instance of ``Reporter``
+      so far, together with their recipient sources
+
+    :ivar already_informed_user_ids: The IDs of all users who have already
+      received a feed entry from this instance of ``Reporter``.  They won't get
+      a second entry.  It is not maintained if the fan-out is deferred.
 
     :ivar originator: the user responsible for the databse change reported by
       the feed entry of this instance of ``Reporter``.
 
-    :type interested_users: set of django.contrib.auth.models.User
-    :type already_informed_users: set of django.contrib.auth.models.User
+    :type sources: list of tuple
+    :type steps: list of dict
+    :type already_informed_user_ids: set of int
     :type originator: django.contrib.auth.models.User
     """
 
@@ -84,8 +97,9 @@ class Reporter(object):
 
         :type originator: django.contrib.auth.models.User
         """
-        self.interested_users = set()
-        self.already_informed_users = set()
+        self.sources = []
+        self.steps = []
+        self.already_informed_user_ids = set()
         self.originator = originator
 
     def __connect_with_users(self, entry, sending_model=None):
@@ -95,7 +109,7 @@ class Reporter(object):
         have already received another feed entry get the current ``entry``.
 
         If the entry would be connected with no interested users, it is
-        deleted.
+        deleted.  If the fan-out is deferred, this happens later.
 
         :param entry: the feed entry that should be connected with users that
             should receive it
@@ -104,44 +118,42 @@ class Reporter(object):
         :type entry: `samples.models.FeedEntry`
         :type sending_model: class, descendant of ``models.Model``
         """
-        self.interested_users -= self.already_informed_users
-        if sending_model:
-            self.interested_users &= set(user_details.user for user_details in
-                                         ContentType.objects.get_for_model(sending_model).subscribed_users.all())
-        self.already_informed_users.update(self.interested_users)
-        self.interested_users.discard(self.originator)
-        if self.interested_users:
-            entry.users = self.interested_users
+        step = {"entry_id": entry.id, "sources": self.sources,
+                "content_type_id": ContentType.objects.get_for_model(sending_model).id if sending_model else None}
+        self.steps.append(step)
+        if settings.DEFERRED_FEED_FAN_OUT:
+            feed_delivery.enqueue(self.steps, self.originator.id)
         else:
-            entry.delete()
-        self.interested_users = set()
+            self.already_informed_user_ids = \
+                feed_delivery.fan_out(step, self.originator.id, self.already_informed_user_ids)
+        self.sources = []
 
     def __add_interested_users(self, samples, important=True):
         """Add users interested in news about the given samples.  These are
         all users that have one of ``samples`` on their “My Samples” list,
-        *and* the level of importance is enough.  They are added to the set of
-        users connected with the next generated feed entry by `__connect_with_users`.
+        *and* the level of importance is enough.  They are added to the
+        recipients of the next generated feed entry by `__connect_with_users`.
 
         :param samples: the samples involved in the database change
         :param important: whether the news is marked as being important;
             defaults to ``True``
 
-        :type samples: list of `samples.models.Sample`
+        :type samples: list of `samples.models.Sample` or QuerySet
         :type important: bool
         """
-        for sample in samples:
-            for user in sample.watchers.all():
-                if (important or not user.samples_user_details.only_important_news) and \
-                        permissions.has_permission_to_fully_view_sample(user, sample):
-                    self.interested_users.add(user)
+        if isinstance(samples, QuerySet):
+            sample_ids = list(samples.values_list("id", flat=True))
+        else:
+            sample_ids = [sample.id for sample in samples]
+        self.sources.append(("samples", sample_ids, important))
 
     def __add_watchers(self, process_or_sample_series, important=True):
         """Add users interested in news about the given process or sample
-        series.  They are added to the set of users connected with the next
-        generated feed entry by `__connect_with_users`.  The odd unification of
-        processes and sample series stems from the fact that both share the
-        attribute ``samples`` as a many-to-many relationship.  Thus, I use
-        duck-typing here.
+        series.  They are added to the recipients of the next generated feed
+        entry by `__connect_with_users`.  The odd unification of processes and
+        sample series stems from the fact that both share the attribute
+        ``samples`` as a many-to-many relationship.  Thus, I use duck-typing
+        here.
 
         :param process_or_sample_series: the process or sample_series involved
             in the database change
@@ -155,20 +167,34 @@ class Reporter(object):
         self.__add_interested_users(process_or_sample_series.samples.all(), important)
 
     def __add_topic_members(self, topic):
-        """Add all members of the given topic to the set of users connected
-        with the next generated feed entry by `__connect_with_users`.  However,
-        only those members are added who wish to receive also non-important
-        news.
+        """Add all members of the given topic to the recipients of the next
+        generated feed entry by `__connect_with_users`.  However, only those
+        members are added who wish to receive also non-important news.
 
         :param topic: the topic whose members should be informed with the next
-            feed entry
+            feed entry; may be ``None``
 
-        :type topic: `jb_common.models.Topic`
+        :type topic: `jb_common.models.Topic` or NoneType
         """
-        self.interested_users.update(user for user in topic.members.iterator()
-                                     if not user.samples_user_details.only_important_news)
+        if topic:
+            self.sources.append(("topic", topic.id))
+
+    def __add_users(self, users):
+        """Add the given users to the recipients of the next generated feed
+        entry by `__connect_with_users`.
+
+        :param users: the users to be informed with the next feed entry
+
+        :type users: iterable of django.contrib.auth.models.User or QuerySet
+        """
+        if isinstance(users, QuerySet):
+            user_ids = list(users.values_list("id", flat=True))
+        else:
+            user_ids = [user.id for user in users]
+        self.sources.append(("users", user_ids))
 
-    def __get_subscribers(self, sample_series):
+    @staticmethod
+    def __get_subscribers(sample_series):
         """
         :param sample_series: the sample series whose subscribers should be
             determined
@@ -176,19 +202,13 @@ class Reporter(object):
         :type sample_series: `samples.models.SampleSeries`
 
         :return:
-          all user who watch a sample in this sample series, and therefore, the
-          sample series itself, too
+          the IDs of all users who watch a sample in this sample series, and
+          therefore, the sample series itself, too
 
-        :rtype: list of `models.UserDetails`
+        :rtype: set of int
         """
-        # This is a hack but I think it's okay.  I save
-        # ``self.interested_users``, fill it with the subscribers, and restore
-        # the old value for ``self.interested_users`` again.
-        interested_users = self.interested_users
-        self.__add_watchers(sample_series)
-        subscribers = self.interested_users
-        self.interested_users = interested_users
-        return subscribers
+        return feed_delivery.get_recipients([("samples", list(sample_series.samples.values_list("id", flat=True)),
+                                              True)])
 
     def report_new_samples(self, samples):
         """Generate one feed entry for new samples.  If more than one sample
@@ -207,7 +227,7 @@ class Reporter(object):
             common_purpose = samples[0].purpose
             entry = models.FeedNewSamples.objects.create(originator=self.originator, topic=topic, purpose=common_purpose)
             entry.samples = samples
-            entry.auto_adders = [user_details.user for user_details in topic.auto_adders.all()]
+            entry.auto_adders = list(topic.auto_adders.values_list("pk", flat=True))
             self.__add_topic_members(topic)
             self.__connect_with_users(entry, jb_common.models.Topic)
 
@@ -275,7 +295,7 @@ class Reporter(object):
         """
         entry = models.FeedCopiedMySamples.objects.create(originator=self.originator, comments=comments)
         entry.samples = samples
-        self.interested_users.add(recipient)
+        self.__add_users([recipient])
         self.__connect_with_users(entry, models.Sample)
 
     def report_new_responsible_person_samples(self, samples, edit_description):
@@ -299,7 +319,7 @@ class Reporter(object):
             originator=self.originator, description=edit_description["description"],
             important=edit_description["important"], responsible_person_changed=True)
         entry.samples = samples
-        self.interested_users.add(samples[0].currently_responsible_person)
+        self.__add_users([samples[0].currently_responsible_person])
         self.__connect_with_users(entry, models.Sample)
 
     def report_changed_sample_topic(self, samples, old_topic, edit_description):
@@ -327,7 +347,7 @@ class Reporter(object):
             originator=self.originator, description=edit_description["description"],
             important=important, topic=topic, old_topic=old_topic)
         entry.samples = samples
-        entry.auto_adders = [user_details.user for user_details in topic.auto_adders.all()]
+        entry.auto_adders = list(topic.auto_adders.values_list("pk", flat=True))
         if old_topic:
             self.__add_topic_members(old_topic)
         self.__add_topic_members(topic)
@@ -411,7 +431,7 @@ class Reporter(object):
         entry = models.FeedEditedSampleSeries.objects.create(
             originator=self.originator, description=edit_description["description"],
             important=edit_description["important"], responsible_person_changed=True, sample_series=sample_series)
-        self.interested_users.add(sample_series.currently_responsible_person)
+        self.__add_users([sample_series.currently_responsible_person])
         self.__connect_with_users(entry, models.SampleSeries)
 
     def report_changed_sample_series_topic(self, sample_series, old_topic, edit_description):
@@ -471,7 +491,7 @@ class Reporter(object):
         :type action: str
         """
         entry = models.FeedChangedTopic.objects.create(originator=self.originator, topic=topic, action=action)
-        self.interested_users = set(users)
+        self.__add_users(users)
         self.__connect_with_users(entry, jb_common.models.Topic)
 
     def report_status_message(self, process_class, status_message):
@@ -487,7 +507,8 @@ class Reporter(object):
         """
         entry = models.FeedStatusMessage.objects.create(originator=self.originator, process_class=process_class,
                                                         status=status_message)
-        self.interested_users = set(user_details.user for user_details in process_class.subscribed_users.all())
+        # The primary key of ``UserDetails`` is the user ID.
+        self.sources.append(("users", list(process_class.subscribed_users.values_list("pk", flat=True))))
         self.__connect_with_users(entry)
 
     def report_withdrawn_status_message(self, process_class, status_message):
@@ -503,7 +524,8 @@ class Reporter(object):
         """
         entry = models.FeedWithdrawnStatusMessage.objects.create(
             originator=self.originator, process_class=process_class, status=status_message)
-        self.interested_users = set(user_details.user for user_details in process_class.subscribed_users.all())
+        # The primary key of ``UserDetails`` is the user ID.
+        self.sources.append(("users", list(process_class.subscribed_users.values_list("pk", flat=True))))
         self.__connect_with_users(entry)
 
     def report_task(self, task, edit_description=None):
@@ -519,11 +541,11 @@ class Reporter(object):
         :type edit_description: dict mapping str to ``object`` or ``None``
         """
         process_class = task.process_class
-        self.interested_users = set(permissions.get_all_adders(task.process_class.model_class()))
+        self.__add_users(permissions.get_all_adders(task.process_class.model_class()))
         if edit_description is None:
             entry = models.FeedNewTask.objects.create(originator=self.originator, task=task)
         else:
-            self.interested_users.add(task.customer)
+            self.__add_users([task.customer])
             important = edit_description["important"]
             entry = models.FeedEditedTask.objects.create(originator=self.originator, task=task,
                                                          description=edit_description["description"], important=important)
@@ -537,8 +559,8 @@ class Reporter(object):
 
         :type task: `models.Task`
         """
-        self.interested_users = set(permissions.get_all_adders(task.process_class.model_class()))
-        self.interested_users.add(task.customer)
+        self.__add_users(permissions.get_all_adders(task.process_class.model_class()))
+        self.__add_users([task.customer])
         entry = models.FeedRemovedTask.objects.create(old_id=task.id, originator=self.originator,
                                                       process_class=task.process_class)
         entry.samples = task.samples.all()
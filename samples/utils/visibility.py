@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Maintenance of the precomputed sample visibility, see
+:py:class:`samples.models.SampleVisibility`.  The levels are derived from the
+same rules as :py:func:`samples.permissions.assert_can_fully_view_sample` and
+:py:func:`samples.utils.views.restricted_samples_query`, but for many users
+and samples at once.  The signal receivers in :py:mod:`samples.signals` call
+`update` for the users and samples affected by a change.  The management
+commands ``rebuild_sample_visibility`` and ``check_sample_visibility`` process
+all samples.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import collections
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from jb_common.models import Topic, UserDetails
+from samples import models
+
+
+def _chunks(ids, chunk_size):
+    ids = list(ids)
+    for i in range(0, len(ids), chunk_size):
+        yield ids[i:i + chunk_size]
+
+
+class _Users(object):
+    """The data of the users which is needed to compute their levels of access.
+    It is read once for every call of `update` or `check`.
+    """
+
+    def __init__(self, user_ids=None):
+        users = User.objects.all() if user_ids is None else User.objects.filter(pk__in=user_ids)
+        self.all = set()
+        self.superusers = set()
+        for id_, is_superuser in users.values_list("id", "is_superuser"):
+            self.all.add(id_)
+            if is_superuser:
+                self.superusers.add(id_)
+        self.departments = dict(UserDetails.objects.values_list("user_id", "department_id"))
+        self.by_department = collections.defaultdict(set)
+        for id_ in self.all:
+            if self.departments.get(id_):
+                self.by_department[self.departments[id_]].add(id_)
+        can_view_every_sample = set(users.filter(is_active=True).filter(
+            Q(user_permissions__codename="view_every_sample", user_permissions__content_type__app_label="samples") |
+            Q(groups__permissions__codename="view_every_sample",
+              groups__permissions__content_type__app_label="samples")).values_list("id", flat=True))
+        self.can_view_every_sample_by_department = collections.defaultdict(set)
+        for id_ in can_view_every_sample:
+            if self.departments.get(id_):
+                self.can_view_every_sample_by_department[self.departments[id_]].add(id_)
+
+
+def compute_levels(sample_ids, users):
+    """Computes the levels of access of users to samples.
+
+    :param sample_ids: the IDs of the samples
+    :param users: the users
+
+    :type sample_ids: list of int
+    :type users: `_Users`
+
+    :return:
+      the levels of access, mapping (user ID, sample ID) to the level; if a
+      pair is missing, the user must not even see the name of the sample
+
+    :rtype: dict mapping (int, int) to int
+    """
+    samples = models.Sample.objects.filter(pk__in=sample_ids).values_list(
+        "id", "topic_id", "topic__confidential", "currently_responsible_person_id")
+    samples = list(samples)
+    members = collections.defaultdict(set)
+    for topic_id, user_id in Topic.members.through.objects.filter(
+            topic__in=set(sample[1] for sample in samples if sample[1])).values_list("topic_id", "user_id"):
+        members[topic_id].add(user_id)
+    clearances = collections.defaultdict(set)
+    for sample_id, user_id in models.Clearance.objects.filter(sample__in=sample_ids).values_list("sample_id", "user_id"):
+        clearances[sample_id].add(user_id)
+    levels = {}
+    for sample_id, topic_id, confidential, responsible_person_id in samples:
+        department_id = users.departments.get(responsible_person_id)
+        full = set(users.superusers)
+        if topic_id:
+            full |= members[topic_id]
+            full.add(responsible_person_id)
+            if not confidential and department_id:
+                full |= users.can_view_every_sample_by_department[department_id]
+        elif department_id:
+            full |= users.by_department[department_id]
+        if topic_id and confidential:
+            name_only = members[topic_id] | {responsible_person_id} | clearances[sample_id]
+        else:
+            name_only = users.all
+        for user_id in name_only & users.all:
+            levels[user_id, sample_id] = models.SampleVisibility.name_only
+        for user_id in clearances[sample_id] & users.all:
+            levels[user_id, sample_id] = models.SampleVisibility.via_clearance
+        for user_id in full & users.all:
+            levels[user_id, sample_id] = models.SampleVisibility.full
+    return levels
+
+
+def _differences(sample_ids, user_ids, chunk_size):
+    """Compares the stored levels with the computed ones.  It yields the
+    differences chunk by chunk, so that the caller can write them before the
+    next chunk is computed.
+
+    :return:
+      generator for the differences of each chunk: the stored rows to be
+      deleted, the rows to be created, and the rows to be changed; they map
+      (user ID, sample ID) to the stored level, to the computed level, and to
+      both levels, respectively
+
+    :rtype: generator of (dict mapping (int, int) to int, dict mapping (int,
+      int) to int, dict mapping (int, int) to (int, int))
+    """
+    users = _Users(user_ids)
+    if sample_ids is None:
+        sample_ids = models.Sample.objects.values_list("id", flat=True).order_by("id")
+    for chunk in _chunks(sample_ids, chunk_size):
+        levels = compute_levels(chunk, users)
+        stored = models.SampleVisibility.objects.filter(sample__in=chunk)
+        if user_ids is not None:
+            stored = stored.filter(user__in=users.all)
+        stored = dict(((user_id, sample_id), level)
+                      for user_id, sample_id, level in stored.values_list("user_id", "sample_id", "level"))
+        obsolete = dict((key, level) for key, level in stored.items() if key not in levels)
+        missing = dict((key, level) for key, level in levels.items() if key not in stored)
+        changed = dict((key, (stored[key], level)) for key, level in levels.items()
+                       if key in stored and stored[key] != level)
+        yield obsolete, missing, changed
+
+
+def update(sample_ids=None, user_ids=None, chunk_size=1000):
+    """Brings the stored levels of access up to date.  Only the levels of the
+    given samples and users are updated.
+
+    :param sample_ids: the IDs of the samples to be updated; if ``None``, all
+        samples are updated
+    :param user_ids: the IDs of the users to be updated; if ``None``, all users
+        are updated
+    :param chunk_size: the number of samples which are processed at once
+
+    :type sample_ids: iterable of int
+    :type user_ids: iterable of int
+    :type chunk_size: int
+
+    :return:
+      the number of changed rows
+
+    :rtype: int
+    """
+    number_of_changes = 0
+    for obsolete, missing, changed in _differences(sample_ids, user_ids, chunk_size):
+        with transaction.atomic():
+            obsolete_by_user = collections.defaultdict(list)
+            for user_id, sample_id in obsolete:
+                obsolete_by_user[user_id].append(sample_id)
+            for user_id, sample_ids_ in obsolete_by_user.items():
+                models.SampleVisibility.objects.filter(user=user_id, sample__in=sample_ids_).delete()
+            models.SampleVisibility.objects.bulk_create(
+                models.SampleVisibility(user_id=user_id, sample_id=sample_id, level=level)
+                for (user_id, sample_id), level in missing.items())
+            changed_by_level = collections.defaultdict(lambda: collections.defaultdict(list))
+            for (user_id, sample_id), (__, level) in changed.items():
+                changed_by_level[level][user_id].append(sample_id)
+            for level, sample_ids_by_user in changed_by_level.items():
+                for user_id, sample_ids_ in sample_ids_by_user.items():
+                    models.SampleVisibility.objects.filter(user=user_id, sample__in=sample_ids_).update(level=level)
+        number_of_changes += len(obsolete) + len(missing) + len(changed)
+    return number_of_changes
+
+
+def check(chunk_size=1000):
+    """Compares the stored levels of access with the computed ones, without
+    changing anything.
+
+    :param chunk_size: the number of samples which are processed at once
+
+    :type chunk_size: int
+
+    :return:
+      all inconsistencies as tuples of user ID, sample ID, stored level, and
+      computed level; a level is ``None`` if the row is missing
+
+    :rtype: list of (int, int, int or NoneType, int or NoneType)
+    """
+    inconsistencies = []
+    for obsolete, missing, changed in _differences(None, None, chunk_size):
+        inconsistencies.extend((user_id, sample_id, level, None) for (user_id, sample_id), level in obsolete.items())
+        inconsistencies.extend((user_id, sample_id, None, level) for (user_id, sample_id), level in missing.items())
+        inconsistencies.extend((user_id, sample_id, stored_level, level)
+                               for (user_id, sample_id), (stored_level, level) in changed.items())
+    return sorted(inconsistencies)
+
+
+def get_level(user, sample):
+    """Returns the level of access of a user to a sample.
+
+    :param user: the user
+    :param sample: the sample
+
+    :type user: django.contrib.auth.models.User
+    :type sample: `samples.models.Sample`
+
+    :return:
+      the level (see :py:class:`samples.models.SampleVisibility`), or ``None``
+      if the user must not even see the name of the sample
+
+    :rtype: int or NoneType
+    """
+    levels = models.SampleVisibility.objects.filter(user=user, sample=sample).values_list("level", flat=True)
+    return levels[0] if levels else None
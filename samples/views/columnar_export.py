@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""View for downloading the columnar export of a process class, see
+:py:mod:`samples.utils.columnar_export`.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import tempfile
+from wsgiref.util import FileWrapper
+from django.http import Http404, StreamingHttpResponse
+from django.contrib.auth.decorators import login_required
+from django.utils.translation import ugettext as _
+from jb_common.utils.base import get_all_models
+from samples import models, permissions
+from samples.utils import columnar_export
+
+
+@login_required
+def export(request, process_name, table_name, format_):
+    """View for downloading one table of the columnar export of a process
+    class.  Only the processes that the user is allowed to view are exported.
+    The file is written to a temporary file first and then streamed to the
+    client, so that the database connection is not held open by a slow
+    download.
+
+    :param request: the current HTTP Request object
+    :param process_name: the class name of the model of the physical process,
+        e.g. ``"FiveChamberDeposition"``
+    :param table_name: the name of the table, e.g.
+        ``"five_chamber_deposition__layers"``
+    :param format_: the file format; one of
+        ``samples.utils.columnar_export.formats``
+
+    :type request: HttpRequest
+    :type process_name: str
+    :type table_name: str
+    :type format_: str
+
+    :return:
+      the HTTP response object
+
+    :rtype: HttpResponse
+    """
+    try:
+        process_class = get_all_models()[process_name]
+    except KeyError:
+        raise Http404("Process class not found.")
+    if not issubclass(process_class, models.PhysicalProcess) or process_class._meta.abstract:
+        raise Http404("Process class not found.")
+    try:
+        table = columnar_export.get_table(process_class, table_name)
+    except KeyError:
+        raise Http404("Table not found.")
+    if format_ != "csv" and columnar_export.pyarrow is None:
+        raise Http404(_("This format is not available because pyarrow is not installed."))
+    processes = permissions.get_viewable_physical_processes(request.user, process_class)
+    outfile = tempfile.TemporaryFile()
+    columnar_export.write_table(table, processes, outfile, format_)
+    size = outfile.tell()
+    outfile.seek(0)
+    response = StreamingHttpResponse(FileWrapper(outfile), content_type=columnar_export.mime_types[format_])
+    response["Content-Length"] = size
+    response["Content-Disposition"] = 'attachment; filename="{0}.{1}"'.format(table_name, format_)
+    return response
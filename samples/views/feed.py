@@ -22,18 +22,23 @@
 """
 
 from __future__ import absolute_import, unicode_literals
+import django.utils.six as six
 
-import datetime, time
+import datetime, time, hashlib
 import xml.etree.ElementTree as ElementTree
 import django.contrib.auth.models
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.template import Context, loader
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import translation
 from django.utils.translation import ugettext_lazy as _, ugettext
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import condition
 from django.conf import settings
 import django.core.urlresolvers
-from jb_common.utils.base import get_really_full_name, camel_case_to_underscores
+from jb_common.utils.base import get_really_full_name, camel_case_to_underscores, adjust_timezone_information, \
+    resolve_actual_instances, get_many_from_cache
 from jb_common import __version__
 from samples import permissions, models
 import samples.utils.views as utils
@@ -123,9 +128,190 @@ def format_timestamp(timestamp):
     return timestamp.strftime("%Y-%m-%dT%H:%M:%S") + get_timezone_string(timestamp)
 
 
-@cache_page(600)
+def embed_feed_state(request, username, user_hash):
+    """Put the timestamp of the newest feed entry and the ETag of the feed into
+    the request object.  They are used by both `feed_timestamp` and
+    `feed_etag`.  This needs one query for the user and one query for the IDs
+    and timestamps of the feed entries; the feed entries themselves are not
+    loaded.  If the user doesn't exist or must not see the feed, both are
+    ``None``, and the view takes care of the error.
+
+    :param request: the current HTTP Request object
+    :param username: the login name of the user whose feed is requested
+    :param user_hash: the secret user hash
+
+    :type request: HttpRequest
+    :type username: str
+    :type user_hash: str
+    """
+    if not hasattr(request, "_feed_timestamp"):
+        request._feed_timestamp = request._feed_etag = None
+        try:
+            user = django.contrib.auth.models.User.objects.select_related("samples_user_details"). \
+                   get(username=username)
+        except django.contrib.auth.models.User.DoesNotExist:
+            return
+        try:
+            permissions.assert_can_view_feed(user_hash, user)
+        except permissions.PermissionError:
+            return
+        only_important = user.samples_user_details.only_important_news
+        entries = user.feed_entries.filter(important=True) if only_important else user.feed_entries.all()
+        entries = sorted(entries.values_list("id", "timestamp"))
+        newest = max(timestamp for id_, timestamp in entries) if entries else None
+        if newest:
+            request._feed_timestamp = adjust_timezone_information(newest)
+        hash_ = hashlib.sha1()
+        for item in (newest, ",".join(six.text_type(id_) for id_, timestamp in entries), only_important,
+                     translation.get_language()):
+            hash_.update(six.text_type(item).encode("utf-8"))
+        request._feed_etag = hash_.hexdigest()
+
+
+def feed_timestamp(request, username, user_hash):
+    """Returns the timestamp of the newest entry in the feed.
+
+    :param request: the current HTTP Request object
+    :param username: the login name of the user whose feed is requested
+    :param user_hash: the secret user hash
+
+    :type request: HttpRequest
+    :type username: str
+    :type user_hash: str
+
+    :return:
+      the timestamp of the newest feed entry
+
+    :rtype: datetime.datetime
+    """
+    embed_feed_state(request, username, user_hash)
+    return request._feed_timestamp
+
+
+def feed_etag(request, username, user_hash):
+    """Returns the ETag of the feed.  It is a checksum of the timestamp of the
+    newest entry, the IDs of all entries (which change if an entry is deleted
+    or if the user is added to an older entry), the user's news settings, and
+    the language.
+
+    :param request: the current HTTP Request object
+    :param username: the login name of the user whose feed is requested
+    :param user_hash: the secret user hash
+
+    :type request: HttpRequest
+    :type username: str
+    :type user_hash: str
+
+    :return:
+      the ETag of the feed
+
+    :rtype: str
+    """
+    embed_feed_state(request, username, user_hash)
+    return request._feed_etag
+
+
+def get_last_modifications(entries):
+    """Returns the timestamps of the last modifications of the objects the feed
+    entries refer to, see
+    :py:attr:`samples.models.FeedEntry.last_modified_field`.  This needs one
+    query per feed entry class which has such an object.
+
+    :param entries: the feed entries; they needn't be the actual instances
+
+    :type entries: list of `samples.models.FeedEntry`
+
+    :return:
+      the timestamps of the last modifications, mapping the entry ID to the
+      timestamp.  Entries without such an object are missing.
+
+    :rtype: dict mapping int to datetime.datetime
+    """
+    ids_by_model = {}
+    for entry in entries:
+        model = ContentType.objects.get_for_id(entry.content_type_id).model_class()
+        if model and model.last_modified_field:
+            ids_by_model.setdefault(model, []).append(entry.pk)
+    last_modifications = {}
+    for model, ids in ids_by_model.items():
+        last_modifications.update(model.objects.filter(pk__in=ids).values_list("pk", model.last_modified_field))
+    return last_modifications
+
+
+def get_entry_cache_key(entry, user, language, last_modified):
+    """Returns the cache key of the rendered feed entry.  Normally, it is the
+    same for all users.  Only if the template context of the entry depends on
+    the user, it contains the user's ID.  If the entry refers to an object
+    which may be edited later, e.g. a process, the key contains the timestamp
+    of its last modification so that the rendered entry doesn't become stale.
+
+    :param entry: the feed entry; it needn't be the actual instance
+    :param user: the user whose feed is generated
+    :param language: the current language
+    :param last_modified: the timestamp of the last modification of the object
+        the entry refers to, or ``None`` if there is none
+
+    :type entry: `samples.models.FeedEntry`
+    :type user: django.contrib.auth.models.User
+    :type language: str
+    :type last_modified: datetime.datetime or NoneType
+
+    :return:
+      the cache key
+
+    :rtype: str
+    """
+    cache_key = "feed-entry:{0}:{1}".format(entry.pk, language)
+    if last_modified:
+        cache_key += last_modified.strftime(":%Y%m%d%H%M%S%f")
+    model = ContentType.objects.get_for_id(entry.content_type_id).model_class()
+    if model and model.user_dependent_template_context:
+        cache_key += ":{0}".format(user.pk)
+    return cache_key
+
+
+def render_entries(entries, user):
+    """Renders the metadata and the HTML content of feed entries.  The actual
+    instances are resolved with one query per feed entry class.  Orphaned
+    entries (i.e. whose samples have been deleted) are skipped because they are
+    a) phony and b) cause tracebacks.  They are deleted by the maintenance.
+
+    :param entries: the feed entries to be rendered; they needn't be the actual
+        instances
+    :param user: the user whose feed is generated
+
+    :type entries: list of `samples.models.FeedEntry`
+    :type user: django.contrib.auth.models.User
+
+    :return:
+      the rendered entries, mapping the entry ID to the metadata (see
+      :py:meth:`samples.models.FeedEntry.get_metadata`) plus the key
+      ``"content"`` for the HTML content
+
+    :rtype: dict mapping int to dict mapping str to unicode
+    """
+    entries = resolve_actual_instances(entries)
+    orphans = set()
+    for model in models.sample_feed_entry_models:
+        ids = [entry.pk for entry in entries if isinstance(entry, model)]
+        if ids:
+            orphans.update(model.objects.filter(pk__in=ids, samples=None).values_list("pk", flat=True))
+    rendered_entries = {}
+    for entry in entries:
+        if entry.pk in orphans:
+            continue
+        rendered_entry = entry.get_metadata()
+        template = loader.get_template("samples/" + camel_case_to_underscores(entry.__class__.__name__) + ".html")
+        context_dict = {"entry": entry}
+        context_dict.update(entry.get_additional_template_context(user))
+        rendered_entry["content"] = template.render(Context(context_dict))
+        rendered_entries[entry.pk] = rendered_entry
+    return rendered_entries
+
+
+@condition(feed_etag, feed_timestamp)
 def show(request, username, user_hash):
-    """View which doesn't generate an HTML page but an Atom 1.0 feed with
+    """View which doesn't generate an HTML page but an Atom 1.0 feed with
     current news for the user.
 
     The problem we have to deal with here is that the feed-reading program
@@ -135,6 +321,10 @@ def show(request, username, user_hash):
     to the URL in the query string.  This should be enough security for this
     purpose.
 
+    Feed readers poll often, so if the feed has not changed, a 304 response is
+    sent (see `embed_feed_state`).  Otherwise, the rendered entries are taken
+    from the cache as far as possible.
+
     :param request: the current HTTP Request object
     :param username: the login name of the user for which the news should be
         delivered
@@ -159,7 +349,10 @@ def show(request, username, user_hash):
     ElementTree.SubElement(feed, "id").text = feed_absolute_url
     ElementTree.SubElement(feed, "title").text = \
         _("JuliaBase news for {user_name}").format(user_name=get_really_full_name(user))
-    entries = [entry.actual_instance for entry in user.feed_entries.all()]
+    entries = user.feed_entries.select_related("originator")
+    if user.samples_user_details.only_important_news:
+        entries = entries.filter(important=True)
+    entries = list(entries)
     if entries:
         ElementTree.SubElement(feed, "updated").text = format_timestamp(entries[0].timestamp)
     else:
@@ -170,37 +363,40 @@ def show(request, username, user_hash):
     ElementTree.SubElement(feed, "link", rel="self", href=feed_absolute_url)
     ElementTree.SubElement(feed, "generator", version=__version__).text = "JuliaBase"
     ElementTree.SubElement(feed, "icon").text = request.build_absolute_uri("/static/juliabase/juliabase_logo.png")
-    only_important = user.samples_user_details.only_important_news
+    language = translation.get_language()
+    last_modifications = get_last_modifications(entries)
+    cache_keys = dict((entry.pk, get_entry_cache_key(entry, user, language, last_modifications.get(entry.pk)))
+                      for entry in entries)
+    cached_entries = get_many_from_cache(cache_keys.values())
+    rendered_entries = dict((entry_id, cached_entries[cache_key]) for entry_id, cache_key in cache_keys.items()
+                            if cache_key in cached_entries)
+    missing_entries = [entry for entry in entries if entry.pk not in rendered_entries]
+    if missing_entries:
+        new_rendered_entries = render_entries(missing_entries, user)
+        cache.set_many(dict((cache_keys[entry_id], rendered_entry)
+                            for entry_id, rendered_entry in new_rendered_entries.items()), 24 * 3600)
+        rendered_entries.update(new_rendered_entries)
+    host = request.build_absolute_uri("/").partition("//")[2][:-1]
     for entry in entries:
-        if only_important and not entry.important:
+        rendered_entry = rendered_entries.get(entry.pk)
+        if rendered_entry is None:
             continue
-        if isinstance(entry, (models.FeedNewSamples, models.FeedMovedSamples, models.FeedCopiedMySamples,
-                              models.FeedEditedSamples)):
-            # Remove orphaned entries (i.e. whose samples have been deleted)
-            # because they are a) phony and b) cause tracebacks.
-            if entry.samples.count() == 0:
-                entry.delete()
-                continue
         entry_element = ElementTree.SubElement(feed, "entry")
         ElementTree.SubElement(entry_element, "id").text = \
-            "tag:{0},{1}:{2}".format(request.build_absolute_uri("/").partition("//")[2][:-1],
-                                     entry.timestamp.strftime("%Y-%m-%d"), entry.sha1_hash)
-        metadata = entry.get_metadata()
-        ElementTree.SubElement(entry_element, "title").text = metadata["title"]
+            "tag:{0},{1}:{2}".format(host, entry.timestamp.strftime("%Y-%m-%d"), entry.sha1_hash)
+        ElementTree.SubElement(entry_element, "title").text = rendered_entry["title"]
         ElementTree.SubElement(entry_element, "updated").text = format_timestamp(entry.timestamp)
         author = ElementTree.SubElement(entry_element, "author")
         ElementTree.SubElement(author, "name").text = get_really_full_name(entry.originator)
         if entry.originator.email:
             ElementTree.SubElement(author, "email").text = entry.originator.email
-        category = ElementTree.SubElement(
-            entry_element, "category", term=metadata["category term"], label=metadata["category label"])
-        if "link" in metadata:
-            ElementTree.SubElement(entry_element, "link", rel="alternate", href=request.build_absolute_uri(metadata["link"]))
-        template = loader.get_template("samples/" + camel_case_to_underscores(entry.__class__.__name__) + ".html")
+        category = ElementTree.SubElement(entry_element, "category", term=rendered_entry["category term"],
+                                          label=rendered_entry["category label"])
+        if "link" in rendered_entry:
+            ElementTree.SubElement(entry_element, "link", rel="alternate",
+                                   href=request.build_absolute_uri(rendered_entry["link"]))
         content = ElementTree.SubElement(entry_element, "content")
-        context_dict = {"entry": entry}
-        context_dict.update(entry.get_additional_template_context(user))
-        content.text = template.render(Context(context_dict))
+        content.text = rendered_entry["content"]
         content.attrib["type"] = "html"
 #    indent(feed)
     return HttpResponse("""<?xml version="1.0"?>\n"""
@@ -25,12 +25,16 @@ communication to the remote client happens in JSON format.
 """
 
 from __future__ import absolute_import, unicode_literals
+import django.utils.six as six
 
-import sys, json
+import sys, json, copy
+from django.db import transaction
 from django.db.utils import IntegrityError
 from django.db.models import Q
 from django.conf import settings
-from django.http import Http404
+from django.http import Http404, HttpResponseNotFound, QueryDict
+from django.utils.datastructures import MultiValueDict
+import django.core.urlresolvers
 from django.utils.translation import ugettext as _
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
@@ -41,7 +45,9 @@ import django.contrib.auth
 from django.shortcuts import get_object_or_404
 from django.contrib.contenttypes.models import ContentType
 from jb_common.models import Topic
-from jb_common.utils.base import respond_in_json, JSONRequestException, int_or_zero
+from jb_common.utils.base import respond_in_json, JSONRequestException, int_or_zero, get_cache_versions, \
+    HttpResponseUnauthorized
+from jb_common.middleware import JSONClientMiddleware, HttpResponseUnprocessableEntity
 import samples.utils.views as utils
 from samples.utils import sample_names
 from samples import models, permissions
@@ -193,6 +199,38 @@ def primary_keys(request):
     return respond_in_json(result_dict)
 
 
+@login_required
+@never_cache
+@require_http_methods(["GET"])
+def primary_keys_versions(request):
+    """Returns the current versions of the components of `primary_keys`.  The
+    remote client stores the primary keys it has got from `primary_keys`
+    persistently, together with these versions.  If the version of a component
+    has changed since then, e.g. because a sample was renamed or a user was
+    added, the remote client discards the stored primary keys of that
+    component::
+
+        {"samples": 1445326128307, "users": 1445326128311, "topics": 1445326128312,
+         "external_operators": 1445326128312}
+
+    This is much cheaper than re-fetching all primary keys.  The versions are
+    incremented in :py:func:`samples.signals.expire_primary_keys` and
+    :py:func:`samples.signals.expire_primary_keys_by_alias`.
+
+    :param request: the current HTTP Request object
+
+    :type request: HttpRequest
+
+    :return:
+      the HTTP response object
+
+    :rtype: HttpResponse
+    """
+    components = ("samples", "users", "topics", "external_operators")
+    versions = get_cache_versions("primary-keys:" + component for component in components)
+    return respond_in_json(dict((component, versions["primary-keys:" + component]) for component in components))
+
+
 # FixMe: This should be merged into `primary_keys`.
 
 @login_required
@@ -375,6 +413,271 @@ def change_my_samples(request):
     return respond_in_json(changed_sample_ids)
 
 
+class _ItemFailed(Exception):
+    """Raised for rolling back the savepoint of a failed item in
+    `bulk_submit`.
+    """
+    pass
+
+
+def _resolve_references(value, results, sample_ids):
+    """Replaces the references in the data of an item of `bulk_submit`.  A
+    reference is a dictionary ``{"$result": index}``, which is replaced by the
+    result of the item with this index in the batch, ``{"$sample":
+    sample_name}``, which is replaced by the ID of the sample, or ``{"$join":
+    list}``, which is replaced by the comma-separated resolved list items.  In
+    the latter, list results are flattened.
+
+    :param value: the data of an item, or a part of it
+    :param results: the results of the previous items
+    :param sample_ids: mapping of all sample names referenced in the batch to
+        their IDs
+
+    :type value: ``object``
+    :type results: list of (int, ``object``)
+    :type sample_ids: dict mapping unicode to int
+
+    :return:
+      the value with the references replaced
+
+    :rtype: ``object``
+
+    :raises JSONRequestException: if a reference cannot be resolved
+    """
+    if isinstance(value, dict):
+        if "$result" in value:
+            index = value["$result"]
+            if not isinstance(index, int) or not 0 <= index < len(results):
+                raise JSONRequestException(5, "Invalid reference to item {}.".format(index))
+            status, result = results[index]
+            if status != 200:
+                raise JSONRequestException(5, "Referenced item {} failed.".format(index))
+            return result
+        elif "$sample" in value:
+            try:
+                return sample_ids[value["$sample"]]
+            except KeyError:
+                raise JSONRequestException(5, "Sample {} not found or ambiguous.".format(value["$sample"]))
+        elif "$join" in value:
+            ids = []
+            for id_ in _resolve_references(value["$join"], results, sample_ids):
+                ids.extend(id_ if isinstance(id_, list) else [id_])
+            return ",".join(six.text_type(id_) for id_ in ids)
+        else:
+            raise JSONRequestException(5, "Invalid reference {}.".format(json.dumps(value)))
+    elif isinstance(value, list):
+        return [_resolve_references(item, results, sample_ids) for item in value]
+    return value
+
+
+def _collect_sample_names(value, sample_names):
+    """Adds all sample names referenced with ``{"$sample": sample_name}`` in the
+    data of an item of `bulk_submit` to `sample_names`.
+    """
+    if isinstance(value, dict):
+        if "$sample" in value:
+            sample_names.add(value["$sample"])
+        elif "$join" in value:
+            _collect_sample_names(value["$join"], sample_names)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_sample_names(item, sample_names)
+
+
+def _get_sample_ids(user, sample_names):
+    """Looks up sample names in one go for `bulk_submit`.  Aliases are taken
+    into account, however, names that are ambiguous are left out.
+
+    :param user: the user who submits the batch
+    :param sample_names: the names of the samples
+
+    :type user: django.contrib.auth.models.User
+    :type sample_names: set of unicode
+
+    :return:
+      mapping of the sample names to the sample IDs
+
+    :rtype: dict mapping unicode to int
+    """
+    if not sample_names:
+        return {}
+    restricted_samples = utils.restricted_samples_query(user)
+    aliases = {}
+    for alias, sample_id in models.SampleAlias.objects.filter(name__in=sample_names, sample__in=restricted_samples). \
+        values_list("name", "sample"):
+        aliases.setdefault(alias, set()).add(sample_id)
+    sample_ids = {alias: ids.pop() for alias, ids in aliases.items() if len(ids) == 1}
+    sample_ids.update(restricted_samples.filter(name__in=sample_names).values_list("name", "id"))
+    return sample_ids
+
+
+def _call_view(request, relative_url, data):
+    """Calls the view for one item of `bulk_submit` with a POST request built
+    from the item data.  The exceptions are converted to JSON responses as if
+    the view had been called directly by the remote client.  However, the
+    response is not yet passed through `JSONClientMiddleware`, see
+    `_decode_response`.
+
+    :param request: the current HTTP Request object
+    :param relative_url: the URL of the view, relative to the JuliaBase root
+        URL, e.g. ``"pds_measurements/add/"``
+    :param data: the POST data
+
+    :type request: HttpRequest
+    :type relative_url: unicode
+    :type data: dict mapping unicode to unicode or list of unicode
+
+    :return:
+      the request object passed to the view, and the response
+
+    :rtype: HttpRequest, HttpResponse
+    """
+    path_info, __, query_string = relative_url.partition("?")
+    path_info = "/" + path_info
+    sub_request = copy.copy(request)
+    sub_request.META = request.META.copy()
+    sub_request.META["PATH_INFO"] = sub_request.path_info = path_info
+    sub_request.META["QUERY_STRING"] = query_string
+    sub_request.path = request.path[:len(request.path) - len(request.path_info)] + path_info
+    sub_request.GET = QueryDict(query_string)
+    post_data = QueryDict("", mutable=True)
+    for key, value in data.items():
+        post_data.setlist(key, [six.text_type(item) for item in value] if isinstance(value, list) else
+                          [six.text_type(value)])
+    sub_request._post, sub_request._files = post_data, MultiValueDict()
+    try:
+        match = django.core.urlresolvers.resolve(path_info)
+        response = match.func(sub_request, *match.args, **match.kwargs)
+        if hasattr(response, "render") and callable(response.render):
+            response = response.render()
+    except Http404 as error:
+        # ``Resolver404`` has a dictionary as its argument.
+        message = error.args[0] if error.args and isinstance(error.args[0], six.string_types) else "Not found."
+        response = HttpResponseNotFound(json.dumps((2, message)), content_type="application/json")
+    except JSONRequestException as error:
+        response = HttpResponseUnprocessableEntity(json.dumps((error.error_number, error.error_message)),
+                                                   content_type="application/json")
+    except permissions.PermissionError as error:
+        response = HttpResponseUnauthorized(json.dumps((6, error.description)), content_type="application/json")
+    return sub_request, response
+
+
+def _is_successful(response):
+    """Returns whether the view called by `_call_view` was successful.  An HTML
+    page with HTTP status 200 means that the view has found errors in the
+    submitted data.
+    """
+    return response.status_code == 200 and not response["Content-Type"].startswith("text/html")
+
+
+def _decode_response(sub_request, response):
+    """Converts the response of a view called by `_call_view` to the result
+    of the item in `bulk_submit`.  HTML pages with form errors are stored as
+    error pages by `JSONClientMiddleware`.  Therefore, this function must be
+    called only after the savepoint of a failed item was rolled back, and
+    outside the transaction which is rolled back for ``all_or_nothing``;
+    otherwise, the error page would be rolled back, too.
+
+    :param sub_request: the request object passed to the view
+    :param response: the response of the view
+
+    :type sub_request: HttpRequest
+    :type response: HttpResponse
+
+    :return:
+      the HTTP status code of the response, and the JSON-decoded response
+
+    :rtype: int, ``object``
+    """
+    response = JSONClientMiddleware().process_response(sub_request, response)
+    try:
+        result = json.loads(response.content.decode("utf-8"))
+    except ValueError:
+        result = None
+    return response.status_code, result
+
+
+@login_required
+@require_http_methods(["POST"])
+@ensure_csrf_cookie
+def bulk_submit(request):
+    """Submits many samples and processes in one request.  This is used by
+    crawlers of the remote client which add hundreds of processes.  The POST
+    parameter ``items`` contains a JSON list of items, each of which is a
+    dictionary with the keys ``"url"`` and ``"data"``.  For every item, the
+    view behind the URL (relative to the JuliaBase root URL, e.g.
+    ``"pds_measurements/add/"``) is called with the data as POST data, in the
+    order of the list.  This way, all the validation of the usual views
+    applies.
+
+    In the data, ``{"$sample": sample_name}`` is replaced by the ID of the
+    sample, where all such sample names are looked up at once.  ``{"$result":
+    index}`` is replaced by the result of an earlier item, e.g. the ID of a
+    sample that was added in the same batch.  ``{"$join": list}`` is replaced
+    by the comma-separated items of the list, after having replaced the
+    references in it.
+
+    Every item is executed in its own savepoint, so that a failed item leaves
+    no traces.  If the POST parameter ``all_or_nothing`` is given, nothing is
+    committed if one item fails.  Only the error pages of failed items are
+    stored in any case.
+
+    :param request: the current HTTP Request object
+
+    :type request: HttpRequest
+
+    :return:
+      The HTTP response object.  It is a JSON object with the keys
+      ``"committed"``, whether the items were committed, and ``"results"``, a
+      list with the HTTP status code and the JSON response of every item.  If
+      the status code is 200, the response is the result of the view, usually
+      the ID of the new object.  Otherwise, it is an error tuple like in the
+      responses of failed requests of the remote client.
+
+    :rtype: HttpResponse
+    """
+    try:
+        items = json.loads(request.POST["items"])
+    except KeyError:
+        raise JSONRequestException(3, '"items" missing')
+    except ValueError:
+        raise JSONRequestException(5, '"items" is not valid JSON')
+    if not isinstance(items, list) or \
+       not all(isinstance(item, dict) and isinstance(item.get("url"), six.string_types) and
+               isinstance(item.get("data", {}), dict) for item in items):
+        raise JSONRequestException(5, '"items" must be a list of objects with "url" and "data"')
+    referenced_sample_names = set()
+    for item in items:
+        _collect_sample_names(list(item.get("data", {}).values()), referenced_sample_names)
+    sample_ids = _get_sample_ids(request.user, referenced_sample_names)
+    results = []
+    failed_responses = {}
+    with transaction.atomic():
+        for index, item in enumerate(items):
+            try:
+                with transaction.atomic():
+                    data = dict((key, _resolve_references(value, results, sample_ids))
+                                for key, value in item.get("data", {}).items())
+                    sub_request, response = _call_view(request, item["url"], data)
+                    if not _is_successful(response):
+                        raise _ItemFailed()
+            except JSONRequestException as error:
+                results.append((422, (error.error_number, error.error_message)))
+            except _ItemFailed:
+                # The response is decoded after the transaction, see
+                # `_decode_response`.
+                failed_responses[index] = sub_request, response
+                results.append((None, None))
+            else:
+                results.append(_decode_response(sub_request, response))
+        committed = not ("all_or_nothing" in request.POST and any(status != 200 for status, __ in results))
+        if not committed:
+            transaction.set_rollback(True)
+    for index, (sub_request, response) in failed_responses.items():
+        results[index] = _decode_response(sub_request, response)
+    return respond_in_json({"committed": committed, "results": results})
+
+
 def _is_folded(process_id, folded_process_classes, exceptional_processes, switch):
     """Helper routine to determine whether the process is folded or not. Is the switch
     parameter is ``True``, the new status is saved.
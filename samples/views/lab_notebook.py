@@ -188,7 +188,9 @@ def export(request, process_name, year_and_month):
     """View for exporting the data of a month of a lab notebook.  Thus, the
     return value is not an HTML response but a CSV or JSON response.  In
     ``urls.py``, you must give the entry for this view the name
-    ``"export_lab_notebook_<process_name>"``.
+    ``"export_lab_notebook_<process_name>"``.  If the query string contains
+    ``stream``, the table is streamed without preview, see
+    `samples.utils.views.streaming_table_export`.
 
     :param request: the current HTTP Request object
     :param process_name: the class name of the model of the physical process,
@@ -208,6 +210,10 @@ def export(request, process_name, year_and_month):
     process_class = get_all_models()[process_name]
     permissions.assert_can_view_lab_notebook(request.user, process_class)
     year, month = parse_year_and_month(year_and_month)
+    if "stream" in request.GET:
+        name = _("lab notebook for {process_name}").format(process_name=process_class._meta.verbose_name_plural)
+        return utils.streaming_table_export(request, name, lambda: process_class.get_lab_notebook_rows(year, month),
+                                            _("process"))
     data = process_class.get_lab_notebook_data(year, month)
     result = utils.table_export(request, data, _("process"))
     if isinstance(result, tuple):
@@ -219,6 +225,7 @@ def export(request, process_name, year_and_month):
                                                          "columns": columns_form,
                                                          "rows": list(zip(table, switch_row_forms)) if table else None,
                                                          "old_data": old_data_form,
+                                                         "streaming_export": True,
                                                          "backlink": request.GET.get("next", "")})
 
 
@@ -23,39 +23,25 @@
 
 from __future__ import absolute_import, unicode_literals
 
-import datetime, re, os.path, codecs
+import os.path
 from django.http import Http404
 from django.shortcuts import render
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from django.utils.translation import ugettext as _
-from jb_common.utils.base import camel_case_to_underscores
+from jb_common.utils.base import camel_case_to_underscores, int_or_zero
 from samples import permissions
-
-
-start_pattern = re.compile(r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d INFO     started crawling")
-
-def read_crawler_log(filepath):
-    try:
-        lines = codecs.open(filepath, encoding="utf-8").readlines()
-    except IOError:
-        return None, None
-    start_index = len(lines) - 1
-    while start_index >= 0 and not start_pattern.match(lines[start_index]):
-        start_index -= 1
-    if start_index < 0:
-        return None, None
-    content = ""
-    for i in xrange(start_index, len(lines)):
-        content += lines[i][20:]
-    return content, datetime.datetime.strptime(lines[start_index][:19], "%Y-%m-%d %H:%M:%S")
+from samples.utils import crawler_logs
 
 
 @login_required
 @require_http_methods(["GET"])
 def view(request, process_class_name):
-    """View for log files of crawlers.
+    """View for log files of crawlers.  By default, the last run of the
+    crawler is shown.  The query parameter ``run`` selects another run by its
+    number, counting from 1 for the oldest run in the log file, and ``level``
+    hides all lines below that log level.
 
     :param request: the current HTTP Request object
     :param process_class_name: the name of the crawler whose log file is about to be
@@ -82,11 +68,24 @@ def view(request, process_class_name):
         permissions.assert_can_add_physical_process(request.user, process_class)
     assert "." not in process_class_name and "/" not in process_class_name
     filepath = os.path.join(settings.CRAWLER_LOGS_ROOT, process_class_name + ".log")
-    log_content, log_timestamp = read_crawler_log(filepath)
-    return render(request, "samples/log_viewer.html",
-                  {"title": _("Log of crawler “{process_class_name}”").format(
-                      process_class_name=process_class._meta.verbose_name_plural),
-                   "log_content": log_content, "log_timestamp": log_timestamp})
+    level = request.GET.get("level")
+    if level not in crawler_logs.levels:
+        level = None
+    context = {"title": _("Log of crawler “{process_class_name}”").format(
+        process_class_name=process_class._meta.verbose_name_plural), "levels": crawler_logs.levels, "level": level}
+    try:
+        log = crawler_logs.CrawlerLog(filepath)
+    except IOError:
+        return render(request, "samples/log_viewer.html", context)
+    with log:
+        if log.runs:
+            number_of_runs = len(log.runs)
+            run = max(1, min(int_or_zero(request.GET.get("run")) or number_of_runs, number_of_runs))
+            context.update({"log_lines": log.get_lines(run - 1, level), "log_timestamp": log.runs[run - 1][1],
+                            "run": run, "previous_run": run - 1 if run > 1 else None,
+                            "next_run": run + 1 if run < number_of_runs else None})
+        # The lines are read while rendering, so the log must still be open.
+        return render(request, "samples/log_viewer.html", context)
 
 
 @login_required
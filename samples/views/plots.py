@@ -24,47 +24,34 @@
 from __future__ import absolute_import, unicode_literals
 import django.utils.six as six
 
-import os.path, mimetypes
-from functools import partial
-from matplotlib.backends.backend_agg import FigureCanvasAgg
-from matplotlib.figure import Figure
+import os.path
 from django.shortcuts import get_object_or_404
-from django.http import Http404
+from django.http import Http404, HttpResponse
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
-from jb_common.utils.base import get_cached_file_content, static_response
+from jb_common.utils.base import static_file_response
 from samples import models, permissions
 import samples.utils.views as utils
 from samples.utils.plots import PlotError
+from samples.utils import plot_rendering
 
 
-def generate_plot(process, plot_id, thumbnail, datafile_name):
-    try:
-        output = six.BytesIO()
-        if thumbnail:
-            figure = Figure(frameon=False, figsize=(4, 3))
-            canvas = FigureCanvasAgg(figure)
-            axes = figure.add_subplot(111)
-            axes.set_position((0.17, 0.16, 0.78, 0.78))
-            axes.grid(True)
-            process.draw_plot(axes, plot_id, datafile_name, for_thumbnail=True)
-            canvas.print_figure(output, dpi=settings.THUMBNAIL_WIDTH / 4, format="png")
-        else:
-            figure = Figure()
-            canvas = FigureCanvasAgg(figure)
-            axes = figure.add_subplot(111)
-            axes.grid(True)
-            axes.set_title(six.text_type(process))
-            process.draw_plot(axes, plot_id, datafile_name, for_thumbnail=False)
-            # FixMe: Activate this line with Matplotlib 1.1.0.
-#                figure.tight_layout()
-            canvas.print_figure(output, format="pdf")
-    except PlotError as e:
-        raise Http404(six.text_type(e) or "Plot could not be generated.")
-    except ValueError as e:
-        raise Http404("Plot could not be generated: " + e.args[0])
-    else:
-        return output.getvalue()
+def pending_response():
+    """Returns the response for a thumbnail which is still being rendered.  It
+    is empty, so that the browser fires an ``error`` event for the image.
+    Then, ``juliabase.js`` shows a placeholder and requests the thumbnail
+    again later for images of the class ``pending-thumbnail``.  The status code
+    is 202 (Accepted), and the response must not be stored by the browser.
+
+    :return:
+      the HTTP response object
+
+    :rtype: HttpResponse
+    """
+    response = HttpResponse(status=202, content_type="image/png")
+    response["Cache-Control"] = "no-store"
+    response["Retry-After"] = "5"
+    return response
 
 
 @login_required
@@ -72,6 +59,10 @@ def show_plot(request, process_id, plot_id, thumbnail):
     """Shows a particular plot.  Although its response is a bitmap rather than
     an HTML file, it is served by Django in order to enforce user permissions.
 
+    If ``settings.ASYNCHRONOUS_PLOT_RENDERING`` is ``True`` and a thumbnail is not
+    in the cache yet, it is queued for rendering, and an empty response is
+    returned (see `pending_response`).
+
     :param request: the current HTTP Request object
     :param process_id: the database ID of the process to show
     :param plot_id: the plot_id of the image.  This is mostly ``u""`` because
@@ -91,16 +82,16 @@ def show_plot(request, process_id, plot_id, thumbnail):
     process = get_object_or_404(models.Process, pk=utils.convert_id_to_int(process_id))
     process = process.actual_instance
     permissions.assert_can_view_physical_process(request.user, process)
-    plot_filepath = process.calculate_plot_locations(plot_id)["thumbnail_file" if thumbnail else "plot_file"]
-    datafile_name = process.get_datafile_name(plot_id)
-    if datafile_name is None:
-        raise Http404("No such plot available.")
-    timestamps = [] if thumbnail else [sample.last_modified for sample in process.samples.all()]
-    timestamps.append(process.last_modified)
-    datafile_names = datafile_name if isinstance(datafile_name, list) else [datafile_name]
-    if not all(os.path.exists(filename) for filename in datafile_names):
-        raise Http404("One of the raw datafiles was not found.")
-    content = get_cached_file_content(plot_filepath, partial(generate_plot, process, plot_id, thumbnail, datafile_name),
-                                      datafile_names, timestamps)
-    return static_response(content, None if thumbnail else process.get_plotfile_basename(plot_id) + ".pdf",
-                           mimetypes.guess_type(plot_filepath))
+    try:
+        if thumbnail and settings.ASYNCHRONOUS_PLOT_RENDERING:
+            filepath = plot_rendering.get_plot_source(process, plot_id, thumbnail)[0]
+            if not plot_rendering.is_rendered(filepath):
+                plot_rendering.enqueue_plot(process, plot_id, thumbnail)
+                return pending_response()
+        else:
+            filepath = plot_rendering.get_plot(process, plot_id, thumbnail)
+    except PlotError as e:
+        raise Http404(six.text_type(e))
+    if not os.path.getsize(filepath):
+        raise Http404("Plot could not be generated.")
+    return static_file_response(filepath, None if thumbnail else process.get_plotfile_basename(plot_id) + ".pdf")
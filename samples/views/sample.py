@@ -26,7 +26,7 @@ from __future__ import absolute_import, unicode_literals
 import django.utils.six as six
 from django.utils.six import BytesIO
 
-import hashlib, os.path, time, urllib, json
+import hashlib, os.path, time, urllib, json, collections
 import PIL
 import PIL.ImageOps
 from django.conf import settings
@@ -37,7 +37,7 @@ import django.core.urlresolvers
 import django.forms as forms
 from django.core.cache import cache
 from django.db.models import Q
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
 from django.utils.http import urlquote_plus
 from django.utils.translation import ugettext_lazy as _, ugettext, ungettext
@@ -48,11 +48,12 @@ import jb_common.search
 from jb_common.signals import storage_changed
 from jb_common.utils.base import format_enumeration, unquote_view_parameters, HttpResponseSeeOther, \
     adjust_timezone_information, is_json_requested, respond_in_json, get_all_models, \
-    mkdirs, cache_key_locked, get_from_cache, unlazy_object, int_or_zero, help_link
+    mkdirs, get_cache_version, get_from_cache, unlazy_object, int_or_zero, help_link, JSONRequestException, \
+    JSONEncoder
 from jb_common.utils.views import UserField, TopicField
 from samples import models, permissions, data_tree
 import samples.utils.views as utils
-from samples.utils import sample_names
+from samples.utils import sample_names, sample_search
 
 
 class IsMySampleForm(forms.Form):
@@ -272,7 +273,8 @@ class SamplesAndProcesses(object):
         :rtype: `SamplesAndProcesses`
         """
         sample, clearance = utils.lookup_sample(sample_name, user, with_clearance=True)
-        cache_key = "sample:{0}-{1}".format(sample.pk, user.jb_user_details.get_data_hash())
+        cache_key = "sample:{0}-{1}:{2}".format(sample.pk, user.jb_user_details.get_data_hash(),
+                                                get_cache_version("sample:{0}".format(sample.pk)))
         # The following ``10`` is the expectation value of the number of
         # processes.  To get accurate results, use
         # ``samples.processes.count()`` instead.  However, this would slow down
@@ -280,20 +282,15 @@ class SamplesAndProcesses(object):
         samples_and_processes = get_from_cache(cache_key, hits=10)
         if samples_and_processes is None:
             samples_and_processes = SamplesAndProcesses(sample, clearance, user, post_data)
-            keys_list_key = "sample-keys:{0}".format(sample.pk)
-            with cache_key_locked("sample-lock:{0}".format(sample.pk)):
-                keys = cache.get(keys_list_key, [])
-                keys.append(cache_key)
-                cache.set(keys_list_key, keys, settings.CACHES["default"].get("TIMEOUT", 300) + 10)
-                # FixMe: Remove try block when it is clear that request.user is
-                # a SimpleLazyObject which is not pickable.  Maybe this can be
-                # removed completely if
-                # https://code.djangoproject.com/ticket/16563 is fixed.
-                try:
-                    samples_and_processes.user = unlazy_object(samples_and_processes.user)
-                except AttributeError:
-                    pass
-                cache.set(cache_key, samples_and_processes)
+            # FixMe: Remove try block when it is clear that request.user is
+            # a SimpleLazyObject which is not pickable.  Maybe this can be
+            # removed completely if
+            # https://code.djangoproject.com/ticket/16563 is fixed.
+            try:
+                samples_and_processes.user = unlazy_object(samples_and_processes.user)
+            except AttributeError:
+                pass
+            cache.set(cache_key, samples_and_processes)
             samples_and_processes.remove_noncleared_process_contexts(user, clearance)
         else:
             samples_and_processes.personalize(user, clearance, post_data)
@@ -316,48 +313,56 @@ class SamplesAndProcesses(object):
         # This will be filled with more, once child samples are displayed, too.
         self.sample_context = {"sample": sample}
         self.update_sample_context_for_user(user, clearance, post_data)
-        self.process_contexts = []
         self.process_ids = set()
-        def collect_process_contexts(local_context=None):
-            """Constructs the list of process context dictionaries.  This
-            internal helper function directly populates
-            ``self.process_contexts``.  It consists of three parts: First, we
-            ascend through the ancestors of the sample to the first parent.
-            Then, for every ancestor and for the sample itself, the relevant
-            processes are found in form of a QuerySet, paying attention to
-            a possible clearance and to the so-called “cutoff timestamps”.  And
-            finally, we iterate over the QuerySet and get the process
-            context dictionary, possibly from the cache.
-
-            :param local_context: Information about the current sample to
-                process.  This is important when we walk through the ancestors
-                and need to keep track of where we are currently.  In
-                particular, this is used for sample splits because they must
-                know which is the current sample, which is the main sample
-                which will be actually displayed etc.
-
-            :type local_context: dict mapping str to ``object``
+        processes_with_local_contexts = []
+        def collect_processes():
+            """Constructs the list of processes together with their local
+            sample contexts.  This internal helper function directly populates
+            ``processes_with_local_contexts``.  It consists of two parts:
+            First, the ancestors of the sample are read from the precomputed
+            split genealogy (see :py:class:`samples.models.SampleGenealogy`),
+            together with their so-called “cutoff timestamps”.  Then, the
+            relevant processes of all ancestors and of the sample itself are
+            found with one query.  The local sample context of every ancestor
+            is important for sample splits because they must know which is the
+            current sample, which is the main sample which will be actually
+            displayed etc.  The process context dictionaries are created
+            afterwards for all processes at once, see
+            `samples.utils.views.digest_processes`.
             """
-            if local_context is None:
-                local_context = self.sample_context.copy()
-                local_context.update({"original_sample": sample, "latest_descendant": None, "cutoff_timestamp": None})
-            split = local_context["sample"].split_origin
-            if split:
-                new_local_context = local_context.copy()
-                new_local_context["sample"] = split.parent
-                new_local_context["latest_descendant"] = local_context["sample"]
-                new_local_context["cutoff_timestamp"] = split.timestamp
-                collect_process_contexts(new_local_context)
-            processes = models.Process.objects. \
-                filter(Q(samples=local_context["sample"]) | Q(result__sample_series__samples=local_context["sample"])). \
-                distinct()
-            if local_context["cutoff_timestamp"]:
-                processes = processes.filter(timestamp__lte=local_context["cutoff_timestamp"])
-            for process in processes:
-                process_context = utils.digest_process(process, user, local_context)
-                self.process_contexts.append(process_context)
-                self.process_ids.add(process.id)
-        collect_process_contexts()
+            local_context = self.sample_context.copy()
+            local_context.update({"original_sample": sample, "latest_descendant": None, "cutoff_timestamp": None})
+            local_contexts = [local_context]
+            for link in models.SampleGenealogy.objects.filter(descendant=sample).select_related("ancestor"). \
+                    order_by("depth"):
+                local_context = local_context.copy()
+                local_context.update({"sample": link.ancestor, "latest_descendant": local_context["sample"],
+                                      "cutoff_timestamp": link.cutoff_timestamp})
+                local_contexts.append(local_context)
+            local_contexts.reverse()
+            local_contexts_by_sample = dict((local_context["sample"].id, local_context)
+                                            for local_context in local_contexts)
+            process_ids_by_sample = collections.defaultdict(set)
+            timestamps = {}
+            sample_ids = list(local_contexts_by_sample)
+            rows = models.Process.objects. \
+                   filter(Q(samples__in=sample_ids) | Q(result__sample_series__samples__in=sample_ids)). \
+                   values_list("id", "timestamp", "samples", "result__sample_series__samples")
+            for process_id, timestamp, direct_sample_id, series_sample_id in rows:
+                timestamps[process_id] = timestamp
+                for sample_id in {direct_sample_id, series_sample_id}:
+                    if sample_id in local_contexts_by_sample:
+                        cutoff_timestamp = local_contexts_by_sample[sample_id]["cutoff_timestamp"]
+                        if not cutoff_timestamp or timestamp <= cutoff_timestamp:
+                            process_ids_by_sample[sample_id].add(process_id)
+            processes = models.Process.objects.in_bulk(timestamps)
+            for local_context in local_contexts:
+                for process_id in sorted(process_ids_by_sample[local_context["sample"].id],
+                                         key=lambda process_id: (timestamps[process_id], process_id)):
+                    processes_with_local_contexts.append((processes[process_id], local_context))
+                    self.process_ids.add(process_id)
+        collect_processes()
+        self.process_contexts = utils.digest_processes(processes_with_local_contexts, user)
         self.process_lists = []
 
     def update_sample_context_for_user(self, user, clearance, post_data):
@@ -768,6 +773,10 @@ def search(request):
     search, this is a GET requets.  Therefore, this view has two submit
     buttons.
 
+    If the query string contains ``stream``, all results are exported as a
+    table without limit and without preview, see
+    `samples.utils.views.streaming_table_export`.
+
     :param request: the current HTTP Request object
 
     :type request: HttpRequest
@@ -784,12 +793,8 @@ def search(request):
     if search_samples_form.is_valid():
         name_pattern = search_samples_form.cleaned_data["name_pattern"]
         if name_pattern:
-            if search_samples_form.cleaned_data["aliases"]:
-                found_samples = base_query.filter(Q(name__icontains=name_pattern) | Q(aliases__name__icontains=name_pattern))
-            else:
-                found_samples = base_query.filter(name__icontains=name_pattern)
-            too_many_results = found_samples.count() > max_results
-            found_samples = found_samples[:max_results] if too_many_results else found_samples
+            found_samples, too_many_results = sample_search.search_samples(
+                request.user, name_pattern, search_samples_form.cleaned_data["aliases"], max_results)
     my_samples = request.user.my_samples.all()
     if request.method == "POST":
         sample_ids = set(int_or_zero(key.partition("-")[0]) for key, value in request.POST.items()
@@ -805,6 +810,87 @@ def search(request):
                                                            "max_results": max_results})
 
 
+@login_required
+def autocomplete(request):
+    """Returns the names of the samples which match a search pattern, as a JSON
+    list.  It is meant for the auto-completion of sample names in input
+    fields.  The pattern is given in the query string as ``q``; the optional
+    ``limit`` defaults to 10 and may be at most 100.  Aliases are searched,
+    too, and the most relevant samples come first (see
+    :py:func:`samples.utils.sample_search.search_samples`).
+
+    :param request: the current HTTP Request object
+
+    :type request: HttpRequest
+
+    :return:
+      the HTTP response object
+
+    :rtype: HttpResponse
+    """
+    try:
+        name_pattern = request.GET["q"]
+    except KeyError:
+        raise JSONRequestException(3, "\"q\" parameter missing.")
+    limit = min(int_or_zero(request.GET.get("limit")) or 10, 100)
+    found_samples = sample_search.search_samples(request.user, name_pattern, aliases=True, limit=limit)[0] \
+                    if name_pattern else []
+    return respond_in_json([sample.name for sample in found_samples])
+
+
+def get_search_base_query(model_class, user):
+    """Returns the query set which restricts the results of an advanced search
+    to what the user is allowed to find.  Samples in confidential topics are
+    only found by members of the topic.  Sample series are only found if they
+    are in a non-confidential topic, in one of the user's topics, or if the
+    user is their currently responsible person.
+
+    :param model_class: the model class of the top-level search tree node
+    :param user: the current user
+
+    :type model_class: class (decendant of models.Model)
+    :type user: django.contrib.auth.models.User
+
+    :return:
+      the base query for `jb_common.search.get_search_results`, or ``None`` if
+      there is no restriction
+
+    :rtype: QuerySet or NoneType
+    """
+    if model_class == models.Sample:
+        return utils.restricted_samples_query(user)
+    elif model_class == models.SampleSeries:
+        return models.SampleSeries.objects.filter(
+            Q(topic__confidential=False) | Q(topic__members=user) | Q(currently_responsible_person=user)).distinct()
+
+
+def is_search_result_viewable(user, result):
+    """Returns whether the user may see the data of a search result.  Note
+    that the user may find things they can't see fully, e.g. samples of other
+    users in non-confidential topics.
+
+    :param user: the current user
+    :param result: a found object
+
+    :type user: django.contrib.auth.models.User
+    :type result: model instance
+
+    :return:
+      whether the user may see the data of ``result``
+
+    :rtype: bool
+    """
+    if isinstance(result, models.PhysicalProcess):
+        return permissions.has_permission_to_view_physical_process(user, result)
+    elif isinstance(result, models.Result):
+        return permissions.has_permission_to_view_result_process(user, result)
+    elif isinstance(result, models.Sample):
+        return permissions.has_permission_to_fully_view_sample(user, result)
+    elif isinstance(result, models.SampleSeries):
+        return permissions.has_permission_to_view_sample_series(user, result)
+    return False
+
+
 @help_link("demo.html#advanced-search")
 @login_required
 def advanced_search(request):
@@ -842,14 +928,13 @@ def advanced_search(request):
         parse_tree = root_form.cleaned_data["_model"] == root_form.cleaned_data["_old_model"]
         search_tree.parse_data(request.GET if parse_tree else None, "")
         if search_tree.is_valid():
-            if search_tree.model_class == models.Sample:
-                base_query = utils.restricted_samples_query(request.user)
-            elif search_tree.model_class == models.SampleSeries:
-                base_query = models.SampleSeries.objects.filter(
-                    Q(topic__confidential=False) | Q(topic__members=request.user) |
-                    Q(currently_responsible_person=request.user)).distinct()
-            else:
-                base_query = None
+            base_query = get_search_base_query(search_tree.model_class, request.user)
+            if "stream" in request.GET and parse_tree:
+                def get_row_trees():
+                    for result in jb_common.search.iterate_search_results(search_tree, base_query):
+                        if is_search_result_viewable(request.user, result):
+                            yield result.get_data_for_table_export()
+                return utils.streaming_table_export(request, _("search results"), get_row_trees, "")
             results, too_many_results = jb_common.search.get_search_results(search_tree, max_results, base_query)
             if search_tree.model_class == models.Sample:
                 if request.method == "POST":
@@ -864,20 +949,7 @@ def advanced_search(request):
             if results and root_form.cleaned_data["_search_parameters_hash"] == _search_parameters_hash:
                 data_node = data_tree.DataNode(_("search results"))
                 for result in results:
-                    insert = False
-                    if isinstance(result, models.PhysicalProcess) \
-                        and permissions.has_permission_to_view_physical_process(request.user, result):
-                            insert = True
-                    elif isinstance(result, models.Result) \
-                        and permissions.has_permission_to_view_result_process(request.user, result):
-                            insert = True
-                    elif isinstance(result, models.Sample) \
-                        and permissions.has_permission_to_fully_view_sample(request.user, result):
-                            insert = True
-                    elif isinstance(result, models.SampleSeries) \
-                        and permissions.has_permission_to_view_sample_series(request.user, result):
-                            insert = True
-                    if insert:
+                    if is_search_result_viewable(request.user, result):
                         data_node.children.append(result.get_data_for_table_export())
                 if len(data_node.children) == 0:
                     no_permission_message = _("You don't have the permission to see any content of the search results.")
@@ -899,10 +971,50 @@ def advanced_search(request):
                     "something_to_add": any(add_forms), "too_many_results": too_many_results, "max_results": max_results,
                     "column_groups": column_groups_form, "columns": columns_form, "old_data": old_data_form,
                     "rows": list(zip(table, switch_row_forms)) if table else None,
-                    "no_permission_message": no_permission_message}
+                    "streaming_export": True, "no_permission_message": no_permission_message}
     return render(request, "samples/advanced_search.html", content_dict)
 
 
+@login_required
+def advanced_search_stream(request):
+    """Streams the results of an advanced search as newline-delimited JSON.  It
+    takes the same query string as `advanced_search`, but it has no limit on
+    the number of results.  Every line is the ``get_data`` dictionary of one
+    found object which the user is allowed to see.  The results are fetched in
+    batches (see `jb_common.search.iterate_search_results`), so the first
+    lines are sent before the search is completed.  The header
+    ``X-Estimated-Count`` contains the number of results as estimated by the
+    database, before permissions are checked.
+
+    :param request: the current HTTP Request object
+
+    :type request: HttpRequest
+
+    :return:
+      the HTTP response object
+
+    :rtype: StreamingHttpResponse
+    """
+    model_list = [model for model in jb_common.search.get_all_searchable_models() if hasattr(model, "get_absolute_url")]
+    root_form = jb_common.search.SearchModelForm(model_list, request.GET)
+    if not root_form.is_valid() or not root_form.cleaned_data["_model"]:
+        raise JSONRequestException(3, "\"_model\" parameter missing or invalid.")
+    search_tree = get_all_models()[root_form.cleaned_data["_model"]].get_search_tree_node()
+    search_tree.parse_data(request.GET, "")
+    if not search_tree.is_valid():
+        raise JSONRequestException(5, "The search parameters are invalid.")
+    base_query = get_search_base_query(search_tree.model_class, request.user)
+
+    def lines():
+        for result in jb_common.search.iterate_search_results(search_tree, base_query):
+            if is_search_result_viewable(request.user, result):
+                yield json.dumps(result.get_data(), cls=JSONEncoder) + "\n"
+
+    response = StreamingHttpResponse(lines(), content_type="application/x-ndjson; charset=utf-8")
+    response["X-Estimated-Count"] = jb_common.search.estimate_count(search_tree.get_query_set(base_query))
+    return response
+
+
 @login_required
 @unquote_view_parameters
 def export(request, sample_name):
@@ -195,7 +195,7 @@ def show(request, name):
     """
     sample_series = get_object_or_404(models.SampleSeries, name=name)
     permissions.assert_can_view_sample_series(request.user, sample_series)
-    result_processes = [utils.digest_process(result, request.user) for result in sample_series.results.all()]
+    result_processes = utils.digest_processes([(result, {}) for result in sample_series.results.all()], request.user)
     can_edit = permissions.has_permission_to_edit_sample_series(request.user, sample_series)
     can_add_result = permissions.has_permission_to_add_result_process(request.user, sample_series)
     return render(request, "samples/show_sample_series.html",
@@ -116,6 +116,7 @@ from django.forms.utils import ValidationError
 from django.utils.translation import ugettext_lazy as _, ugettext
 import django.core.urlresolvers
 import django.forms as forms
+from samples.data_tree import DataNode, DataItem
 
 
 class ColumnGroup(object):
@@ -250,7 +251,7 @@ class Column(object):
         """
         for column_group_name in self.column_group_names:
             if column_group_name in row:
-                return row[column_group_name][self.key]
+                return row[column_group_name].get(self.key, "")
         return ""
 
 
@@ -351,6 +352,63 @@ def build_column_group_list(root):
     return column_groups, columns
 
 
+def get_row_tree_schema(node):
+    """Returns the structure of a row tree without the values.  Two row trees
+    with the same schema contribute the same column groups and columns to the
+    table.
+
+    :param node: the root node of the row tree
+
+    :type node: `samples.data_tree.DataNode`
+
+    :return:
+      the node name, the keys and origins of the items, and the schemas of the
+      children
+
+    :rtype: tuple
+    """
+    return (node.name, tuple((item.key, item.origin) for item in node.items),
+            tuple(get_row_tree_schema(child) for child in node.children))
+
+
+def build_column_group_list_for_rows(row_trees):
+    """Like `build_column_group_list`, but for an iterable of row trees, which
+    may be generated lazily.  Only the schemas of the row trees (see
+    `get_row_tree_schema`) are kept, and only if they differ from the schema
+    of the previous row tree, which doesn't change the result.  Therefore, the
+    column indices are the same as if the whole tree was passed to
+    `build_column_group_list` after
+    :py:meth:`samples.data_tree.DataNode.complete_items_in_children`.
+
+    :param row_trees: the row trees; the node names must have been made
+        unambiguous within each row tree already, see `prepare_row_trees`
+
+    :type row_trees: iterable of `samples.data_tree.DataNode`
+
+    :return:
+      the column groups, the column list
+
+    :rtype: list of `ColumnGroup`, list of `Column`
+    """
+    schemas = []
+    for row_tree in row_trees:
+        schema = get_row_tree_schema(row_tree)
+        if not schemas or schemas[-1] != schema:
+            schemas.append(schema)
+
+    def build_node(schema):
+        name, keys, children = schema
+        node = DataNode(name)
+        node.items = [DataItem(key, "", origin) for key, origin in keys]
+        node.children = [build_node(child) for child in children]
+        return node
+
+    root = DataNode("")
+    root.children = [build_node(schema) for schema in schemas]
+    root.complete_items_in_children()
+    return build_column_group_list(root)
+
+
 def flatten_tree(root):
     """Walk through a ``DataNode`` tree and convert it to a list of nested
     dictionaries for easy cell value lookup.  The resulting data structure is
@@ -371,14 +429,27 @@ def flatten_tree(root):
     :rtype: list of dictionary mapping unicode to dictionary mapping unicode to
       unicode
     """
+    return [flatten_row_tree(row) for row in root.children]
 
-    def flatten_row_tree(node):
-        name_dict = {node.name: dict((item.key, item.value if item.value is not None else "") for item in node.items)}
-        for child in node.children:
-            name_dict.update(flatten_row_tree(child))
-        return name_dict
 
-    return [flatten_row_tree(row) for row in root.children]
+def flatten_row_tree(node):
+    """Convert one row tree to nested dictionaries for easy cell value lookup.
+    See `flatten_tree` for details.
+
+    :param node: the root node of the row tree
+
+    :type node: `samples.data_tree.DataNode`
+
+    :return:
+      dictionary mapping node names to dictionaries mapping key names to cell
+      values
+
+    :rtype: dict mapping unicode to dict mapping unicode to unicode
+    """
+    name_dict = {node.name: dict((item.key, item.value if item.value is not None else "") for item in node.items)}
+    for child in node.children:
+        name_dict.update(flatten_row_tree(child))
+    return name_dict
 
 
 def generate_table_rows(flattened_tree, columns, selected_key_indices, label_column, label_column_heading):
@@ -430,6 +501,64 @@ def generate_table_rows(flattened_tree, columns, selected_key_indices, label_col
     return table_rows
 
 
+def prepare_row_trees(row_trees):
+    """Makes the node names unambiguous in each of the given row trees.  This
+    is equivalent to calling
+    :py:meth:`samples.data_tree.DataNode.find_unambiguous_names` for the root
+    node, but the row trees are processed one at a time, as they are
+    generated.
+
+    :param row_trees: the row trees
+
+    :type row_trees: iterable of `samples.data_tree.DataNode`
+
+    :return:
+      the row trees
+
+    :rtype: iterator over `samples.data_tree.DataNode`
+    """
+    for row_tree in row_trees:
+        row_tree.find_unambiguous_names(0)
+        yield row_tree
+
+
+def iterate_table_rows(row_trees, columns, selected_key_indices, generate_label_column, label_column_heading):
+    """Generates the rows of the final table one by one.  This is the lazy
+    counterpart of `generate_table_rows` for the streaming export: The row
+    trees are flattened only when their row is needed.  Rows without any value
+    in the selected columns are skipped.
+
+    :param row_trees: the row trees, processed by `prepare_row_trees`
+    :param columns: list of columns as constructed by
+        `build_column_group_list_for_rows`
+    :param selected_key_indices: list of the column indices which should be
+        output
+    :param generate_label_column: whether the first column should contain the
+        descriptive names of the row trees
+    :param label_column_heading: Description of the very first column with the
+        table row headings.
+
+    :type row_trees: iterable of `samples.data_tree.DataNode`
+    :type columns: list of `Column`
+    :type selected_key_indices: list of int
+    :type generate_label_column: bool
+    :type label_column_heading: unicode
+
+    :return:
+      the rows, starting with the head row
+
+    :rtype: iterator over list of object
+    """
+    head_row = [label_column_heading] if generate_label_column else []
+    head_row.extend([six.text_type(columns[key_index].heading) for key_index in selected_key_indices])
+    yield head_row
+    for row_tree in row_trees:
+        row = flatten_row_tree(row_tree)
+        cells = [columns[key_index].get_value(row) for key_index in selected_key_indices]
+        if any(cells):
+            yield ([row_tree.descriptive_name] if generate_label_column else []) + cells
+
+
 class ColumnGroupsForm(forms.Form):
     """Form for the columns choice.  It has only one field, ``column_groups``,
     the result of which is a set with the selected column group names.
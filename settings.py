@@ -120,6 +120,7 @@ MIDDLEWARE_CLASSES = (
     "samples.middleware.juliabase.ExceptionsMiddleware",
     "jb_common.middleware.JSONClientMiddleware",
     "jb_common.middleware.UserTracebackMiddleware",
+    "samples.middleware.juliabase.CoalescedTouchesMiddleware",
 )
 APPEND_SLASH = False
 
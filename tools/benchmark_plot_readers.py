@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of JuliaBase, see http://www.juliabase.org.
+# Copyright © 2008–2015 Forschungszentrum Jülich GmbH, Jülich, Germany
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compares the plot file readers of ``samples.utils.plots`` with the
+line-by-line parsing they replaced.  It writes two multi-megabyte files to a
+temporary directory: a tab-separated file with decimal commas and some
+non-numeric cells, and a solarsimulator file with 36 cells.  Call it from the
+root directory of JuliaBase::
+
+    PYTHONPATH=. tools/benchmark_plot_readers.py
+"""
+
+import os, time, tempfile, shutil, io, codecs
+import numpy
+from samples.utils import plots
+
+
+def line_by_line_reader(filename, columns, start_value, end_value="", separator=None):
+    """The reader which was used before the switch to NumPy arrays.
+    """
+    start_values = False
+    result = [[] for i in range(len(columns))]
+    with codecs.open(filename, encoding="cp1252") as datafile:
+        for line in datafile:
+            if start_values:
+                if end_value and line.lower().startswith(end_value):
+                    break
+                if not line.strip():
+                    continue
+                cells = line.strip().split(separator)
+                for column, result_array in zip(columns, result):
+                    try:
+                        value = float(cells[column].replace(",", "."))
+                    except ValueError:
+                        value = float("nan")
+                    result_array.append(value)
+            elif line.lower().startswith(start_value.lower()):
+                start_values = True
+    return result
+
+
+def loadtxt_solarsimulator_reader(filename, position):
+    """The solarsimulator reader which was used before the switch to the shared
+    cache.
+    """
+    datafile_content = io.StringIO(open(filename).read())
+    for line in datafile_content:
+        if line.startswith("# Positions:"):
+            positions = line.partition(":")[2].split()
+            break
+    column = positions.index(position) + 1
+    datafile_content.seek(0)
+    return numpy.loadtxt(datafile_content, usecols=(0, column), unpack=True)
+
+
+def solarsimulator_reader(filename, position):
+    with codecs.open(filename, encoding="cp1252") as datafile:
+        for line in datafile:
+            if line.startswith("# Positions:"):
+                positions = line.partition(":")[2].split()
+                break
+    column = positions.index(position) + 1
+    return plots.read_plot_file_without_comments(filename, (0, column), strict=True)
+
+
+def clear_caches():
+    plots._blocks_cache.clear()
+
+
+def timed(function, *args):
+    start = time.time()
+    function(*args)
+    return time.time() - start
+
+
+directory = tempfile.mkdtemp()
+try:
+    numpy.random.seed(8765432)
+
+    filename = os.path.join(directory, "table.dat")
+    with io.open(filename, "w", encoding="cp1252") as outfile:
+        outfile.write("Header\nDATA START\n")
+        for i, row in enumerate(numpy.random.rand(200000, 4)):
+            cells = ["{:.6f}".format(value).replace(".", ",") for value in row]
+            if i % 1000 == 0:
+                cells[2] = "n/a"
+            outfile.write("\t".join(cells) + "\n")
+        outfile.write("END\n")
+    print("{:.1f} MB tab-separated file".format(os.path.getsize(filename) / 1e6))
+    arguments = (filename, [0, 2], "data start", "end", "\t")
+    print("  line by line:    {:.3f} s".format(timed(line_by_line_reader, *arguments)))
+    clear_caches()
+    print("  NumPy, cold:     {:.3f} s".format(timed(plots.read_plot_file_beginning_after_start_value, *arguments)))
+    print("  NumPy, cached:   {:.6f} s".format(timed(plots.read_plot_file_beginning_after_start_value, *arguments)))
+
+    filename = os.path.join(directory, "solarsimulator.dat")
+    positions = [str(position) for position in range(1, 37)]
+    numpy.savetxt(filename, numpy.random.rand(30000, 37), "%06.5f",
+                  header="Positions: " + " ".join(positions) + "\n" + 70 * "-" + "\nU/V")
+    print("{:.1f} MB solarsimulator file, all 36 cells".format(os.path.getsize(filename) / 1e6))
+    print("  numpy.loadtxt:   {:.3f} s".format(
+        timed(lambda: [loadtxt_solarsimulator_reader(filename, position) for position in positions])))
+    clear_caches()
+    print("  shared parse:    {:.3f} s".format(
+        timed(lambda: [solarsimulator_reader(filename, position) for position in positions])))
+finally:
+    shutil.rmtree(directory)